@@ -1,5 +1,6 @@
-
-python src/crawler/utils/maxit_convert.py \
+python src/crawler/convert/maxit_convert.py \
     --input_dir dataset/Ago/pdb \
     --out_dir dataset/Ago/cif \
-    --strategy pdb2cif
\ No newline at end of file
+    --strategy pdb2cif \
+    --num_workers 16 \
+    --error_file dataset/Ago/pdb2cif_error.csv
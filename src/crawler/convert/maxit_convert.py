@@ -1,20 +1,87 @@
 import os
 import argparse
 import subprocess
-import shutil
+import pandas as pd
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 """
 Install maxit first
 https://sw-tools.rcsb.org/apps/MAXIT/index.html
 """
 
-def convert(file, maxit_o=1, out_dir=None, postfix=None):
-    converted_file = file[:-4] + postfix
-    if out_dir:
-        converted_file = os.path.join(out_dir, converted_file.split('/')[-1])
-    subprocess.run(["maxit", "-input", file, "-output", converted_file, "-o", str(maxit_o)])
-    
+strategy_dict = {
+    # strategy: (maxit -o option, input suffix, output suffix)
+    "pdb2cif": (1, ".pdb", ".cif"),
+    "cif2pdb": (2, ".cif", ".pdb"),
+    "cif2mmcif": (8, ".cif", ".cif"),
+}
+
+
+def get_out_file(file, out_dir=None, postfix=None, index_level=0):
+    """
+    params:
+        file: input structure file
+        out_dir: output directory, defaults to the directory of the input file
+        postfix: suffix of the converted file
+        index_level: number of name prefix sub directories, e.g. 2 puts P12345 under out_dir/P/P1/
+    return:
+        path of the converted file
+    """
+    name = os.path.basename(file)[:-4]
+    if out_dir is None:
+        return os.path.join(os.path.dirname(file), name + postfix)
+    for index in range(index_level):
+        out_dir = os.path.join(out_dir, name[:index + 1])
+    return os.path.join(out_dir, name + postfix)
+
+
+def is_up_to_date(file, converted_file):
+    return os.path.exists(converted_file) and os.path.getmtime(converted_file) >= os.path.getmtime(file)
+
+
+def convert(file, maxit_o=1, out_dir=None, postfix=None, index_level=0, overwrite=False, timeout=None, maxit="maxit"):
+    """
+    Convert one file with maxit.
+
+    return:
+        input file and a message, the message starts with "failed" when the conversion did not produce an output
+    """
+    converted_file = get_out_file(file, out_dir, postfix, index_level)
+    if not overwrite and converted_file != file and is_up_to_date(file, converted_file):
+        return file, f"{converted_file} already exists, skipping"
+    os.makedirs(os.path.dirname(converted_file) or ".", exist_ok=True)
+
+    # write to a temporary name so an interrupted run never leaves a half written output that looks up to date
+    tmp_file = converted_file + ".tmp" + postfix
+    try:
+        result = subprocess.run(
+            [maxit, "-input", file, "-output", tmp_file, "-o", str(maxit_o)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return file, f"failed, {e}"
+
+    if result.returncode != 0 or not os.path.exists(tmp_file) or os.path.getsize(tmp_file) == 0:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        error = (result.stderr or result.stdout).strip().splitlines()
+        return file, f"failed, return code {result.returncode}: {error[-1] if error else 'no output'}"
+    os.replace(tmp_file, converted_file)
+    return file, f"{converted_file} successfully converted"
+
+
+def list_input_files(input_dir, suffix):
+    """Walk input_dir recursively so name prefix sharded layouts are read as well."""
+    files = []
+    for root, _, names in os.walk(input_dir):
+        for name in names:
+            if name.endswith(suffix) and ".tmp" not in name:
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -22,24 +89,49 @@ if __name__ == '__main__':
     parser.add_argument("--input_dir", type=str, default=None)
     parser.add_argument("--strategy", type=str, choices=["pdb2cif", "cif2pdb", "cif2mmcif"], default=None)
     parser.add_argument("--out_dir", type=str, default=None)
+    parser.add_argument("--index_level", type=int, default=0, help="Number of name prefix sub directories in out_dir")
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count(), help="Number of maxit processes to run at once")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds before a single maxit call is killed")
+    parser.add_argument("--overwrite", action="store_true", help="Convert again even if the output is up to date")
+    parser.add_argument("--maxit", type=str, default="maxit", help="maxit executable")
+    parser.add_argument("--error_file", type=str, default=None, help="File to store the files that failed to convert")
     args = parser.parse_args()
-    
+
     if args.out_dir:
         os.makedirs(args.out_dir, exist_ok=True)
-    
-    if args.strategy == "pdb2cif":
-        maxit_o = 1
-        postfix = ".cif"
-    elif args.strategy == "cif2pdb":
-        maxit_o = 2
-        postfix = ".pdb"
-    elif args.strategy == "cif2mmcif":
-        maxit_o = 8
-        postfix = ".cif"
-    
+
+    maxit_o, in_suffix, postfix = strategy_dict[args.strategy]
+    convert_kwargs = {
+        "maxit_o": maxit_o, "out_dir": args.out_dir, "postfix": postfix, "index_level": args.index_level,
+        "overwrite": args.overwrite, "timeout": args.timeout, "maxit": args.maxit
+    }
+
+    error_files, error_messages = [], []
     if args.input_dir:
-        for file in tqdm(os.listdir(args.input_dir)):
-            args.file = os.path.join(args.input_dir, file)
-            convert(args.file, maxit_o, args.out_dir, postfix)
+        files = list_input_files(args.input_dir, in_suffix)
+        with ThreadPoolExecutor(max_workers=args.num_workers) as executor:
+            futures = [executor.submit(convert, file, **convert_kwargs) for file in files]
+
+            with tqdm(total=len(files), desc="Converting Files") as bar:
+                for future in as_completed(futures):
+                    file, message = future.result()
+                    if message.startswith("failed"):
+                        error_files.append(file)
+                        error_messages.append(message)
+                    bar.set_postfix({"failed": len(error_files)})
+                    bar.update(1)
     else:
-        convert(args.file, maxit_o, args.out_dir, postfix)
+        file, message = convert(args.file, **convert_kwargs)
+        print(message)
+        if message.startswith("failed"):
+            error_files.append(file)
+            error_messages.append(message)
+
+    if error_files:
+        if args.error_file is None:
+            args.error_file = os.path.join(args.out_dir or ".", f"{args.strategy}_error.csv")
+        error_dir = os.path.dirname(args.error_file)
+        if error_dir:
+            os.makedirs(error_dir, exist_ok=True)
+        pd.DataFrame({"file": error_files, "error": error_messages}).to_csv(args.error_file, index=False)
+        print(f"{len(error_files)} files failed, see {args.error_file}")
@@ -1,13 +1,29 @@
 import argparse
 import os
 import sys
+import gzip
+import json
+import math
 import shutil
+import sqlite3
+import hashlib
 import warnings
 warnings.filterwarnings("ignore")
 sys.path.append(os.getcwd())
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tqdm import tqdm
-from Bio.PDB import PDBParser, PPBuilder
-from src.data_collect.utils import unzip, ungzip, get_seq_from_pdb, get_seqs_from_pdb
+from src.crawler.utils.utils import ungzip
+
+
+AA_3TO1 = {
+    "ALA": "A", "ARG": "R", "ASN": "N", "ASP": "D", "CYS": "C",
+    "GLN": "Q", "GLU": "E", "GLY": "G", "HIS": "H", "ILE": "I",
+    "LEU": "L", "LYS": "K", "MET": "M", "PHE": "F", "PRO": "P",
+    "SER": "S", "THR": "T", "TRP": "W", "TYR": "Y", "VAL": "V",
+}
+
+STRUCTURE_SUFFIXES = (".pdb", ".ent", ".pdb.gz", ".ent.gz")
 
 
 def unzip_files(unzip_dir):
@@ -18,51 +34,284 @@ def unzip_files(unzip_dir):
         ungzip(os.path.join(unzip_dir, file), unzip_dir)
 
 
-def is_apo(pdb_path):
-    parser = PDBParser()
-    structure = parser.get_structure('pdb', pdb_path)
+def parse_structure(pdb_path):
+    """
+    Read the chain sequences and the HETATM flag of a pdb file in a single pass.
+    Only the first model is used, a residue is kept when it is a standard amino acid with a CA atom.
+
+    params:
+        pdb_path: path to a pdb file, optionally gzipped
+    return:
+        a dictionary of chain id to sequence, and whether the structure has no hetero residues
+    """
+    opener = gzip.open if pdb_path.endswith(".gz") else open
+    chains, seen = {}, set()
+    apo = True
+    with opener(pdb_path, "rt") as f:
+        for line in f:
+            record = line[:6]
+            if record == "ATOM  ":
+                if line[12:16].strip() != "CA":
+                    continue
+                res_name = line[17:20].strip()
+                if res_name not in AA_3TO1:
+                    continue
+                chain_id = line[21]
+                res_key = (chain_id, line[22:27])
+                if res_key in seen:
+                    continue
+                seen.add(res_key)
+                chains.setdefault(chain_id, []).append(AA_3TO1[res_name])
+            elif record == "HETATM":
+                apo = False
+            elif record == "ENDMDL":
+                break
+    return {chain_id: "".join(residues) for chain_id, residues in chains.items()}, apo
+
+
+def index_structure(pdb_path):
+    """Worker entry of the indexing pass, never raises so a broken file does not stop the pool."""
+    try:
+        chains, apo = parse_structure(pdb_path)
+        return chains, apo, None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def build_key(chains, chain="A"):
+    """
+    Deduplication key of a structure.
+
+    params:
+        chains: dictionary of chain id to sequence
+        chain: chain id to compare on, "all" joins every chain in file order
+    return:
+        the key sequence, None when the chain is missing or empty
+    """
+    if chain == "all":
+        seq = "/".join(chains.values())
+    else:
+        seq = chains.get(chain, "")
+    return seq or None
+
+
+def hash_seq(seq):
+    return hashlib.sha1(seq.encode()).hexdigest()
+
+
+class StructureIndex:
+    """
+    Persistent sqlite index of structure files, keyed by file name.
+    Each row keeps the file size and mtime so re-runs only parse new or changed files.
+    """
+    def __init__(self, index_file, chain="A"):
+        index_dir = os.path.dirname(index_file)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        self.conn = sqlite3.connect(index_file)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY, size INTEGER, mtime REAL,
+                chains TEXT, is_apo INTEGER, seq_hash TEXT, error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sequences (seq_hash TEXT PRIMARY KEY, seq TEXT);
+            CREATE INDEX IF NOT EXISTS files_seq_hash ON files (seq_hash);
+        """)
+        self.chain = chain
+        self._rekey()
+
+    def _rekey(self):
+        # the key chain may change between runs, recompute the hashes from the stored chains instead of re-parsing
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'chain'").fetchone()
+        if row is not None and row[0] != self.chain:
+            rows = self.conn.execute("SELECT name, chains FROM files WHERE chains IS NOT NULL").fetchall()
+            self.conn.execute("DELETE FROM sequences")
+            updates = []
+            for name, chains in rows:
+                seq = build_key(json.loads(chains), self.chain)
+                seq_hash = hash_seq(seq) if seq else None
+                if seq_hash:
+                    self.conn.execute("INSERT OR IGNORE INTO sequences VALUES (?, ?)", (seq_hash, seq))
+                updates.append((seq_hash, name))
+            self.conn.executemany("UPDATE files SET seq_hash = ? WHERE name = ?", updates)
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('chain', ?)", (self.chain,))
+        self.conn.commit()
+
+    def stale_files(self, raw_dir):
+        """
+        Compare the directory listing with the index.
+
+        return:
+            list of (name, size, mtime) that need parsing
+        """
+        known = {name: (size, mtime) for name, size, mtime in self.conn.execute("SELECT name, size, mtime FROM files")}
+        stale, present = [], set()
+        with os.scandir(raw_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.endswith(STRUCTURE_SUFFIXES):
+                    continue
+                present.add(entry.name)
+                stat = entry.stat()
+                if known.get(entry.name) != (stat.st_size, stat.st_mtime):
+                    stale.append((entry.name, stat.st_size, stat.st_mtime))
+        removed = [(name,) for name in known if name not in present]
+        if removed:
+            self.conn.executemany("DELETE FROM files WHERE name = ?", removed)
+            self.conn.commit()
+        return sorted(stale)
+
+    def add(self, records):
+        rows = []
+        for name, size, mtime, chains, apo, error in records:
+            seq_hash = None
+            if chains is not None:
+                seq = build_key(chains, self.chain)
+                if seq:
+                    seq_hash = hash_seq(seq)
+                    self.conn.execute("INSERT OR IGNORE INTO sequences VALUES (?, ?)", (seq_hash, seq))
+                chains = json.dumps(chains)
+                apo = int(apo)
+            rows.append((name, size, mtime, chains, apo, seq_hash, error))
+        self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def candidates(self):
+        """
+        return:
+            dictionary of sequence hash to candidate files, apo structures first then by name
+        """
+        groups = defaultdict(list)
+        query = "SELECT seq_hash, name FROM files WHERE seq_hash IS NOT NULL ORDER BY seq_hash, is_apo DESC, name"
+        for seq_hash, name in self.conn.execute(query):
+            groups[seq_hash].append(name)
+        return groups
+
+    def sequences(self):
+        return dict(self.conn.execute("SELECT seq_hash, seq FROM sequences"))
 
-    for model in structure:
-        for chain in model:
-            for residue in chain:
-                hetero_flag = residue.id[0].strip()
-                if hetero_flag != '':
-                    return False
-    return True
+    def close(self):
+        self.conn.close()
+
+
+def update_index(index, raw_dir, num_workers=8, commit_every=1000):
+    """Parse the new or changed files of raw_dir in parallel and store them in the index."""
+    stale = index.stale_files(raw_dir)
+    if not stale:
+        return 0
+    paths = [os.path.join(raw_dir, name) for name, _, _ in stale]
+    records = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        results = executor.map(index_structure, paths, chunksize=64)
+        for (name, size, mtime), (chains, apo, error) in tqdm(zip(stale, results), total=len(stale), desc="Indexing pdb"):
+            records.append((name, size, mtime, chains, apo, error))
+            # commit in batches so an interrupted run keeps its finished work
+            if len(records) >= commit_every:
+                index.add(records)
+                records = []
+    if records:
+        index.add(records)
+    return len(stale)
+
+
+def identity(seq_a, seq_b, aligner):
+    """Identical aligned residues over the length of the longer sequence."""
+    alignment = aligner.align(seq_a, seq_b)[0]
+    identical = sum(
+        sum(a == b for a, b in zip(seq_a[a_start:a_end], seq_b[b_start:b_end]))
+        for (a_start, a_end), (b_start, b_end) in zip(*alignment.aligned)
+    )
+    return identical / max(len(seq_a), len(seq_b))
+
+
+def cluster_near_duplicates(representatives, seqs, threshold, kmer=5):
+    """
+    Greedy clustering of representatives by sequence identity, longest sequence first.
+    A short word filter skips the alignment of pairs that cannot reach the threshold.
+
+    params:
+        representatives: dictionary of sequence hash to representative file
+        seqs: dictionary of sequence hash to sequence
+        threshold: identity over the longer sequence to merge two structures
+    return:
+        dictionary of sequence hash to representative file after merging
+    """
+    from Bio.Align import PairwiseAligner, substitution_matrices
+    # the scoring of EMBOSS needle, gaps are penalized so the identity is not inflated by gapping
+    aligner = PairwiseAligner()
+    aligner.mode = "global"
+    aligner.substitution_matrix = substitution_matrices.load("BLOSUM62")
+    aligner.open_gap_score, aligner.extend_gap_score = -10, -0.5
+
+    order = sorted(representatives, key=lambda h: len(seqs[h]), reverse=True)
+    kept, kmer_index = [], defaultdict(list)
+    for seq_hash in tqdm(order, desc="Clustering"):
+        seq = seqs[seq_hash]
+        words = {seq[i:i + kmer] for i in range(len(seq) - kmer + 1)}
+        # each mismatch can remove at most `kmer` shared words, a pair at exactly the threshold is
+        # allowed len - ceil(threshold * len) mismatches (the epsilon absorbs float error, 0.9 * 100)
+        min_shared = len(words) - kmer * (len(seq) - math.ceil(threshold * len(seq) - 1e-9))
+        hits = Counter(rep for w in words for rep in kmer_index.get(w, ()))
+        merged = False
+        for rep, shared in hits.most_common():
+            if shared < min_shared:
+                break
+            if identity(seq, seqs[rep], aligner) >= threshold:
+                merged = True
+                break
+        if merged:
+            continue
+        kept.append(seq_hash)
+        for w in words:
+            kmer_index[w].append(seq_hash)
+    return {seq_hash: representatives[seq_hash] for seq_hash in kept}
+
+
+def copy_files(names, raw_dir, unique_dir, num_workers=8):
+    os.makedirs(unique_dir, exist_ok=True)
+
+    def copy(name):
+        src, dst = os.path.join(raw_dir, name), os.path.join(unique_dir, name)
+        if os.path.exists(dst) and os.path.getsize(dst) == os.path.getsize(src):
+            return
+        shutil.copyfile(src, dst)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        list(tqdm(executor.map(copy, names), total=len(names), desc="Copying pdb"))
 
 
 def process(args):
     if args.is_zip:
         assert args.raw_dir, "no raw_dir"
         unzip_files(args.raw_dir)
-    
-    pdbs = sorted(os.listdir(args.raw_dir))
-    seq_pdb_dic = {}
-    bar = tqdm(pdbs)
-    for pdb in bar:
-        bar.set_postfix_str(f"{pdb}")
-        try:
-            seq = get_seq_from_pdb(os.path.join(args.raw_dir, pdb))
-        except:
-            continue
-        if seq in seq_pdb_dic.keys():
-            if is_apo(os.path.join(args.raw_dir, pdb)):
-                seq_pdb_dic[seq] = pdb
-            else:
-                continue
-        seq_pdb_dic[seq] = pdb
-    for seq, pdb in seq_pdb_dic.items():
-        shutil.copyfile(os.path.join(args.raw_dir, pdb), os.path.join(args.unique_dir, pdb))
-    
+
+    index_file = args.index_file or f"{args.raw_dir.rstrip('/')}_index.db"
+    index = StructureIndex(index_file, chain=args.chain)
+    num_parsed = update_index(index, args.raw_dir, args.num_workers)
+    print(f"Parsed {num_parsed} new or changed files, index at {index_file}")
+
+    # pick an apo structure for each sequence when there is one
+    representatives = {seq_hash: names[0] for seq_hash, names in index.candidates().items()}
+    if args.identity is not None and args.identity < 1:
+        representatives = cluster_near_duplicates(representatives, index.sequences(), args.identity)
+    index.close()
+
+    print(f"Keep {len(representatives)} unique structures")
+    copy_files(sorted(representatives.values()), args.raw_dir, args.unique_dir, args.num_workers)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--is_zip", action="store_true")
     parser.add_argument("--raw_dir", type=str, default="data/MDH/af/raw")
     parser.add_argument("--unique_dir", type=str, default="data/MDH/af/unique")
-    
+    parser.add_argument("--index_file", type=str, default=None, help="sqlite index file, defaults to <raw_dir>_index.db")
+    parser.add_argument("--chain", type=str, default="A", help="chain to deduplicate on, 'all' for every chain")
+    parser.add_argument("--identity", type=float, default=None, help="merge near duplicates above this sequence identity")
+    parser.add_argument("--num_workers", type=int, default=8)
+
     args = parser.parse_args()
     process(args)
     # get_seqs_from_pdb("data/MDH/pdb/unique", "data/MDH/pdb/unique_seqs.fasta")
-    
-    
\ No newline at end of file
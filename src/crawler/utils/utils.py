@@ -2,8 +2,11 @@ import zipfile
 import gzip
 import shutil
 import os
+import sys
+sys.path.append(os.getcwd())
 from tqdm import tqdm
 from Bio.PDB import PDBParser, PPBuilder
+from src.utils.fasta import iter_fasta
 
 def unzip(zipath, savefolder):
     zf = zipfile.ZipFile(zipath)
@@ -39,23 +42,9 @@ def read_multi_fasta(file_path):
     params:
         file_path: path to a fasta file
     return:
-        a dictionary of sequences
+        a dictionary of sequences, keys are the header lines
     """
-    sequences = {}
-    current_sequence = ''
-    with open(file_path, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if line.startswith('>'):
-                if current_sequence:
-                    sequences[header] = current_sequence
-                    current_sequence = ''
-                header = line
-            else:
-                current_sequence += line
-        if current_sequence:
-            sequences[header] = current_sequence
-    return sequences
+    return {f">{header}": sequence for header, sequence in iter_fasta(file_path)}
 
 def make_uid_chunks(uid_file, chunk_dir=None, chunk_size=10000):
     """
@@ -1,6 +1,7 @@
 import torch
 import json
 import re
+import numpy as np
 from typing import Dict, List, Any
 from transformers import PreTrainedTokenizer
 from dataclasses import dataclass
@@ -25,6 +26,8 @@ class Collator:
     num_labels: int = None
     sequence_column_name: str = 'aa_seq'
     label_column_name: str = 'label'
+    # add cumulative sequence lengths so the adapter heads can run on packed, padding free tokens
+    packed: bool = False
 
     def __call__(self, examples: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
         """Collate function for batching examples."""
@@ -80,6 +83,10 @@ class Collator:
         else:
             batch = self.tokenize_sequences(aa_seqs, structure_seqs)
         
+        if self.packed:
+            lengths = batch["aa_seq_attention_mask"].sum(dim=1, dtype=torch.int32)
+            batch["aa_seq_cu_seqlens"] = torch.nn.functional.pad(torch.cumsum(lengths, dim=0, dtype=torch.int32), (1, 0))
+
         max_seq_len = batch["aa_seq_input_ids"].shape[1]
         if 'residue' in self.problem_type:
             # For residue classification, labels should be position-level
@@ -113,6 +120,10 @@ class Collator:
 
     def process_esm3_structure_seq(self, seq: List[int]) -> torch.Tensor:
         """Process ESM3 structure sequence."""
+        if isinstance(seq, np.ndarray):
+            # packed array read from lmdb
+            seq = torch.from_numpy(seq.astype(np.int64))
+            return torch.cat([torch.tensor([VQVAE_SPECIAL_TOKENS["BOS"]]), seq, torch.tensor([VQVAE_SPECIAL_TOKENS["EOS"]])])
         return torch.tensor([VQVAE_SPECIAL_TOKENS["BOS"]] + seq + [VQVAE_SPECIAL_TOKENS["EOS"]])
 
     def process_stru_tokens(self, seq:List[int]) -> torch.Tensor:
@@ -122,6 +133,9 @@ class Collator:
             tokens = list(map(int, seq_clean.split(','))) if seq_clean else []
         elif isinstance(seq, (list, tuple)):
             tokens = [int(x) for x in seq]
+        elif isinstance(seq, np.ndarray):
+            # packed array read from lmdb
+            return torch.from_numpy(seq.astype(np.int64))
         stru_tokens = [int(num) for num in tokens]
         return torch.tensor(stru_tokens)
     
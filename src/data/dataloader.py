@@ -1,3 +1,4 @@
+import os
 import json
 import torch
 import datasets
@@ -13,19 +14,35 @@ def prepare_dataloaders(args, tokenizer, logger):
     """Prepare train, validation and test dataloaders."""
     aa_seq_key = args.sequence_column_name
     # Process datasets
-    train_dataset = datasets.load_dataset(args.dataset)['train']
-    train_dataset_token_lengths = [len(item[aa_seq_key]) for item in train_dataset]
-    val_dataset = datasets.load_dataset(args.dataset)['validation']
-    val_dataset_token_lengths = [len(item[aa_seq_key]) for item in val_dataset]
-    test_dataset = datasets.load_dataset(args.dataset)['test']
-    test_dataset_token_lengths = [len(item[aa_seq_key]) for item in test_dataset]
-    
-    if args.normalize is not None:
-        train_dataset, val_dataset, test_dataset = normalize_dataset(
-            train_dataset, val_dataset, test_dataset, 
-            args.normalize, 
-            label_column_name=args.label_column_name
-        )
+    if getattr(args, 'dataset_format', 'hf') == 'lmdb':
+        # records stay on disk, token lengths come from the index written by the converter
+        from .lmdb_dataset import LMDBDataset, normalize_lmdb_datasets
+        train_dataset = LMDBDataset(os.path.join(args.dataset, 'train'))
+        val_dataset = LMDBDataset(os.path.join(args.dataset, 'validation'))
+        test_dataset = LMDBDataset(os.path.join(args.dataset, 'test'))
+        train_dataset_token_lengths = train_dataset.lengths.tolist()
+        val_dataset_token_lengths = val_dataset.lengths.tolist()
+        test_dataset_token_lengths = test_dataset.lengths.tolist()
+        if args.normalize is not None:
+            train_dataset, val_dataset, test_dataset = normalize_lmdb_datasets(
+                train_dataset, val_dataset, test_dataset,
+                args.normalize,
+                label_column_name=args.label_column_name
+            )
+    else:
+        train_dataset = datasets.load_dataset(args.dataset)['train']
+        train_dataset_token_lengths = [len(item[aa_seq_key]) for item in train_dataset]
+        val_dataset = datasets.load_dataset(args.dataset)['validation']
+        val_dataset_token_lengths = [len(item[aa_seq_key]) for item in val_dataset]
+        test_dataset = datasets.load_dataset(args.dataset)['test']
+        test_dataset_token_lengths = [len(item[aa_seq_key]) for item in test_dataset]
+        
+        if args.normalize is not None:
+            train_dataset, val_dataset, test_dataset = normalize_dataset(
+                train_dataset, val_dataset, test_dataset, 
+                args.normalize, 
+                label_column_name=args.label_column_name
+            )
     
     # log dataset info
     logger.info("Dataset Statistics:")
@@ -50,7 +67,8 @@ def prepare_dataloaders(args, tokenizer, logger):
         plm_model=args.plm_model,
         num_labels=args.num_labels,
         sequence_column_name=args.sequence_column_name,
-        label_column_name=args.label_column_name
+        label_column_name=args.label_column_name,
+        packed=getattr(args, 'packed', False)
     )
     
     # Common dataloader parameters
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Stand-in for the foldseek binary, for exercising FoldseekStore without installing foldseek.
+
+Only `structureto3didescriptor` is implemented. It writes a 3di.tsv in the format of foldseek:
+one line per chain and model with the name, the residue sequence, a 3Di sequence and the CA
+coordinates. Entries are named like --chain-name-mode 1, <file name>_<chain>, and
+<file name>_MODEL_<n>_<chain> for files with several models. The 3Di letters are derived from the
+residues, they are not real structural states.
+
+Every call appends its input file names to FOLDSEEK_STUB_LOG if it is set, one JSON list per call,
+so tests can check the batching and which files an incremental update sends.
+
+    python src/data/get_foldseek_structure_seq.py --pdb_dir data/pdb --out_file 3di.jsonl --foldseek src/data/foldseek_stub.py
+"""
+import os
+import gzip
+import json
+import argparse
+
+THREE_TO_ONE = {
+    "ALA": "A", "ARG": "R", "ASN": "N", "ASP": "D", "CYS": "C", "GLN": "Q", "GLU": "E", "GLY": "G",
+    "HIS": "H", "ILE": "I", "LEU": "L", "LYS": "K", "MET": "M", "PHE": "F", "PRO": "P", "SER": "S",
+    "THR": "T", "TRP": "W", "TYR": "Y", "VAL": "V", "MSE": "M", "SEC": "U", "PYL": "O",
+}
+STATES_3DI = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def read_chains(path):
+    """CA atoms of a PDB file, a list of (model, chain, residues, coordinates) in file order."""
+    opener = gzip.open if path.endswith(".gz") else open
+    chains = {}
+    model = 1
+    with opener(path, "rt") as f:
+        for line in f:
+            if line.startswith("MODEL"):
+                model = int(line[10:14])
+            elif line.startswith(("ATOM", "HETATM")) and line[12:16].strip() == "CA":
+                residue = THREE_TO_ONE.get(line[17:20].strip())
+                if residue is None:
+                    continue
+                chain = chains.setdefault((model, line[21].strip() or "A"), ([], []))
+                chain[0].append(residue)
+                chain[1].append(f"{float(line[30:38]):.3f},{float(line[38:46]):.3f},{float(line[46:54]):.3f}")
+    return [(model, chain, residues, coords) for (model, chain), (residues, coords) in chains.items()]
+
+
+def structureto3didescriptor(input_dir, tsv_file):
+    names = sorted(os.listdir(input_dir))
+    if os.environ.get("FOLDSEEK_STUB_LOG"):
+        with open(os.environ["FOLDSEEK_STUB_LOG"], "a") as f:
+            f.write(json.dumps(names) + "\n")
+    with open(tsv_file, "w") as out:
+        for name in names:
+            chains = read_chains(os.path.join(input_dir, name))
+            multi_model = len({model for model, _, _, _ in chains}) > 1
+            # foldseek drops the compression suffix from the entry name
+            entry = name[:-3] if name.endswith(".gz") else name
+            for model, chain, residues, coords in chains:
+                header = f"{entry}_MODEL_{model}_{chain}" if multi_model else f"{entry}_{chain}"
+                states = "".join(STATES_3DI[(ord(residue) * 7 + i) % len(STATES_3DI)] for i, residue in enumerate(residues))
+                out.write(f"{header}\t{''.join(residues)}\t{states}\t{','.join(coords)}\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["structureto3didescriptor"])
+    parser.add_argument("input_dir", type=str)
+    parser.add_argument("tsv_file", type=str)
+    # accepted for compatibility with the foldseek command line, ignored
+    parser.add_argument("--threads", type=str, default="1")
+    parser.add_argument("--chain-name-mode", type=str, default="1")
+    parser.add_argument("-v", type=str, default="3")
+    args = parser.parse_args()
+
+    structureto3didescriptor(args.input_dir, args.tsv_file)
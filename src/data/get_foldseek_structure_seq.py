@@ -1,41 +1,180 @@
 import os
+import re
 import argparse
 import json
+import shutil
+import sqlite3
+import subprocess
+import tempfile
 from tqdm import tqdm
 
+STRUCTURE_SUFFIXES = (".pdb", ".cif", ".ent", ".pdb.gz", ".cif.gz", ".ent.gz")
+
+
+def get_name(pdb_file):
+    return os.path.basename(pdb_file).split('.')[0]
+
+
+def get_key(pdb_file):
+    # absolute path, file names repeat across directories
+    return os.path.abspath(pdb_file)
+
+
+class FoldseekStore:
+    """
+    Persistent path -> 3Di sequence store backed by sqlite.
+
+    New or modified structures are converted in batches with one `foldseek structureto3didescriptor`
+    call each, in its own temporary directory so concurrent runs never share files. Entries are keyed
+    by absolute path. Use ":memory:" as store_path for a throw-away store.
+    """
+    # bumped when the tables change, older stores are rebuilt
+    SCHEMA_VERSION = 2
+
+    def __init__(self, store_path=":memory:", foldseek="foldseek", threads=1, batch_size=10000, verbose=False, rm_tmp=True):
+        if store_path != ":memory:" and os.path.dirname(store_path):
+            os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        self.conn = sqlite3.connect(store_path, timeout=600)
+        if store_path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.conn.executescript(f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS chains;
+                PRAGMA user_version = {self.SCHEMA_VERSION};
+            """)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL);
+            CREATE TABLE IF NOT EXISTS chains (
+                path TEXT, chain TEXT, idx INTEGER, aa_seq TEXT, foldseek_seq TEXT, PRIMARY KEY (path, chain)
+            );
+        """)
+        self.foldseek = foldseek
+        self.threads = threads
+        self.batch_size = batch_size
+        self.verbose = verbose
+        self.rm_tmp = rm_tmp
+
+    def _run(self, *cmd):
+        verbosity = [] if self.verbose else ["-v", "0"]
+        subprocess.run([self.foldseek, *cmd, *verbosity], check=True,
+                       stdout=None if self.verbose else subprocess.DEVNULL)
+
+    def stale_files(self, pdb_files):
+        known = {path: (size, mtime) for path, size, mtime in self.conn.execute("SELECT * FROM files")}
+        stale = []
+        for pdb_file in pdb_files:
+            stat = os.stat(pdb_file)
+            if known.get(get_key(pdb_file)) != (stat.st_size, stat.st_mtime):
+                stale.append(pdb_file)
+        return stale
+
+    def _extract_batch(self, pdb_files):
+        tmp_dir = tempfile.mkdtemp(prefix="foldseek_")
+        try:
+            # link the batch into one directory so a single call covers it, the links are numbered
+            # because file names repeat across directories
+            input_dir = os.path.join(tmp_dir, "input")
+            os.makedirs(input_dir)
+            file_dict = {}
+            for i, pdb_file in enumerate(pdb_files):
+                link_name = f"{i}-{os.path.basename(pdb_file)}"
+                os.symlink(os.path.abspath(pdb_file), os.path.join(input_dir, link_name))
+                file_dict[link_name] = pdb_file
+                if link_name.endswith(".gz"):
+                    file_dict[link_name[:-3]] = pdb_file
+            tsv_file = os.path.join(tmp_dir, "3di.tsv")
+            self._run("structureto3didescriptor", input_dir, tsv_file, "--threads", str(self.threads), "--chain-name-mode", "1")
+            with open(tsv_file, "r") as f:
+                records = [line.rstrip("\n").split("\t")[:3] for line in f if line.strip()]
+        finally:
+            if self.rm_tmp:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        chain_rows, chain_idx, seen = [], {}, set()
+        for desc, aa_seq, ss_seq in records:
+            # --chain-name-mode 1 names every entry <file name>_<chain>, or <file name>_MODEL_<n>_<chain>
+            # for files with several models
+            header = desc.split()[0]
+            link_name, chain = header.rsplit("_", 1) if "_" in header else (header, "A")
+            link_name = re.sub(r"_MODEL_\d+$", "", link_name)
+            if link_name not in file_dict:
+                continue
+            key = get_key(file_dict[link_name])
+            # a chain repeats in every model of the file, the first model is kept
+            if (key, chain) in seen:
+                continue
+            seen.add((key, chain))
+            chain_idx[key] = chain_idx.get(key, -1) + 1
+            chain_rows.append((key, chain, chain_idx[key], aa_seq, ss_seq))
+
+        file_rows = []
+        for pdb_file in pdb_files:
+            stat = os.stat(pdb_file)
+            file_rows.append((get_key(pdb_file), stat.st_size, stat.st_mtime))
+        with self.conn:
+            self.conn.executemany("DELETE FROM chains WHERE path = ?", [(row[0],) for row in file_rows])
+            self.conn.executemany("INSERT OR IGNORE INTO chains VALUES (?, ?, ?, ?, ?)", chain_rows)
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", file_rows)
+
+    def update(self, pdb_files):
+        """
+        Extract the 3Di sequences of the new or changed files.
+
+        params:
+            pdb_files: list of structure files
+        return:
+            number of files sent to foldseek
+        """
+        stale = self.stale_files(pdb_files)
+        for i in tqdm(range(0, len(stale), self.batch_size), disable=len(stale) <= self.batch_size):
+            self._extract_batch(stale[i:i + self.batch_size])
+        return len(stale)
+
+    def get(self, pdb_file, chains=None):
+        """
+        params:
+            pdb_file: structure file passed to update
+        return:
+            a dict of chain -> (aa_seq, foldseek_seq), in file order
+        """
+        rows = self.conn.execute(
+            "SELECT chain, aa_seq, foldseek_seq FROM chains WHERE path = ? ORDER BY idx", (get_key(pdb_file),)
+        ).fetchall()
+        return {chain: (aa_seq, ss_seq) for chain, aa_seq, ss_seq in rows if chains is None or chain in chains}
+
+    def close(self):
+        self.conn.close()
+
+
 # conda install -c conda-forge -c bioconda foldseek
-def get_foldseek_structure_seq(pdb_dir, rm_tmp=True):
-    # foldseek createdb INPUT_dir_with_structures tmp_db
-    # foldseek lndb tmp_db_h tmp_db_ss_h
-    # foldseek convert2fasta tmp_db_ss OUTPUT_3di.fasta
-    # use command to generate foldseek structure seq
-    os.makedirs("tmp_db", exist_ok=True)
-    os.system(f"foldseek createdb {pdb_dir} tmp_db/tmp_db")
-    os.system(f"foldseek lndb tmp_db/tmp_db_h tmp_db/tmp_db_ss_h")
-    os.system(f"foldseek convert2fasta tmp_db/tmp_db_ss tmp_db/tmp_db_ss.fasta")
-    
+def get_foldseek_structure_seq(pdb_dir, rm_tmp=True, store_path=":memory:", foldseek="foldseek", threads=1, batch_size=10000):
+    # foldseek structureto3didescriptor INPUT_dir_with_structures OUTPUT_3di.tsv
+    # only the structures missing from the store are sent to foldseek
+    pdb_files = sorted([os.path.join(pdb_dir, p) for p in os.listdir(pdb_dir) if p.endswith(STRUCTURE_SUFFIXES)])
+    store = FoldseekStore(store_path, foldseek=foldseek, threads=threads, batch_size=batch_size, rm_tmp=rm_tmp)
+    store.update(pdb_files)
+
     results = []
-    # read fasta file
-    with open("tmp_db/tmp_db_ss.fasta", "r") as f:
-        for line in tqdm(f):
-            if line.startswith(">"):
-                name = line.split()[0][1:]
-                seq = next(f).strip()
-                results.append({"name":name.split('.')[0], "foldseek_seq":seq})
-    
-    if rm_tmp:
-        os.system("rm -rf tmp_db")
-        
+    for pdb_file in tqdm(pdb_files):
+        name = get_name(pdb_file)
+        for aa_seq, foldseek_seq in store.get(pdb_file).values():
+            results.append({"name": name, "foldseek_seq": foldseek_seq})
+    store.close()
     return results
-    
-    
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--pdb_dir", type=str, default=None)
     parser.add_argument("--out_file", type=str, default=None)
     parser.add_argument("--rm_tmp", type=bool, default=True)
+    parser.add_argument("--store", type=str, default=":memory:", help="persistent sqlite store of 3Di sequences")
+    parser.add_argument("--foldseek", type=str, default="foldseek", help="foldseek binary")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--batch_size", type=int, default=10000, help="number of structures per structureto3didescriptor call")
     args = parser.parse_args()
-    
-    results = get_foldseek_structure_seq(args.pdb_dir, args.rm_tmp)
+
+    results = get_foldseek_structure_seq(args.pdb_dir, args.rm_tmp, args.store, args.foldseek, args.threads, args.batch_size)
     with open(args.out_file, "w") as f:
-        f.write("\n".join([json.dumps(r) for r in results]))
\ No newline at end of file
+        f.write("\n".join([json.dumps(r) for r in results]))
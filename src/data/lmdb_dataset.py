@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import argparse
+import lmdb
+import msgpack
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from torch.utils.data import Dataset
+from typing import Any, Callable, Dict, Iterable, Optional
+
+SPLITS = ["train", "validation", "test"]
+META_KEY = b"__meta__"
+LENGTHS_KEY = b"__lengths__"
+LABELS_KEY = b"__labels__"
+# msgpack extension code for integer token arrays (ProSST / ESM3 structure tokens)
+NDARRAY_EXT = 1
+INT_LIST_PATTERN = re.compile(r"^\[\s*-?\d+(\s*,\s*-?\d+)*\s*\]$")
+
+
+def _encode_default(obj):
+    if isinstance(obj, np.ndarray):
+        return msgpack.ExtType(NDARRAY_EXT, obj.dtype.char.encode() + obj.tobytes())
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot serialize {type(obj)}")
+
+
+def _decode_ext(code, data):
+    if code == NDARRAY_EXT:
+        # read-only view on the decoded bytes, no per-token Python objects
+        return np.frombuffer(data, dtype=np.dtype(data[:1].decode()), offset=1)
+    return msgpack.ExtType(code, data)
+
+
+def compact_record(record: Dict[str, Any], skip_columns=()) -> Dict[str, Any]:
+    """Store integer token lists, or their string form "[1, 2, 3]", as packed int16/int32 arrays."""
+    compact = {}
+    for key, value in record.items():
+        if key in skip_columns:
+            compact[key] = value
+            continue
+        if isinstance(value, str) and INT_LIST_PATTERN.match(value):
+            value = json.loads(value)
+        if isinstance(value, (list, tuple)) and value and all(isinstance(v, int) for v in value):
+            array = np.asarray(value)
+            dtype = np.int16 if array.min() >= -32768 and array.max() < 32768 else np.int32
+            value = array.astype(dtype)
+        compact[key] = value
+    return compact
+
+
+def write_lmdb(records: Iterable[Dict[str, Any]], out_path: str, sequence_column_name: str = "aa_seq",
+               label_column_name: str = "label", map_size: int = 1 << 40, commit_every: int = 10000) -> int:
+    """
+    Write records into an lmdb environment.
+
+    Records are stored under their zero padded index as msgpack, next to a length index of
+    `sequence_column_name` for the token based batch sampler and, for numeric labels, a label array.
+
+    Returns:
+        number of written records
+    """
+    os.makedirs(out_path, exist_ok=True)
+    env = lmdb.open(out_path, map_size=map_size, subdir=True, meminit=False, map_async=True)
+    lengths, labels, columns = [], [], None
+    txn = env.begin(write=True)
+    for idx, record in enumerate(tqdm(records, desc=f"Writing {out_path}")):
+        columns = columns or list(record.keys())
+        lengths.append(len(record[sequence_column_name]))
+        label = record.get(label_column_name)
+        labels.append(label if isinstance(label, (int, float)) and not isinstance(label, bool) else None)
+        txn.put(f"{idx:010d}".encode(), msgpack.packb(compact_record(record, [label_column_name]), default=_encode_default, use_bin_type=True))
+        if (idx + 1) % commit_every == 0:
+            txn.commit()
+            txn = env.begin(write=True)
+
+    meta = {
+        "num_examples": len(lengths),
+        "columns": columns or [],
+        "sequence_column_name": sequence_column_name,
+        "label_column_name": label_column_name,
+    }
+    txn.put(META_KEY, msgpack.packb(meta, use_bin_type=True))
+    txn.put(LENGTHS_KEY, np.asarray(lengths, dtype=np.int32).tobytes())
+    if labels and all(label is not None for label in labels):
+        txn.put(LABELS_KEY, np.asarray(labels, dtype=np.float64).tobytes())
+    txn.commit()
+    env.sync()
+    env.close()
+    return len(lengths)
+
+
+class LMDBDataset(Dataset):
+    """
+    Lazily read records written by `write_lmdb`.
+
+    The environment is opened read-only on first access in each process, so the dataset can be
+    handed to DataLoader workers without sharing an lmdb handle across fork.
+
+    Args:
+        data_path: Path to the lmdb directory
+        transform: Optional function applied to every decoded record, module level (or a
+            functools.partial of one) so DataLoader workers can pickle it
+
+    Integer token columns are returned as read-only numpy arrays.
+    """
+    def __init__(self, data_path: str, transform: Optional[Callable] = None):
+        if not os.path.exists(data_path):
+            raise FileNotFoundError(data_path)
+        self.data_path = data_path
+        self.transform = transform
+        self._env = None
+        self._pid = None
+
+        with self._get_env().begin(write=False) as txn:
+            self.meta = msgpack.unpackb(txn.get(META_KEY), raw=False)
+            self.lengths = np.frombuffer(txn.get(LENGTHS_KEY), dtype=np.int32).copy()
+            labels = txn.get(LABELS_KEY)
+            self.labels = np.frombuffer(labels, dtype=np.float64).copy() if labels is not None else None
+        self._label_override = None
+        self._num_examples = self.meta["num_examples"]
+
+    def _get_env(self):
+        if self._env is None or self._pid != os.getpid():
+            self._env = lmdb.open(self.data_path, readonly=True, lock=False, readahead=False, meminit=False)
+            self._pid = os.getpid()
+        return self._env
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_env"] = None
+        return state
+
+    def __len__(self) -> int:
+        return self._num_examples
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if not 0 <= index < self._num_examples:
+            raise IndexError(index)
+        with self._get_env().begin(write=False, buffers=True) as txn:
+            item = msgpack.unpackb(txn.get(f"{index:010d}".encode()), ext_hook=_decode_ext, raw=False)
+        if self._label_override is not None:
+            item[self.meta["label_column_name"]] = float(self._label_override[index])
+        if self.transform is not None:
+            item = self.transform(item)
+        return item
+
+    def set_labels(self, labels):
+        """Replace the stored labels, e.g. after normalization, without rewriting the records."""
+        self._label_override = np.asarray(labels, dtype=np.float64)
+
+    def to_dataframe(self, exclude_columns=()) -> pd.DataFrame:
+        rows = []
+        with self._get_env().begin(write=False, buffers=True) as txn:
+            for index in range(self._num_examples):
+                item = msgpack.unpackb(txn.get(f"{index:010d}".encode()), ext_hook=_decode_ext, raw=False)
+                rows.append({k: v for k, v in item.items() if k not in exclude_columns})
+        return pd.DataFrame(rows)
+
+
+def normalize_lmdb_datasets(train_dataset, val_dataset, test_dataset, method, label_column_name="label"):
+    """Fit the label normalization on the stored label arrays and apply it as a label override."""
+    from .norm import normalize_dataset
+    for dataset in [train_dataset, val_dataset, test_dataset]:
+        if dataset.labels is None:
+            raise ValueError(f"{dataset.data_path} has no numeric labels to normalize")
+    splits = [[{label_column_name: label} for label in dataset.labels.tolist()]
+              for dataset in [train_dataset, val_dataset, test_dataset]]
+    splits = normalize_dataset(*splits, method, label_column_name=label_column_name)
+    for dataset, split in zip([train_dataset, val_dataset, test_dataset], splits):
+        dataset.set_labels([e[label_column_name] for e in split])
+    return train_dataset, val_dataset, test_dataset
+
+
+def iter_file_records(file: str):
+    if file.endswith("csv"):
+        for chunk in pd.read_csv(file, chunksize=10000):
+            yield from chunk.to_dict("records")
+    else:
+        with open(file) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a dataset into the lmdb format used by --dataset_format lmdb")
+    parser.add_argument("--dataset", type=str, default=None, help="Huggingface dataset name or local dataset path")
+    parser.add_argument("--train_file", type=str, default=None, help="json lines or csv file")
+    parser.add_argument("--valid_file", type=str, default=None, help="json lines or csv file")
+    parser.add_argument("--test_file", type=str, default=None, help="json lines or csv file")
+    parser.add_argument("--sequence_column_name", type=str, default="aa_seq")
+    parser.add_argument("--label_column_name", type=str, default="label")
+    parser.add_argument("--out_dir", type=str, required=True, help="one lmdb directory per split is written here")
+    args = parser.parse_args()
+
+    sources = {}
+    if args.dataset is not None:
+        import datasets
+        raw_dataset = datasets.load_dataset(args.dataset)
+        sources = {split: raw_dataset[split] for split in SPLITS if split in raw_dataset}
+    for split, file in zip(SPLITS, [args.train_file, args.valid_file, args.test_file]):
+        if file is not None:
+            sources[split] = iter_file_records(file)
+
+    for split, records in sources.items():
+        num = write_lmdb(records, os.path.join(args.out_dir, split), args.sequence_column_name, args.label_column_name)
+        print(f"{split}: {num} records")
@@ -66,21 +66,9 @@ def _positional_embeddings(edge_index,
 
     
 
-def generate_graph(pdb_file, max_distance=10):
-    """
-    generate graph data from pdb file
-    
-    params:
-        pdb_file: pdb file path
-        max_distance: cut off
-    
-    return:
-        graph data
-    
-    """
+def _read_backbone(pdb_file):
     pdb_parser = PDB.PDBParser(QUIET=True)
     structure = pdb_parser.get_structure("protein", pdb_file)
-    model = structure[0]
 
     # extract amino acid sequence
     seq = []
@@ -95,11 +83,41 @@ def generate_graph(pdb_file, max_distance=10):
                     for atom_name in aa_coords.keys():
                         atom = residue[atom_name]
                         aa_coords[atom_name].append(atom.get_coord().tolist())
+    return seq, list(zip(aa_coords['N'], aa_coords['CA'], aa_coords['C'], aa_coords['O']))
+
+
+def _parsed_backbone(structure):
+    # standard residues of the first model, a missing backbone atom is an error as with Biopython
+    atom_names = ("N", "CA", "C", "O")
+    coords = structure.backbone_coords(atom_names, standard_only=True)
+    seq = structure.residue_names(standard_only=True).tolist()
+    missing = np.isnan(coords).any(axis=-1)
+    if missing.any():
+        residue, atom = np.argwhere(missing)[0]
+        raise KeyError(f"{atom_names[atom]} missing in residue {seq[residue]} {structure.residue_ids(standard_only=True)[residue]}")
+    return seq, coords
+
+
+def generate_graph(pdb_file, max_distance=10):
+    """
+    generate graph data from pdb file
+    
+    params:
+        pdb_file: pdb file path, or a ParsedStructure from src.mutation.structure
+        max_distance: cut off
+    
+    return:
+        graph data
+    
+    """
+    if isinstance(pdb_file, str):
+        seq, coords = _read_backbone(pdb_file)
+    else:
+        seq, coords = _parsed_backbone(pdb_file)
     aa_seq = "".join([seq1(aa) for aa in seq])
     
         
     # aa means amino acid
-    coords = list(zip(aa_coords['N'], aa_coords['CA'], aa_coords['C'], aa_coords['O']))
     coords = torch.tensor(coords)
     # mask out the missing coordinates
     mask = torch.isfinite(coords.sum(dim=(1,2)))
@@ -1,7 +1,9 @@
 import torch
 import os
+import queue
 import joblib
 import warnings
+import threading
 import pandas as pd
 import torch.nn.functional as F
 from tqdm import tqdm
@@ -10,11 +12,16 @@ from torch_geometric.data import Batch
 from torch_scatter import scatter_mean, scatter_sum, scatter_max
 from .encoder.gvp import AutoGraphEncoder
 from .utils.data_utils import convert_graph, BatchSampler, extract_seq_from_pdb
+from .utils.subgraph_cache import (
+    CACHE_SUFFIX, SubgraphCache, cache_path, collate_cached_subgraphs, source_digest, write_subgraph_cache
+)
 from .build_graph import generate_graph
 from .build_subgraph import generate_pos_subgraph
 from pathos.multiprocessing import Pool
 from pathos.threading import ThreadPool
 from pathlib import Path
+from collections import deque
+from src.utils.checkpoint import load_checkpoint
 
 def iter_parallel_map(func, data, workers: int = 2):
     pool = Pool(workers)
@@ -28,33 +35,58 @@ def threading_map(func, data, workers: int = 2):
     pool = ThreadPool(workers)
     return pool.map(func, data)
 
+def iter_bounded_parallel_map(func, data, workers: int = 2, window: int = None):
+    # imap submits all tasks at once and its results pile up while the consumer is slower than
+    # the workers, here at most two windows of tasks are in flight
+    # the pool is terminated when the generator finishes or is closed, so a consumer that stops
+    # early does not leave the remaining windows running
+    window = window or 2 * workers
+    pool = Pool(workers)
+    try:
+        pending = deque()
+        for start in range(0, len(data), window):
+            pending.append(pool.imap(func, data[start:start + window]))
+            if len(pending) == 2:
+                yield from pending.popleft()
+        while pending:
+            yield from pending.popleft()
+    finally:
+        pool.terminate()
+        pool.join()
+
 warnings.filterwarnings("ignore")
 
 
-def predict_sturcture(model, cluster_models, dataloader, device):
-    epoch_iterator = tqdm(dataloader)
-    struc_label_dict = {}
-    cluster_model_dict = {}
+def load_cluster_models(cluster_models):
+    return {
+        cluster_model_path.split("/")[-1].split(".")[0]: joblib.load(cluster_model_path)
+        for cluster_model_path in cluster_models
+    }
 
-    for cluster_model_path in cluster_models:
-        cluster_model_name = cluster_model_path.split("/")[-1].split(".")[0]
-        struc_label_dict[cluster_model_name] = []
-        cluster_model_dict[cluster_model_name] = joblib.load(cluster_model_path)
 
-    with torch.no_grad():
-        for batch in epoch_iterator:
-            batch.to(device)
-            h_V = (batch.node_s, batch.node_v)
-            h_E = (batch.edge_s, batch.edge_v)
+@torch.no_grad()
+def predict_batch(model, cluster_model_dict, batch, device):
+    batch.to(device)
+    h_V = (batch.node_s, batch.node_v)
+    h_E = (batch.edge_s, batch.edge_v)
+
+    node_emebddings = model.get_embedding(h_V, batch.edge_index, h_E)
+    graph_emebddings = scatter_mean(node_emebddings, batch.batch, dim=0).cpu()
+    norm_graph_emebddings = F.normalize(graph_emebddings, p=2, dim=1)
+    return {
+        name: cluster_model.predict(norm_graph_emebddings).tolist()
+        for name, cluster_model in cluster_model_dict.items()
+    }
 
-            node_emebddings = model.get_embedding(h_V, batch.edge_index, h_E)
-            graph_emebddings = scatter_mean(node_emebddings, batch.batch, dim=0).cpu()
-            norm_graph_emebddings = F.normalize(graph_emebddings, p=2, dim=1)
-            for name, cluster_model in cluster_model_dict.items():
-                batch_structure_labels = cluster_model.predict(
-                    norm_graph_emebddings
-                ).tolist()
-                struc_label_dict[name].extend(batch_structure_labels)
+
+def predict_sturcture(model, cluster_models, dataloader, device):
+    epoch_iterator = tqdm(dataloader)
+    cluster_model_dict = load_cluster_models(cluster_models)
+    struc_label_dict = {name: [] for name in cluster_model_dict}
+
+    for batch in epoch_iterator:
+        for name, batch_structure_labels in predict_batch(model, cluster_model_dict, batch, device).items():
+            struc_label_dict[name].extend(batch_structure_labels)
 
     return struc_label_dict
 
@@ -106,20 +138,19 @@ def subgraph_conventer(subgraph_dir, pdb_dir, max_batch_nodes, num_processes=12)
     
 
     def collate_fn(batch):
-        # TODO: speed up
+        # compact cache files are sliced, pickled {anchor: Data} dicts are still read
+        if all(d.endswith(CACHE_SUFFIX) for d in batch):
+            return collate_cached([(SubgraphCache(d), 0, None) for d in batch])
         batch_graphs = []
         for d in batch:
+            if d.endswith(CACHE_SUFFIX):
+                cache = SubgraphCache(d)
+                batch_graphs.extend(cache.subgraph(i) for i in range(len(cache)))
+                continue
             subgraph_dict = torch.load(d)
-            batch_graphs.extend(list(subgraph_dict.values()))
-
-        # graph has `index_map` or other redundant attributes, remove them
-        prue_batch_graphs = []
-        for d in batch_graphs:
-            prue_batch_graphs.append(convert_graph(d))
-
-        batch_graphs = Batch.from_data_list(prue_batch_graphs)
-        batch_graphs.node_s = torch.zeros_like(batch_graphs.node_s)
-        return batch_graphs
+            # graph has `index_map` or other redundant attributes, remove them
+            batch_graphs.extend(convert_graph(g) for g in subgraph_dict.values())
+        return collate_subgraphs(batch_graphs)
 
     data_loader = DataLoader(
         subgraph_files,
@@ -171,13 +202,13 @@ def graph_conventer(
             subgraph_dict[anchor] = subgraph
 
         subgraph_dict = dict(sorted(subgraph_dict.items(), key=lambda x: x[0]))
-        if cache_subgraph_dir:
-            torch.save(
-                subgraph_dict,
-                os.path.join(cache_subgraph_dir, f"{result_dict['name']}.pt"),
-            )
-            return [], result_dict, len(graph.node_s)
         subgraphs = list(subgraph_dict.values())
+        if cache_subgraph_dir:
+            subgraph_file = cache_path(cache_subgraph_dir, result_dict["name"])
+            os.makedirs(cache_subgraph_dir, exist_ok=True)
+            meta = {"subgraph_depth": subgraph_depth, "max_distance": max_distance, "source": source_digest(graph_file)}
+            write_subgraph_cache(subgraph_file, subgraphs, graph.aa_seq, meta)
+            return subgraph_file, result_dict, len(graph.node_s)
         return subgraphs, result_dict, len(graph.node_s)
 
     # multi process
@@ -193,19 +224,12 @@ def graph_conventer(
         node_counts.append(node_count)
     
     def collate_fn(batch):
-        batch_graphs = []
         if cache_subgraph_dir:
-            for d in batch:
-                name = d.split("/")[-1].split(".")[0]
-                graph = torch.load(os.path.join(cache_subgraph_dir, f"{name}.pt"))
-                batch_graphs.extend(graph.values())
-        else:
-            for d in batch:
-                batch_graphs.extend(d)
-
-        batch_graphs = Batch.from_data_list(batch_graphs)
-        batch_graphs.node_s = torch.zeros_like(batch_graphs.node_s)
-        return batch_graphs
+            return collate_cached([(SubgraphCache(d), 0, None) for d in batch])
+        batch_graphs = []
+        for d in batch:
+            batch_graphs.extend(d)
+        return collate_subgraphs(batch_graphs)
 
     data_loader = DataLoader(
         dataset,
@@ -217,6 +241,11 @@ def graph_conventer(
     return data_loader, results
 
 
+def _pdb_path(pdb_file):
+    # pdb files are paths or ParsedStructure objects from src.mutation.structure
+    return pdb_file if isinstance(pdb_file, str) else pdb_file.path
+
+
 def process_pdb_file(
     pdb_file,
     subgraph_depth,
@@ -225,7 +254,28 @@ def process_pdb_file(
     cache_subgraph_dir,
 ):
     result_dict, subgraph_dict = {}, {}
-    result_dict["name"] = pdb_file.split("/")[-1]
+    result_dict["name"] = _pdb_path(pdb_file).split("/")[-1]
+    # cached subgraphs are read by the collator, the graph is not built again
+    if cache_subgraph_dir is not None:
+        subgraph_file = cache_path(cache_subgraph_dir, result_dict["name"])
+        try:
+            meta = {
+                "subgraph_depth": subgraph_depth,
+                "max_distance": max_distance,
+                "source": source_digest(_pdb_path(pdb_file)),
+            }
+        except OSError as e:
+            result_dict["error"] = str(e)
+            return None, result_dict, 0
+        if os.path.exists(subgraph_file):
+            # stale, mismatched or corrupt caches are rebuilt
+            try:
+                cache = SubgraphCache(subgraph_file)
+                if cache.matches(meta):
+                    result_dict["aa_seq"] = cache.aa_seq
+                    return subgraph_file, result_dict, len(cache)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Rebuilding subgraph cache {subgraph_file}: {e}")
     # build graph, maybe lack of some atoms
     try:
         graph = generate_graph(pdb_file, max_distance)
@@ -255,16 +305,127 @@ def process_pdb_file(
     subgraph_dict = dict(sorted(subgraph_dict.items(), key=lambda x: x[0]))
 
     # cache graph
+    subgraphs = list(subgraph_dict.values())
     if cache_subgraph_dir is not None:
-        subgraph_file = os.path.join(
-            cache_subgraph_dir, f"{result_dict['name'].split('.')[0]}.pt"
-        )
-        torch.save(subgraph_dict, subgraph_file)
+        try:
+            os.makedirs(cache_subgraph_dir, exist_ok=True)
+            write_subgraph_cache(subgraph_file, subgraphs, graph.aa_seq, meta)
+        except (OSError, ValueError) as e:
+            # e.g. a structure without residues, reported in the error file
+            result_dict["error"] = str(e)
+            return None, result_dict, 0
         return subgraph_file, result_dict, len(anchor_nodes)
-    subgraphs = list(subgraph_dict.values())
     return subgraphs, result_dict, len(anchor_nodes)
 
 
+def save_error_file(pdb_files, error_file, error_proteins, error_messages, append=False):
+    # append adds the rows to an existing error file, the header is only written once
+    if not error_proteins:
+        return
+    print(f"---------- Save Error File ----------")
+    if error_file is None:
+        first_file = _pdb_path(pdb_files[0])
+        error_file = os.path.join(os.path.dirname(first_file), f"{os.path.basename(first_file).split('.')[0]}_error.csv")
+    os.makedirs(os.path.dirname(error_file), exist_ok=True)
+    append = append and os.path.exists(error_file)
+    pd.DataFrame({"name": error_proteins, "error": error_messages}).to_csv(
+        error_file, index=False, mode="a" if append else "w", header=not append
+    )
+
+
+def collate_subgraphs(subgraphs):
+    batch_graphs = Batch.from_data_list(subgraphs)
+    batch_graphs.node_s = torch.zeros_like(batch_graphs.node_s)
+    return batch_graphs
+
+
+def collate_cached(segments):
+    # (SubgraphCache, start, stop) ranges, sliced from the memory-mapped arrays
+    batch_graphs = collate_cached_subgraphs(segments)
+    batch_graphs.node_s = torch.zeros_like(batch_graphs.node_s)
+    return batch_graphs
+
+
+def pdb_batch_producer(
+    pdb_files,
+    subgraph_depth,
+    max_distance,
+    max_batch_nodes,
+    out_queue,
+    stop,
+    num_processes=12,
+    num_threads=12,
+    cache_subgraph_dir=None,
+):
+    """Stream the subgraphs of the pdb files into out_queue as collated batches.
+
+    Puts ("protein", result_dict, node_count) before the first batch holding subgraphs of a protein,
+    ("error", result_dict) for a pdb file without graph, ("batch", batch) for every batch of at most
+    max_batch_nodes subgraphs, and None at the end. Proteins larger than max_batch_nodes are split
+    over several batches. Blocks while out_queue is full, so only a few batches are held in memory.
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def handle_pdf_file(pdb_file):
+        return process_pdb_file(
+            pdb_file,
+            subgraph_depth,
+            max_distance,
+            num_threads,
+            cache_subgraph_dir,
+        )
+
+    # cached proteins are batched as subgraph ranges of their cache files
+    collate = collate_cached if cache_subgraph_dir is not None else collate_subgraphs
+    results = iter_bounded_parallel_map(handle_pdf_file, pdb_files, num_processes)
+    try:
+        pending, pending_nodes = [], 0
+        for pdb_subgraphs, result_dict, node_count in results:
+            if pdb_subgraphs is None:
+                if not put(("error", result_dict)):
+                    return
+                continue
+            cache = None
+            if cache_subgraph_dir is not None:
+                try:
+                    cache = SubgraphCache(pdb_subgraphs)
+                except (OSError, ValueError, KeyError) as e:
+                    result_dict["error"] = f"Unreadable subgraph cache {pdb_subgraphs}: {e}"
+                    if not put(("error", result_dict)):
+                        return
+                    continue
+            if not put(("protein", result_dict, node_count)):
+                return
+            start = 0
+            while start < node_count:
+                take = min(node_count - start, max_batch_nodes - pending_nodes)
+                if cache is not None:
+                    pending.append((cache, start, start + take))
+                else:
+                    pending.extend(pdb_subgraphs[start:start + take])
+                pending_nodes += take
+                start += take
+                if pending_nodes == max_batch_nodes:
+                    if not put(("batch", collate(pending))):
+                        return
+                    pending, pending_nodes = [], 0
+        if pending and not put(("batch", collate(pending))):
+            return
+        put(None)
+    except Exception as e:
+        put(("exception", e))
+    finally:
+        # stops the workers of an early return right away instead of when the generator is collected
+        results.close()
+
+
 def pdb_conventer(
     pdb_files,
     subgraph_depth,
@@ -300,30 +461,15 @@ def pdb_conventer(
         results.append(result_dict)
         node_counts.append(node_count)
         
-    # save the error file
-    if error_proteins:
-        print(f"---------- Save Error File ----------")
-        if error_file is None:
-            error_file = os.path.join(os.path.dirname(pdb_files[0]), f"{os.path.basename(pdb_files[0]).split('.')[0]}_error.csv")
-        os.makedirs(os.path.dirname(error_file), exist_ok=True)
-        pd.DataFrame({"name": error_proteins, "error": error_messages}).to_csv(
-            error_file, index=False
-        )
+    save_error_file(pdb_files, error_file, error_proteins, error_messages)
 
     def collate_fn(batch):
-        batch_graphs = []
         if cache_subgraph_dir is not None:
-            for d in batch:
-                name = d.split("/")[-1].split(".")[0]
-                graph = torch.load(os.path.join(cache_subgraph_dir, f"{name}.pt"))
-                batch_graphs.extend(graph.values())
-        else:
-            for d in batch:
-                batch_graphs.extend(d)
-
-        batch_graphs = Batch.from_data_list(batch_graphs)
-        batch_graphs.node_s = torch.zeros_like(batch_graphs.node_s)
-        return batch_graphs
+            return collate_cached([(SubgraphCache(d), 0, None) for d in batch])
+        batch_graphs = []
+        for d in batch:
+            batch_graphs.extend(d)
+        return collate_subgraphs(batch_graphs)
 
     data_loader = DataLoader(
         dataset,
@@ -402,53 +548,112 @@ class SSTPredictor:
             edge_h_dim=edge_dim,
             num_layers=6,
         )
-        if self.device == "cpu":
-            model.load_state_dict(torch.load(self.model_path, map_location=torch.device('cpu')))
-        else:
-            model.load_state_dict(torch.load(self.model_path))
-            model.to(self.device)
+        model.to(self.device)
+        model.load_state_dict(load_checkpoint(self.model_path, self.device))
         model.eval()
         self.model = model
         params = sum(p.numel() for p in model.parameters() if p.requires_grad) / 1e6
         print(f"MODEL: {params:.2f}M parameters")
         
         self.cluster_models = [os.path.join(self.cluster_dir, m) for m in self.cluster_model]
+        self._cluster_model_dict = None
 
     def predict_from_pdb(self, pdb_files, error_file=None, cache_subgraph_dir=None):
         """Predict structure from PDB files.
         
         Args:
-            pdb_files: Single PDB file path or list of PDB file paths
+            pdb_files: Single PDB file path or list of PDB file paths, parsed structures
+                (src.mutation.structure.ParsedStructure) are accepted as well
             error_file: Path to save error log
             cache_subgraph_dir: Directory to cache subgraphs
             
         Returns:
             List of dictionaries containing predictions for each PDB
         """
-        if isinstance(pdb_files, str):
-            pdb_files = [pdb_files]
-            
-        data_loader, results = pdb_conventer(
-            pdb_files, 
-            self.subgraph_depth, 
-            self.max_distance, 
-            self.max_batch_nodes, 
-            error_file, 
-            self.num_processes, 
-            self.num_threads, 
-            cache_subgraph_dir
-        )
+        return list(self.iter_predict_from_pdb(pdb_files, error_file, cache_subgraph_dir))
+
+    def iter_predict_from_pdb(self, pdb_files, error_file=None, cache_subgraph_dir=None, prefetch_batches=2, with_index=False,
+                              append_errors=False):
+        """Predict structure from PDB files, yielding the predictions of each PDB as it completes.
         
-        structures = predict_sturcture(self.model, self.cluster_models, data_loader, self.device)
+        The subgraphs are built by worker processes and streamed as batches of at most
+        max_batch_nodes subgraphs through a queue of prefetch_batches batches, the encoder
+        consumes them while the next ones are built. Memory stays flat in the number of PDBs.
         
-        start, end = 0, 0
-        for result in results:
-            end += len(result["aa_seq"])
-            for cluster_name, structure_labels in structures.items():
-                result[f"{cluster_name}_sst_seq"] = structure_labels[start:end]
-            start = end
+        Args:
+            pdb_files: Single PDB file path or list of PDB file paths, parsed structures
+                (src.mutation.structure.ParsedStructure) are accepted as well
+            error_file: Path to save error log
+            cache_subgraph_dir: Directory to cache subgraphs
+            prefetch_batches: Number of collated batches waiting for the encoder
+            with_index: Yield (position in pdb_files, predictions) pairs, names are not unique across directories
+            append_errors: Add the errors to error_file instead of replacing it, for repeated calls sharing one log
             
-        return results
+        Yields:
+            Dictionaries containing predictions for each PDB, in input order, PDBs without graph are skipped
+        """
+        if not isinstance(pdb_files, (list, tuple)):
+            pdb_files = [pdb_files]
+        if self._cluster_model_dict is None:
+            self._cluster_model_dict = load_cluster_models(self.cluster_models)
+        cluster_names = list(self._cluster_model_dict)
+
+        print("---------- Building Subgraphs ----------")
+        batches = queue.Queue(maxsize=prefetch_batches)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=pdb_batch_producer,
+            args=(pdb_files, self.subgraph_depth, self.max_distance, self.max_batch_nodes, batches, stop,
+                  self.num_processes, self.num_threads, cache_subgraph_dir),
+            daemon=True,
+        )
+        producer.start()
+
+        # proteins waiting for labels in input order: [result_dict, remaining subgraphs, labels per cluster, input index]
+        waiting = deque()
+        # the producer reports every pdb file once, as a protein or an error, in input order
+        input_index = 0
+        error_proteins, error_messages = [], []
+        progress = tqdm(total=len(pdb_files))
+        try:
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                if item[0] == "exception":
+                    raise item[1]
+                if item[0] == "error":
+                    error_proteins.append(item[1]["name"])
+                    error_messages.append(item[1]["error"])
+                    input_index += 1
+                    progress.update(1)
+                    continue
+                if item[0] == "protein":
+                    waiting.append([item[1], item[2], {name: [] for name in cluster_names}, input_index])
+                    input_index += 1
+                else:
+                    labels = predict_batch(self.model, self._cluster_model_dict, item[1], self.device)
+                    start = 0
+                    for protein in waiting:
+                        if start == len(labels[cluster_names[0]]):
+                            break
+                        take = min(protein[1], len(labels[cluster_names[0]]) - start)
+                        for name in cluster_names:
+                            protein[2][name].extend(labels[name][start:start + take])
+                        protein[1] -= take
+                        start += take
+                # the batches follow the input order, so the proteins complete in order
+                while waiting and waiting[0][1] == 0:
+                    result, _, structure_labels, index = waiting.popleft()
+                    for name in cluster_names:
+                        result[f"{name}_sst_seq"] = structure_labels[name]
+                    progress.update(1)
+                    yield (index, result) if with_index else result
+        finally:
+            stop.set()
+            progress.close()
+            producer.join()
+        save_error_file(pdb_files, error_file, error_proteins, error_messages, append=append_errors)
 
     def predict_from_graph(self, graph_dir, cache_subgraph_dir=None):
         """Predict structure from pre-built graph files.
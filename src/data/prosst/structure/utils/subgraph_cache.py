@@ -0,0 +1,167 @@
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+from torch_geometric.data import Batch, Data
+
+CACHE_SUFFIX = ".sgc"
+_MAGIC = b"SUBGRAPH"
+_ALIGN = 64
+
+
+def cache_path(cache_subgraph_dir, name):
+    """Cache file of a protein, name is the pdb file name with or without extension."""
+    return os.path.join(cache_subgraph_dir, f"{name.split('.')[0]}{CACHE_SUFFIX}")
+
+
+def source_digest(path):
+    """SHA-256 of the file the subgraphs are built from, stored with them to detect stale caches."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_subgraph_cache(path, subgraphs, aa_seq=None, meta=None):
+    """
+    Write the subgraphs of one protein as a compact cache file.
+
+    The node and edge features of all subgraphs are concatenated, the subgraph i owns the nodes
+    node_offsets[i]:node_offsets[i + 1] and the edges edge_offsets[i]:edge_offsets[i + 1]. The
+    edge index refers to the concatenated nodes. The file is a JSON header followed by the raw
+    arrays, aligned so they can be memory-mapped, nothing is pickled.
+
+    Args:
+        path: Cache file, written atomically
+        subgraphs: Pure subgraphs (node_s, node_v, edge_s, edge_v, edge_index) in anchor order
+        aa_seq: Residue sequence stored in the header, so the graph is not rebuilt on a cache hit
+        meta: JSON-serializable build parameters and source digest, compared by SubgraphCache.matches
+    """
+    if not subgraphs:
+        raise ValueError(f"No subgraphs to cache in {path}")
+    node_counts = [g.node_s.shape[0] for g in subgraphs]
+    edge_counts = [g.edge_index.shape[1] for g in subgraphs]
+    node_offsets = np.concatenate([[0], np.cumsum(node_counts)]).astype(np.int64)
+    edge_offsets = np.concatenate([[0], np.cumsum(edge_counts)]).astype(np.int64)
+    arrays = {
+        "node_s": np.concatenate([g.node_s.numpy() for g in subgraphs]).astype(np.float32),
+        "node_v": np.concatenate([g.node_v.numpy() for g in subgraphs]).astype(np.float32),
+        "edge_s": np.concatenate([g.edge_s.numpy() for g in subgraphs]).astype(np.float32),
+        "edge_v": np.concatenate([g.edge_v.numpy() for g in subgraphs]).astype(np.float32),
+        "edge_index": np.concatenate(
+            [g.edge_index.numpy() + offset for g, offset in zip(subgraphs, node_offsets)], axis=1
+        ).astype(np.int32),
+        "node_offsets": node_offsets,
+        "edge_offsets": edge_offsets,
+    }
+
+    # the header holds the array offsets, which depend on the header length
+    header = {"aa_seq": aa_seq, "meta": meta or {}, "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+    header_bytes = json.dumps(header).encode()
+    data_start = -(-(len(_MAGIC) + 8 + len(header_bytes)) // _ALIGN) * _ALIGN
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+
+class SubgraphCache:
+    """
+    Memory-mapped subgraphs of one protein, written by write_subgraph_cache.
+
+    Raises ValueError for files that are not subgraph caches or are truncated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"Not a subgraph cache file: {path}")
+            length_bytes = f.read(8)
+            if len(length_bytes) != 8:
+                raise ValueError(f"Truncated subgraph cache file: {path}")
+            header_length = int(np.frombuffer(length_bytes, dtype=np.uint64)[0])
+            try:
+                header = json.loads(f.read(header_length))
+            except ValueError as e:
+                raise ValueError(f"Corrupt subgraph cache header in {path}: {e}") from e
+        data_start = -(-(len(_MAGIC) + 8 + header_length) // _ALIGN) * _ALIGN
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        self.aa_seq = header["aa_seq"]
+        self.meta = header.get("meta", {})
+        self.arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            start = data_start + spec["offset"]
+            nbytes = int(np.prod(spec["shape"])) * dtype.itemsize
+            if start + nbytes > len(buffer):
+                raise ValueError(f"Truncated subgraph cache file: {path}")
+            self.arrays[name] = buffer[start:start + nbytes].view(dtype).reshape(spec["shape"])
+        self.node_offsets = self.arrays["node_offsets"]
+        self.edge_offsets = self.arrays["edge_offsets"]
+
+    def matches(self, meta):
+        """Whether the cache was built with the same parameters from the same source file."""
+        return self.aa_seq is not None and self.meta == meta
+
+    def __len__(self):
+        return len(self.node_offsets) - 1
+
+    def subgraph(self, i):
+        n0, n1 = int(self.node_offsets[i]), int(self.node_offsets[i + 1])
+        e0, e1 = int(self.edge_offsets[i]), int(self.edge_offsets[i + 1])
+        return Data(
+            node_s=torch.from_numpy(np.array(self.arrays["node_s"][n0:n1])),
+            node_v=torch.from_numpy(np.array(self.arrays["node_v"][n0:n1])),
+            edge_index=torch.from_numpy(self.arrays["edge_index"][:, e0:e1].astype(np.int64) - n0),
+            edge_s=torch.from_numpy(np.array(self.arrays["edge_s"][e0:e1])),
+            edge_v=torch.from_numpy(np.array(self.arrays["edge_v"][e0:e1])),
+        )
+
+
+def collate_cached_subgraphs(segments):
+    """
+    Batch of subgraph ranges of cached proteins, built by slicing the concatenated arrays.
+
+    Args:
+        segments: (SubgraphCache, start, stop) tuples, stop None for all subgraphs from start on
+
+    Returns:
+        torch_geometric Batch with node_s, node_v, edge_s, edge_v, edge_index, batch and ptr,
+        equal to Batch.from_data_list of the subgraphs
+    """
+    node_s, node_v, edge_s, edge_v, edge_index, node_counts = [], [], [], [], [], []
+    num_nodes = 0
+    for cache, start, stop in segments:
+        stop = len(cache) if stop is None else stop
+        n0, n1 = int(cache.node_offsets[start]), int(cache.node_offsets[stop])
+        e0, e1 = int(cache.edge_offsets[start]), int(cache.edge_offsets[stop])
+        node_s.append(cache.arrays["node_s"][n0:n1])
+        node_v.append(cache.arrays["node_v"][n0:n1])
+        edge_s.append(cache.arrays["edge_s"][e0:e1])
+        edge_v.append(cache.arrays["edge_v"][e0:e1])
+        edge_index.append(cache.arrays["edge_index"][:, e0:e1].astype(np.int64) + (num_nodes - n0))
+        node_counts.append(np.diff(cache.node_offsets[start:stop + 1]))
+        num_nodes += n1 - n0
+    node_counts = np.concatenate(node_counts)
+    return Batch(
+        node_s=torch.from_numpy(np.concatenate(node_s)),
+        node_v=torch.from_numpy(np.concatenate(node_v)),
+        edge_s=torch.from_numpy(np.concatenate(edge_s)),
+        edge_v=torch.from_numpy(np.concatenate(edge_v)),
+        edge_index=torch.from_numpy(np.concatenate(edge_index, axis=1)),
+        batch=torch.from_numpy(np.repeat(np.arange(len(node_counts)), node_counts)),
+        ptr=torch.from_numpy(np.concatenate([[0], np.cumsum(node_counts)])),
+    )
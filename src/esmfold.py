@@ -7,6 +7,7 @@ import pandas as pd
 from tqdm import tqdm
 from Bio import SeqIO
 from transformers import AutoTokenizer, EsmForProteinFolding
+from utils.fasta import FastaFile, iter_fasta
 
 from transformers.models.esm.openfold_utils.protein import to_pdb, Protein as OFProtein
 from transformers.models.esm.openfold_utils.feats import atom14_to_atom37
@@ -19,23 +20,9 @@ def read_multi_fasta(file_path):
     params:
         file_path: path to a fasta file
     return:
-        a dictionary of sequences
+        a dictionary of sequences, keys are the header lines
     """
-    sequences = {}
-    current_sequence = ''
-    with open(file_path, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if line.startswith('>'):
-                if current_sequence:
-                    sequences[header] = current_sequence
-                    current_sequence = ''
-                header = line
-            else:
-                current_sequence += line
-        if current_sequence:
-            sequences[header] = current_sequence
-    return sequences
+    return {f">{header}": sequence for header, sequence in iter_fasta(file_path)}
 
 def convert_outputs_to_pdb(outputs):
     final_atom_positions = atom14_to_atom37(outputs["positions"][-1], outputs)
@@ -88,20 +75,18 @@ if __name__ == '__main__':
     
     if args.fasta_file is not None:
         unfold_proteins = []
-        seq_dict = read_multi_fasta(args.fasta_file)
+        # sequences are read from disk one at a time through the byte offset index
+        fasta = FastaFile(args.fasta_file)
         os.makedirs(args.out_dir, exist_ok=True)
-        names, sequences = list(seq_dict.keys()), list(seq_dict.values())
+        start, end = 0, len(fasta)
         if args.fasta_chunk_num is not None:
-            chunk_size = len(names) // args.fasta_chunk_num + 1
-            start = args.fasta_chunk_id * chunk_size
-            end = min((args.fasta_chunk_id + 1) * chunk_size, len(names))
-            names, sequences = names[start:end], sequences[start:end]
+            start, end = fasta.shard(args.fasta_chunk_num, args.fasta_chunk_id)
         
         out_info_dict = {"name": [], "plddt": []}
-        bar = tqdm(zip(names, sequences))
+        bar = tqdm(fasta.iter_records(start, end), total=end - start)
         for name, sequence in bar:
             bar.set_description(name)
-            name = name[1:].split(" ")[0]
+            name = name.split(" ")[0]
             out_file = os.path.join(args.out_dir, f"{name}.ef.pdb")
             if os.path.exists(out_file):
                 out_info_dict["name"].append(name)
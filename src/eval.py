@@ -4,7 +4,9 @@ import os
 os.environ["HF_ENDPOINT"]="https://hf-mirror.com"
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 import argparse
+import functools
 import torch
+import numpy as np
 import re
 import json
 import os
@@ -26,6 +28,7 @@ from torch.utils.data import DataLoader
 from data.batch_sampler import BatchSampler
 from training.metrics import MultilabelF1Max
 from models.adapter_model import AdapterModel
+from utils.checkpoint import load_checkpoint
 from models.lora_model import LoraModel
 from peft import PeftModel
 from typing import Dict, Any, Union, Tuple
@@ -75,6 +78,44 @@ def evaluate(model, plm_model, metrics, dataloader, loss_function, device=None):
     metrics['loss'] = [epoch_loss]
     return metrics, pred_labels
 
+def process_data_line(data, args):
+    """Truncate and convert the labels of one test record, returns (record, token number)."""
+    # Use the column names from args if available, otherwise use defaults
+    sequence_column_name = getattr(args, 'sequence_column_name', 'aa_seq')
+    label_column_name = getattr(args, 'label_column_name', 'label')
+    
+    if args.problem_type == 'multi_label_classification':
+        label_list = data[label_column_name].split(',')
+        data[label_column_name] = [int(l) for l in label_list]
+        binary_list = [0] * args.num_labels
+        for index in data[label_column_name]:
+            binary_list[index] = 1
+        data[label_column_name] = binary_list
+    if args.max_seq_len is not None:
+        data[sequence_column_name] = data[sequence_column_name][:args.max_seq_len]
+        if args.use_foldseek:
+            data["foldseek_seq"] = data["foldseek_seq"][:args.max_seq_len]
+        if args.use_ss8:
+            data["ss8_seq"] = data["ss8_seq"][:args.max_seq_len]
+        # 如果是 ProSST 模型且有结构标记，也需要截断
+        if "ProSST" in args.plm_model and "prosst_stru_token" in data:
+            # 结构标记可能是字符串或列表形式
+            if isinstance(data["prosst_stru_token"], str):
+
+                pass
+            elif isinstance(data["prosst_stru_token"], (list, tuple, np.ndarray)):
+                data["prosst_stru_token"] = data["prosst_stru_token"][:args.max_seq_len]
+        token_num = min(len(data[sequence_column_name]), args.max_seq_len)
+    else:
+        token_num = len(data[sequence_column_name])
+    return data, token_num
+
+
+def process_lmdb_record(data, args):
+    # module level so DataLoader workers can pickle it under the spawn start method
+    return process_data_line(data, args)[0]
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
@@ -94,6 +135,7 @@ if __name__ == '__main__':
     parser.add_argument('--sequence_column_name', type=str, default=None, help='sequence column name')
     parser.add_argument('--label_column_name', type=str, default=None, help='label column name')
     parser.add_argument('--test_file', type=str, default=None, help='test file')
+    parser.add_argument('--dataset_format', type=str, default=None, choices=['hf', 'lmdb'], help='lmdb reads test_file as an lmdb directory')
     parser.add_argument('--split', type=str, default=None, help='split name in Huggingface')
     parser.add_argument('--test_result_dir', type=str, default=None, help='test result directory')
     parser.add_argument('--metrics', type=str, default=None, help='computation metrics')
@@ -225,13 +267,15 @@ if __name__ == '__main__':
         model_path = args.model_path
     else:
         model_path = f"{args.output_root}/{args.output_dir}/{args.output_model_name}"
+    # move the model first, the weights are then loaded straight onto the device
+    model.to(device)
     if args.eval_method == "full":
-        model_weights = torch.load(model_path)
+        model_weights = load_checkpoint(model_path, device)
         model.load_state_dict(model_weights['model_state_dict'])
         plm_model.load_state_dict(model_weights['plm_state_dict'])
     else:
-        model.load_state_dict(torch.load(model_path))
-    model.to(device).eval()
+        model.load_state_dict(load_checkpoint(model_path, device))
+    model.eval()
     
     if args.eval_method == 'plm-lora':
         lora_path = model_path.replace(".pt", "_lora")
@@ -289,9 +333,12 @@ if __name__ == '__main__':
                     tokens = list(map(int, seq_clean.split(','))) if seq_clean else []
                 elif isinstance(stru_token, (list, tuple)):
                     tokens = [int(x) for x in stru_token]
+                elif isinstance(stru_token, np.ndarray):
+                    # packed array read from lmdb
+                    tokens = stru_token.astype(np.int64)
                 else:
                     tokens = []
-                prosst_stru_tokens.append(torch.tensor(tokens))
+                prosst_stru_tokens.append(torch.as_tensor(tokens))
             
             if 'prot_bert' in args.plm_model or "prot_t5" in args.plm_model:
                 aa_seq = " ".join(list(aa_seq))
@@ -366,43 +413,12 @@ if __name__ == '__main__':
         
     loss_function = nn.CrossEntropyLoss()
     
-    def process_data_line(data):
-        # Use the column names from args if available, otherwise use defaults
-        sequence_column_name = getattr(args, 'sequence_column_name', 'aa_seq')
-        label_column_name = getattr(args, 'label_column_name', 'label')
-        
-        if args.problem_type == 'multi_label_classification':
-            label_list = data[label_column_name].split(',')
-            data[label_column_name] = [int(l) for l in label_list]
-            binary_list = [0] * args.num_labels
-            for index in data[label_column_name]:
-                binary_list[index] = 1
-            data[label_column_name] = binary_list
-        if args.max_seq_len is not None:
-            data[sequence_column_name] = data[sequence_column_name][:args.max_seq_len]
-            if args.use_foldseek:
-                data["foldseek_seq"] = data["foldseek_seq"][:args.max_seq_len]
-            if args.use_ss8:
-                data["ss8_seq"] = data["ss8_seq"][:args.max_seq_len]
-            # 如果是 ProSST 模型且有结构标记，也需要截断
-            if "ProSST" in args.plm_model and "prosst_stru_token" in data:
-                # 结构标记可能是字符串或列表形式
-                if isinstance(data["prosst_stru_token"], str):
-
-                    pass
-                elif isinstance(data["prosst_stru_token"], (list, tuple)):
-                    data["prosst_stru_token"] = data["prosst_stru_token"][:args.max_seq_len]
-            token_num = min(len(data[sequence_column_name]), args.max_seq_len)
-        else:
-            token_num = len(data[sequence_column_name])
-        return data, token_num
-    
     # process dataset from json file
     def process_dataset_from_json(file):
         dataset, token_nums = [], []
         for l in open(file):
             data = json.loads(l)
-            data, token_num = process_data_line(data)
+            data, token_num = process_data_line(data, args)
             dataset.append(data)
             token_nums.append(token_num)
         return dataset, token_nums
@@ -412,13 +428,22 @@ if __name__ == '__main__':
     def process_dataset_from_list(data_list):
         dataset, token_nums = [], []
         for l in data_list:
-            data, token_num = process_data_line(l)
+            data, token_num = process_data_line(l, args)
             dataset.append(data)
             token_nums.append(token_num)
         return dataset, token_nums
     
     
-    if args.test_file.endswith('json'):
+    if args.dataset_format == 'lmdb' or args.test_file.endswith('.lmdb'):
+        # records are decoded lazily in the DataLoader workers
+        from data.lmdb_dataset import LMDBDataset
+        test_dataset = LMDBDataset(args.test_file, transform=functools.partial(process_lmdb_record, args=args))
+        test_token_num = test_dataset.lengths.tolist()
+        if args.max_seq_len is not None:
+            test_token_num = [min(n, args.max_seq_len) for n in test_token_num]
+        if args.test_result_dir:
+            test_result_df = test_dataset.to_dataframe(exclude_columns=["prosst_stru_token", "esm3_structure_seq"])
+    elif args.test_file.endswith('json'):
         test_dataset, test_token_num = process_dataset_from_json(args.test_file)
     elif args.test_file.endswith('csv'):
         test_dataset, test_token_num = process_dataset_from_list(load_dataset("csv", data_files=args.test_file)['train'])
@@ -6,6 +6,7 @@ from typing import Tuple
 from .pooling import Attention1dPoolingHead, MeanPoolingHead, LightAttentionPoolingHead
 from .pooling import MeanPooling, MeanPoolingProjection
 from .pooling import ResidueClassificationHeadWithProjection
+from .pooling import pack_padded, unpack_to_padded
 
 def rotate_half(x):
     x1, x2 = x.chunk(2, dim=-1)
@@ -32,32 +33,31 @@ class RotaryEmbedding(nn.Module):
         inv_freq = inv_freq
         self.register_buffer("inv_freq", inv_freq)
 
-        self._seq_len_cached = None
-        self._cos_cached = None
-        self._sin_cached = None
+        # one table per (device, dtype), grown to the longest sequence seen and sliced for shorter ones
+        self._tables = {}
 
     def _update_cos_sin_tables(self, x, seq_dimension=2):
         seq_len = x.shape[seq_dimension]
+        key = (x.device, x.dtype)
+        cos, sin = self._tables.get(key, (None, None))
 
-        # Reset the tables if the sequence length has changed,
-        # or if we're on a new device (possibly due to tracing for instance)
-        if seq_len != self._seq_len_cached or self._cos_cached.device != x.device:
-            self._seq_len_cached = seq_len
-            t = torch.arange(x.shape[seq_dimension], device=x.device).type_as(self.inv_freq)
-            freqs = torch.outer(t, self.inv_freq)
-            emb = torch.cat((freqs, freqs), dim=-1).to(x.device)
+        if cos is None or cos.shape[-2] < seq_len:
+            t = torch.arange(seq_len, device=x.device).type_as(self.inv_freq)
+            freqs = torch.outer(t, self.inv_freq.to(x.device))
+            emb = torch.cat((freqs, freqs), dim=-1)
 
-            self._cos_cached = emb.cos()[None, None, :, :]
-            self._sin_cached = emb.sin()[None, None, :, :]
+            cos = emb.cos()[None, None, :, :].to(x.dtype)
+            sin = emb.sin()[None, None, :, :].to(x.dtype)
+            self._tables[key] = (cos, sin)
 
-        return self._cos_cached, self._sin_cached
+        return cos[:, :, :seq_len, :], sin[:, :, :seq_len, :]
 
     def forward(self, q: torch.Tensor, k: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
-        self._cos_cached, self._sin_cached = self._update_cos_sin_tables(k, seq_dimension=-2)
+        cos, sin = self._update_cos_sin_tables(k, seq_dimension=-2)
 
         return (
-            apply_rotary_pos_emb(q, self._cos_cached, self._sin_cached),
-            apply_rotary_pos_emb(k, self._cos_cached, self._sin_cached),
+            apply_rotary_pos_emb(q, cos, sin),
+            apply_rotary_pos_emb(k, cos, sin),
         )
 
 
@@ -89,22 +89,34 @@ class CrossModalAttention(nn.Module):
         key_layer = self.transpose_for_scores(self.key_proj(key))
         value_layer = self.transpose_for_scores(self.value_proj(value))
         query_layer = self.transpose_for_scores(self.query_proj(query))
-        query_layer = query_layer * self.attention_head_size**-0.5
         
+        # the rotation is linear, so scaling the query before or after it gives the same scores
         query_layer, key_layer = self.rotary_embeddings(query_layer, key_layer)
         
-        # Take the dot product between "query" and "key" to get the raw attention scores.
-        attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
-        
         if attention_mask is not None:
             attention_mask = attention_mask.unsqueeze(1).unsqueeze(2)
-            attention_scores = attention_scores.masked_fill(attention_mask == 0, float('-inf'))
         
-        attention_probs = F.softmax(attention_scores, dim=-1)
-        # This is actually dropping out entire tokens to attend to, which might
-        # seem a bit unusual, but is taken from the original Transformer paper.
-        attention_probs = self.dropout(attention_probs)
-        context_layer = torch.matmul(attention_probs, value_layer)
+        if output_attentions:
+            # explicit path, the only one that can return the attention probabilities
+            query_layer = query_layer * self.attention_head_size**-0.5
+            # Take the dot product between "query" and "key" to get the raw attention scores.
+            attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
+            
+            if attention_mask is not None:
+                attention_scores = attention_scores.masked_fill(attention_mask == 0, float('-inf'))
+            
+            attention_probs = F.softmax(attention_scores, dim=-1)
+            # This is actually dropping out entire tokens to attend to, which might
+            # seem a bit unusual, but is taken from the original Transformer paper.
+            attention_probs = self.dropout(attention_probs)
+            context_layer = torch.matmul(attention_probs, value_layer)
+        else:
+            # fused kernel, never materialises the B x H x L x L score tensor
+            context_layer = F.scaled_dot_product_attention(
+                query_layer, key_layer, value_layer,
+                attn_mask=attention_mask.bool() if attention_mask is not None else None,
+                dropout_p=self.dropout.p if self.training else 0.0,
+            )
 
         context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
         new_context_layer_shape = context_layer.size()[:-2] + (self.hidden_size,)
@@ -167,12 +179,16 @@ class AdapterModel(nn.Module):
         torch.cuda.empty_cache()
         return seq_embeds
     
-    def forward(self, plm_model, batch):
-        if "ProSST" in self.args.plm_model:
-            aa_seq, attention_mask, stru_tokens = batch['aa_seq_input_ids'], batch['aa_seq_attention_mask'], batch['aa_seq_stru_tokens']
+    def forward(self, plm_model, batch, seq_embeds=None):
+        # seq_embeds can be passed in when several adapters share one forward pass of the same PLM
+        attention_mask = batch['aa_seq_attention_mask']
+        if seq_embeds is not None:
+            pass
+        elif "ProSST" in self.args.plm_model:
+            aa_seq, stru_tokens = batch['aa_seq_input_ids'], batch['aa_seq_stru_tokens']
             seq_embeds = self.plm_embedding(plm_model, aa_seq, attention_mask, stru_tokens)
         else:
-            aa_seq, attention_mask = batch['aa_seq_input_ids'], batch['aa_seq_attention_mask']
+            aa_seq = batch['aa_seq_input_ids']
             seq_embeds = self.plm_embedding(plm_model, aa_seq, attention_mask)
 
         if 'foldseek_seq' in self.args.structure_seq:
@@ -215,9 +231,27 @@ class AdapterModel(nn.Module):
             embeds = self.layer_norm(embeds)
         
         if self.args.structure_seq:
-            logits = self.classifier(embeds, attention_mask)
+            logits = self.classify(embeds, attention_mask, batch.get('aa_seq_cu_seqlens'))
         else:
-            logits = self.classifier(seq_embeds, attention_mask)            
+            logits = self.classify(seq_embeds, attention_mask, batch.get('aa_seq_cu_seqlens'))
+        
+        return logits
+
+    def classify(self, embeds, attention_mask, cu_seqlens=None):
+        """
+        Run the classifier on padded embeddings, or on packed ones when the collator provides cu_seqlens.
+        In packed mode the pad positions are dropped before the head and residue logits are scattered
+        back to the padded layout, so the output matches the padded path.
         
+        Only the head is packed. The PLM encoders are Hugging Face models without variable length
+        attention and still run on the padded batch, so the saving is bounded by the share of the
+        head in the step, see benchmark_packed_pooling.py.
+        """
+        if cu_seqlens is None or not getattr(self.classifier, "supports_packed", True):
+            return self.classifier(embeds, attention_mask)
+        packed = pack_padded(embeds, attention_mask)
+        logits = self.classifier(packed, attention_mask, cu_seqlens=cu_seqlens)
+        if "residue" in self.args.problem_type:
+            logits = unpack_to_padded(logits, attention_mask, fill_value=-1e9)
         return logits
        
\ No newline at end of file
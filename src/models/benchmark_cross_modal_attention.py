@@ -0,0 +1,119 @@
+"""
+Compare the fused scaled_dot_product_attention path of CrossModalAttention with the explicit
+matmul/softmax path (output_attentions=True, the implementation used before) on random padded batches.
+
+Every path runs in its own process, the reported memory is the peak resident memory of that
+process (or the peak CUDA memory with --device cuda). Both paths start from the same weights and
+inputs, their outputs are compared at the end.
+
+    python src/models/benchmark_cross_modal_attention.py --batch_size 16 --max_len 1024 --hidden_size 512
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import resource
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_inputs(args, device):
+    import torch
+    generator = torch.Generator().manual_seed(args.seed)
+    # lengths between max_len / 4 and max_len, as in a padded batch of proteins
+    lengths = torch.randint(args.max_len // 4, args.max_len + 1, (args.batch_size,), generator=generator)
+    lengths[0] = args.max_len
+    attention_mask = (torch.arange(args.max_len)[None, :] < lengths[:, None]).long()
+    query = torch.randn(args.batch_size, args.max_len, args.hidden_size, generator=generator)
+    key = torch.randn(args.batch_size, args.max_len, args.hidden_size, generator=generator)
+    return query.to(device), key.to(device), attention_mask.to(device)
+
+
+def run_method(method, args, result_queue):
+    import torch
+    from models.adapter_model import CrossModalAttention
+
+    device = torch.device(args.device)
+    torch.manual_seed(args.seed)
+    config = SimpleNamespace(
+        hidden_size=args.hidden_size, num_attention_head=args.num_heads, attention_probs_dropout=0.0
+    )
+    model = CrossModalAttention(config).to(device).eval()
+    query, key, attention_mask = make_inputs(args, device)
+    output_attentions = method == "explicit"
+
+    def step():
+        if args.backward:
+            query.requires_grad_(True)
+            output = model(query, key, key, attention_mask, output_attentions=output_attentions)
+            output = output[0] if output_attentions else output
+            output.sum().backward()
+            return output.detach()
+        with torch.no_grad():
+            output = model(query, key, key, attention_mask, output_attentions=output_attentions)
+        return output[0] if output_attentions else output
+
+    # warm up kernels and the rotary tables
+    step()
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+    begin = time.perf_counter()
+    for _ in range(args.repeats):
+        output = step()
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elapsed = (time.perf_counter() - begin) / args.repeats
+
+    if device.type == "cuda":
+        peak = torch.cuda.max_memory_allocated(device)
+    else:
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    result_queue.put((output.float().cpu().numpy(), elapsed, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fused against explicit cross-modal attention")
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--max_len", type=int, default=1024)
+    parser.add_argument("--hidden_size", type=int, default=512)
+    parser.add_argument("--num_heads", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--backward", action="store_true", help="Time forward and backward passes")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--seed", type=int, default=3407)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for method in ["fused", "explicit"]:
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=run_method, args=(method, args, result_queue))
+        process.start()
+        # the output is large, read it before joining so the child can flush the queue
+        result = None
+        while result is None and (process.is_alive() or not result_queue.empty()):
+            try:
+                result = result_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+        process.join()
+        if result is None:
+            print(f"{method}: failed with exit code {process.exitcode} (out of memory?)")
+            continue
+        results[method] = result
+        _, elapsed, peak = results[method]
+        print(f"{method:>8}: time={elapsed * 1000:.1f}ms peak_memory={peak / (1 << 20):.1f}MB")
+
+    if len(results) == 2:
+        import numpy as np
+        error = np.abs(results["fused"][0] - results["explicit"][0]).max()
+        print(f"max |fused - explicit| = {error:.2e}")
+
+
+if __name__ == "__main__":
+    main()
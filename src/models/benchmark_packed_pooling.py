@@ -0,0 +1,143 @@
+"""
+Compare the packed (padding free) and the padded classifier path of AdapterModel.classify on
+batches of variable length sequences.
+
+The packed mode only changes the pooling head, the PLM still runs on the padded batch. With
+--plm_model the embeddings come from that PLM and its padded forward pass is timed as well, so the
+share of the step that packing can save is visible.
+
+    python src/models/benchmark_packed_pooling.py --pooling_method attention1d --batch_size 32 --max_len 1024
+    python src/models/benchmark_packed_pooling.py --plm_model facebook/esm2_t12_35M_UR50D --device cuda
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def make_lengths(args, generator):
+    import torch
+    # lengths between min_len and max_len, as in a padded batch of proteins
+    lengths = torch.randint(args.min_len, args.max_len + 1, (args.batch_size,), generator=generator)
+    lengths[0] = args.max_len
+    return lengths
+
+
+def make_embeddings(args, lengths, generator, device):
+    import torch
+    attention_mask = (torch.arange(args.max_len)[None, :] < lengths[:, None]).long()
+    embeds = torch.randn(args.batch_size, args.max_len, args.hidden_size, generator=generator)
+    return embeds.to(device), attention_mask.to(device)
+
+
+def plm_embeddings(args, lengths, generator, device):
+    """Embeddings of random sequences from the PLM, and the time of its padded forward pass."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.plm_model)
+    model = AutoModel.from_pretrained(args.plm_model).to(device).eval()
+    sequences = [
+        "".join(AMINO_ACIDS[i] for i in torch.randint(len(AMINO_ACIDS), (int(length),), generator=generator))
+        for length in lengths
+    ]
+    inputs = tokenizer(sequences, return_tensors="pt", padding=True).to(device)
+
+    def forward():
+        with torch.no_grad():
+            return model(**inputs).last_hidden_state
+
+    embeds, elapsed = timed(forward, args.repeats, device)
+    return embeds, inputs["attention_mask"], elapsed
+
+
+def timed(func, repeats, device):
+    import torch
+    # warm up kernels
+    output = func()
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    begin = time.perf_counter()
+    for _ in range(repeats):
+        output = func()
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    return output, (time.perf_counter() - begin) / repeats
+
+
+def build_head(args, hidden_size):
+    from models.pooling import Attention1dPoolingHead, MeanPoolingHead, ResidueClassificationHeadWithProjection
+    if "residue" in args.problem_type:
+        return ResidueClassificationHeadWithProjection(hidden_size, args.num_labels, 0.0, hidden_size)
+    if args.pooling_method == "attention1d":
+        return Attention1dPoolingHead(hidden_size, args.num_labels, 0.0)
+    return MeanPoolingHead(hidden_size, args.num_labels, 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark packed against padded pooling heads")
+    parser.add_argument("--pooling_method", type=str, default="mean", choices=["mean", "attention1d"])
+    parser.add_argument("--problem_type", type=str, default="single_label_classification",
+                        help="A residue_* problem type benchmarks the residue classification head")
+    parser.add_argument("--num_labels", type=int, default=2)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--min_len", type=int, default=64)
+    parser.add_argument("--max_len", type=int, default=1024)
+    parser.add_argument("--hidden_size", type=int, default=1280, help="Ignored with --plm_model")
+    parser.add_argument("--plm_model", type=str, default=None, help="Hugging Face PLM for real embeddings")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--seed", type=int, default=3407)
+    args = parser.parse_args()
+
+    import torch
+    from models.adapter_model import AdapterModel
+    from models.pooling import cu_seqlens_from_mask
+
+    device = torch.device(args.device)
+    generator = torch.Generator().manual_seed(args.seed)
+    torch.manual_seed(args.seed)
+    lengths = make_lengths(args, generator)
+    if args.plm_model:
+        embeds, attention_mask, plm_elapsed = plm_embeddings(args, lengths, generator, device)
+        print(f"     plm: time={plm_elapsed * 1000:.1f}ms (padded, shared by both paths)")
+    else:
+        embeds, attention_mask = make_embeddings(args, lengths, generator, device)
+    cu_seqlens = cu_seqlens_from_mask(attention_mask)
+    tokens = int(attention_mask.sum())
+    print(f"  tokens: {tokens} of {attention_mask.numel()} padded positions ({tokens / attention_mask.numel():.0%})")
+
+    # AdapterModel.classify only reads the classifier and the problem type
+    model = SimpleNamespace(
+        classifier=build_head(args, embeds.shape[-1]).to(device).eval(),
+        args=SimpleNamespace(problem_type=args.problem_type),
+    )
+    results = {}
+    for method, method_cu_seqlens in [("padded", None), ("packed", cu_seqlens)]:
+        def step():
+            with torch.no_grad():
+                return AdapterModel.classify(model, embeds, attention_mask, method_cu_seqlens)
+
+        if device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(device)
+        logits, elapsed = timed(step, args.repeats, device)
+        peak = torch.cuda.max_memory_allocated(device) / (1 << 20) if device.type == "cuda" else None
+        results[method] = logits
+        memory = f" peak_memory={peak:.1f}MB" if peak is not None else ""
+        print(f"{method:>8}: time={elapsed * 1000:.2f}ms{memory}")
+
+    padded, packed = results["padded"], results["packed"]
+    if "residue" in args.problem_type:
+        # only the real positions carry predictions, pads are -1e9 in both layouts
+        valid = attention_mask.bool()
+        padded, packed = padded[valid], packed[valid]
+    print(f"max |padded - packed| = {(padded - packed).abs().max().item():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,41 @@ import torch.nn as nn
 import torch.nn.functional as F
 from transformers.activations import ACT2FN
 
+def cu_seqlens_from_mask(input_mask):
+    """Cumulative sequence lengths [batch_size + 1] of a padded [batch_size, seq_len] mask."""
+    lengths = input_mask.sum(dim=1, dtype=torch.int32)
+    return F.pad(torch.cumsum(lengths, dim=0, dtype=torch.int32), (1, 0))
+
+
+def pack_padded(features, input_mask):
+    """[batch_size, seq_len, hidden_size] -> [total_tokens, hidden_size], sequences one after another."""
+    return features[input_mask.bool()]
+
+
+def unpack_to_padded(packed, input_mask, fill_value=0.0):
+    """Inverse of pack_padded, padded positions are set to fill_value."""
+    padded = packed.new_full(input_mask.shape + packed.shape[1:], fill_value)
+    padded[input_mask.bool()] = packed
+    return padded
+
+
+def segment_ids(cu_seqlens, total_tokens):
+    """Sequence index of every packed token."""
+    lengths = (cu_seqlens[1:] - cu_seqlens[:-1]).long()
+    return torch.repeat_interleave(torch.arange(len(lengths), device=cu_seqlens.device), lengths, output_size=total_tokens)
+
+
+def segment_sum(x, seg_ids, num_segments):
+    return x.new_zeros((num_segments,) + x.shape[1:]).index_add_(0, seg_ids, x)
+
+
+def segment_softmax(scores, seg_ids, num_segments):
+    """Softmax of packed [total_tokens] scores within each sequence."""
+    seg_max = scores.new_full((num_segments,), float("-inf")).scatter_reduce(0, seg_ids, scores, reduce="amax")
+    exp = torch.exp(scores - seg_max[seg_ids])
+    return exp / segment_sum(exp, seg_ids, num_segments)[seg_ids]
+
+
 class MaskedConv1d(nn.Conv1d):
     """A masked 1-dimensional convolution layer.
 
@@ -56,7 +91,14 @@ class Attention1dPooling(nn.Module):
         super().__init__()
         self.layer = MaskedConv1d(hidden_size, 1, 1)
 
-    def forward(self, x, input_mask=None):
+    def forward(self, x, input_mask=None, cu_seqlens=None):
+        if cu_seqlens is not None:
+            # packed [total_tokens, hidden_size] input, a kernel size 1 convolution is a per token projection
+            num_segments = len(cu_seqlens) - 1
+            seg_ids = segment_ids(cu_seqlens, x.shape[0])
+            attn = F.linear(x, self.layer.weight.squeeze(-1), self.layer.bias).squeeze(-1)
+            attn = segment_softmax(attn, seg_ids, num_segments)
+            return segment_sum(attn.unsqueeze(-1) * x, seg_ids, num_segments)
         batch_szie = x.shape[0]
         attn = self.layer(x)
         attn = attn.view(batch_szie, -1)
@@ -93,7 +135,10 @@ class Attention1dPoolingHead(nn.Module):
         self.attention1d = Attention1dPooling(hidden_size)
         self.attention1d_projection = Attention1dPoolingProjection(hidden_size, num_labels, dropout)
 
-    def forward(self, x, input_mask=None):
+    def forward(self, x, input_mask=None, cu_seqlens=None):
+        if cu_seqlens is not None:
+            x = self.attention1d(x, cu_seqlens=cu_seqlens)
+            return self.attention1d_projection(x)
         x = self.attention1d(x, input_mask=input_mask.unsqueeze(-1))
         x = self.attention1d_projection(x)
         return x
@@ -104,7 +149,13 @@ class MeanPooling(nn.Module):
     def __init__(self):
         super().__init__()
 
-    def forward(self, features, input_mask=None):
+    def forward(self, features, input_mask=None, cu_seqlens=None):
+        if cu_seqlens is not None:
+            # packed [total_tokens, hidden_size] input, average within each sequence
+            num_segments = len(cu_seqlens) - 1
+            sum_features = segment_sum(features, segment_ids(cu_seqlens, features.shape[0]), num_segments)
+            lengths = (cu_seqlens[1:] - cu_seqlens[:-1]).unsqueeze(-1)
+            return sum_features / lengths
         if input_mask is not None:
             # Applying input_mask to zero out masked values
             masked_features = features * input_mask.unsqueeze(2)
@@ -141,8 +192,8 @@ class MeanPoolingHead(nn.Module):
         self.mean_pooling = MeanPooling()
         self.mean_pooling_projection = MeanPoolingProjection(hidden_size, num_labels, dropout)
 
-    def forward(self, features, input_mask=None):
-        mean_pooling_features = self.mean_pooling(features, input_mask=input_mask)
+    def forward(self, features, input_mask=None, cu_seqlens=None):
+        mean_pooling_features = self.mean_pooling(features, input_mask=input_mask, cu_seqlens=cu_seqlens)
         x = self.mean_pooling_projection(mean_pooling_features)
         return x
 
@@ -169,6 +220,9 @@ class LightAttentionPoolingHead(nn.Module):
 
         self.output = nn.Linear(32, num_labels)
 
+    # the convolutions read the neighbouring positions, padding included, so packed input is not supported
+    supports_packed = False
+
     def forward(self, x: torch.Tensor, mask, **kwargs) -> torch.Tensor:
         """
         Args:
@@ -215,13 +269,15 @@ class ResidueClassificationHead(nn.Module):
         self.dropout = nn.Dropout(dropout)
         self.classifier = nn.Linear(hidden_size, num_labels)
         
-    def forward(self, features: torch.Tensor, attention_mask: torch.Tensor = None) -> torch.Tensor:
+    def forward(self, features: torch.Tensor, attention_mask: torch.Tensor = None, cu_seqlens: torch.Tensor = None) -> torch.Tensor:
         """
         Forward pass for residue-level classification.
         
         Args:
             features (torch.Tensor): Hidden states from the model [batch_size, seq_len, hidden_size]
             attention_mask (torch.Tensor, optional): Attention mask [batch_size, seq_len]
+            cu_seqlens (torch.Tensor, optional): Cumulative sequence lengths when features are packed
+                [total_tokens, hidden_size], the logits are then packed as well and need no masking
             
         Returns:
             torch.Tensor: Logits for each residue position [batch_size, seq_len, num_labels]
@@ -233,7 +289,7 @@ class ResidueClassificationHead(nn.Module):
         logits = self.classifier(features)  # [batch_size, seq_len, num_labels]
         
         # If attention mask is provided, mask out padded positions
-        if attention_mask is not None:
+        if attention_mask is not None and cu_seqlens is None:
             # Create mask for padded positions (where attention_mask is 0)
             mask = attention_mask.unsqueeze(-1).expand(-1, -1, logits.size(-1))
             # Set logits for padded positions to a large negative value
@@ -271,13 +327,15 @@ class ResidueClassificationHeadWithProjection(nn.Module):
         # Classification layer
         self.classifier = nn.Linear(intermediate_size, num_labels)
         
-    def forward(self, features: torch.Tensor, attention_mask: torch.Tensor = None) -> torch.Tensor:
+    def forward(self, features: torch.Tensor, attention_mask: torch.Tensor = None, cu_seqlens: torch.Tensor = None) -> torch.Tensor:
         """
         Forward pass for enhanced residue-level classification.
         
         Args:
             features (torch.Tensor): Hidden states from the model [batch_size, seq_len, hidden_size]
             attention_mask (torch.Tensor, optional): Attention mask [batch_size, seq_len]
+            cu_seqlens (torch.Tensor, optional): Cumulative sequence lengths when features are packed
+                [total_tokens, hidden_size], the logits are then packed as well and need no masking
             
         Returns:
             torch.Tensor: Logits for each residue position [batch_size, seq_len, num_labels]
@@ -294,7 +352,7 @@ class ResidueClassificationHeadWithProjection(nn.Module):
         logits = self.classifier(features)  # [batch_size, seq_len, num_labels]
         
         # If attention mask is provided, mask out padded positions
-        if attention_mask is not None:
+        if attention_mask is not None and cu_seqlens is None:
             # Create mask for padded positions (where attention_mask is 0)
             mask = attention_mask.unsqueeze(-1).expand(-1, -1, logits.size(-1))
             # Set logits for padded positions to a large negative value
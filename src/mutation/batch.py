@@ -0,0 +1,371 @@
+"""
+Batch mode of the zero-shot structure scorers: a library of structures scored with one model load.
+
+Structures are given as a directory, a glob pattern or a manifest. A manifest is a .txt file with one
+path per line, or a .csv/.tsv file with a `path` column and optional `structure_id` and
+`mutations_csv` columns, relative paths are resolved against the manifest directory.
+
+Featurization (parsing, coordinates, graphs, 3Di sequences) runs in CPU workers ahead of the model,
+which runs padded forward passes on batches of up to max_tokens residues. The scores are written to
+one output directory partitioned by structure id,
+
+    <output_dir>/structure_id=<id>/scores.csv
+
+Every partition is written atomically, so an interrupted run resumes where it stopped: structures
+with a partition are skipped. Structures that fail are logged to <output_dir>/errors.csv and retried
+by the next run. read_partitioned() loads the output as a single DataFrame.
+"""
+import os
+import csv
+import glob
+import time
+import dataclasses
+import multiprocessing
+from collections import deque
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from src.mutation.mutant_table import MutantTable
+
+STRUCTURE_SUFFIXES = (".pdb", ".cif", ".mmcif", ".ent")
+MANIFEST_SUFFIXES = (".txt", ".csv", ".tsv")
+PARTITION_FILE = "scores.csv"
+ERROR_FILE = "errors.csv"
+
+
+@dataclasses.dataclass
+class StructureJob:
+    """
+    Args:
+        structure_id: Key of the output partition, the file name without its suffixes by default
+        path: Structure file
+        mutations_csv: Mutations of this structure, saturation mutagenesis if None and no
+            mutations are given for the whole run
+    """
+    structure_id: str
+    path: str
+    mutations_csv: Optional[str] = None
+
+
+def get_structure_id(path: str) -> str:
+    """File name without the structure suffix and an optional .gz, e.g. AF-P12345-F1-model_v4.pdb.gz -> AF-P12345-F1-model_v4"""
+    name = os.path.basename(path)
+    if name.endswith(".gz"):
+        name = name[:-3]
+    stem, suffix = os.path.splitext(name)
+    return stem if suffix.lower() in STRUCTURE_SUFFIXES else name
+
+
+def is_structure_file(path: str) -> bool:
+    name = path[:-3] if path.endswith(".gz") else path
+    return os.path.splitext(name)[1].lower() in STRUCTURE_SUFFIXES
+
+
+def _read_manifest(manifest: str) -> List[StructureJob]:
+    root = os.path.dirname(os.path.abspath(manifest))
+    resolve = lambda path: path if os.path.isabs(path) else os.path.join(root, path)
+    if manifest.endswith(".txt"):
+        with open(manifest) as f:
+            paths = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        return [StructureJob(get_structure_id(path), resolve(path)) for path in paths]
+
+    df = pd.read_csv(manifest, sep="\t" if manifest.endswith(".tsv") else ",")
+    if "path" not in df.columns:
+        raise ValueError(f"Manifest {manifest} needs a 'path' column")
+    jobs = []
+    for row in df.to_dict("records"):
+        mutations_csv = row.get("mutations_csv")
+        jobs.append(StructureJob(
+            structure_id=str(row["structure_id"]) if pd.notna(row.get("structure_id")) else get_structure_id(row["path"]),
+            path=resolve(row["path"]),
+            mutations_csv=resolve(mutations_csv) if isinstance(mutations_csv, str) and mutations_csv else None,
+        ))
+    return jobs
+
+
+def resolve_structures(source: str) -> List[StructureJob]:
+    """
+    Structures of a directory, manifest, glob pattern or single file.
+
+    Returns:
+        One job per structure, in a stable order
+
+    Raises:
+        ValueError: If no structure is found or two structures have the same id
+    """
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if is_structure_file(name) and os.path.isfile(os.path.join(source, name))
+        )
+        jobs = [StructureJob(get_structure_id(path), path) for path in paths]
+    elif os.path.isfile(source) and source.endswith(MANIFEST_SUFFIXES):
+        jobs = _read_manifest(source)
+    elif os.path.isfile(source):
+        jobs = [StructureJob(get_structure_id(source), source)]
+    else:
+        paths = sorted(path for path in glob.glob(source, recursive=True) if is_structure_file(path))
+        jobs = [StructureJob(get_structure_id(path), path) for path in paths]
+
+    if not jobs:
+        raise ValueError(f"No structures found for {source}")
+    seen = {}
+    for job in jobs:
+        if job.structure_id in seen:
+            raise ValueError(f"Structure id {job.structure_id} is used by {seen[job.structure_id]} and {job.path}")
+        seen[job.structure_id] = job.path
+    return jobs
+
+
+class PartitionedOutput:
+    """Score table partitioned by structure id, see the module docstring for the layout."""
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def partition_path(self, structure_id: str) -> str:
+        return os.path.join(self.output_dir, f"structure_id={structure_id}", PARTITION_FILE)
+
+    def done(self, structure_id: str) -> bool:
+        return os.path.exists(self.partition_path(structure_id))
+
+    def write(self, structure_id: str, df: pd.DataFrame):
+        path = self.partition_path(structure_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a partition only appears once it is complete
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def write_error(self, job: StructureJob, error: BaseException):
+        path = os.path.join(self.output_dir, ERROR_FILE)
+        write_header = not os.path.exists(path)
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(["structure_id", "path", "error", "time"])
+            writer.writerow([job.structure_id, job.path, f"{type(error).__name__}: {error}", time.strftime("%Y-%m-%d %H:%M:%S")])
+
+
+def read_partitioned(output_dir: str) -> pd.DataFrame:
+    """All partitions of a batch run as one DataFrame with a leading structure_id column."""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(output_dir, "structure_id=*", PARTITION_FILE))):
+        structure_id = os.path.basename(os.path.dirname(path))[len("structure_id="):]
+        df = pd.read_csv(path)
+        df.insert(0, "structure_id", structure_id)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["structure_id", "mutant"])
+
+
+def _finished(future: Future) -> bool:
+    """Whether the future holds a result or an error of the job itself, not of a broken pool."""
+    return future.done() and not future.cancelled() and not isinstance(future.exception(), BrokenExecutor)
+
+
+def prefetch(jobs: Sequence[StructureJob], featurize: Callable[[str], dict], num_workers: int = 4,
+             use_processes: bool = True, max_pending: Optional[int] = None
+             ) -> Iterator[Tuple[StructureJob, Any]]:
+    """
+    Featurize structures in CPU workers, at most max_pending ahead of the consumer.
+
+    Worker processes are spawned, not forked, so they never inherit an initialised CUDA context. If a
+    worker dies, the structures that were in flight are featurized again one at a time in a new pool,
+    and only the one that crashes a pool on its own is reported as failed.
+
+    Returns:
+        Iterator of (job, features), in job order; features is the exception if featurization failed
+    """
+    if num_workers <= 0:
+        for job in jobs:
+            try:
+                yield job, featurize(job.path)
+            except Exception as e:
+                yield job, e
+        return
+
+    max_pending = max_pending or 2 * num_workers
+
+    def new_executor():
+        if use_processes:
+            return ProcessPoolExecutor(num_workers, mp_context=multiprocessing.get_context("spawn"))
+        return ThreadPoolExecutor(num_workers)
+
+    def submit(job):
+        try:
+            return executor.submit(featurize, job.path)
+        except Exception as e:
+            # a broken pool refuses new work, the error surfaces when the job is consumed
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    executor = new_executor()
+    try:
+        # [job, future], the future is None for a job waiting to be rerun alone after a worker crash
+        pending = deque()
+        job_iter = iter(jobs)
+
+        def fill():
+            # no new work while suspects wait, they are rerun one at a time
+            while len(pending) < max_pending and all(future is not None for _, future in pending):
+                job = next(job_iter, None)
+                if job is None:
+                    return
+                pending.append([job, submit(job)])
+
+        fill()
+        while pending:
+            entry = pending[0]
+            if entry[1] is None:
+                entry[1] = submit(entry[0])
+            job, future = entry
+            try:
+                features = future.result()
+            except BrokenExecutor as e:
+                # a worker died (e.g. killed by the OOM killer) and took the pool with it, which job
+                # crashed it is unknown unless it ran alone
+                broken, executor = executor, new_executor()
+                unfinished = [other for other in pending if other[1] is not None and not _finished(other[1])]
+                broken.shutdown(wait=False, cancel_futures=True)
+                if len(unfinished) > 1:
+                    for other in unfinished:
+                        other[1] = None
+                    continue
+                features = e
+            except Exception as e:
+                features = e
+            pending.popleft()
+            fill()
+            yield job, features
+    finally:
+        executor.shutdown()
+
+
+def token_batches(items: Iterable[Tuple[StructureJob, Any]], max_tokens: int
+                  ) -> Iterator[List[Tuple[StructureJob, Any]]]:
+    """
+    Group consecutive featurized structures so that a padded batch holds at most max_tokens
+    residues (batch size times the longest sequence). Failed items are passed on as batches of one.
+    """
+    batch, longest = [], 0
+    for job, features in items:
+        if isinstance(features, Exception):
+            yield [(job, features)]
+            continue
+        length = len(features["sequence"])
+        if batch and max(longest, length) * (len(batch) + 1) > max_tokens:
+            yield batch
+            batch, longest = [], 0
+        batch.append((job, features))
+        longest = max(longest, length)
+    if batch:
+        yield batch
+
+
+def _is_out_of_memory(error: BaseException) -> bool:
+    return "out of memory" in str(error).lower()
+
+
+def _forward(forward: Callable[[List[dict]], List[Any]], features: List[dict]) -> List[Any]:
+    """Batched forward pass, halving the batch when the accelerator runs out of memory."""
+    try:
+        return forward(features)
+    except RuntimeError as e:
+        if len(features) == 1 or not _is_out_of_memory(e):
+            raise
+        try:
+            import torch
+            torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        half = len(features) // 2
+        return _forward(forward, features[:half]) + _forward(forward, features[half:])
+
+
+def load_mutants(job: StructureJob, sequence: str, mutations: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Mutations of a structure: its own CSV, the mutations of the run, or all single mutants."""
+    if job.mutations_csv is not None:
+        return pd.read_csv(job.mutations_csv)
+    if mutations is not None:
+        return mutations.copy()
+    return pd.DataFrame({"mutant": MutantTable.saturation(sequence).to_strings()})
+
+
+def score_structures(jobs: Sequence[StructureJob], featurize: Callable[[str], dict],
+                     forward: Callable[[List[dict]], List[Any]],
+                     score: Callable[[dict, Any, MutantTable], np.ndarray],
+                     column: str, output_dir: str, mutations_csv: Optional[str] = None,
+                     max_tokens: int = 4096, num_workers: int = 4, use_processes: bool = True) -> PartitionedOutput:
+    """
+    Score a library of structures, skipping those already in output_dir.
+
+    Args:
+        jobs: Structures, see resolve_structures
+        featurize: Path -> picklable features with at least the residue "sequence", runs in the workers
+        forward: Features of a batch -> one model output per structure
+        score: (features, model output, mutants) -> one score per mutant
+        column: Name of the score column, e.g. "prosst_score"
+        output_dir: Partitioned output directory
+        mutations_csv: Mutations scored on every structure without its own mutations_csv
+        max_tokens: Residues per padded batch
+        num_workers: Featurization workers, 0 featurizes in the main process
+        use_processes: Process workers for CPU bound featurization, threads otherwise
+
+    Returns:
+        The output, read it with read_partitioned(output_dir)
+    """
+    output = PartitionedOutput(output_dir)
+    todo = [job for job in jobs if not output.done(job.structure_id)]
+    print(f"{len(jobs) - len(todo)} of {len(jobs)} structures already scored in {output_dir}, {len(todo)} to go")
+    mutations = pd.read_csv(mutations_csv) if mutations_csv is not None else None
+
+    start, scored, failed = time.perf_counter(), 0, 0
+    for batch in token_batches(prefetch(todo, featurize, num_workers, use_processes), max_tokens):
+        job, features = batch[0]
+        if isinstance(features, Exception):
+            print(f"Failed to featurize {job.path}: {features}")
+            output.write_error(job, features)
+            failed += 1
+            continue
+        try:
+            outputs = _forward(forward, [features for _, features in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                outputs = [e]
+            else:
+                # find the structure that breaks the batch
+                outputs = []
+                for _, features in batch:
+                    try:
+                        outputs.extend(_forward(forward, [features]))
+                    except Exception as item_error:
+                        outputs.append(item_error)
+
+        for (job, features), model_output in zip(batch, outputs):
+            try:
+                if isinstance(model_output, Exception):
+                    raise model_output
+                df = load_mutants(job, features["sequence"], mutations)
+                table = MutantTable.from_strings(df["mutant"].tolist())
+                df[column] = np.asarray(score(features, model_output, table)).tolist()
+                df = df.sort_values(by=column, ascending=False)
+                output.write(job.structure_id, df)
+                scored += 1
+            except Exception as e:
+                print(f"Failed to score {job.path}: {e}")
+                output.write_error(job, e)
+                failed += 1
+        elapsed = time.perf_counter() - start
+        print(f"Scored {scored}/{len(todo)} structures ({failed} failed), {scored / max(elapsed, 1e-9):.2f} structures/s")
+    return output
+
+
+def add_batch_arguments(parser):
+    """Command line options of the batch mode, shared by the scorer scripts."""
+    parser.add_argument('--structures', type=str, default=None,
+                        help='Directory, glob pattern or manifest of structures, scores them all with one model load')
+    parser.add_argument('--output_dir', type=str, default=None, help='Partitioned output directory of the batch mode')
+    parser.add_argument('--max_tokens', type=int, default=4096, help='Residues per padded batch in the batch mode')
+    parser.add_argument('--num_workers', type=int, default=4, help='Featurization workers in the batch mode')
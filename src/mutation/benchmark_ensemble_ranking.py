@@ -0,0 +1,86 @@
+"""
+Time the recommendation strategies of easy_mutation on random score tables and check them against a
+reference implementation, e.g. the version before the rankings were computed once:
+
+    git show <commit>:src/mutation/models/easy_mutation.py > /tmp/easy_mutation_ref.py
+    python src/mutation/benchmark_ensemble_ranking.py --reference /tmp/easy_mutation_ref.py --sizes 1000 10000 100000
+
+Both the returned mutations and the printed selection log have to be identical. Only the selection
+functions are loaded from the files, so the scorers and torch are not imported.
+"""
+import io
+import os
+import ast
+import sys
+import time
+import argparse
+import contextlib
+from typing import Dict, List, Tuple
+sys.path.append(os.getcwd())
+import numpy as np
+import pandas as pd
+from src.mutation.mutant_table import AMINO_ACIDS, MutantTable
+
+STRATEGIES = ['ensemble_round', 'ensemble_top', 'individual_best', 'frequency_based', 'diversity_based']
+EASY_MUTATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'easy_mutation.py')
+
+
+def load_selection(path: str) -> Dict:
+    """Top-level classes, constants and functions of a version of easy_mutation.py, without its imports."""
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    body = [node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.Assign))]
+    namespace = {'pd': pd, 'np': np, 'List': List, 'Dict': Dict, 'Tuple': Tuple}
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, 'exec'), namespace)
+    return namespace
+
+
+def random_scores(num_mutants: int, correlation: float, seed: int) -> pd.DataFrame:
+    """Saturation mutants of a random sequence with correlated model scores, like the all_scores CSV."""
+    rng = np.random.default_rng(seed)
+    sequence = ''.join(rng.choice(list(AMINO_ACIDS), size=-(-num_mutants // 19)))
+    mutants = MutantTable.saturation(sequence).to_strings()[:num_mutants]
+    shared = rng.normal(size=len(mutants))
+    df = pd.DataFrame({'mutant': mutants})
+    for column in ['prosst_score', 'saprot_score', 'protssn_score', 'esmif1_score']:
+        df[column] = np.sqrt(correlation) * shared + np.sqrt(1 - correlation) * rng.normal(size=len(mutants))
+    norm = (df.iloc[:, 1:] - df.iloc[:, 1:].mean()) / df.iloc[:, 1:].std(ddof=0)
+    df['ensemble_norm_score'] = norm.mean(axis=1)
+    return df.sort_values('ensemble_norm_score', ascending=False)
+
+
+def run(namespace: Dict, df: pd.DataFrame, strategy: str, num_recommendations: int, position_unique: bool):
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        mutations = namespace['select_recommended_mutations'](df, num_recommendations, strategy, position_unique)
+    return mutations, log.getvalue(), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the easy_mutation recommendation strategies')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Numbers of mutants')
+    parser.add_argument('--num_recommendations', type=int, default=30)
+    parser.add_argument('--reference', type=str, default=None, help='Other version of easy_mutation.py to compare with')
+    parser.add_argument('--correlation', type=float, default=0.5, help='Correlation of the model scores, low values reach step 3 of ensemble_round')
+    parser.add_argument('--seed', type=int, default=3407)
+    args = parser.parse_args()
+
+    current = load_selection(EASY_MUTATION)
+    reference = load_selection(args.reference) if args.reference else None
+    for size in args.sizes:
+        df = random_scores(size, args.correlation, args.seed)
+        print(f"{size} mutants")
+        for strategy in STRATEGIES:
+            for position_unique in (True, False):
+                mutations, log, elapsed = run(current, df, strategy, args.num_recommendations, position_unique)
+                line = f"  {strategy:>15} position_unique={position_unique!s:<5}: {elapsed:8.3f}s"
+                if reference is not None:
+                    ref_mutations, ref_log, ref_elapsed = run(reference, df, strategy, args.num_recommendations, position_unique)
+                    same = mutations == ref_mutations and log == ref_log
+                    line += f", reference {ref_elapsed:8.3f}s, {'identical' if same else 'DIFFERENT'}"
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
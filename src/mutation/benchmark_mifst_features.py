@@ -0,0 +1,87 @@
+"""
+Compare the dense (process_coords) and neighbour-first (process_coords_knn) MIF/MIF-ST featurization.
+
+Both paths are collated with the StructureCollater used by MIF-ST and the outputs are checked for
+equality. Time and peak memory of featurization plus collation are reported, the memory is traced
+with tracemalloc, which sees the numpy and Python allocations of the featurization.
+
+    python src/mutation/benchmark_mifst_features.py --pdb_file example.pdb
+    python src/mutation/benchmark_mifst_features.py --length 2000
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+sys.path.append(os.getcwd())
+import numpy as np
+import torch
+from src.mutation.models.sequence_models.pdb_utils import parse_PDB, process_coords, process_coords_knn
+from src.mutation.models.sequence_models.collaters import SimpleCollater, StructureCollater
+from src.mutation.models.sequence_models.constants import PROTEIN_ALPHABET
+
+
+def random_backbone(length, seed):
+    """Backbone of a random walk with ~3.8A between consecutive CA atoms."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(size=(length, 3))
+    steps *= 3.8 / np.linalg.norm(steps, axis=1, keepdims=True)
+    ca = np.cumsum(steps, axis=0)
+    n = ca + rng.normal(scale=0.8, size=(length, 3))
+    c = ca + rng.normal(scale=0.8, size=(length, 3))
+    coords = np.stack([n, ca, c], axis=1)
+    sequence = "".join(rng.choice(list("ACDEFGHIKLMNPQRSTVWY"), size=length))
+    return coords, sequence
+
+
+def featurize_dense(coords, sequence, collater):
+    dist, omega, theta, phi = process_coords(coords)
+    batch = [[sequence, torch.tensor(dist, dtype=torch.float), torch.tensor(omega, dtype=torch.float),
+              torch.tensor(theta, dtype=torch.float), torch.tensor(phi, dtype=torch.float)]]
+    return collater(batch)
+
+
+def featurize_knn(coords, sequence, collater):
+    return collater([[sequence, process_coords_knn(coords, collater.n_connections)]])
+
+
+def measure(func, coords, sequence, collater):
+    tracemalloc.start()
+    start = time.perf_counter()
+    outputs = func(coords, sequence, collater)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return outputs, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MIF-ST structure featurization")
+    parser.add_argument("--pdb_file", type=str, default=None, help="PDB file, a random backbone is used if not given")
+    parser.add_argument("--length", type=int, default=1000, help="Length of the random backbone")
+    parser.add_argument("--seed", type=int, default=3407)
+    parser.add_argument("--skip_dense", action="store_true", help="Only run the neighbour-first featurization")
+    args = parser.parse_args()
+
+    if args.pdb_file is not None:
+        xyz, sequence, _ = parse_PDB(args.pdb_file)
+    else:
+        xyz, sequence = random_backbone(args.length, args.seed)
+    coords = {"N": xyz[:, 0], "CA": xyz[:, 1], "C": xyz[:, 2]}
+    collater = StructureCollater(SimpleCollater(PROTEIN_ALPHABET, pad=True), n_connections=30)
+    print(f"Residues: {len(sequence)}")
+
+    knn_outputs, elapsed, peak = measure(featurize_knn, coords, sequence, collater)
+    print(f"neighbour-first: {elapsed:.2f}s, peak memory {peak / (1 << 20):.1f}MB")
+    if args.skip_dense:
+        return
+
+    dense_outputs, elapsed, peak = measure(featurize_dense, coords, sequence, collater)
+    print(f"          dense: {elapsed:.2f}s, peak memory {peak / (1 << 20):.1f}MB")
+    names = ["src", "nodes", "edges", "connections", "edge_mask"]
+    for name, dense, knn in zip(names, dense_outputs, knn_outputs):
+        print(f"{name:>11}: {'identical' if torch.equal(dense, knn) else 'DIFFERENT'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compare mutant strings with the compact MutantTable on a random sequence.
+
+Saturation mutagenesis is generated and scored both ways, the scores are checked for equality. Then
+doubles and triples are enumerated from the single mutants above a score threshold and scored chunk by
+chunk. Peak memory is traced with tracemalloc, which sees the numpy and Python allocations.
+
+    python src/mutation/benchmark_mutant_table.py --length 1000 --threshold 1.5
+    python src/mutation/benchmark_mutant_table.py --order 3 --threshold 2.0 --output_csv triples.csv
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+sys.path.append(os.getcwd())
+import numpy as np
+from src.mutation.mutant_table import AMINO_ACIDS, MutantTable, write_csv
+
+
+def string_mutants(sequence):
+    """The nested loops generate_mutations_from_sequence used before."""
+    mutations = []
+    for i, original in enumerate(sequence):
+        for mutant in AMINO_ACIDS:
+            if mutant != original:
+                mutations.append(f"{original}{i+1}{mutant}")
+    return mutations
+
+
+def string_scores(mutants, site_scores):
+    """The per-mutant parsing loop of the scorers."""
+    scores = []
+    for mutant in mutants:
+        mutant_score = 0
+        sep = ":" if ":" in mutant else ";"
+        for sub_mutant in mutant.split(sep):
+            wt, idx, mt = sub_mutant[0], int(sub_mutant[1:-1]), sub_mutant[-1]
+            mutant_score += float(site_scores[idx, AMINO_ACIDS.index(mt)] - site_scores[idx, AMINO_ACIDS.index(wt)])
+        scores.append(mutant_score / len(mutant.split(sep)))
+    return scores
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compact mutant table")
+    parser.add_argument("--length", type=int, default=1000, help="Length of the random sequence")
+    parser.add_argument("--order", type=int, default=2, help="Substitutions per combinatorial mutant")
+    parser.add_argument("--threshold", type=float, default=1.5, help="Minimum single mutant score to combine")
+    parser.add_argument("--chunk_size", type=int, default=1 << 20)
+    parser.add_argument("--output_csv", type=str, default=None, help="Stream the combinations to this file")
+    parser.add_argument("--seed", type=int, default=3407)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    sequence = "".join(rng.choice(list(AMINO_ACIDS), size=args.length))
+    # log-probability like scores, row 0 and the last row stand for the special tokens
+    site_scores = rng.normal(size=(args.length + 2, len(AMINO_ACIDS))).astype(np.float32)
+
+    strings, elapsed, peak = measure(string_mutants, sequence)
+    print(f"strings: {len(strings)} single mutants in {elapsed:.3f}s, peak memory {peak / (1 << 20):.1f}MB")
+    table, elapsed, peak = measure(MutantTable.saturation, sequence)
+    print(f"  table: {len(table)} single mutants in {elapsed:.3f}s, peak memory {peak / (1 << 20):.1f}MB")
+    assert table.to_strings() == strings
+
+    reference, elapsed, _ = measure(string_scores, strings, site_scores)
+    print(f"scoring strings: {elapsed:.3f}s")
+    scores, elapsed, _ = measure(table.score, site_scores)
+    print(f"  scoring table: {elapsed:.3f}s, {'identical' if scores.tolist() == reference else 'DIFFERENT'}")
+
+    def score_combinations():
+        count, best = 0, -np.inf
+        for index, (chunk, chunk_scores) in enumerate(
+            table.combinations(scores, args.order, args.threshold, chunk_size=args.chunk_size)
+        ):
+            count += len(chunk)
+            best = max(best, chunk_scores.max())
+            if args.output_csv is not None:
+                write_csv(args.output_csv, chunk, {"score": chunk_scores}, mode="w" if index == 0 else "a")
+        return count, best
+
+    (count, best), elapsed, peak = measure(score_combinations)
+    print(f"{count} combinations of {args.order} from {int((scores >= args.threshold).sum())} single mutants "
+          f"in {elapsed:.2f}s, best {best:.3f}, peak memory {peak / (1 << 20):.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
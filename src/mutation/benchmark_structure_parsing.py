@@ -0,0 +1,77 @@
+"""
+Time the structure parsing of one easy_mutation_prediction run, per scorer vs. parsed once.
+
+"per scorer" reads the file the way the scorers did before they shared a ParsedStructure:
+the sequence three times with biotite, the ProSST graph and the ProtSSN receptor (once for every
+model of the 3x3 ensemble) with Biopython, the SaProt pLDDT with Biopython and the ESM-IF1
+coordinates with biotite. "parsed once" parses the file a single time and derives the same inputs,
+the ProtSSN receptor is built once and shared by the ensemble.
+
+    python src/mutation/benchmark_structure_parsing.py --pdb_files large1.pdb large2.pdb --repeat 3
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+sys.path.append(os.getcwd())
+from Bio.PDB import PDBParser
+from Bio.PDB.PDBExceptions import PDBConstructionWarning
+from src.mutation.structure import parse_structure, clear_structure_cache
+from src.mutation.models.esm.inverse_folding.util import extract_seq_from_pdb, load_coords
+from src.data.prosst.structure.build_graph import _read_backbone, _parsed_backbone
+from src.mutation.models.saprot import extract_plddt
+
+# ProtSSN models of the default ensemble, each builds its own receptor
+PROTSSN_MODELS = 9
+
+
+def per_scorer(pdb_file, chain):
+    for _ in range(3):
+        extract_seq_from_pdb(pdb_file, chain)
+    _read_backbone(pdb_file)
+    extract_plddt(pdb_file, chain)
+    parser = PDBParser()
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=PDBConstructionWarning)
+        for _ in range(PROTSSN_MODELS):
+            parser.get_structure("random_id", pdb_file)
+    load_coords(pdb_file, chain)
+
+
+def parsed_once(pdb_file, chain):
+    clear_structure_cache()
+    structure = parse_structure(pdb_file)
+    for _ in range(3):
+        extract_seq_from_pdb(structure, chain)
+    _parsed_backbone(structure)
+    extract_plddt(structure, chain)
+    structure.to_biopython()
+    load_coords(structure, chain)
+    return structure
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing once against parsing per scorer")
+    parser.add_argument("--pdb_files", type=str, nargs="+", required=True, help="PDB files, large structures show the difference best")
+    parser.add_argument("--chain", type=str, default="A", help="Chain scored by the ensemble")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per file, the best run is reported")
+    args = parser.parse_args()
+
+    for pdb_file in args.pdb_files:
+        timings = {}
+        for name, func in [("per scorer", per_scorer), ("parsed once", parsed_once)]:
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = func(pdb_file, args.chain)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+        num_atoms = len(result.atoms)
+        print(f"{os.path.basename(pdb_file)} ({num_atoms} atoms): "
+              f"per scorer {timings['per scorer']:.3f}s, parsed once {timings['parsed once']:.3f}s, "
+              f"speedup {timings['per scorer'] / timings['parsed once']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
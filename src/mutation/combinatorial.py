@@ -0,0 +1,229 @@
+"""
+Top-k search for combinatorial multi-mutants under the additive model of the zero-shot scorers.
+
+The scorers score a multi-mutant as the mean of the deltas site[pos, mt] - site[pos, wt] of its
+substitutions, so the score of a single mutant is exactly its entry of the L x 20 delta table. The
+table is built from the saturation scores of any scorer (ESM2, ProSST, SaProt, ProtSSN, MIF-ST, ...)
+and searched with branch and bound for the best k combinations of up to m substitutions at distinct
+positions, without enumerating the (19L)^m candidates.
+
+    python src/mutation/models/esm2.py --fasta_file example.fasta --output_csv esm2/singles.csv
+    python src/mutation/combinatorial.py --input_csv esm2/singles.csv --max_order 3 --top_k 100 --output_csv esm2/top_triples.csv
+"""
+import os
+import sys
+import heapq
+import argparse
+from typing import Iterable, List, Optional, Tuple
+sys.path.append(os.getcwd())
+import numpy as np
+from src.mutation.mutant_table import AMINO_ACIDS, MutantTable, write_csv
+
+
+def delta_table(site_scores: np.ndarray, sequence: str, offset: int = 0, alphabet: str = AMINO_ACIDS) -> np.ndarray:
+    """
+    Delta table of a per-site score table, as MutantTable.score uses it.
+
+    Args:
+        site_scores: Per-site scores of shape (rows, len(alphabet))
+        sequence: Wild-type sequence
+        offset: Row of position 0, e.g. 0 for logits with a BOS token and -1 without
+        alphabet: Residue of every column of site_scores
+
+    Returns:
+        (len(sequence), len(alphabet)) array, the wild-type entries and positions with a residue
+        outside the alphabet are -inf so the search never picks them
+    """
+    site_scores = np.asarray(site_scores, dtype=np.float64)
+    rows = site_scores[np.arange(len(sequence)) + 1 + offset]
+    deltas = np.full(rows.shape, -np.inf)
+    for i, residue in enumerate(sequence):
+        column = alphabet.find(residue)
+        if column >= 0:
+            deltas[i] = rows[i] - rows[i, column]
+            deltas[i, column] = -np.inf
+    return deltas
+
+
+def delta_table_from_singles(table: MutantTable, scores: np.ndarray, alphabet: str = AMINO_ACIDS
+                             ) -> Tuple[np.ndarray, str]:
+    """
+    Delta table of scored single mutants, e.g. the saturation output of a scorer or of the ensemble.
+
+    Returns:
+        (deltas, wild-type sequence), positions and substitutions without a score are -inf in the
+        deltas and "X" in the sequence
+    """
+    if np.any(table.sizes != 1):
+        raise ValueError("The delta table needs single mutants")
+    columns = np.full(256, -1, dtype=np.int64)
+    columns[np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)] = np.arange(len(alphabet))
+    mt = columns[table.mt]
+    if len(mt) and mt.min() < 0:
+        raise ValueError(f"Mutant residues {sorted(set(chr(c) for c in table.mt[mt < 0]))} are not in the alphabet")
+    length = int(table.position.max()) if len(table) else 0
+    deltas = np.full((length, len(alphabet)), -np.inf)
+    deltas[table.position - 1, mt] = np.asarray(scores, dtype=np.float64)
+    sequence = np.full(length, ord("X"), dtype=np.uint8)
+    sequence[table.position - 1] = table.wt
+    return deltas, sequence.tobytes().decode("ascii")
+
+
+def _top_k_order(values: np.ndarray, positions: np.ndarray, order: int, k: int) -> List[Tuple[float, Tuple[int, ...]]]:
+    """
+    Exact top-k sums of `order` candidates with distinct positions, by depth-first branch and bound.
+
+    The candidates are sorted by value. Any completion of a prefix with `need` candidates from index i
+    on is bounded by the `need` largest values at distinct positions from i on. A branch is cut once
+    that bound cannot beat the k-th best sum found so far, and the loop over the next candidate stops
+    at the first cut because the bound only decreases with i.
+    """
+    n = len(values)
+    values, positions = values.tolist(), positions.tolist()
+    # bounds[i][t]: sum of the t largest values at distinct positions among the candidates from i on.
+    # Scanning from the end every candidate is the largest value seen so far, so the best values
+    # per position are kept as a short list with the newest in front.
+    bounds = [None] * (n + 1)
+    best = []
+    bounds[n] = [0.0] * (order + 1)
+    for i in range(n - 1, -1, -1):
+        best = [(positions[i], values[i])] + [entry for entry in best if entry[0] != positions[i]][:order - 1]
+        sums = [0.0]
+        for _, value in best:
+            sums.append(sums[-1] + value)
+        bounds[i] = sums + [-np.inf] * (order + 1 - len(sums))
+    heap = []  # (sum, negated indices) min-heap of the best k, ties are broken by the earlier indices
+    used = set()
+    chosen = []
+
+    def search(start: int, total: float):
+        need = order - len(chosen)
+        for i in range(start, n - need + 1):
+            bound = total + bounds[i][need]
+            if bound == -np.inf or len(heap) == k and bound <= heap[0][0]:
+                return
+            if positions[i] in used:
+                continue
+            if need == 1:
+                entry = (total + values[i], tuple(-j for j in chosen + [i]))
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                else:
+                    heapq.heappushpop(heap, entry)
+                continue
+            used.add(positions[i])
+            chosen.append(i)
+            search(i + 1, total + values[i])
+            chosen.pop()
+            used.remove(positions[i])
+
+    search(0, 0.0)
+    return [(total, tuple(-j for j in indices)) for total, indices in sorted(heap, reverse=True)]
+
+
+def top_k_combinations(deltas: np.ndarray, sequence: str, k: int = 100, max_order: int = 3, min_order: int = 1,
+                       objective: str = "sum", positions: Optional[Iterable[int]] = None,
+                       alphabet: str = AMINO_ACIDS) -> Tuple[MutantTable, np.ndarray, np.ndarray]:
+    """
+    Best k combinations of min_order to max_order substitutions at distinct positions.
+
+    The combinations of every order are searched exactly, then merged: by the sum of the deltas
+    (the additive log-odds of the combination) or by their mean (the score the zero-shot scorers
+    report for a multi-mutant, which favours fewer substitutions).
+
+    Args:
+        deltas: Delta table of shape (len(sequence), len(alphabet)), -inf entries are never picked
+        sequence: Wild-type sequence
+        k: Number of combinations
+        max_order: Maximum number of substitutions
+        min_order: Minimum number of substitutions
+        objective: "sum" or "mean"
+        positions: 1-based positions that may be mutated, None allows all
+        alphabet: Residue of every column of deltas
+
+    Returns:
+        (MutantTable of the combinations, their mean scores, their sums), best first
+    """
+    if objective not in ("sum", "mean"):
+        raise ValueError(f"Unknown objective: {objective}. Available objectives: sum, mean")
+    if not 1 <= min_order <= max_order:
+        raise ValueError("Orders must satisfy 1 <= min_order <= max_order")
+    deltas = np.array(deltas, dtype=np.float64)
+    if positions is not None:
+        allowed = np.zeros(len(deltas), dtype=bool)
+        allowed[np.asarray(list(positions), dtype=np.int64) - 1] = True
+        deltas[~allowed] = -np.inf
+
+    # a substitution ranked below k at its position is never needed: swapping it for any of the k
+    # better ones at the same position gives k better combinations
+    per_position = min(k, deltas.shape[1])
+    columns = np.argsort(-deltas, axis=1, kind="stable")[:, :per_position]
+    rows = np.repeat(np.arange(len(deltas)), per_position)
+    columns = columns.ravel()
+    values = deltas[rows, columns]
+    finite = np.isfinite(values)
+    rows, columns, values = rows[finite], columns[finite], values[finite]
+    order_by_value = np.argsort(-values, kind="stable")
+    rows, columns, values = rows[order_by_value], columns[order_by_value], values[order_by_value]
+
+    candidates = []
+    for order in range(min_order, max_order + 1):
+        for total, indices in _top_k_order(values, rows, order, k):
+            # report the substitutions of a combination by position
+            indices = sorted(indices, key=lambda j: rows[j])
+            candidates.append((total / order if objective == "mean" else total, total, order, indices))
+    candidates = sorted(candidates, key=lambda c: -c[0])[:k]
+
+    picked = [j for _, _, _, indices in candidates for j in indices]
+    wt = np.frombuffer(sequence.encode("ascii"), dtype=np.uint8)
+    residues = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)
+    table = MutantTable.from_arrays(
+        rows[picked] + 1, wt[rows[picked]], residues[columns[picked]],
+        np.repeat(np.arange(len(candidates)), [order for _, _, order, _ in candidates]), len(candidates)
+    )
+    sums = np.array([total for _, total, _, _ in candidates])
+    return table, sums / np.maximum(table.sizes, 1), sums
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Top-k combinatorial multi-mutants from single mutant scores")
+    parser.add_argument("--input_csv", type=str, required=True, help="Scored single mutants, e.g. the output of a zero-shot scorer")
+    parser.add_argument("--score_column", type=str, default=None, help="Score column, the only *_score column if not given")
+    parser.add_argument("--top_k", type=int, default=100, help="Number of combinations")
+    parser.add_argument("--max_order", type=int, default=3, help="Maximum number of substitutions")
+    parser.add_argument("--min_order", type=int, default=2, help="Minimum number of substitutions")
+    parser.add_argument("--objective", type=str, default="sum", choices=["sum", "mean"], help="Ranking of combinations of different orders")
+    parser.add_argument("--positions", type=str, default=None, help="Positions that may be mutated, e.g. 10-25,40")
+    parser.add_argument("--output_csv", type=str, required=True, help="Path to the output CSV file")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input_csv)
+    score_column = args.score_column
+    if score_column is None:
+        score_columns = [column for column in df.columns if column.endswith("_score")]
+        if len(score_columns) != 1:
+            raise ValueError(f"Pass --score_column, found score columns {score_columns}")
+        score_column = score_columns[0]
+    deltas, sequence = delta_table_from_singles(MutantTable.from_strings(df["mutant"].tolist()), df[score_column].to_numpy())
+
+    positions = None
+    if args.positions is not None:
+        positions = []
+        for part in args.positions.split(","):
+            start, _, end = part.partition("-")
+            positions.extend(range(int(start), int(end or start) + 1))
+
+    table, scores, sums = top_k_combinations(
+        deltas, sequence, args.top_k, args.max_order, args.min_order, args.objective, positions
+    )
+    output_dir = os.path.dirname(args.output_csv)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    write_csv(args.output_csv, table, {score_column: scores, "sum": sums, "num_mutations": table.sizes})
+    print(f"Wrote {len(table)} combinations to {args.output_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,7 @@ import gc
 from typing import List, Dict, Tuple
 from src.mutation.utils import generate_mutations_from_sequence
 from src.mutation.models.esm.inverse_folding.util import extract_seq_from_pdb
+from src.mutation.structure import parse_structure
 
 # Import all scoring functions
 from src.mutation.models.saprot import saprot_score
@@ -48,7 +49,89 @@ def normalize_scores(scores: List[float]) -> List[float]:
     return normalized.tolist()
 
 
-def ensure_position_uniqueness(mutations: List[str], df: pd.DataFrame, num_recommendations: int = 30) -> List[str]:
+MODEL_COLUMNS = ['saprot_score', 'protssn_score', 'prosst_score', 'esmif1_score']
+# Deletes everything but the digits of a mutant string, M1A -> 1 and A1B:C2D -> 12
+_NON_DIGITS = str.maketrans('', '', ''.join(chr(c) for c in range(128) if not chr(c).isdigit()))
+
+
+class EnsembleRanking:
+    """
+    Ranks of every mutant under every model, computed once and shared by the selection strategies.
+
+    The ranks are ordinal, the same as scipy.stats.rankdata(-scores, method='ordinal') per column:
+    1 is the best score, ties keep the table order and NaN scores rank last, the order of
+    df.sort_values(column, ascending=False). Positions are integer codes of the digits of the
+    mutant string, so the position filters are array operations.
+    
+    Args:
+        df: DataFrame with all model scores
+        model_columns: Score columns the rankings are reported for
+    """
+    def __init__(self, df: pd.DataFrame, model_columns: List[str] = MODEL_COLUMNS):
+        self.model_columns = [column for column in model_columns if column in df.columns]
+        self.columns = self.model_columns + [c for c in ['ensemble_norm_score'] if c in df.columns]
+        self.mutants = df['mutant'].to_numpy()
+        self.position_codes, self.position_names = pd.factorize(np.array([mutant.translate(_NON_DIGITS) for mutant in self.mutants], dtype=object))
+        
+        # One stable sort per column, best first, with NaN last
+        scores = df[self.columns].to_numpy(dtype=np.float64)
+        self.order = np.argsort(-scores, axis=0, kind='stable')
+        self.num_valid = (~np.isnan(scores)).sum(axis=0)
+        row_ranks = np.empty_like(self.order)
+        np.put_along_axis(row_ranks, self.order, np.arange(1, len(df) + 1)[:, None], axis=0)
+        
+        # A mutant listed twice is ranked by its first row in the sorted table
+        mutant_codes, unique_mutants = pd.factorize(self.mutants)
+        self.unique_mutants = pd.Index(unique_mutants)
+        self.ranks = np.full((len(unique_mutants), len(self.columns)), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(self.ranks, mutant_codes, row_ranks)
+        self.first_row = np.unique(mutant_codes, return_index=True)[1]
+        self.ensemble = df['ensemble_norm_score'].to_numpy() if 'ensemble_norm_score' in df.columns else None
+    
+    def position(self, mutant: str) -> int:
+        """Integer code of the position of a mutant, position_names maps it back, e.g. M1A -> '1'"""
+        return int(self.position_codes[self.first_row[self.unique_mutants.get_loc(mutant)]])
+    
+    def ensemble_score(self, mutant: str) -> float:
+        return self.ensemble[self.first_row[self.unique_mutants.get_loc(mutant)]]
+    
+    def rankings(self, mutant: str) -> Dict[str, int]:
+        """Ranking of a mutation in each model"""
+        ranks = self.ranks[self.unique_mutants.get_loc(mutant)]
+        return {column: int(ranks[j]) for j, column in enumerate(self.model_columns)}
+    
+    def mean_rank(self, mutant: str) -> float:
+        return np.mean(self.ranks[self.unique_mutants.get_loc(mutant), :len(self.model_columns)])
+    
+    def top(self, column: str, top_n: int) -> List[str]:
+        """Top N mutations of a column, like df.nlargest(top_n, column)"""
+        j = self.columns.index(column)
+        return self.mutants[self.order[:min(top_n, self.num_valid[j]), j]].tolist()
+    
+    def first_per_position(self, column: str, limit: int, exclude_positions=(), exclude_mutants=()) -> List[str]:
+        """
+        Best mutation of each position in the order of a column, skipping excluded positions and mutations.
+        
+        Args:
+            column: Score column to walk from the best score down
+            limit: Maximum number of mutations
+            exclude_positions: Position codes already covered
+            exclude_mutants: Mutations already selected
+            
+        Returns:
+            At most limit mutations at distinct positions, best first
+        """
+        rows = self.order[:, self.columns.index(column)]
+        keep = ~np.isin(self.position_codes[rows], np.fromiter(exclude_positions, dtype=np.int64))
+        if len(exclude_mutants):
+            keep &= ~pd.Index(self.mutants[rows]).isin(list(exclude_mutants))
+        rows = rows[keep]
+        first = np.unique(self.position_codes[rows], return_index=True)[1]
+        return self.mutants[rows[np.sort(first)[:limit]]].tolist()
+
+
+def ensure_position_uniqueness(mutations: List[str], df: pd.DataFrame, num_recommendations: int = 30,
+                               ranking: EnsembleRanking = None) -> List[str]:
     """
     Ensure position uniqueness in mutation list by keeping the best mutation for each position.
     
@@ -56,36 +139,32 @@ def ensure_position_uniqueness(mutations: List[str], df: pd.DataFrame, num_recom
         mutations: List of mutations to filter
         df: DataFrame with all model scores
         num_recommendations: Target number of recommendations
+        ranking: Precomputed EnsembleRanking of df
         
     Returns:
         List of mutations with unique positions
     """
-    def get_position_from_mutant(mutant: str) -> str:
-        """Extract position from mutant string, e.g., M1A -> 1"""
-        return ''.join(filter(str.isdigit, mutant))
-    
     if not mutations:
         return mutations
+    if ranking is None:
+        ranking = EnsembleRanking(df)
     
     # Create position to mutation mapping, keeping the best mutation for each position
     position_best = {}
     
     for mut in mutations:
-        pos = get_position_from_mutant(mut)
+        pos = ranking.position(mut)
         if pos not in position_best:
             position_best[pos] = mut
-        else:
+        elif ranking.ensemble_score(mut) > ranking.ensemble_score(position_best[pos]):
             # Compare ensemble scores and keep the better one
-            current_score = df[df['mutant'] == position_best[pos]]['ensemble_norm_score'].iloc[0]
-            new_score = df[df['mutant'] == mut]['ensemble_norm_score'].iloc[0]
-            if new_score > current_score:
-                position_best[pos] = mut
+            position_best[pos] = mut
     
     # Convert back to list and limit to num_recommendations
     unique_mutations = list(position_best.values())
     
     # Sort by ensemble score to ensure we keep the best ones
-    unique_mutations.sort(key=lambda x: df[df['mutant'] == x]['ensemble_norm_score'].iloc[0], reverse=True)
+    unique_mutations.sort(key=ranking.ensemble_score, reverse=True)
     
     return unique_mutations[:num_recommendations]
 
@@ -103,22 +182,61 @@ def select_recommended_mutations(df: pd.DataFrame, num_recommendations: int = 30
     Returns:
         List of recommended mutations
     """
-    
-    if strategy == 'ensemble_round':
-        return select_ensemble_round(df, num_recommendations, position_unique)
-    elif strategy == 'ensemble_top':
-        return select_ensemble_top(df, num_recommendations, position_unique)
-    elif strategy == 'individual_best':
-        return select_individual_best(df, num_recommendations, position_unique)
-    elif strategy == 'frequency_based':
-        return select_frequency_based(df, num_recommendations, position_unique)
-    elif strategy == 'diversity_based':
-        return select_diversity_based(df, num_recommendations, position_unique)
-    else:
+    strategies = {
+        'ensemble_round': select_ensemble_round,
+        'ensemble_top': select_ensemble_top,
+        'individual_best': select_individual_best,
+        'frequency_based': select_frequency_based,
+        'diversity_based': select_diversity_based,
+    }
+    if strategy not in strategies:
         raise ValueError(f"Unknown strategy: {strategy}. Available strategies: ensemble_round, ensemble_top, individual_best, frequency_based, diversity_based")
+    # Rank all mutations under all models once, the strategies only look the ranks up
+    return strategies[strategy](df, num_recommendations, position_unique, EnsembleRanking(df))
 
 
-def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True) -> List[str]:
+def get_model_selections(num_mutations: int) -> Dict[str, int]:
+    """
+    Number of mutations to take from each model with the ratios prosst:protssn:saprot:esmif1 = 3:2:2:2.
+    
+    Args:
+        num_mutations: Total number of mutations
+        
+    Returns:
+        Number of mutations per model score column
+    """
+    model_ratios = {
+        'prosst_score': 3,
+        'protssn_score': 2, 
+        'saprot_score': 2,
+        'esmif1_score': 2
+    }
+    
+    # Calculate how many to select from each model
+    total_ratio = sum(model_ratios.values())  # 9
+    model_selections = {}
+    for model_col, ratio in model_ratios.items():
+        model_selections[model_col] = max(1, int(num_mutations * ratio / total_ratio))
+    
+    # Adjust to ensure we get exactly num_mutations mutations
+    current_total = sum(model_selections.values())
+    if current_total < num_mutations:
+        # Add extra to prosst (highest priority)
+        model_selections['prosst_score'] += num_mutations - current_total
+    elif current_total > num_mutations:
+        # Remove excess from lowest priority models
+        excess = current_total - num_mutations
+        for model_col in ['esmif1_score', 'saprot_score', 'protssn_score', 'prosst_score']:
+            if excess <= 0:
+                break
+            reduce_by = min(excess, model_selections[model_col])
+            model_selections[model_col] -= reduce_by
+            excess -= reduce_by
+    return model_selections
+
+
+def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True,
+                          ranking: EnsembleRanking = None) -> List[str]:
     """
     Select recommended mutations based on frequency analysis of top mutations from each model.
     This is the original ensemble round strategy.
@@ -127,24 +245,23 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
         df: DataFrame with all model scores
         num_recommendations: Number of recommended mutations
         position_unique: Whether to ensure position uniqueness in recommendations
+        ranking: Precomputed EnsembleRanking of df
         
     Returns:
         List of recommended mutations
     """
-    model_columns = ['saprot_score', 'protssn_score', 'prosst_score', 'esmif1_score']
+    model_columns = MODEL_COLUMNS
+    if ranking is None:
+        ranking = EnsembleRanking(df, model_columns)
     selection_reasons = {}  # Track selection reasons for each mutation
     
-    def get_position_from_mutant(mutant: str) -> str:
-        """Extract position from mutant string, e.g., M1A -> 1"""
-        return ''.join(filter(str.isdigit, mutant))
-    
     def count_mutation_frequency(top_n: int) -> Dict[str, int]:
         """Count frequency of mutations in top N from each model"""
         mutation_counts = {}
         mutation_sources = {}  # Track which models contribute to each mutation
         
         for model_col in model_columns:
-            top_mutations = df.nlargest(top_n, model_col)['mutant'].tolist()
+            top_mutations = ranking.top(model_col, top_n)
             print(f"  {model_col} top {top_n}: {top_mutations[:10]}...")  # Show first 10 for debugging
             for mut in top_mutations:
                 mutation_counts[mut] = mutation_counts.get(mut, 0) + 1
@@ -154,27 +271,12 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
         
         return mutation_counts, mutation_sources
     
-    def get_mutation_rankings(mutant: str) -> Dict[str, int]:
-        """Get ranking of mutation in each model"""
-        rankings = {}
-        for model_col in model_columns:
-            model_df = df.sort_values(model_col, ascending=False).reset_index(drop=True)
-            try:
-                rank = model_df[model_df['mutant'] == mutant].index[0] + 1
-                rankings[model_col] = rank
-            except IndexError:
-                rankings[model_col] = None
-        return rankings
-    
     def format_rankings(rankings: Dict[str, int]) -> str:
         """Format rankings for display"""
         rank_strs = []
         for model, rank in rankings.items():
             model_short = model.replace('_score', '')
-            if rank is not None:
-                rank_strs.append(f"{model_short}:#{rank}")
-            else:
-                rank_strs.append(f"{model_short}:N/A")
+            rank_strs.append(f"{model_short}:#{rank}")
         return ', '.join(rank_strs)
     
     def filter_by_position(mutation_counts: Dict[str, int], mutation_sources: Dict[str, List[str]], step_name: str, top_n: int) -> List[str]:
@@ -182,7 +284,7 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
         position_best = {}
         
         for mutant, count in mutation_counts.items():
-            position = get_position_from_mutant(mutant)
+            position = ranking.position(mutant)
             
             if position not in position_best:
                 position_best[position] = (mutant, count)
@@ -191,34 +293,20 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
                 if count > current_count:
                     position_best[position] = (mutant, count)
                 elif count == current_count:
-                    # If same frequency, compare rankings and keep the better one
-                    current_rankings = get_mutation_rankings(current_mutant)
-                    new_rankings = get_mutation_rankings(mutant)
-                    
-                    # Calculate average rank (lower is better)
-                    current_ranks = [r for r in current_rankings.values() if r is not None]
-                    new_ranks = [r for r in new_rankings.values() if r is not None]
-                    
-                    if not current_ranks or not new_ranks:
-                        continue  # Skip if we can't compare rankings
-                        
-                    current_avg_rank = np.mean(current_ranks)
-                    new_avg_rank = np.mean(new_ranks)
-                    
-                    if new_avg_rank < current_avg_rank:  # New mutation has better average rank
+                    # If same frequency, keep the one with the better average rank (lower is better)
+                    if ranking.mean_rank(mutant) < ranking.mean_rank(current_mutant):
                         position_best[position] = (mutant, count)
         
         # Extract mutations
         selected_mutations = []
         
         for position, (mutant, count) in position_best.items():
-            rankings = get_mutation_rankings(mutant)
-            ranking_str = format_rankings(rankings)
+            ranking_str = format_rankings(ranking.rankings(mutant))
             overlap_models = mutation_sources.get(mutant, [])
             overlap_models_short = [m.replace('_score', '') for m in overlap_models]
             
             selected_mutations.append(mutant)
-            selection_reasons[mutant] = f"{step_name}: Best at position {position} ({count}/4 models). Rankings: [{ranking_str}]. Overlap in top{top_n}: {', '.join(overlap_models_short)}"
+            selection_reasons[mutant] = f"{step_name}: Best at position {ranking.position_names[position]} ({count}/4 models). Rankings: [{ranking_str}]. Overlap in top{top_n}: {', '.join(overlap_models_short)}"
         
         return selected_mutations
     
@@ -233,16 +321,14 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
     
     # Filter by position preference
     selected_mutations = filter_by_position(frequent_mutations, initial_sources, "Step1", initial_top_n)
-    selected_positions_count = len(set(get_position_from_mutant(mut) for mut in selected_mutations))
+    selected_positions_count = len(set(ranking.position(mut) for mut in selected_mutations))
     print(f"After position filtering: {len(selected_mutations)} mutations, {selected_positions_count} unique positions")
     
     # Sort by frequency (descending) and then by ensemble normalized score
-    selected_mutations.sort(key=lambda x: (frequent_mutations.get(x, 0), 
-                                         df[df['mutant'] == x]['ensemble_norm_score'].iloc[0]), 
-                          reverse=True)
+    selected_mutations.sort(key=lambda x: (frequent_mutations.get(x, 0), ranking.ensemble_score(x)), reverse=True)
     
     # Track positions already selected in Step 1
-    selected_positions_step1 = set(get_position_from_mutant(mut) for mut in selected_mutations)
+    selected_positions_step1 = set(ranking.position(mut) for mut in selected_mutations)
     
     # Check if we have enough unique positions
     selected_positions_count = len(selected_positions_step1)
@@ -253,7 +339,7 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
         for mut in selected_mutations:
             if len(final_selections) >= num_recommendations:
                 break
-            pos = get_position_from_mutant(mut)
+            pos = ranking.position(mut)
             if pos not in seen_positions:
                 final_selections.append(mut)
                 seen_positions.add(pos)
@@ -274,7 +360,7 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
     additional_frequent = {}
     for mut, count in expanded_counts.items():
         if count >= 2 and mut not in selected_mutations:
-            pos = get_position_from_mutant(mut)
+            pos = ranking.position(mut)
             if pos not in selected_positions_step1:  # Exclude positions already selected in Step 1
                 additional_frequent[mut] = count
     
@@ -285,19 +371,17 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
     
     # Remove any that are already selected or at already selected positions
     additional_selected = [mut for mut in additional_selected 
-                          if mut not in selected_mutations and get_position_from_mutant(mut) not in selected_positions_step1]
+                          if mut not in selected_mutations and ranking.position(mut) not in selected_positions_step1]
     
     # Sort additional mutations by frequency and ensemble normalized score
-    additional_selected.sort(key=lambda x: (additional_frequent.get(x, 0), 
-                                          df[df['mutant'] == x]['ensemble_norm_score'].iloc[0]), 
-                           reverse=True)
+    additional_selected.sort(key=lambda x: (additional_frequent.get(x, 0), ranking.ensemble_score(x)), reverse=True)
     
     # Add additional mutations, but limit by remaining needed positions
     positions_added = 0
     for mut in additional_selected:
         if positions_added >= remaining_needed:
             break
-        pos = get_position_from_mutant(mut)
+        pos = ranking.position(mut)
         # Double check - this position should not be covered (but should be redundant now)
         if pos not in selected_positions_step1:
             selected_mutations.append(mut)
@@ -315,39 +399,11 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
         print(f"Current unique positions: {selected_positions_count}")
         print(f"Target: {num_recommendations}")
         
-        # Define model ratios: prosst:protssn:saprot:esmif1 = 3:2:2:2
-        model_ratios = {
-            'prosst_score': 3,
-            'protssn_score': 2, 
-            'saprot_score': 2,
-            'esmif1_score': 2
-        }
-        
-        # Calculate how many to select from each model
-        total_ratio = sum(model_ratios.values())  # 9
-        model_selections = {}
-        for model_col, ratio in model_ratios.items():
-            model_selections[model_col] = max(1, int(remaining_needed * ratio / total_ratio))
-        
-        # Adjust to ensure we get exactly remaining_needed mutations
-        current_total = sum(model_selections.values())
-        if current_total < remaining_needed:
-            # Add extra to prosst (highest priority)
-            model_selections['prosst_score'] += remaining_needed - current_total
-        elif current_total > remaining_needed:
-            # Remove excess from lowest priority models
-            excess = current_total - remaining_needed
-            for model_col in ['esmif1_score', 'saprot_score', 'protssn_score', 'prosst_score']:
-                if excess <= 0:
-                    break
-                reduce_by = min(excess, model_selections[model_col])
-                model_selections[model_col] -= reduce_by
-                excess -= reduce_by
-        
+        model_selections = get_model_selections(remaining_needed)
         print(f"Model selection targets: {model_selections}")
         
         print(f"Positions already covered from previous steps: {len(selected_positions_step1)}")
-        print(f"Available positions for Step 3: {len(set(get_position_from_mutant(mut) for mut in df['mutant'])) - len(selected_positions_step1)}")
+        print(f"Available positions for Step 3: {len(ranking.position_names) - len(selected_positions_step1)}")
         
         # Select mutations from each model
         additional_mutations = []
@@ -362,39 +418,17 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
                 
             print(f"  Selecting {target_count} mutations from {model_col}...")
             
-            # Get top mutations from this model, excluding already selected positions
-            model_df = df.sort_values(model_col, ascending=False)
-            model_candidates = []
-            model_positions_covered = set()  # Track positions covered within this model
-            
-            for _, row in model_df.iterrows():
-                mut = row['mutant']
-                pos = get_position_from_mutant(mut)
-                
-                # Skip if position already covered globally (from Step 1 & 2)
-                if pos in selected_positions_step1:
-                    continue
-                    
-                # Skip if position already covered within this model
-                if pos in model_positions_covered:
-                    continue
-                    
-                # Skip if mutation already selected in previous steps
-                if mut in selected_mutations:
-                    continue
-                
-                model_candidates.append(mut)
-                model_positions_covered.add(pos)  # Mark this position as covered within this model
-                
-                if len(model_candidates) >= target_count:
-                    break
+            # Get top mutations from this model, one per position, excluding positions covered
+            # in previous steps and mutations already selected
+            model_candidates = ranking.first_per_position(
+                model_col, target_count, selected_positions_step1, selected_mutations
+            )
             
             # Add selected mutations from this model
             for mut in model_candidates:
                 additional_mutations.append(mut)
-                selected_positions_step1.add(get_position_from_mutant(mut))  # Update global position set
-                rankings = get_mutation_rankings(mut)
-                ranking_str = format_rankings(rankings)
+                selected_positions_step1.add(ranking.position(mut))  # Update global position set
+                ranking_str = format_rankings(ranking.rankings(mut))
                 model_short = model_col.replace('_score', '')
                 selection_reasons[mut] = f"Step3: Top {model_short} selection. Rankings: [{ranking_str}]"
             
@@ -414,48 +448,29 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
     if position_unique:
         # Use the existing position deduplication logic
         final_selections = []
-        seen_positions = set()
+        position_selected = {}  # position -> mutation kept at that position
         
         for mut in selected_mutations:
-            pos = get_position_from_mutant(mut)
-            if pos not in seen_positions:
+            pos = ranking.position(mut)
+            if pos not in position_selected:
                 final_selections.append(mut)
-                seen_positions.add(pos)
+                position_selected[pos] = mut
             else:
-                # Find the existing mutation at this position
-                existing_mut = None
-                for existing in final_selections:
-                    if get_position_from_mutant(existing) == pos:
-                        existing_mut = existing
-                        break
-                
-                if existing_mut:
-                    # Compare rankings and keep the better one
-                    existing_rankings = get_mutation_rankings(existing_mut)
-                    new_rankings = get_mutation_rankings(mut)
-                    
-                    # Calculate average rank (lower is better)
-                    existing_ranks = [r for r in existing_rankings.values() if r is not None]
-                    new_ranks = [r for r in new_rankings.values() if r is not None]
-                    
-                    if not existing_ranks or not new_ranks:
-                        continue  # Skip if we can't compare rankings
-                        
-                    existing_avg_rank = np.mean(existing_ranks)
-                    new_avg_rank = np.mean(new_ranks)
-                    
-                    if new_avg_rank < existing_avg_rank:  # New mutation has better average rank
-                        # Replace the existing mutation
-                        final_selections.remove(existing_mut)
-                        final_selections.append(mut)
-                        print(f"Replaced {existing_mut} with {mut} at position {pos} (better rank)")
+                # Compare average rankings (lower is better) and keep the better one
+                existing_mut = position_selected[pos]
+                if ranking.mean_rank(mut) < ranking.mean_rank(existing_mut):
+                    # Replace the existing mutation
+                    final_selections.remove(existing_mut)
+                    final_selections.append(mut)
+                    position_selected[pos] = mut
+                    print(f"Replaced {existing_mut} with {mut} at position {ranking.position_names[pos]} (better rank)")
         
         print(f"Final selection after deduplication: {len(final_selections)} mutations")
         
         # Ensure we return exactly num_recommendations mutations
         if len(final_selections) > num_recommendations:
             # Sort by ensemble normalized score to keep the best ones
-            final_selections.sort(key=lambda x: df[df['mutant'] == x]['ensemble_norm_score'].iloc[0], reverse=True)
+            final_selections.sort(key=ranking.ensemble_score, reverse=True)
             final_selections = final_selections[:num_recommendations]
             print(f"Trimmed to target number: {len(final_selections)} mutations")
     else:
@@ -473,7 +488,8 @@ def select_ensemble_round(df: pd.DataFrame, num_recommendations: int = 30, posit
     return final_selections
 
 
-def select_ensemble_top(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True) -> List[str]:
+def select_ensemble_top(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True,
+                        ranking: EnsembleRanking = None) -> List[str]:
     """
     Select top mutations based on ensemble normalized score.
     
@@ -481,26 +497,30 @@ def select_ensemble_top(df: pd.DataFrame, num_recommendations: int = 30, positio
         df: DataFrame with all model scores
         num_recommendations: Number of recommended mutations
         position_unique: Whether to ensure position uniqueness in recommendations
+        ranking: Precomputed EnsembleRanking of df
         
     Returns:
         List of recommended mutations
     """
     print(f"Using ensemble_top strategy to select {num_recommendations} mutations...")
+    if ranking is None:
+        ranking = EnsembleRanking(df)
     
     # Sort by ensemble normalized score and select top N
-    top_mutations = df.nlargest(num_recommendations, 'ensemble_norm_score')['mutant'].tolist()
+    top_mutations = ranking.top('ensemble_norm_score', num_recommendations)
     
     # Apply position uniqueness if requested
     if position_unique:
         print("Applying position uniqueness filter...")
-        top_mutations = ensure_position_uniqueness(top_mutations, df, num_recommendations)
+        top_mutations = ensure_position_uniqueness(top_mutations, df, num_recommendations, ranking)
         print(f"After position uniqueness: {len(top_mutations)} mutations")
     
     print(f"Selected top {len(top_mutations)} mutations by ensemble score")
     return top_mutations
 
 
-def select_individual_best(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True) -> List[str]:
+def select_individual_best(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True,
+                           ranking: EnsembleRanking = None) -> List[str]:
     """
     Select mutations by taking the best from each individual model with specific ratios.
     
@@ -508,50 +528,21 @@ def select_individual_best(df: pd.DataFrame, num_recommendations: int = 30, posi
         df: DataFrame with all model scores
         num_recommendations: Number of recommended mutations
         position_unique: Whether to ensure position uniqueness in recommendations
+        ranking: Precomputed EnsembleRanking of df
         
     Returns:
         List of recommended mutations
     """
     print(f"Using individual_best strategy to select {num_recommendations} mutations...")
+    if ranking is None:
+        ranking = EnsembleRanking(df)
     
-    # Define model ratios: prosst:protssn:saprot:esmif1 = 3:2:2:2
-    model_ratios = {
-        'prosst_score': 3,
-        'protssn_score': 2, 
-        'saprot_score': 2,
-        'esmif1_score': 2
-    }
-    
-    # Calculate how many to select from each model
-    total_ratio = sum(model_ratios.values())  # 9
-    model_selections = {}
-    for model_col, ratio in model_ratios.items():
-        model_selections[model_col] = max(1, int(num_recommendations * ratio / total_ratio))
-    
-    # Adjust to ensure we get exactly num_recommendations mutations
-    current_total = sum(model_selections.values())
-    if current_total < num_recommendations:
-        # Add extra to prosst (highest priority)
-        model_selections['prosst_score'] += num_recommendations - current_total
-    elif current_total > num_recommendations:
-        # Remove excess from lowest priority models
-        excess = current_total - num_recommendations
-        for model_col in ['esmif1_score', 'saprot_score', 'protssn_score', 'prosst_score']:
-            if excess <= 0:
-                break
-            reduce_by = min(excess, model_selections[model_col])
-            model_selections[model_col] -= reduce_by
-            excess -= reduce_by
-    
+    model_selections = get_model_selections(num_recommendations)
     print(f"Model selection targets: {model_selections}")
     
     selected_mutations = []
     seen_positions = set()
     
-    def get_position_from_mutant(mutant: str) -> str:
-        """Extract position from mutant string, e.g., M1A -> 1"""
-        return ''.join(filter(str.isdigit, mutant))
-    
     # Priority order: prosst > protssn > saprot > esmif1
     priority_order = ['prosst_score', 'protssn_score', 'saprot_score', 'esmif1_score']
     
@@ -562,23 +553,9 @@ def select_individual_best(df: pd.DataFrame, num_recommendations: int = 30, posi
             
         print(f"  Selecting {target_count} mutations from {model_col}...")
         
-        # Get top mutations from this model, excluding already selected positions
-        model_df = df.sort_values(model_col, ascending=False)
-        model_candidates = []
-        
-        for _, row in model_df.iterrows():
-            mut = row['mutant']
-            pos = get_position_from_mutant(mut)
-            
-            # Skip if position already covered
-            if pos in seen_positions:
-                continue
-                
-            model_candidates.append(mut)
-            seen_positions.add(pos)
-            
-            if len(model_candidates) >= target_count:
-                break
+        # Get top mutations from this model, one per position, excluding already selected positions
+        model_candidates = ranking.first_per_position(model_col, target_count, seen_positions)
+        seen_positions.update(ranking.position(mut) for mut in model_candidates)
         
         selected_mutations.extend(model_candidates)
         print(f"    Selected {len(model_candidates)} mutations from {model_col}")
@@ -588,13 +565,14 @@ def select_individual_best(df: pd.DataFrame, num_recommendations: int = 30, posi
     # Apply position uniqueness if requested
     if position_unique:
         print("Applying position uniqueness filter...")
-        selected_mutations = ensure_position_uniqueness(selected_mutations, df, num_recommendations)
+        selected_mutations = ensure_position_uniqueness(selected_mutations, df, num_recommendations, ranking)
         print(f"After position uniqueness: {len(selected_mutations)} mutations")
     
     return selected_mutations
 
 
-def select_frequency_based(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True) -> List[str]:
+def select_frequency_based(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True,
+                           ranking: EnsembleRanking = None) -> List[str]:
     """
     Select mutations based on frequency of appearance in top N from each model.
     
@@ -602,38 +580,37 @@ def select_frequency_based(df: pd.DataFrame, num_recommendations: int = 30, posi
         df: DataFrame with all model scores
         num_recommendations: Number of recommended mutations
         position_unique: Whether to ensure position uniqueness in recommendations
+        ranking: Precomputed EnsembleRanking of df
         
     Returns:
         List of recommended mutations
     """
     print(f"Using frequency_based strategy to select {num_recommendations} mutations...")
     
-    model_columns = ['saprot_score', 'protssn_score', 'prosst_score', 'esmif1_score']
+    model_columns = MODEL_COLUMNS
+    if ranking is None:
+        ranking = EnsembleRanking(df, model_columns)
     top_n = max(num_recommendations, 50)  # Analyze top N from each model
     
     # Count frequency of mutations in top N from each model
     mutation_counts = {}
     for model_col in model_columns:
-        top_mutations = df.nlargest(top_n, model_col)['mutant'].tolist()
-        for mut in top_mutations:
+        for mut in ranking.top(model_col, top_n):
             mutation_counts[mut] = mutation_counts.get(mut, 0) + 1
     
     # Sort by frequency (descending) and then by ensemble score
     frequent_mutations = [(mut, count) for mut, count in mutation_counts.items() if count >= 2]
-    frequent_mutations.sort(key=lambda x: (x[1], df[df['mutant'] == x[0]]['ensemble_norm_score'].iloc[0]), reverse=True)
+    frequent_mutations.sort(key=lambda x: (x[1], ranking.ensemble_score(x[0])), reverse=True)
     
     # Select top mutations, ensuring no duplicate positions
     selected_mutations = []
     seen_positions = set()
     
-    def get_position_from_mutant(mutant: str) -> str:
-        return ''.join(filter(str.isdigit, mutant))
-    
     for mut, count in frequent_mutations:
         if len(selected_mutations) >= num_recommendations:
             break
             
-        pos = get_position_from_mutant(mut)
+        pos = ranking.position(mut)
         if pos not in seen_positions:
             selected_mutations.append(mut)
             seen_positions.add(pos)
@@ -643,13 +620,14 @@ def select_frequency_based(df: pd.DataFrame, num_recommendations: int = 30, posi
     # Apply position uniqueness if requested
     if position_unique:
         print("Applying position uniqueness filter...")
-        selected_mutations = ensure_position_uniqueness(selected_mutations, df, num_recommendations)
+        selected_mutations = ensure_position_uniqueness(selected_mutations, df, num_recommendations, ranking)
         print(f"After position uniqueness: {len(selected_mutations)} mutations")
     
     return selected_mutations
 
 
-def select_diversity_based(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True) -> List[str]:
+def select_diversity_based(df: pd.DataFrame, num_recommendations: int = 30, position_unique: bool = True,
+                           ranking: EnsembleRanking = None) -> List[str]:
     """
     Select mutations to maximize diversity across different score ranges and models.
     
@@ -657,61 +635,39 @@ def select_diversity_based(df: pd.DataFrame, num_recommendations: int = 30, posi
         df: DataFrame with all model scores
         num_recommendations: Number of recommended mutations
         position_unique: Whether to ensure position uniqueness in recommendations
+        ranking: Precomputed EnsembleRanking of df
         
     Returns:
         List of recommended mutations
     """
     print(f"Using diversity_based strategy to select {num_recommendations} mutations...")
     
-    model_columns = ['saprot_score', 'protssn_score', 'prosst_score', 'esmif1_score']
+    model_columns = MODEL_COLUMNS
+    if ranking is None:
+        ranking = EnsembleRanking(df, model_columns)
     selected_mutations = []
     seen_positions = set()
     
-    def get_position_from_mutant(mutant: str) -> str:
-        return ''.join(filter(str.isdigit, mutant))
-    
     # Strategy: Select from different score ranges and models to ensure diversity
     # 1. Top performers from each model (25% each)
     top_per_model = max(1, num_recommendations // 4)
     
     for model_col in model_columns:
-        model_df = df.sort_values(model_col, ascending=False)
-        count = 0
-        
-        for _, row in model_df.iterrows():
-            if count >= top_per_model:
-                break
-                
-            mut = row['mutant']
-            pos = get_position_from_mutant(mut)
-            
-            if pos not in seen_positions:
-                selected_mutations.append(mut)
-                seen_positions.add(pos)
-                count += 1
+        model_mutations = ranking.first_per_position(model_col, top_per_model, seen_positions)
+        selected_mutations.extend(model_mutations)
+        seen_positions.update(ranking.position(mut) for mut in model_mutations)
     
     # 2. Fill remaining with ensemble top performers
     remaining = num_recommendations - len(selected_mutations)
     if remaining > 0:
-        ensemble_df = df.sort_values('ensemble_norm_score', ascending=False)
-        
-        for _, row in ensemble_df.iterrows():
-            if len(selected_mutations) >= num_recommendations:
-                break
-                
-            mut = row['mutant']
-            pos = get_position_from_mutant(mut)
-            
-            if pos not in seen_positions:
-                selected_mutations.append(mut)
-                seen_positions.add(pos)
+        selected_mutations.extend(ranking.first_per_position('ensemble_norm_score', remaining, seen_positions))
     
     print(f"Selected {len(selected_mutations)} mutations for diversity")
     
     # Apply position uniqueness if requested
     if position_unique:
         print("Applying position uniqueness filter...")
-        selected_mutations = ensure_position_uniqueness(selected_mutations, df, num_recommendations)
+        selected_mutations = ensure_position_uniqueness(selected_mutations, df, num_recommendations, ranking)
         print(f"After position uniqueness: {len(selected_mutations)} mutations")
     
     return selected_mutations
@@ -743,8 +699,9 @@ def easy_mutation_prediction(pdb_file: str, num_recommendations: int = 30,
     print(f"Starting ensemble mutation prediction for {pdb_file}")
     print(f"Target recommendations: {num_recommendations}")
     
-    # Extract sequence from PDB
-    sequence = extract_seq_from_pdb(pdb_file)
+    # Parse the structure once, all scorers below share it
+    structure = parse_structure(pdb_file)
+    sequence = extract_seq_from_pdb(structure)
     print(f"Sequence length: {len(sequence)}")
     
     # Generate or load mutations
@@ -779,7 +736,7 @@ def easy_mutation_prediction(pdb_file: str, num_recommendations: int = 30,
         
         # Calculate ProSST scores
         print("Calculating ProSST scores...")
-        prosst_scores = prosst_score(pdb_file, mutants)
+        prosst_scores = prosst_score(structure, mutants)
         df['prosst_score'] = prosst_scores
         # Clear GPU memory after ProSST
         if torch.cuda.is_available():
@@ -789,7 +746,7 @@ def easy_mutation_prediction(pdb_file: str, num_recommendations: int = 30,
         
         # Calculate SaProt scores
         print("Calculating SaProt scores...")
-        saprot_scores = saprot_score(pdb_file, mutants)
+        saprot_scores = saprot_score(structure, mutants)
         df['saprot_score'] = saprot_scores
         # Clear GPU memory after SaProt
         if torch.cuda.is_available():
@@ -799,7 +756,7 @@ def easy_mutation_prediction(pdb_file: str, num_recommendations: int = 30,
         
         # Calculate ProtSSN scores
         print("Calculating ProtSSN scores...")
-        protssn_scores = protssn_score(pdb_file, mutants)
+        protssn_scores = protssn_score(structure, mutants)
         df['protssn_score'] = protssn_scores
         # Clear GPU memory after ProtSSN
         if torch.cuda.is_available():
@@ -809,7 +766,7 @@ def easy_mutation_prediction(pdb_file: str, num_recommendations: int = 30,
         
         # Calculate ESM-IF1 scores
         print("Calculating ESM-IF1 scores...")
-        esmif1_scores = esmif1_score(pdb_file, mutants)
+        esmif1_scores = esmif1_score(structure, mutants)
         df['esmif1_score'] = esmif1_scores
         # Clear GPU memory after ESM-IF1
         if torch.cuda.is_available():
@@ -12,6 +12,7 @@ import shutil
 import torch
 from pathlib import Path
 from esm.constants import proteinseq_toks
+from src.utils.fasta import FastaFile, FastaSequences
 
 RawMSA = Sequence[Tuple[str, str]]
 
@@ -19,42 +20,22 @@ RawMSA = Sequence[Tuple[str, str]]
 class FastaBatchedDataset(object):
     def __init__(self, sequence_labels, sequence_strs):
         self.sequence_labels = list(sequence_labels)
-        self.sequence_strs = list(sequence_strs)
+        # lazy views over an indexed FASTA file are kept as they are
+        self.sequence_strs = sequence_strs if isinstance(sequence_strs, FastaSequences) else list(sequence_strs)
 
     @classmethod
     def from_file(cls, fasta_file):
-        sequence_labels, sequence_strs = [], []
-        cur_seq_label = None
-        buf = []
-
-        def _flush_current_seq():
-            nonlocal cur_seq_label, buf
-            if cur_seq_label is None:
-                return
-            sequence_labels.append(cur_seq_label)
-            sequence_strs.append("".join(buf))
-            cur_seq_label = None
-            buf = []
-
-        with open(fasta_file, "r") as infile:
-            for line_idx, line in enumerate(infile):
-                if line.startswith(">"):  # label line
-                    _flush_current_seq()
-                    line = line[1:].strip()
-                    if len(line) > 0:
-                        cur_seq_label = line
-                    else:
-                        cur_seq_label = f"seqnum{line_idx:09d}"
-                else:  # sequence line
-                    buf.append(line.strip())
-
-        _flush_current_seq()
+        fasta = FastaFile(fasta_file)
+        sequence_labels = []
+        for idx in range(len(fasta)):
+            label = fasta.header(idx)
+            sequence_labels.append(label if len(label) > 0 else f"seqnum{idx:09d}")
 
         assert len(set(sequence_labels)) == len(
             sequence_labels
         ), "Found duplicate sequence labels"
 
-        return cls(sequence_labels, sequence_strs)
+        return cls(sequence_labels, FastaSequences(fasta))
 
     def __len__(self):
         return len(self.sequence_labels)
@@ -63,7 +44,10 @@ class FastaBatchedDataset(object):
         return self.sequence_labels[idx], self.sequence_strs[idx]
 
     def get_batch_indices(self, toks_per_batch, extra_toks_per_seq=0):
-        sizes = [(len(s), i) for i, s in enumerate(self.sequence_strs)]
+        if isinstance(self.sequence_strs, FastaSequences):
+            sizes = [(sz, i) for i, sz in enumerate(self.sequence_strs.lengths)]
+        else:
+            sizes = [(len(s), i) for i, s in enumerate(self.sequence_strs)]
         sizes.sort()
         batches = []
         buf = []
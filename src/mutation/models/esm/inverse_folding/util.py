@@ -23,12 +23,15 @@ from esm.data import BatchConverter
 def load_structure(fpath, chain=None):
     """
     Args:
-        fpath: filepath to either pdb or cif file
+        fpath: filepath to either pdb or cif file, or a ParsedStructure from src.mutation.structure
         chain: the chain id or list of chain ids to load
     Returns:
         biotite.structure.AtomArray
     """
-    if fpath.endswith('cif'):
+    if not isinstance(fpath, str):
+        # already parsed, e.g. shared by the scorers of easy_mutation_prediction
+        structure = fpath.atoms
+    elif fpath.endswith('cif'):
         with open(fpath) as fin:
             pdbxf = pdbx.PDBxFile.read(fin)
         structure = pdbx.get_structure(pdbxf, model=1)
@@ -9,10 +9,9 @@ import warnings
 from argparse import Namespace
 from pathlib import Path
 
-import torch
-
 import esm
 from esm.model.esm2 import ESM2
+from src.utils.checkpoint import load_checkpoint, load_url_checkpoint
 
 
 def _has_regression_weights(model_name):
@@ -30,14 +29,8 @@ def load_model_and_alphabet(model_name):
 
 def load_hub_workaround(url):
     try:
-        data = torch.hub.load_state_dict_from_url(url, progress=False, map_location="cpu")
-    except RuntimeError:
-        # Pytorch version issue - see https://github.com/pytorch/pytorch/issues/43106
-        fn = Path(url).name
-        data = torch.load(
-            f"{torch.hub.get_dir()}/checkpoints/{fn}",
-            map_location="cpu",
-        )
+        # memory-maps the cached file, the checkpoints hold an argparse Namespace next to the weights
+        data = load_url_checkpoint(url, weights_only=False)
     except urllib.error.HTTPError as e:
         raise Exception(f"Could not load {url}, check if you specified a correct model name?")
     return data
@@ -67,11 +60,11 @@ def load_model_and_alphabet_hub(model_name):
 def load_model_and_alphabet_local(model_location):
     """Load from local path. The regression weights need to be co-located"""
     model_location = Path(model_location)
-    model_data = torch.load(str(model_location), map_location="cpu")
+    model_data = load_checkpoint(model_location, weights_only=False)
     model_name = model_location.stem
     if _has_regression_weights(model_name):
         regression_location = str(model_location.with_suffix("")) + "-contact-regression.pt"
-        regression_data = torch.load(regression_location, map_location="cpu")
+        regression_data = load_checkpoint(regression_location, weights_only=False)
     else:
         regression_data = None
     return load_model_and_alphabet_core(model_name, model_data, regression_data)
@@ -5,9 +5,10 @@ import argparse
 import torch
 import datetime
 import pandas as pd
-from tqdm import tqdm
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from src.mutation.utils import generate_mutations_from_sequence
+from src.mutation.mutant_table import score_mutants, vocab_alphabet
+from src.utils.fasta import read_fasta_sequence
 from typing import List
 
 
@@ -18,7 +19,7 @@ def esm2_score(fasta_file: str, mutants: List[str],
     
     Args:
         fasta_file: Path to the FASTA file
-        mutants: List of mutation strings (e.g., ["A1B", "C2D"])
+        mutants: List of mutation strings (e.g., ["A1B", "C2D"]) or a MutantTable
         model_name: ESM2 model name
         
     Returns:
@@ -32,9 +33,7 @@ def esm2_score(fasta_file: str, mutants: List[str],
     esm2_tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
 
     # Load sequence from FASTA file
-    with open(fasta_file, 'r') as f:
-        lines = f.readlines()
-        sequence = ''.join(line.strip() for line in lines[1:])
+    sequence = read_fasta_sequence(fasta_file)
 
     # Tokenize sequence
     tokenized_res = esm2_tokenizer([sequence], return_tensors='pt')
@@ -47,17 +46,10 @@ def esm2_score(fasta_file: str, mutants: List[str],
         outputs = esm2_model(input_ids=input_ids, attention_mask=attention_mask)
         logits = outputs.logits.squeeze()
 
-    # Calculate scores for each mutation
-    pred_scores = []
-    for mutant in tqdm(mutants):
-        mutant_score = 0
-        sep = ":" if ":" in mutant else ";"
-        for sub_mutant in mutant.split(sep):
-            wt, idx, mt = sub_mutant[0], int(sub_mutant[1:-1]), sub_mutant[-1]
-            # Calculate log probability difference: log(P(mutant)) - log(P(wildtype))
-            pred = logits[idx, vocab[mt]] - logits[idx, vocab[wt]]
-            mutant_score += pred.item()
-        pred_scores.append(mutant_score / len(mutant.split(sep)))
+    # Calculate scores for each mutation: log(P(mutant)) - log(P(wildtype)) averaged over the sites
+    alphabet = vocab_alphabet(vocab)
+    site_scores = logits[:, [vocab[aa] for aa in alphabet]].float().cpu().numpy()
+    pred_scores = score_mutants(mutants, site_scores, offset=0, alphabet=alphabet)
 
     return pred_scores
 
@@ -70,9 +62,7 @@ def main():
     args = parser.parse_args()
 
     # Load sequence from FASTA file
-    with open(args.fasta_file, 'r') as f:
-        lines = f.readlines()
-        sequence = ''.join(line.strip() for line in lines[1:])
+    sequence = read_fasta_sequence(args.fasta_file)
 
     # Handle mutations
     if args.mutations_csv is not None:
@@ -2,6 +2,7 @@ import sys
 import os
 sys.path.append(os.getcwd())
 import argparse
+import functools
 import torch
 import numpy as np
 import datetime
@@ -13,7 +14,10 @@ from src.mutation.models.esm.inverse_folding.util import CoordBatchConverter
 from src.mutation.models.esm import pretrained
 from tqdm import tqdm
 from src.mutation.utils import generate_mutations_from_sequence
-from typing import List
+from src.mutation.mutant_table import MutantTable, vocab_alphabet
+from src.mutation.structure import ParsedStructure, parse_structure, structure_path
+from src.mutation.batch import add_batch_arguments, resolve_structures, score_structures
+from typing import List, Union
 
 warnings.filterwarnings("ignore")
 
@@ -35,30 +39,76 @@ def full_sequence(origin_sequence, raw_mutant, offset):
         sequence = sequence[:pos] + to + sequence[pos + 1:]
     return sequence
 
-def load_coords_and_sequence(pdb_path: str, chain: str = "A") -> tuple:
+def load_coords_and_sequence(pdb_path: Union[str, ParsedStructure], chain: str = "A") -> tuple:
     """
     Load coordinates and sequence from PDB file.
     
     Args:
-        pdb_path: Path to PDB file
+        pdb_path: Path to PDB file or the structure parsed by parse_structure
         chain: Chain ID to extract
         
     Returns:
         tuple: (coordinates, sequence)
     """
-    coords, pdb_seq = esm.inverse_folding.util.load_coords(pdb_path, chain)
+    coords, pdb_seq = esm.inverse_folding.util.load_coords(parse_structure(pdb_path), chain)
     return coords, pdb_seq
 
 
-def esmif1_score(pdb_file: str, mutants: List[str], chain: str = "A", 
+def esmif1_features(pdb_file: Union[str, ParsedStructure], chain: str = "A") -> dict:
+    """Backbone coordinates and sequence of a chain, the featurization step of the batch mode."""
+    coords, pdb_seq = load_coords_and_sequence(pdb_file, chain)
+    return {'sequence': pdb_seq, 'coords': coords}
+
+
+def esmif1_log_probs(model, alphabet, items: List[dict], device) -> List[np.ndarray]:
+    """
+    Log-probabilities of every target token given the wild-type sequence before it, for a padded
+    batch of featurized structures.
+    
+    Returns:
+        One (len(sequence) + 1, vocab) array per structure, the residues followed by the eos token
+    """
+    batch_converter = CoordBatchConverter(alphabet)
+    coords_, confidence, strs, tokens, padding_mask = batch_converter(
+        [(item['coords'], None, item['sequence']) for item in items]
+    )
+    with torch.no_grad():
+        logits, _ = model.forward(
+            coords_.to(device),
+            padding_mask.to(device),
+            confidence.to(device),
+            tokens[:, :-1].to(device)  # prev_output_tokens
+        )
+    log_probs = torch.log_softmax(logits.float(), dim=1).transpose(1, 2)
+    return [log_probs[i, :len(item['sequence']) + 1].cpu().numpy() for i, item in enumerate(items)]
+
+
+def esmif1_mutant_scores(log_probs: np.ndarray, sequence: str, mutants: MutantTable, alphabet) -> np.ndarray:
+    """
+    Score of every mutant as minus the mean cross entropy of the mutated sequence under the wild-type
+    logits, the non-exhaustive ESM-IF1 score. Only the mutated positions differ from the wild type,
+    so the score is (log P(wild type) + sum of log P(mt) - log P(wt) over the substitutions) / (L + 1).
+    """
+    targets = [alphabet.get_idx(aa) for aa in sequence] + [alphabet.eos_idx]
+    wt_total = log_probs[np.arange(len(targets)), targets].sum(dtype=np.float64)
+    residues = np.frombuffer(sequence.encode("ascii"), dtype=np.uint8)
+    if len(mutants.position) and (mutants.position.max() > len(sequence) or np.any(residues[mutants.position - 1] != mutants.wt)):
+        raise ValueError("Mutants do not match the wild-type sequence of the structure")
+    letters = vocab_alphabet(alphabet.all_toks)
+    site_scores = log_probs[:len(sequence), [alphabet.get_idx(aa) for aa in letters]]
+    deltas = mutants.score(site_scores, offset=-1, alphabet=letters) * mutants.sizes
+    return (wt_total + deltas) / len(targets)
+
+
+def esmif1_score(pdb_file: Union[str, ParsedStructure], mutants: List[str], chain: str = "A", 
                  model_name: str = "esm_if1_gvp4_t16_142M_UR50", 
                  exhaustive: bool = False) -> List[float]:
     """
     Calculate ESM-IF1 scores for a list of mutations.
     
     Args:
-        pdb_file: Path to the PDB file
-        mutants: List of mutation strings (e.g., ["A1B", "C2D"])
+        pdb_file: Path to the PDB file or the structure parsed by parse_structure
+        mutants: List of mutation strings (e.g., ["A1B", "C2D"]), or a MutantTable if not exhaustive
         chain: Chain ID to extract from PDB
         model_name: ESM-IF1 model name
         exhaustive: Whether to use exhaustive mode
@@ -76,29 +126,21 @@ def esmif1_score(pdb_file: str, mutants: List[str], chain: str = "A",
     model = model.to(device)
     
     # Load coordinates and sequence
-    print(f"Loading coordinates from: {pdb_file}")
-    coords, pdb_seq = load_coords_and_sequence(pdb_file, chain)
+    print(f"Loading coordinates from: {structure_path(pdb_file)}")
+    features = esmif1_features(pdb_file, chain)
+    coords, pdb_seq = features['coords'], features['sequence']
     print(f"Sequence length: {len(pdb_seq)}")
+    print(f"Processing {len(mutants)} mutations...")
     
-    # Prepare batch converter
-    batch_converter = CoordBatchConverter(alphabet)
-    
-    # Use cached computation for efficiency
-    batch = [(coords, None, pdb_seq)]
-    coords_, confidence, strs, tokens, padding_mask = batch_converter(batch)
-    prev_output_tokens = tokens[:, :-1]
-    with torch.no_grad():
-        logits, _ = model.forward(
-            coords_.to(device),
-            padding_mask.to(device),
-            confidence.to(device),
-            prev_output_tokens.to(device)
-        )
+    if not exhaustive:
+        # All mutants are scored under the logits of the wild-type sequence
+        log_probs = esmif1_log_probs(model, alphabet, [features], device)[0]
+        mutants = mutants if isinstance(mutants, MutantTable) else MutantTable.from_strings(mutants)
+        return esmif1_mutant_scores(log_probs, pdb_seq, mutants, alphabet).tolist()
     
-    # Calculate scores for each mutation
+    # Exhaustive mode: one forward pass per mutated sequence
+    batch_converter = CoordBatchConverter(alphabet)
     scores = []
-    print(f"Processing {len(mutants)} mutations...")
-    
     for mutation in tqdm(mutants):
         # Create mutated sequence
         mutated_seq = full_sequence(pdb_seq, mutation, 1)
@@ -107,15 +149,14 @@ def esmif1_score(pdb_file: str, mutants: List[str], chain: str = "A",
         batch = [(coords, None, mutated_seq)]
         coords_, confidence, strs, tokens, padding_mask = batch_converter(batch)
         
-        if exhaustive:
-            # Forward pass
-            with torch.no_grad():
-                logits, _ = model.forward(
-                    coords_.to(device),
-                    padding_mask.to(device),
-                    confidence.to(device),
-                    tokens[:, :-1].to(device)  # prev_output_tokens
-                )
+        # Forward pass
+        with torch.no_grad():
+            logits, _ = model.forward(
+                coords_.to(device),
+                padding_mask.to(device),
+                confidence.to(device),
+                tokens[:, :-1].to(device)  # prev_output_tokens
+            )
         
         # Calculate loss
         target = tokens[:, 1:].to(device)
@@ -131,15 +172,58 @@ def esmif1_score(pdb_file: str, mutants: List[str], chain: str = "A",
     return scores
 
 
+def esmif1_score_batch(structures: str, output_dir: str, mutations_csv: str = None, chain: str = "A",
+                       model_name: str = "esm_if1_gvp4_t16_142M_UR50", max_tokens: int = 4096, num_workers: int = 4):
+    """
+    Score a library of structures with one model load, see src/mutation/batch.py.
+    
+    Args:
+        structures: Directory, glob pattern or manifest of PDB files
+        output_dir: Output directory partitioned by structure id, finished structures are skipped
+        mutations_csv: Mutations scored on every structure, all single mutants if None
+        chain: Chain ID to extract from every PDB
+        model_name: ESM-IF1 model name
+        max_tokens: Residues per padded batch
+        num_workers: Featurization worker processes
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+    print(f"Loading ESM-IF1 model: {model_name}")
+    model, alphabet = pretrained.load_model_and_alphabet(model_name)
+    model.eval()
+    model = model.to(device)
+    
+    return score_structures(
+        resolve_structures(structures),
+        featurize=functools.partial(esmif1_features, chain=chain),
+        forward=lambda items: esmif1_log_probs(model, alphabet, items, device),
+        score=lambda features, log_probs, table: esmif1_mutant_scores(log_probs, features['sequence'], table, alphabet),
+        column='esmif1_score', output_dir=output_dir, mutations_csv=mutations_csv,
+        max_tokens=max_tokens, num_workers=num_workers
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(description='ESM-IF1 protein mutation scoring')
-    parser.add_argument('--pdb_file', type=str, required=True, help='Path to the PDB file')
+    parser.add_argument('--pdb_file', type=str, default=None, help='Path to the PDB file')
     parser.add_argument('--mutations_csv', type=str, default=None, help='Path to the mutations CSV file')
     parser.add_argument('--output_csv', type=str, default=None, help='Path to the output CSV file')
     parser.add_argument('--chain', type=str, default="A", help='Chain to be processed')
     parser.add_argument('--exhaustive', action='store_true', help='Use exhaustive mode')
+    add_batch_arguments(parser)
     args = parser.parse_args()
 
+    if args.structures is not None:
+        if args.output_dir is None:
+            parser.error('--structures needs --output_dir')
+        if args.exhaustive:
+            parser.error('the batch mode does not support --exhaustive')
+        esmif1_score_batch(args.structures, args.output_dir, args.mutations_csv, args.chain,
+                           max_tokens=args.max_tokens, num_workers=args.num_workers)
+        return
+    if args.pdb_file is None:
+        parser.error('one of --pdb_file or --structures is required')
+
     # Load coordinates and sequence to get the sequence for mutation generation
     coords, pdb_seq = load_coords_and_sequence(args.pdb_file, args.chain)
     
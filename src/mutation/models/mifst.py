@@ -2,22 +2,56 @@ import sys
 import os
 sys.path.append(os.getcwd())
 import argparse
+import functools
 import torch
+import numpy as np
 import pandas as pd
-from src.mutation.models.sequence_models.pdb_utils import parse_PDB, process_coords
+from src.mutation.models.sequence_models.pdb_utils import parse_PDB, process_coords_knn
 from src.mutation.models.sequence_models.pretrained import load_model_and_alphabet
 from src.mutation.models.sequence_models.constants import PROTEIN_ALPHABET
 from src.mutation.utils import generate_mutations_from_sequence
-from typing import List
-from tqdm import tqdm
+from src.mutation.mutant_table import score_mutants, vocab_alphabet
+from src.mutation.structure import ParsedStructure
+from src.mutation.batch import add_batch_arguments, resolve_structures, score_structures
+from typing import List, Union
 
-def mifst_score(pdb_file: str, mutants: List[str], model_location: str = 'mifst') -> List[float]:
+
+def mifst_features(pdb_file: Union[str, ParsedStructure], n_connections: int = 30) -> dict:
+    """
+    Residue sequence and neighbour-first structure features of a PDB file, see process_coords_knn.
+    Only needs numpy, so it runs in the featurization workers of the batch mode.
+    """
+    coords, sequence, _ = parse_PDB(pdb_file)
+    coords = {
+        'N': coords[:, 0],
+        'CA': coords[:, 1],
+        'C': coords[:, 2]
+    }
+    return {'sequence': sequence, 'features': process_coords_knn(coords, n_connections)}
+
+
+def mifst_site_scores(model, collater, items: List[dict], device, alphabet: str) -> List[np.ndarray]:
+    """
+    Per-site logits of a padded batch of featurized structures.
+
+    Returns:
+        One (len(sequence), len(alphabet)) array per structure
+    """
+    src, nodes, edges, connections, edge_mask = collater([[item['sequence'], item['features']] for item in items])
+    with torch.no_grad():
+        logits = model(src.to(device), nodes.to(device), edges.to(device), 
+                      connections.to(device), edge_mask.to(device), result='logits')
+    # logits shape: (batch, max_len, 20)
+    columns = [PROTEIN_ALPHABET.index(aa) for aa in alphabet]
+    return [logits[i, :len(item['sequence'])][:, columns].float().cpu().numpy() for i, item in enumerate(items)]
+
+def mifst_score(pdb_file: Union[str, ParsedStructure], mutants: List[str], model_location: str = 'mifst') -> List[float]:
     """
     Calculate MIF-ST scores for a list of mutations.
     
     Args:
-        pdb_file: Path to the PDB file
-        mutants: List of mutation strings (e.g., ["A1B", "C2D"])
+        pdb_file: Path to the PDB file or the structure parsed by parse_structure
+        mutants: List of mutation strings (e.g., ["A1B", "C2D"]) or a MutantTable
         model_location: Path or name of the MIF-ST model
         
     Returns:
@@ -31,55 +65,65 @@ def mifst_score(pdb_file: str, mutants: List[str], model_location: str = 'mifst'
     model = model.to(device)
     model.eval()
 
-    # Parse PDB file and extract coordinates
-    coords, sequence, _ = parse_PDB(pdb_file)
-    coords = {
-        'N': coords[:, 0],
-        'CA': coords[:, 1],
-        'C': coords[:, 2]
-    }
-    
-    # Process coordinates
-    dist, omega, theta, phi = process_coords(coords)
-    batch = [[sequence, torch.tensor(dist, dtype=torch.float).to(device),
-              torch.tensor(omega, dtype=torch.float).to(device),
-              torch.tensor(theta, dtype=torch.float).to(device),
-              torch.tensor(phi, dtype=torch.float).to(device)]]
-    
-    # Prepare input for model
-    src, nodes, edges, connections, edge_mask = collater(batch)
-    
-    # Compute logits
-    with torch.no_grad():
-        logits = model(src.to(device), nodes.to(device), edges.to(device), 
-                      connections.to(device), edge_mask.to(device), result='logits')
-    # logits shape: (1, seq_len, 20)
+    # Parse the PDB file, only the edges kept by the collater are featurized
+    features = mifst_features(pdb_file, collater.n_connections)
 
     # Calculate scores for each mutation
-    pred_scores = []
-    for mutant in tqdm(mutants):
-        mutant_score = 0
-        sep = ":" if ":" in mutant else ";"
-        for sub_mut in mutant.split(sep):
-            if sub_mut.lower() == "wt":
-                continue
-            wt, idx, mt = sub_mut[0], int(sub_mut[1:-1]) - 1, sub_mut[-1]
-            wt_encoded, mt_encoded = PROTEIN_ALPHABET.index(wt), PROTEIN_ALPHABET.index(mt)
-            pred = logits[0, idx, mt_encoded] - logits[0, idx, wt_encoded]
-            mutant_score += pred.item()
-        pred_scores.append(mutant_score / len(mutant.split(sep)))
+    alphabet = vocab_alphabet(PROTEIN_ALPHABET)
+    site_scores = mifst_site_scores(model, collater, [features], device, alphabet)[0]
+    pred_scores = score_mutants(mutants, site_scores, offset=-1, alphabet=alphabet)
 
     return pred_scores
 
 
+def mifst_score_batch(structures: str, output_dir: str, mutations_csv: str = None, model_location: str = 'mifst',
+                      max_tokens: int = 4096, num_workers: int = 4):
+    """
+    Score a library of structures with one model load, see src/mutation/batch.py.
+    
+    Args:
+        structures: Directory, glob pattern or manifest of PDB files
+        output_dir: Output directory partitioned by structure id, finished structures are skipped
+        mutations_csv: Mutations scored on every structure, all single mutants if None
+        model_location: Path or name of the MIF-ST model
+        max_tokens: Residues per padded batch
+        num_workers: Featurization worker processes
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+    model, collater = load_model_and_alphabet(model_location)
+    model = model.to(device)
+    model.eval()
+    alphabet = vocab_alphabet(PROTEIN_ALPHABET)
+
+    return score_structures(
+        resolve_structures(structures),
+        featurize=functools.partial(mifst_features, n_connections=collater.n_connections),
+        forward=lambda items: mifst_site_scores(model, collater, items, device, alphabet),
+        score=lambda features, site_scores, table: table.score(site_scores, offset=-1, alphabet=alphabet),
+        column='mifst_score', output_dir=output_dir, mutations_csv=mutations_csv,
+        max_tokens=max_tokens, num_workers=num_workers
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(description='MIF-ST')
-    parser.add_argument('--pdb_file', type=str, required=True, help='Path to the pdb file')
+    parser.add_argument('--pdb_file', type=str, default=None, help='Path to the pdb file')
     parser.add_argument('--mutations_csv', type=str, default=None, help='Path to the mutations CSV file')
     parser.add_argument('--output_csv', type=str, default=None, help='Path to the output CSV file')
     parser.add_argument('--model_location', type=str, default='mifst', help='Path or name of the MIF-ST model')
+    add_batch_arguments(parser)
     args = parser.parse_args()
 
+    if args.structures is not None:
+        if args.output_dir is None:
+            parser.error('--structures needs --output_dir')
+        mifst_score_batch(args.structures, args.output_dir, args.mutations_csv, args.model_location,
+                          args.max_tokens, args.num_workers)
+        return
+    if args.pdb_file is None:
+        parser.error('one of --pdb_file or --structures is required')
+
     # Parse PDB file to get sequence
     coords, sequence, _ = parse_PDB(args.pdb_file)
 
@@ -8,18 +8,62 @@ import pandas as pd
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from src.data.prosst.structure.get_sst_seq import SSTPredictor
 from src.mutation.utils import generate_mutations_from_sequence
+from src.mutation.mutant_table import score_mutants, vocab_alphabet
 from src.mutation.models.esm.inverse_folding.util import extract_seq_from_pdb
-from typing import List
-from tqdm import tqdm
+from src.mutation.structure import ParsedStructure, parse_structure
+from src.mutation.batch import add_batch_arguments, resolve_structures, score_structures
+from typing import List, Union
 
 
-def prosst_score(pdb_file: str, mutants: List[str]) -> List[float]:
+def prosst_features(pdb_file: Union[str, ParsedStructure]) -> dict:
+    """
+    Residue sequence of a structure, the featurization step of the batch mode. The structure
+    tokens are predicted per batch by the SSTPredictor of the main process.
+    """
+    structure = parse_structure(pdb_file)
+    return {'sequence': extract_seq_from_pdb(structure), 'path': structure.path}
+
+
+def prosst_site_scores(model, tokenizer, residue_sequences: List[str], structure_sequences: List[List[int]],
+                       device, alphabet: str) -> List:
+    """
+    Per-site log-probabilities of a padded batch of residue and structure token sequences.
+    
+    Returns:
+        One (L, len(alphabet)) array per sequence, without the special tokens
+    """
+    # Tokenize sequences, structure tokens are shifted past the special tokens and padded with 0
+    tokenized_res = tokenizer(residue_sequences, return_tensors='pt', padding=True)
+    input_ids = tokenized_res['input_ids'].to(device)
+    attention_mask = tokenized_res['attention_mask'].to(device)
+    structure_input_ids = torch.zeros_like(input_ids)
+    for i, structure_sequence in enumerate(structure_sequences):
+        structure_input_ids[i, :len(structure_sequence) + 2] = torch.tensor(
+            [1, *[t + 3 for t in structure_sequence], 2], dtype=torch.long
+        )
+
+    # Compute logits
+    with torch.no_grad():
+        outputs = model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            ss_input_ids=structure_input_ids
+        )
+    vocab = tokenizer.get_vocab()
+    columns = [vocab[aa] for aa in alphabet]
+    return [
+        torch.log_softmax(outputs.logits[i, 1:1 + len(sequence)], dim=-1)[:, columns].float().cpu().numpy()
+        for i, sequence in enumerate(residue_sequences)
+    ]
+
+
+def prosst_score(pdb_file: Union[str, ParsedStructure], mutants: List[str]) -> List[float]:
     """
     Calculate ProSST scores for a list of mutations.
     
     Args:
-        pdb_file: Path to the PDB file
-        mutants: List of mutation strings (e.g., ["A1B", "C2D"])
+        pdb_file: Path to the PDB file or the structure parsed by parse_structure
+        mutants: List of mutation strings (e.g., ["A1B", "C2D"]) or a MutantTable
         
     Returns:
         List of scores corresponding to the input mutations
@@ -31,54 +75,95 @@ def prosst_score(pdb_file: str, mutants: List[str]) -> List[float]:
     prosst_model = AutoModelForMaskedLM.from_pretrained("AI4Protein/ProSST-2048", trust_remote_code=True).to(device)
     prosst_tokenizer = AutoTokenizer.from_pretrained("AI4Protein/ProSST-2048", trust_remote_code=True)
     predictor = SSTPredictor(structure_vocab_size=2048)
+    structure = parse_structure(pdb_file)
 
     # Extract structure sequence from PDB
-    structure_sequence = predictor.predict_from_pdb(pdb_file)[0]['2048_sst_seq']
-    structure_sequence_offset = [i + 3 for i in structure_sequence]
+    structure_sequence = predictor.predict_from_pdb(structure)[0]['2048_sst_seq']
 
     # Extract residue sequence from PDB
-    residue_sequence = extract_seq_from_pdb(pdb_file)
+    residue_sequence = extract_seq_from_pdb(structure)
 
-    # Tokenize sequences
-    tokenized_res = prosst_tokenizer([residue_sequence], return_tensors='pt')
-    input_ids = tokenized_res['input_ids'].to(device)
-    attention_mask = tokenized_res['attention_mask'].to(device)
-    structure_input_ids = torch.tensor([1, *structure_sequence_offset, 2], dtype=torch.long).unsqueeze(0).to(device)
+    # Calculate scores for each mutation: log(P(mutant)) - log(P(wildtype)) averaged over the sites
+    alphabet = vocab_alphabet(prosst_tokenizer.get_vocab())
+    site_scores = prosst_site_scores(
+        prosst_model, prosst_tokenizer, [residue_sequence], [structure_sequence], device, alphabet
+    )[0]
+    pred_scores = score_mutants(mutants, site_scores, offset=-1, alphabet=alphabet)
+
+    return pred_scores
 
-    # Compute logits
-    with torch.no_grad():
-        outputs = prosst_model(
-            input_ids=input_ids,
-            attention_mask=attention_mask,
-            ss_input_ids=structure_input_ids
-        )
-    logits = torch.log_softmax(outputs.logits[:, 1:-1], dim=-1).squeeze()
 
-    # Get vocabulary for scoring
-    vocab = prosst_tokenizer.get_vocab()
+def prosst_score_batch(structures: str, output_dir: str, mutations_csv: str = None,
+                       max_tokens: int = 4096, num_workers: int = 4):
+    """
+    Score a library of structures with one model load, see src/mutation/batch.py.
     
-    # Calculate scores for each mutation
-    pred_scores = []
-    for mutant in tqdm(mutants):
-        mutant_score = 0
-        sep = ":" if ":" in mutant else ";"
-        for sub_mutant in mutant.split(sep):
-            wt, idx, mt = sub_mutant[0], int(sub_mutant[1:-1]) - 1, sub_mutant[-1]
-            # Calculate log probability difference: log(P(mutant)) - log(P(wildtype))
-            pred = logits[idx, vocab[mt]] - logits[idx, vocab[wt]]
-            mutant_score += pred.item()
-        pred_scores.append(mutant_score / len(mutant.split(sep)))
+    Args:
+        structures: Directory, glob pattern or manifest of PDB files
+        output_dir: Output directory partitioned by structure id, finished structures are skipped
+        mutations_csv: Mutations scored on every structure, all single mutants if None
+        max_tokens: Residues per padded batch
+        num_workers: Featurization worker processes
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+    prosst_model = AutoModelForMaskedLM.from_pretrained("AI4Protein/ProSST-2048", trust_remote_code=True).to(device)
+    prosst_tokenizer = AutoTokenizer.from_pretrained("AI4Protein/ProSST-2048", trust_remote_code=True)
+    predictor = SSTPredictor(structure_vocab_size=2048)
+    alphabet = vocab_alphabet(prosst_tokenizer.get_vocab())
+    os.makedirs(output_dir, exist_ok=True)
+    # every token batch appends its failed structures, the log covers this run only
+    error_file = os.path.join(output_dir, "sst_errors.csv")
+    if os.path.exists(error_file):
+        os.remove(error_file)
 
-    return pred_scores
+    def forward(items):
+        # one SST prediction for the whole batch, structures it fails on are missing from the results;
+        # keyed by batch position, file names repeat across directories
+        results = predictor.iter_predict_from_pdb(
+            [item['path'] for item in items], error_file=error_file, with_index=True, append_errors=True
+        )
+        structure_sequences = {i: result['2048_sst_seq'] for i, result in results}
+        predicted = [i for i in range(len(items)) if i in structure_sequences]
+        outputs = [
+            ValueError(f"No structure tokens predicted for {item['path']}, see {error_file}") for item in items
+        ]
+        if predicted:
+            site_scores = prosst_site_scores(
+                prosst_model, prosst_tokenizer,
+                [items[i]['sequence'] for i in predicted], [structure_sequences[i] for i in predicted],
+                device, alphabet
+            )
+            for i, scores in zip(predicted, site_scores):
+                outputs[i] = scores
+        return outputs
+
+    return score_structures(
+        resolve_structures(structures),
+        featurize=prosst_features,
+        forward=forward,
+        score=lambda features, site_scores, table: table.score(site_scores, offset=-1, alphabet=alphabet),
+        column='prosst_score', output_dir=output_dir, mutations_csv=mutations_csv,
+        max_tokens=max_tokens, num_workers=num_workers
+    )
 
 
 def main():
     parser = argparse.ArgumentParser(description='Prosst')
-    parser.add_argument('--pdb_file', type=str, required=True, help='Path to the pdb file')
+    parser.add_argument('--pdb_file', type=str, default=None, help='Path to the pdb file')
     parser.add_argument('--mutations_csv', type=str, default=None, help='Path to the mutations CSV file')
     parser.add_argument('--output_csv', type=str, default=None, help='Path to the output CSV file')
+    add_batch_arguments(parser)
     args = parser.parse_args()
 
+    if args.structures is not None:
+        if args.output_dir is None:
+            parser.error('--structures needs --output_dir')
+        prosst_score_batch(args.structures, args.output_dir, args.mutations_csv, args.max_tokens, args.num_workers)
+        return
+    if args.pdb_file is None:
+        parser.error('one of --pdb_file or --structures is required')
+
     # Extract residue sequence from PDB
     residue_sequence = extract_seq_from_pdb(args.pdb_file)
 
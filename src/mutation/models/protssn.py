@@ -6,6 +6,7 @@ import yaml
 import warnings
 import argparse
 import datetime
+import functools
 import numpy as np
 import gc
 import torch
@@ -14,18 +15,22 @@ import torch.nn as nn
 import torch.nn.functional as F
 import scipy.spatial as spa
 import pandas as pd
-from tqdm import tqdm
 from torch_geometric.data import Data
 from scipy.special import softmax
 from Bio.PDB import PDBParser, ShrakeRupley
 from Bio.PDB.PDBExceptions import PDBConstructionWarning
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Union
 from transformers import AutoTokenizer, EsmModel
 from torch_geometric.data import Batch
-from src.mutation.utils import safe_index, one_hot_res, log, dihedral, NormalizeProtein
+from src.mutation.utils import safe_index, one_hot_res, log, dihedral
+from src.mutation.transforms import NormalizeProtein
 from src.mutation.models.egnn.network import EGNN
 from src.mutation.utils import generate_mutations_from_sequence
+from src.mutation.mutant_table import MutantTable, score_mutants
 from src.mutation.models.esm.inverse_folding.util import extract_seq_from_pdb
+from src.mutation.structure import ParsedStructure, parse_structure
+from src.mutation.batch import add_batch_arguments, resolve_structures, score_structures
+from src.utils.checkpoint import load_checkpoint
 
 warnings.filterwarnings("ignore")
 
@@ -153,12 +158,13 @@ class ProtSSN:
                                     'PHE', 'PRO', 'SER', 'THR', 'TRP', 'TYR', 'VAL', 'HIP', 'HIE', 'TPO', 'HID', 'LEV', 'MEU',
                                     'PTR', 'GLV', 'CYT', 'SEP', 'HIZ', 'CYM', 'GLM', 'ASQ', 'TYS', 'CYX', 'GLZ', 'misc'],
         }
-        self.plm_model = plm_model.to(self.device)
-        self.gnn_model = gnn_model.to(self.device)
+        # graphs can be built without the models, e.g. in the featurization workers of the batch mode
+        self.plm_model = plm_model.to(self.device) if plm_model is not None else None
+        self.gnn_model = gnn_model.to(self.device) if gnn_model is not None else None
 
     @torch.no_grad()
-    def compute_logits(self, pdb_file, *args, **kwargs) -> torch.Tensor:
-        graph = self.generate_protein_graph(pdb_file)
+    def compute_logits(self, pdb_file, *args, receptor=None, **kwargs) -> torch.Tensor:
+        graph = self.generate_protein_graph(pdb_file, receptor)
         batch_graph = self.plm_model([graph])
         logits, embeds = self.gnn_model(batch_graph)
         return logits
@@ -186,8 +192,12 @@ class ProtSSN:
         loss = self.loss_fn(logits[:, :20], graph.x[:,:20])
         return torch.exp(loss).item()
     
-    def generate_protein_graph(self, pdb_file):
-        rec, rec_coords, c_alpha_coords, n_coords, c_coords,seq = self.get_receptor_inference(pdb_file)
+    def generate_protein_graph(self, pdb_file, receptor=None):
+        # receptor: get_receptor_inference of pdb_file, it does not depend on k and is shared by the
+        # models of an ensemble instead of rebuilding the Biopython structure for each
+        if receptor is None:
+            receptor = self.get_receptor_inference(pdb_file)
+        rec, rec_coords, c_alpha_coords, n_coords, c_coords,seq = receptor
         graph = self.get_calpha_graph(rec, c_alpha_coords, n_coords, c_coords,seq)
         if not graph:
             return None
@@ -395,7 +405,10 @@ class ProtSSN:
     def get_receptor_inference(self, rec_path):
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=PDBConstructionWarning)
-            structure = self.biopython_parser.get_structure('random_id', rec_path)
+            if isinstance(rec_path, ParsedStructure):
+                structure = rec_path.to_biopython()
+            else:
+                structure = self.biopython_parser.get_structure('random_id', rec_path)
             rec = structure[0]
         coords = []
         c_alpha_coords = []
@@ -491,7 +504,47 @@ class ProtSSN:
         return torch.from_numpy(transformed_dist.astype(np.float32))
 
 
-def protssn_score(pdb_file: str, mutants: List[str], 
+def get_gnn_base_path(gnn_model_path: str = None) -> str:
+    """Directory of the ProtSSN GNN checkpoints, downloaded to the huggingface cache if no path is given."""
+    if gnn_model_path is not None:
+        return gnn_model_path
+    # if downloaded, use the local model
+    model_path = os.path.expanduser("~/.cache/huggingface/hub/models--tyang816--ProtSSN/model/protssn_k10_h512.pt")
+    if not os.path.exists(model_path):
+        # download gnn model to .cache/huggingface/hub/models--tyang816--ProtSSN
+        cache_dir = os.path.expanduser("~/.cache/huggingface/hub/models--tyang816--ProtSSN")
+        os.system(f"mkdir -p {cache_dir}")
+        os.system(f"wget https://huggingface.co/tyang816/ProtSSN/resolve/main/ProtSSN.zip -P {cache_dir}")
+        os.system(f"unzip {cache_dir}/ProtSSN.zip -d {cache_dir}")
+        os.system(f"rm {cache_dir}/ProtSSN.zip")
+    return os.path.expanduser("~/.cache/huggingface/hub/models--tyang816--ProtSSN/model")
+
+
+def protssn_features(pdb_file: Union[str, ParsedStructure], ks: List[int] = (10, 20, 30)) -> dict:
+    """
+    Residue sequence and normalized graphs of a structure for every neighbor count k, the
+    featurization step of the batch mode. Only builds the graphs, so it runs in the workers.
+    
+    Returns:
+        dict with the residue "sequence" and the "graphs" by k
+    """
+    structure = parse_structure(pdb_file)
+    graphs, receptor = {}, None
+    for k in ks:
+        protssn = ProtSSN(
+            c_alpha_max_neighbors=k,
+            pre_transform=NormalizeProtein(filename=f'src/mutation/models/egnn/norm/cath_k{k}_mean_attr.pt')
+        )
+        if receptor is None:
+            receptor = protssn.get_receptor_inference(structure)
+        graph = protssn.generate_protein_graph(structure, receptor)
+        if graph is None:
+            raise ValueError(f"Failed to build the k={k} graph of {structure.path}")
+        graphs[k] = graph
+    return {'sequence': extract_seq_from_pdb(structure), 'graphs': graphs}
+
+
+def protssn_score(pdb_file: Union[str, ParsedStructure], mutants: List[str], 
                   gnn_model_path: str = None, 
                   c_alpha_max_neighbors: int = 10,
                   gnn_config_path: str = "src/mutation/models/egnn/egnn.yaml",
@@ -500,8 +553,8 @@ def protssn_score(pdb_file: str, mutants: List[str],
     Calculate ProtSSN scores for a list of mutations.
     
     Args:
-        pdb_file: Path to the PDB file
-        mutants: List of mutation strings (e.g., ["A1B", "C2D"])
+        pdb_file: Path to the PDB file or the structure parsed by parse_structure
+        mutants: List of mutation strings (e.g., ["A1B", "C2D"]) or a MutantTable
         gnn_model_path: Path to the GNN model (optional, will download if None)
         c_alpha_max_neighbors: Number of maximum neighbors for C-alpha atoms (used when use_ensemble=False)
         gnn_config_path: Path to GNN config file
@@ -517,25 +570,14 @@ def protssn_score(pdb_file: str, mutants: List[str],
     # Load GNN config
     gnn_config = yaml.load(open(gnn_config_path), Loader=yaml.FullLoader)['egnn']
     
-    # Setup model paths
-    if gnn_model_path is None:
-        # if downloaded, use the local model
-        model_path = os.path.expanduser("~/.cache/huggingface/hub/models--tyang816--ProtSSN/model/protssn_k10_h512.pt")
-        if os.path.exists(model_path):
-            gnn_base_path = os.path.expanduser("~/.cache/huggingface/hub/models--tyang816--ProtSSN/model")
-        else:
-            # download gnn model to .cache/huggingface/hub/models--tyang816--ProtSSN
-            cache_dir = os.path.expanduser("~/.cache/huggingface/hub/models--tyang816--ProtSSN")
-            os.system(f"mkdir -p {cache_dir}")
-            os.system(f"wget https://huggingface.co/tyang816/ProtSSN/resolve/main/ProtSSN.zip -P {cache_dir}")
-            os.system(f"unzip {cache_dir}/ProtSSN.zip -d {cache_dir}")
-            os.system(f"rm {cache_dir}/ProtSSN.zip")
-            gnn_base_path = os.path.expanduser("~/.cache/huggingface/hub/models--tyang816--ProtSSN/model")
-    else:
-        gnn_base_path = gnn_model_path
+    gnn_base_path = get_gnn_base_path(gnn_model_path)
     
-    # Load sequence from PDB
+    # Parse once, every model of the ensemble builds its graph from the same structure
+    pdb_file = parse_structure(pdb_file)
     sequence = extract_seq_from_pdb(pdb_file)
+    # Parse the mutants once for all models of the ensemble
+    mutants = mutants if isinstance(mutants, MutantTable) else MutantTable.from_strings(mutants)
+    alphabet = "".join(amino_acids_type)
     
     # Load PLM model
     plm = "facebook/esm2_t33_650M_UR50D"
@@ -545,6 +587,8 @@ def protssn_score(pdb_file: str, mutants: List[str],
     if use_ensemble:
         # Ensemble mode: use multiple model configurations
         all_scores = []
+        # the receptor features do not depend on k or h, they are extracted once for all models
+        receptor = None
         
         for k in [10, 20, 30]:
             norm_file = f'src/mutation/models/egnn/norm/cath_k{k}_mean_attr.pt'
@@ -565,7 +609,7 @@ def protssn_score(pdb_file: str, mutants: List[str],
                 # Initialize models
                 plm_model = PLM_model(args, esm_model, tokenizer)
                 gnn_model = GNN_model(args)
-                gnn_model.load_state_dict(torch.load(os.path.join(gnn_base_path, f"protssn_k{k}_h{h}.pt")))
+                gnn_model.load_state_dict(load_checkpoint(os.path.join(gnn_base_path, f"protssn_k{k}_h{h}.pt")))
                 
                 # Initialize ProtSSN
                 protssn = ProtSSN(
@@ -575,18 +619,12 @@ def protssn_score(pdb_file: str, mutants: List[str],
                 )
                 
                 # Compute logits
-                logits = protssn.compute_logits(pdb_file).squeeze()
+                if receptor is None:
+                    receptor = protssn.get_receptor_inference(pdb_file)
+                logits = protssn.compute_logits(pdb_file, receptor=receptor).squeeze()
                 
                 # Calculate scores for each mutation
-                pred_scores = []
-                for mutant in tqdm(mutants):
-                    mutant_score = 0
-                    sep = ":" if ":" in mutant else ";"
-                    for sub_mutant in mutant.split(sep):
-                        wt, idx, mt = sub_mutant[0], int(sub_mutant[1:-1]) - 1, sub_mutant[-1]
-                        pred = logits[idx, amino_acids_type.index(mt)] - logits[idx, amino_acids_type.index(wt)]
-                        mutant_score += pred.item()
-                    pred_scores.append(mutant_score / len(mutant.split(sep)))
+                pred_scores = score_mutants(mutants, logits.float().cpu().numpy(), offset=-1, alphabet=alphabet)
                 
                 all_scores.append(pred_scores)
         
@@ -612,7 +650,7 @@ def protssn_score(pdb_file: str, mutants: List[str],
         
         # Load GNN model weights
         norm_file = f'src/mutation/models/egnn/norm/cath_k{c_alpha_max_neighbors}_mean_attr.pt'
-        gnn_model.load_state_dict(torch.load(os.path.join(gnn_base_path, f"protssn_k{c_alpha_max_neighbors}_h512.pt")))
+        gnn_model.load_state_dict(load_checkpoint(os.path.join(gnn_base_path, f"protssn_k{c_alpha_max_neighbors}_h512.pt")))
         
         # Initialize ProtSSN
         protssn = ProtSSN(
@@ -625,19 +663,85 @@ def protssn_score(pdb_file: str, mutants: List[str],
         logits = protssn.compute_logits(pdb_file).squeeze()
         
         # Calculate scores for each mutation
-        pred_scores = []
-        for mutant in tqdm(mutants):
-            mutant_score = 0
-            sep = ":" if ":" in mutant else ";"
-            for sub_mutant in mutant.split(sep):
-                wt, idx, mt = sub_mutant[0], int(sub_mutant[1:-1]) - 1, sub_mutant[-1]
-                pred = logits[idx, amino_acids_type.index(mt)] - logits[idx, amino_acids_type.index(wt)]
-                mutant_score += pred.item()
-            pred_scores.append(mutant_score / len(mutant.split(sep)))
+        pred_scores = score_mutants(mutants, logits.float().cpu().numpy(), offset=-1, alphabet=alphabet)
         
         return pred_scores
 
 
+def protssn_score_batch(structures: str, output_dir: str, mutations_csv: str = None,
+                        gnn_model_path: str = None, c_alpha_max_neighbors: int = 10,
+                        gnn_config_path: str = "src/mutation/models/egnn/egnn.yaml",
+                        use_ensemble: bool = True, max_tokens: int = 4096, num_workers: int = 4):
+    """
+    Score a library of structures with one model load, see src/mutation/batch.py.
+    
+    Args:
+        structures: Directory, glob pattern or manifest of PDB files
+        output_dir: Output directory partitioned by structure id, finished structures are skipped
+        mutations_csv: Mutations scored on every structure, all single mutants if None
+        gnn_model_path: Path to the GNN model (optional, will download if None)
+        c_alpha_max_neighbors: Number of maximum neighbors for C-alpha atoms (used when use_ensemble=False)
+        gnn_config_path: Path to GNN config file
+        use_ensemble: Whether to use ensemble of multiple models (default: True)
+        max_tokens: Residues per padded batch
+        num_workers: Featurization worker processes, the graphs are built there
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
+    if gnn_config_path is None:
+        gnn_config_path = "src/mutation/models/egnn/egnn.yaml"
+    gnn_config = yaml.load(open(gnn_config_path), Loader=yaml.FullLoader)['egnn']
+    gnn_base_path = get_gnn_base_path(gnn_model_path)
+    ks, hs = ([10, 20, 30], [512, 768, 1280]) if use_ensemble else ([c_alpha_max_neighbors], [512])
+    alphabet = "".join(amino_acids_type)
+
+    # Load the PLM once and every GNN of the ensemble, the models are reused by all batches
+    plm = "facebook/esm2_t33_650M_UR50D"
+    esm_model = EsmModel.from_pretrained(plm).to(device)
+    tokenizer = AutoTokenizer.from_pretrained(plm)
+
+    class Args:
+        def __init__(self, k, h):
+            self.gnn_config = dict(gnn_config, hidden_channels=h)
+            self.noise_type = None
+            self.noise_ratio = 0.0
+            self.c_alpha_max_neighbors = k
+
+    plm_model = PLM_model(Args(ks[0], hs[0]), esm_model, tokenizer)
+    gnn_models = {}
+    for k in ks:
+        for h in hs:
+            gnn_model = GNN_model(Args(k, h))
+            gnn_model.load_state_dict(load_checkpoint(os.path.join(gnn_base_path, f"protssn_k{k}_h{h}.pt")))
+            gnn_models[k, h] = gnn_model.to(device).eval()
+
+    @torch.no_grad()
+    def forward(items):
+        outputs = [[] for _ in items]
+        for k in ks:
+            # the PLM embeddings of a k are shared by its GNNs, the graphs are copied as the PLM annotates them
+            graphs = [item['graphs'][k].clone() for item in items]
+            num_nodes = [graph.num_nodes for graph in graphs]
+            batch_graph = plm_model(graphs)
+            for h in hs:
+                logits, embeds = gnn_models[k, h](batch_graph.clone())
+                for output, item_logits in zip(outputs, torch.split(logits, num_nodes)):
+                    output.append(item_logits.float().cpu().numpy())
+        return outputs
+
+    return score_structures(
+        resolve_structures(structures),
+        featurize=functools.partial(protssn_features, ks=ks),
+        forward=forward,
+        # Calculate ensemble scores (mean of all models)
+        score=lambda features, logits, table: np.mean(
+            [table.score(model_logits, offset=-1, alphabet=alphabet) for model_logits in logits], axis=0
+        ),
+        column='protssn_score', output_dir=output_dir, mutations_csv=mutations_csv,
+        max_tokens=max_tokens, num_workers=num_workers
+    )
+
+
 def main():
     parser = argparse.ArgumentParser()
     
@@ -651,8 +755,25 @@ def main():
     parser.add_argument("--pdb_file", type=str, default=None, help="pdb file path")
     parser.add_argument("--mutations_csv", type=str, default=None, help="mutations csv file path")
     parser.add_argument("--output_csv", type=str, default=None, help="output csv file path")
+    add_batch_arguments(parser)
     
     args = parser.parse_args()
+
+    if args.structures is not None:
+        if args.output_dir is None:
+            parser.error("--structures needs --output_dir")
+        protssn_score_batch(
+            args.structures, args.output_dir, args.mutations_csv,
+            gnn_model_path=args.gnn_model_path,
+            c_alpha_max_neighbors=args.c_alpha_max_neighbors,
+            gnn_config_path=args.gnn_config,
+            use_ensemble=args.use_ensemble,
+            max_tokens=args.max_tokens,
+            num_workers=args.num_workers
+        )
+        return
+    if args.pdb_file is None:
+        parser.error("one of --pdb_file or --structures is required")
     
     # Load sequence from PDB
     sequence = extract_seq_from_pdb(args.pdb_file)
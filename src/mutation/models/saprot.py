@@ -1,28 +1,49 @@
 import sys
 import os
 sys.path.append(os.getcwd())
-import time
 import argparse
+import functools
+import threading
 import torch
 import numpy as np
 import datetime
 import pandas as pd
-from tqdm import tqdm
 from Bio.PDB import PDBParser, MMCIFParser
 from transformers import EsmTokenizer, EsmForMaskedLM
 from src.mutation.utils import generate_mutations_from_sequence
+from src.mutation.mutant_table import score_mutants, vocab_alphabet
 from src.mutation.models.esm.inverse_folding.util import extract_seq_from_pdb
-from typing import List
+from src.data.get_foldseek_structure_seq import FoldseekStore
+from src.mutation.structure import ParsedStructure, parse_structure
+from src.mutation.batch import add_batch_arguments, resolve_structures, score_structures
+from typing import List, Union
 
-def extract_plddt(pdb_path: str) -> np.ndarray:
+FOLDSEEK_STRUC_VOCAB = "pynwrqhgdlvtmfsaeikc#"
+
+# 3Di stores opened by this thread, sqlite connections are not shared across threads
+_stores = threading.local()
+
+
+def get_store(foldseek: str, store_path: str = ":memory:", verbose: bool = False) -> FoldseekStore:
+    """The 3Di store of this thread for store_path, opened once and reused by every call."""
+    stores = _stores.__dict__.setdefault("stores", {})
+    key = (store_path, foldseek, verbose)
+    if key not in stores:
+        stores[key] = FoldseekStore(store_path, foldseek=foldseek, verbose=verbose)
+    return stores[key]
+
+def extract_plddt(pdb_path: Union[str, ParsedStructure], chain: str = "A") -> np.ndarray:
     """
     Extract plddt scores from pdb file.
     Args:
-        pdb_path: Path to pdb file.
+        pdb_path: Path to pdb file or the structure parsed by parse_structure.
+        chain: Chain to extract the plddt scores of.
 
     Returns:
         plddts: plddt scores.
     """
+    if isinstance(pdb_path, ParsedStructure):
+        return pdb_path.residue_bfactors(chain)
 
     # Initialize parser
     if pdb_path.endswith(".cif"):
@@ -34,7 +55,7 @@ def extract_plddt(pdb_path: str) -> np.ndarray:
     
     structure = parser.get_structure('protein', pdb_path)
     model = structure[0]
-    chain = model["A"]
+    chain = model[chain]
 
     # Extract plddt scores
     plddts = []
@@ -55,7 +76,9 @@ def get_struc_seq(foldseek,
                   process_id: int = 0,
                   plddt_mask: bool = "auto",
                   plddt_threshold: float = 70.,
-                  foldseek_verbose: bool = False) -> dict:
+                  foldseek_verbose: bool = False,
+                  store: FoldseekStore = None,
+                  structure: ParsedStructure = None) -> dict:
     """
 
     Args:
@@ -65,7 +88,7 @@ def get_struc_seq(foldseek,
 
         chains: Chains to be extracted from pdb file. If None, all chains will be extracted.
 
-        process_id: Process ID for temporary files. This is used for parallel processing.
+        process_id: Unused, kept for backward compatibility. Temporary files live in unique directories.
 
         plddt_mask: If True, mask regions with plddt < plddt_threshold. plddt scores are from the pdb file.
 
@@ -73,6 +96,11 @@ def get_struc_seq(foldseek,
 
         foldseek_verbose: If True, foldseek will print verbose messages.
 
+        store: 3Di store. Structures already in the store are not passed to foldseek again, the
+            in-memory store of this thread is used if None.
+
+        structure: The file parsed by parse_structure. If given, plddt scores are taken from it instead of parsing the file again.
+
     Returns:
         seq_dict: A dict of structural seqs. The keys are chain IDs. The values are tuples of
         (seq, struc_seq, combined_seq).
@@ -80,62 +108,110 @@ def get_struc_seq(foldseek,
     assert os.path.exists(foldseek), f"Foldseek not found: {foldseek}"
     assert os.path.exists(path), f"PDB file not found: {path}"
     
-    tmp_save_path = f"get_struc_seq_{process_id}_{time.time()}.tsv"
-    if foldseek_verbose:
-        cmd = f"{foldseek} structureto3didescriptor --threads 1 --chain-name-mode 1 {path} {tmp_save_path}"
-    else:
-        cmd = f"{foldseek} structureto3didescriptor -v 0 --threads 1 --chain-name-mode 1 {path} {tmp_save_path}"
-    os.system(cmd)
+    if store is None:
+        store = get_store(foldseek, verbose=foldseek_verbose)
+    store.update([path])
+    struc_seqs = store.get(path, chains)
     
     # Check whether the structure is predicted by AlphaFold2
     if plddt_mask == "auto":
-        with open(path, "r") as r:
-            plddt_mask = True if "alphafold" in r.read().lower() else False
+        if structure is not None:
+            plddt_mask = "alphafold" in structure.header.lower()
+        else:
+            with open(path, "r") as r:
+                plddt_mask = True if "alphafold" in r.read().lower() else False
     
     seq_dict = {}
     name = os.path.basename(path)
-    with open(tmp_save_path, "r") as r:
-        for i, line in enumerate(r):
-            desc, seq, struc_seq = line.split("\t")[:3]
-            
-            # Mask low plddt
-            if plddt_mask:
-                try:
-                    plddts = extract_plddt(path)
-                    assert len(plddts) == len(struc_seq), f"Length mismatch: {len(plddts)} != {len(struc_seq)}"
-                    
-                    # Mask regions with plddt < threshold
-                    indices = np.where(plddts < plddt_threshold)[0]
-                    np_seq = np.array(list(struc_seq))
-                    np_seq[indices] = "#"
-                    struc_seq = "".join(np_seq)
+    for chain, (seq, struc_seq) in struc_seqs.items():
+        # Mask low plddt
+        if plddt_mask:
+            try:
+                plddts = extract_plddt(structure if structure is not None else path, chain)
+                assert len(plddts) == len(struc_seq), f"Length mismatch: {len(plddts)} != {len(struc_seq)}"
                 
-                except Exception as e:
-                    print(f"Error: {e}")
-                    print(f"Failed to mask plddt for {name}")
+                # Mask regions with plddt < threshold
+                indices = np.where(plddts < plddt_threshold)[0]
+                np_seq = np.array(list(struc_seq))
+                np_seq[indices] = "#"
+                struc_seq = "".join(np_seq)
             
-            name_chain = desc.split(" ")[0]
-            chain = name_chain.replace(name, "").split("_")[-1]
-            
-            if chains is None or chain in chains:
-                if chain not in seq_dict:
-                    combined_seq = "".join([a + b.lower() for a, b in zip(seq, struc_seq)])
-                    seq_dict[chain] = (seq, struc_seq, combined_seq)
+            except Exception as e:
+                print(f"Error: {e}")
+                print(f"Failed to mask plddt for {name}")
+        
+        combined_seq = "".join([a + b.lower() for a, b in zip(seq, struc_seq)])
+        seq_dict[chain] = (seq, struc_seq, combined_seq)
     
-    os.remove(tmp_save_path)
-    os.remove(tmp_save_path + ".dbtype")
     return seq_dict
 
-def saprot_score(pdb_file: str, mutants: List[str], chain: str = "A", 
-                 foldseek_path: str = None) -> List[float]:
+def get_foldseek(foldseek_path: str = None) -> str:
+    """Path of the foldseek binary, downloaded next to the SaProt weights if no path is given."""
+    if foldseek_path is None:
+        foldseek_path = os.path.expanduser("~/.cache/huggingface/hub/models--westlake-repl--SaProt_650M_AF2/foldseek")
+        if not os.path.exists(foldseek_path + "/foldseek"):
+            os.system(f"mkdir -p {foldseek_path}")
+            os.system(f"wget https://huggingface.co/tyang816/Foldseek_bin/resolve/main/foldseek -P {foldseek_path}")
+            os.system(f"chmod +x {foldseek_path}/foldseek")
+        else:
+            print(f"Foldseek already exists at {foldseek_path}/foldseek")
+    return foldseek_path + "/foldseek"
+
+def saprot_features(pdb_file: Union[str, ParsedStructure], chain: str = "A", foldseek: str = None,
+                    foldseek_store: str = None) -> dict:
+    """
+    Residue and structure-aware sequence of a chain, the featurization step of the batch mode.
+
+    Args:
+        pdb_file: Path to the PDB file or the structure parsed by parse_structure
+        chain: Chain ID to extract from PDB
+        foldseek: Path to the foldseek binary
+        foldseek_store: Path to a persistent 3Di store, shared by the workers of a batch run
+
+    Returns:
+        dict with the residue "sequence" and the "combined_seq" of residue and 3Di tokens
+    """
+    # foldseek reads the file itself
+    structure = parse_structure(pdb_file)
+    store = get_store(foldseek, foldseek_store) if foldseek_store else None
+    seq, foldseek_seq, combined_seq = get_struc_seq(foldseek, structure.path, [chain], store=store, structure=structure)[chain]
+    return {'sequence': extract_seq_from_pdb(structure, chain), 'combined_seq': combined_seq}
+
+def saprot_site_scores(model, tokenizer, combined_seqs: List[str], device) -> tuple:
+    """
+    Per-site scores of a padded batch of structure-aware sequences, a residue scores the sum over
+    all its structure tokens.
+
+    Returns:
+        (one (tokens, len(alphabet)) array per sequence including the special tokens, alphabet)
+    """
+    inputs = tokenizer(combined_seqs, return_tensors="pt", padding=True)
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+
+    # Compute logits
+    with torch.no_grad():
+        logits = model(**inputs).logits
+
+    vocab = tokenizer.get_vocab()
+    alphabet = vocab_alphabet(token[0] for token in vocab if token[1:] == FOLDSEEK_STRUC_VOCAB[0])
+    site_scores = torch.stack([
+        logits[..., vocab[aa + FOLDSEEK_STRUC_VOCAB[0]]: vocab[aa + FOLDSEEK_STRUC_VOCAB[0]] + len(FOLDSEEK_STRUC_VOCAB)].sum(-1)
+        for aa in alphabet
+    ], dim=-1).float().cpu().numpy()
+    lengths = inputs["attention_mask"].sum(-1).tolist()
+    return [site_scores[i, :length] for i, length in enumerate(lengths)], alphabet
+
+def saprot_score(pdb_file: Union[str, ParsedStructure], mutants: List[str], chain: str = "A", 
+                 foldseek_path: str = None, foldseek_store: str = None) -> List[float]:
     """
     Calculate SaProt scores for a list of mutations.
     
     Args:
-        pdb_file: Path to the PDB file
-        mutants: List of mutation strings (e.g., ["A1B", "C2D"])
+        pdb_file: Path to the PDB file or the structure parsed by parse_structure
+        mutants: List of mutation strings (e.g., ["A1B", "C2D"]) or a MutantTable
         chain: Chain ID to extract from PDB
         foldseek_path: Path to foldseek binary (optional, will download if None)
+        foldseek_store: Path to a persistent 3Di store (optional), reused across runs
         
     Returns:
         List of scores corresponding to the input mutations
@@ -148,58 +224,76 @@ def saprot_score(pdb_file: str, mutants: List[str], chain: str = "A",
     tokenizer = EsmTokenizer.from_pretrained(model_path, trust_remote_code=True)
     model = EsmForMaskedLM.from_pretrained(model_path, trust_remote_code=True).to(device)
 
-    foldseek_struc_vocab = "pynwrqhgdlvtmfsaeikc#"
-    # Setup foldseek path
-    if foldseek_path is None:
-        foldseek_path = os.path.expanduser("~/.cache/huggingface/hub/models--westlake-repl--SaProt_650M_AF2/foldseek")
-        if not os.path.exists(foldseek_path + "/foldseek"):
-            os.system(f"mkdir -p {foldseek_path}")
-            os.system(f"wget https://huggingface.co/tyang816/Foldseek_bin/resolve/main/foldseek -P {foldseek_path}")
-            os.system(f"chmod +x {foldseek_path}/foldseek")
-        else:
-            print(f"Foldseek already exists at {foldseek_path}/foldseek")
-    
-    # Extract structural sequence
-    parsed_seqs = get_struc_seq(foldseek_path + "/foldseek", pdb_file, [chain])[chain]
-    seq, foldseek_seq, combined_seq = parsed_seqs
+    # Extract structural sequence, foldseek reads the file itself
+    structure = parse_structure(pdb_file)
+    features = saprot_features(structure, chain, get_foldseek(foldseek_path), foldseek_store)
+
+    # Calculate scores for each mutation, a residue scores the sum over all its structure tokens
+    site_scores, alphabet = saprot_site_scores(model, tokenizer, [features['combined_seq']], device)
+    pred_scores = score_mutants(mutants, site_scores[0], offset=0, alphabet=alphabet)
+
+    return pred_scores
+
+def saprot_score_batch(structures: str, output_dir: str, mutations_csv: str = None, chain: str = "A",
+                       foldseek_path: str = None, foldseek_store: str = None,
+                       max_tokens: int = 4096, num_workers: int = 4):
+    """
+    Score a library of structures with one model load, see src/mutation/batch.py.
     
-    # Tokenize the combined sequence (structure-aware sequence)
-    inputs = tokenizer(combined_seq, return_tensors="pt")
-    inputs = {k: v.to(device) for k, v in inputs.items()}
+    Args:
+        structures: Directory, glob pattern or manifest of PDB files
+        output_dir: Output directory partitioned by structure id, finished structures are skipped
+        mutations_csv: Mutations scored on every structure, all single mutants if None
+        chain: Chain ID to extract from every PDB
+        foldseek_path: Path to foldseek binary (optional, will download if None)
+        foldseek_store: Path to a persistent 3Di store, <output_dir>/foldseek_store.sqlite if None
+        max_tokens: Residues per padded batch
+        num_workers: Featurization worker processes, each runs foldseek on its structures
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
 
-    # Compute logits
-    with torch.no_grad():
-        outputs = model(**inputs)
-        logits = outputs.logits.squeeze()
-
-    # Calculate scores for each mutation
-    pred_scores = []
-    for mutant in tqdm(mutants):
-        mutant_score = 0
-        sep = ":" if ":" in mutant else ";"
-        for sub_mutant in mutant.split(sep):
-            wt, idx, mt = sub_mutant[0], int(sub_mutant[1:-1]), sub_mutant[-1]
-            ori_st = tokenizer.get_vocab()[wt + foldseek_struc_vocab[0]]
-            mut_st = tokenizer.get_vocab()[mt + foldseek_struc_vocab[0]]
-            
-            ori_prob = logits[idx, ori_st: ori_st + len(foldseek_struc_vocab)].sum()
-            mut_prob = logits[idx, mut_st: mut_st + len(foldseek_struc_vocab)].sum()
+    model_path = "westlake-repl/SaProt_650M_AF2"
+    tokenizer = EsmTokenizer.from_pretrained(model_path, trust_remote_code=True)
+    model = EsmForMaskedLM.from_pretrained(model_path, trust_remote_code=True).to(device)
+    os.makedirs(output_dir, exist_ok=True)
+    if foldseek_store is None:
+        foldseek_store = os.path.join(output_dir, "foldseek_store.sqlite")
 
-            pred = mut_prob - ori_prob
-            mutant_score += pred.item()
-        pred_scores.append(mutant_score / len(mutant.split(sep)))
+    def forward(items):
+        site_scores, alphabet = saprot_site_scores(model, tokenizer, [item['combined_seq'] for item in items], device)
+        return [(scores, alphabet) for scores in site_scores]
 
-    return pred_scores
+    return score_structures(
+        resolve_structures(structures),
+        featurize=functools.partial(saprot_features, chain=chain, foldseek=get_foldseek(foldseek_path),
+                                    foldseek_store=foldseek_store),
+        forward=forward,
+        score=lambda features, output, table: table.score(output[0], offset=0, alphabet=output[1]),
+        column='saprot_score', output_dir=output_dir, mutations_csv=mutations_csv,
+        max_tokens=max_tokens, num_workers=num_workers
+    )
 
 def main():
     parser = argparse.ArgumentParser(description='saprot')
-    parser.add_argument('--pdb_file', type=str, required=True, help='Path to the pdb file')
+    parser.add_argument('--pdb_file', type=str, default=None, help='Path to the pdb file')
     parser.add_argument('--mutations_csv', type=str, default=None, help='Path to the mutations CSV file')
     parser.add_argument('--output_csv', type=str, default=None, help='Path to the output CSV file')
     parser.add_argument('--foldseek_path', type=str, default=None, required=False, help='Path to the foldseek binary')
     parser.add_argument('--chain', type=str, default="A", help='Chain to be processed')
+    parser.add_argument('--foldseek_store', type=str, default=None, help='Path to a persistent 3Di sequence store')
+    add_batch_arguments(parser)
     args = parser.parse_args()
 
+    if args.structures is not None:
+        if args.output_dir is None:
+            parser.error('--structures needs --output_dir')
+        saprot_score_batch(args.structures, args.output_dir, args.mutations_csv, args.chain, args.foldseek_path,
+                           args.foldseek_store, args.max_tokens, args.num_workers)
+        return
+    if args.pdb_file is None:
+        parser.error('one of --pdb_file or --structures is required')
+
     # Extract sequence from PDB for mutation generation
     seq = extract_seq_from_pdb(args.pdb_file)
 
@@ -212,7 +306,7 @@ def main():
         df = pd.DataFrame(mutants, columns=['mutant'])
 
     # Calculate scores using the new function
-    scores = saprot_score(args.pdb_file, mutants, args.chain, args.foldseek_path)
+    scores = saprot_score(args.pdb_file, mutants, args.chain, args.foldseek_path, args.foldseek_store)
     df['saprot_score'] = scores
     df = df.sort_values(by='saprot_score', ascending=False)
     
@@ -277,7 +277,9 @@ class StructureCollater(object):
         startstop (boolean): if true, expect the sequence collater to add starts/stops, and adds an
             extra zeroed node at the left of the graph.
 
-    Input (list): a batch of sequences as strings
+    Input (list): a batch of (sequence, dist, omega, theta, phi) with the dense matrices of
+        pdb_utils.process_coords, or of (sequence, features) with the neighbour features of
+        pdb_utils.process_coords_knn. Both give the same outputs.
     Output:
         sequences from sequence_collater
         nodes, edges, connections, edge_mask for GNN
@@ -290,8 +292,21 @@ class StructureCollater(object):
         self.n_node_features = n_node_features
         self.n_edge_features = n_edge_features
 
+    def _knn_features(self, features, ell):
+        # same float32 steps as get_node_features and get_edge_features on the dense matrices
+        nc = min(ell - 1, self.n_connections)
+        if features["E_idx"].shape[1] < nc:
+            raise ValueError(f"Features have {features['E_idx'].shape[1]} neighbours, the collater needs {nc}")
+        ns = torch.as_tensor(features["nodes"], dtype=torch.float)
+        V = torch.cat([torch.sin(ns), torch.cos(ns)], dim=1)
+        E_idx = torch.as_tensor(features["E_idx"][:, :nc], dtype=torch.long)
+        edges = torch.as_tensor(features["edges"][:, :nc], dtype=torch.float)
+        angles = edges[..., 1:]
+        E = torch.cat([edges[..., :1], torch.sin(angles), torch.cos(angles)], dim=2)
+        return V, E, E_idx
+
     def __call__(self, batch: List[Any], ) -> Iterable[torch.Tensor]:
-        sequences, dists, omegas, thetas, phis = tuple(zip(*batch))
+        sequences = [item[0] for item in batch]
         collated_seqs = self.sequence_collater._prep(sequences)
         ells = [len(s) for s in sequences]
         max_ell = max(ells)
@@ -300,12 +315,16 @@ class StructureCollater(object):
         edges = torch.zeros(n, max_ell, self.n_connections, self.n_edge_features)
         connections = torch.zeros(n, max_ell, self.n_connections, dtype=torch.long)
         edge_mask = torch.zeros(n, max_ell, self.n_connections, 1)
-        for i, (ell, dist, omega, theta, phi) in enumerate(zip(ells, dists, omegas, thetas, phis)):
+        for i, (ell, item) in enumerate(zip(ells, batch)):
             # process features
-            V = get_node_features(omega, theta, phi)
-            dist.fill_diagonal_(np.nan)
-            E_idx = get_k_neighbors(dist, self.n_connections)
-            E = get_edge_features(dist, omega, theta, phi, E_idx)
+            if len(item) == 2:
+                V, E, E_idx = self._knn_features(item[1], ell)
+            else:
+                _, dist, omega, theta, phi = item
+                V = get_node_features(omega, theta, phi)
+                dist.fill_diagonal_(np.nan)
+                E_idx = get_k_neighbors(dist, self.n_connections)
+                E = get_edge_features(dist, omega, theta, phi, E_idx)
             str_mask = get_mask(E)
             E = replace_nan(E)
             V = replace_nan(V)
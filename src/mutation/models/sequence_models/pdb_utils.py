@@ -1,7 +1,8 @@
 import gzip
 import numpy as np
 import scipy
-from scipy.spatial.distance import squareform, pdist
+import torch
+from scipy.spatial.distance import squareform, pdist, cdist
 
 from .constants import IUPAC_CODES
 
@@ -34,13 +35,20 @@ def get_angles(a, b, c):
     return np.arccos(x)
 
 
-def parse_PDB(x, atoms=["N", "CA", "C"], chain=None):
+def _atom_records(x, chain=None):
     """
-    input:  x = PDB filename
-            atoms = atoms to extract (optional)
-    output: (length, atoms, coords=(x,y,z)), sequence
+    input:  x = PDB filename or ParsedStructure (src.mutation.structure)
+    output: (atom name, residue name, residue number + insertion code, (x, y, z)) of every ATOM record,
+            selenomethionines are read as methionines
     """
-    xyz, seq, min_resn, max_resn = {}, {}, np.inf, -np.inf
+    if not isinstance(x, str):
+        atoms = x.select(chain)
+        atoms = atoms[~atoms.hetero | (atoms.res_name == "MSE")]
+        res_names = np.where(atoms.res_name == "MSE", "MET", atoms.res_name)
+        for atom, resi, resn, icode, coord in zip(atoms.atom_name, res_names, atoms.res_id, atoms.ins_code, atoms.coord):
+            yield atom, resi, f"{resn}{icode}", coord
+        return
+
     open_func = gzip.open if x.endswith('.gz') else open
     for line in open_func(x, "rb"):
         line = line.decode("utf-8", "ignore").rstrip()
@@ -55,27 +63,36 @@ def parse_PDB(x, atoms=["N", "CA", "C"], chain=None):
                 atom = line[12 : 12 + 4].strip()
                 resi = line[17 : 17 + 3]
                 resn = line[22 : 22 + 5].strip()
-                x, y, z = [float(line[i : (i + 8)]) for i in [30, 38, 46]]
-
-                if resn[-1].isalpha():
-                    resa, resn = resn[-1], int(resn[:-1]) - 1
-                else:
-                    resa, resn = "", int(resn) - 1
-                if resn < min_resn:
-                    min_resn = resn
-                if resn > max_resn:
-                    max_resn = resn
-                if resn not in xyz:
-                    xyz[resn] = {}
-                if resa not in xyz[resn]:
-                    xyz[resn][resa] = {}
-                if resn not in seq:
-                    seq[resn] = {}
-                if resa not in seq[resn]:
-                    seq[resn][resa] = resi
-
-                if atom not in xyz[resn][resa]:
-                    xyz[resn][resa][atom] = np.array([x, y, z])
+                yield atom, resi, resn, [float(line[i : (i + 8)]) for i in [30, 38, 46]]
+
+
+def parse_PDB(x, atoms=["N", "CA", "C"], chain=None):
+    """
+    input:  x = PDB filename or ParsedStructure (src.mutation.structure)
+            atoms = atoms to extract (optional)
+    output: (length, atoms, coords=(x,y,z)), sequence
+    """
+    xyz, seq, min_resn, max_resn = {}, {}, np.inf, -np.inf
+    for atom, resi, resn, coord in _atom_records(x, chain):
+        if resn[-1].isalpha():
+            resa, resn = resn[-1], int(resn[:-1]) - 1
+        else:
+            resa, resn = "", int(resn) - 1
+        if resn < min_resn:
+            min_resn = resn
+        if resn > max_resn:
+            max_resn = resn
+        if resn not in xyz:
+            xyz[resn] = {}
+        if resa not in xyz[resn]:
+            xyz[resn][resa] = {}
+        if resn not in seq:
+            seq[resn] = {}
+        if resa not in seq[resn]:
+            seq[resn][resa] = resi
+
+        if atom not in xyz[resn][resa]:
+            xyz[resn][resa][atom] = np.array(coord, dtype=float)
 
     # convert to numpy arrays, fill in missing values
     seq_, xyz_ = [], []
@@ -100,25 +117,28 @@ def parse_PDB(x, atoms=["N", "CA", "C"], chain=None):
     return np.array(xyz_).reshape(-1, len(atoms), 3), "".join(seq_), valid_resn
 
 
-def process_coords(coords):
+def _backbone_with_cb(coords):
     N = np.array(coords['N'])
     Ca = np.array(coords['CA'])
     C = np.array(coords['C'])
 
     # recreate Cb given N,Ca,C
-    nres = len(N)
     b = Ca - N
     c = C - Ca
     a = np.cross(b, c)
     Cb = -0.58273431 * a + 0.56802827 * b - 0.54067466 * c + Ca
+    return N, Ca, C, Cb
+
+
+def process_coords(coords):
+    N, Ca, C, Cb = _backbone_with_cb(coords)
+    nres = len(N)
 
     # Cb-Cb distance matrix
     dist = squareform(pdist(Cb))
     np.fill_diagonal(dist, np.nan)
-    indices = [[i for i in range(nres) if i != j] for j in range(nres)]
-    idx = np.array([[i, j] for i in range(len(indices)) for j in indices[i]]).T
-    idx0 = idx[0]
-    idx1 = idx[1]
+    # all off-diagonal pairs, row by row
+    idx0, idx1 = np.where(~np.eye(nres, dtype=bool))
     # matrix of Ca-Cb-Cb-Ca dihedrals
     omega = np.zeros((nres, nres)) + np.nan
     omega[idx0, idx1] = get_dihedrals(Ca[idx0], Cb[idx0], Cb[idx1], Ca[idx1])
@@ -131,3 +151,59 @@ def process_coords(coords):
     phi = np.zeros((nres, nres)) + np.nan
     phi[idx0, idx1] = get_angles(Ca[idx0], Cb[idx0], Cb[idx1])
     return dist, omega, theta, phi
+
+
+def process_coords_knn(coords, n_connections=30, chunk_size=256):
+    """
+    Neighbour-first version of process_coords for the StructureCollater.
+
+    The n_connections nearest residues by Cb distance are found in row chunks of the distance
+    matrix, and the distance and angles are computed only for those edges and for consecutive
+    residues (node features). No L x L matrix is kept, the collated outputs are the same as
+    with the dense matrices of process_coords.
+
+    input:  coords = {'N': (L, 3), 'CA': (L, 3), 'C': (L, 3)}
+            n_connections = neighbours per residue, at least the n_connections of the collater
+    output: dict with
+            E_idx: (L, k) neighbour indices, nearest first
+            edges: (L, k, 6) dist, omega, theta, theta of the reverse edge, phi, phi of the reverse edge
+            nodes: (L, 5) omega, theta and phi angles relative to the previous and next residue
+    """
+    N, Ca, C, Cb = _backbone_with_cb(coords)
+    nres = len(N)
+    k = min(n_connections, nres - 1)
+
+    E_idx = np.zeros((nres, k), dtype=np.int64)
+    dist = np.zeros((nres, k))
+    for start in range(0, nres, chunk_size):
+        stop = min(start + chunk_size, nres)
+        d = cdist(Cb[start:stop], Cb)
+        d[np.arange(stop - start), np.arange(start, stop)] = np.nan
+        # the same float32 topk as get_k_neighbors, so ties and missing residues pick the same neighbours
+        idx = torch.topk(torch.tensor(d, dtype=torch.float), k, largest=False)[1].numpy()
+        E_idx[start:stop] = idx
+        dist[start:stop] = np.take_along_axis(d, idx, axis=1)
+
+    i = np.repeat(np.arange(nres), k)
+    j = E_idx.reshape(-1)
+    edges = np.stack([
+        dist.reshape(-1),
+        get_dihedrals(Ca[i], Cb[i], Cb[j], Ca[j]),
+        get_dihedrals(N[i], Ca[i], Cb[i], Cb[j]),
+        get_dihedrals(N[j], Ca[j], Cb[j], Cb[i]),
+        get_angles(Ca[i], Cb[i], Cb[j]),
+        get_angles(Ca[j], Cb[j], Cb[i]),
+    ], axis=-1)
+    # the dense matrices leave the diagonal empty, a residue can only be its own neighbour when its row is all nan
+    edges[i == j] = np.nan
+
+    nodes = np.zeros((nres, 5))
+    if nres > 1:
+        p, q = np.arange(nres - 1), np.arange(1, nres)
+        # omega[i, i + 1], theta[i, i + 1], theta[i + 1, i], phi[i, i + 1], phi[i + 1, i]
+        nodes[1:, 0] = get_dihedrals(Ca[p], Cb[p], Cb[q], Ca[q])
+        nodes[:-1, 1] = get_dihedrals(N[p], Ca[p], Cb[p], Cb[q])
+        nodes[1:, 2] = get_dihedrals(N[q], Ca[q], Cb[q], Cb[p])
+        nodes[:-1, 3] = get_angles(Ca[p], Cb[p], Cb[q])
+        nodes[1:, 4] = get_angles(Ca[q], Cb[q], Cb[p])
+    return {"E_idx": E_idx, "edges": edges.reshape(nres, k, 6), "nodes": nodes}
@@ -1,10 +1,10 @@
-import torch
 import torch.nn as nn
 
 from .constants import PROTEIN_ALPHABET, PAD, MASK
 from .convolutional import ByteNetLM
 from .gnn import BidirectionalStruct2SeqDecoder
 from .collaters import SimpleCollater, StructureCollater, BGCCollater
+from src.utils.checkpoint import load_checkpoint, load_url_checkpoint
 
 
 CARP_URL = 'https://zenodo.org/record/6564798/files/'
@@ -61,9 +61,9 @@ def load_model_and_alphabet(model_name):
             url = CARP_URL + '%s.pt?download=1' %model_name
         elif 'mif' in model_name:
             url = MIF_URL + '%s.pt?download=1' %model_name
-        model_data = torch.hub.load_state_dict_from_url(url, progress=False, map_location="cpu")
+        model_data = load_url_checkpoint(url, weights_only=False)
     else:
-        model_data = torch.load(model_name, map_location="cpu")
+        model_data = load_checkpoint(model_name, weights_only=False)
     if 'big' in model_data['model']:
         pfam_to_domain = model_data['pfam_to_domain']
         tokens = model_data['tokens']
@@ -77,7 +77,7 @@ def load_model_and_alphabet(model_name):
         cnn = None
         if model_data['model'] == 'mif-st':
             url = CARP_URL + '%s.pt?download=1' % 'carp_640M'
-            cnn_data = torch.hub.load_state_dict_from_url(url, progress=False, map_location="cpu")
+            cnn_data = load_url_checkpoint(url, weights_only=False)
             cnn = load_carp(cnn_data)
         collater = StructureCollater(collater, n_connections=30)
         model = MIF(gnn, cnn=cnn)
@@ -0,0 +1,268 @@
+import csv
+import dataclasses
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def _encode(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+
+
+@dataclasses.dataclass
+class MutantTable:
+    """
+    Mutants as flat arrays of substitutions instead of one Python string per mutant.
+
+    A substitution takes 10 bytes. Residues are stored as their ASCII codes, so any one-letter code
+    round-trips, strings like "A12G:C15D" are only built when they are written or asked for.
+    Mutants without substitutions ("WT") are allowed and score 0.
+
+    Args:
+        position: 1-based position of every substitution, int32
+        wt: Wild-type residue of every substitution, uint8 ASCII code
+        mt: Mutant residue of every substitution, uint8 ASCII code
+        group: Index of the mutant every substitution belongs to, int32, non-decreasing
+        num_mutants: Number of mutants
+    """
+    position: np.ndarray
+    wt: np.ndarray
+    mt: np.ndarray
+    group: np.ndarray
+    num_mutants: int
+
+    def __len__(self) -> int:
+        return self.num_mutants
+
+    @property
+    def nbytes(self) -> int:
+        return self.position.nbytes + self.wt.nbytes + self.mt.nbytes + self.group.nbytes
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """Number of substitutions of every mutant."""
+        return np.bincount(self.group, minlength=self.num_mutants)
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """Index of the first substitution of every mutant, plus the total number of substitutions."""
+        offsets = np.zeros(self.num_mutants + 1, dtype=np.int64)
+        np.cumsum(self.sizes, out=offsets[1:])
+        return offsets
+
+    @classmethod
+    def from_arrays(cls, position, wt, mt, group=None, num_mutants: Optional[int] = None) -> "MutantTable":
+        """Build a table from substitution arrays, every substitution is a single mutant if group is None."""
+        position = np.asarray(position, dtype=np.int32)
+        group = np.arange(len(position), dtype=np.int32) if group is None else np.asarray(group, dtype=np.int32)
+        if num_mutants is None:
+            num_mutants = int(group[-1]) + 1 if len(group) else 0
+        return cls(position, np.asarray(wt, dtype=np.uint8), np.asarray(mt, dtype=np.uint8), group, num_mutants)
+
+    @classmethod
+    def saturation(cls, sequence: str, alphabet: str = AMINO_ACIDS) -> "MutantTable":
+        """
+        All single mutants of a sequence, in the order of generate_mutations_from_sequence:
+        by position, then by mutant residue in alphabet order.
+        """
+        residues = _encode(alphabet)
+        mask = residues[None, :] != _encode(sequence)[:, None]
+        rows, columns = np.nonzero(mask)
+        return cls.from_arrays(rows + 1, _encode(sequence)[rows], residues[columns])
+
+    @classmethod
+    def from_strings(cls, mutants: Iterable[str]) -> "MutantTable":
+        """Parse mutant strings like "A12G", "A12G:C15D", "A12G;C15D" or "WT"."""
+        position, wt, mt, group = array("i"), array("B"), array("B"), array("i")
+        num_mutants = 0
+        for index, mutant in enumerate(mutants):
+            sep = ":" if ":" in mutant else ";"
+            for sub_mutant in mutant.split(sep):
+                if sub_mutant.lower() == "wt":
+                    continue
+                try:
+                    position.append(int(sub_mutant[1:-1]))
+                    wt.append(ord(sub_mutant[0]))
+                    mt.append(ord(sub_mutant[-1]))
+                except (ValueError, OverflowError, IndexError):
+                    raise ValueError(f"Invalid mutant {mutant!r}") from None
+                group.append(index)
+            num_mutants = index + 1
+        return cls.from_arrays(
+            np.frombuffer(position, dtype=np.int32), np.frombuffer(wt, dtype=np.uint8),
+            np.frombuffer(mt, dtype=np.uint8), np.frombuffer(group, dtype=np.int32), num_mutants
+        )
+
+    def take(self, indices) -> "MutantTable":
+        """Table of the selected mutants, in the given order."""
+        indices = np.asarray(indices, dtype=np.int64)
+        offsets = self.offsets
+        starts, sizes = offsets[indices], offsets[indices + 1] - offsets[indices]
+        # index of every substitution of the selected mutants
+        group = np.repeat(np.arange(len(indices), dtype=np.int32), sizes)
+        rows = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(int(sizes.sum()))
+        return MutantTable(self.position[rows], self.wt[rows], self.mt[rows], group, len(indices))
+
+    def iter_strings(self, sep: str = ":", chunk_size: int = 1 << 16) -> Iterator[str]:
+        """Mutant strings, built chunk by chunk."""
+        for start in range(0, self.num_mutants, chunk_size):
+            yield from self.take(np.arange(start, min(start + chunk_size, self.num_mutants)))._strings(sep)
+
+    def to_strings(self, sep: str = ":") -> List[str]:
+        return list(self.iter_strings(sep))
+
+    def _strings(self, sep: str) -> List[str]:
+        substitutions = [
+            f"{w}{p}{m}" for w, p, m in
+            zip(self.wt.tobytes().decode("ascii"), self.position.tolist(), self.mt.tobytes().decode("ascii"))
+        ]
+        if len(substitutions) == self.num_mutants and np.all(self.sizes == 1):
+            return substitutions
+        offsets = self.offsets.tolist()
+        return [sep.join(substitutions[offsets[i]:offsets[i + 1]]) or "WT" for i in range(self.num_mutants)]
+
+    def score(self, site_scores: np.ndarray, offset: int = 0, alphabet: str = AMINO_ACIDS) -> np.ndarray:
+        """
+        Additive zero-shot score of every mutant: the mean over its substitutions of
+        site_scores[position + offset, mt] - site_scores[position + offset, wt].
+
+        Args:
+            site_scores: Per-site scores, e.g. log-probabilities, of shape (rows, len(alphabet))
+            offset: Row of position 0, e.g. 0 for logits with a BOS token and -1 without
+            alphabet: Residue of every column of site_scores
+
+        Returns:
+            float64 array with one score per mutant
+        """
+        site_scores = np.asarray(site_scores)
+        columns = np.full(256, -1, dtype=np.int64)
+        columns[_encode(alphabet)] = np.arange(len(alphabet))
+        wt, mt = columns[self.wt], columns[self.mt]
+        if len(wt) and (wt.min() < 0 or mt.min() < 0):
+            unknown = set(chr(code) for code in np.concatenate([self.wt[wt < 0], self.mt[mt < 0]]))
+            raise ValueError(f"Residues {sorted(unknown)} are not in the alphabet {alphabet}")
+        rows = self.position.astype(np.int64) + offset
+        deltas = site_scores[rows, mt] - site_scores[rows, wt]
+        sums = np.bincount(self.group, weights=deltas.astype(np.float64), minlength=self.num_mutants)
+        sizes = self.sizes
+        return np.divide(sums, sizes, out=np.zeros(self.num_mutants), where=sizes > 0)
+
+    def combinations(self, scores: np.ndarray, order: int = 2, threshold: Optional[float] = None,
+                     max_mutants: Optional[int] = None, chunk_size: int = 1 << 20
+                     ) -> Iterator[Tuple["MutantTable", np.ndarray]]:
+        """
+        Enumerate the combinatorial multi-mutants of a table of single mutants in chunks.
+
+        Only single mutants scoring at least `threshold` are combined and every combination has
+        distinct positions. The score of a combination is the mean of the scores of its single
+        mutants, which is what the additive zero-shot scorers return for a multi-mutant. A chunk holds
+        at most max(chunk_size, number of single mutants) combinations, so millions of them can be
+        scored and written without materialising the full list.
+
+        Args:
+            scores: Score of every single mutant of this table
+            order: Number of substitutions per combination, e.g. 2 for doubles and 3 for triples
+            threshold: Minimum single mutant score, None keeps all single mutants
+            max_mutants: Stop after this many combinations
+            chunk_size: Maximum number of combinations per chunk
+
+        Returns:
+            Iterator of (MutantTable of the combinations, their scores)
+        """
+        if np.any(self.sizes != 1):
+            raise ValueError("combinations needs a table of single mutants")
+        scores = np.asarray(scores, dtype=np.float64)
+        keep = np.arange(self.num_mutants) if threshold is None else np.nonzero(scores >= threshold)[0]
+        keep = keep[np.argsort(self.position[keep], kind="stable")]
+        position, wt, mt, single_scores = self.position[keep], self.wt[keep], self.mt[keep], scores[keep]
+        n = len(keep)
+        # first single mutant at a later position than single mutant i
+        next_start = np.searchsorted(position, position, side="right")
+
+        remaining = np.inf if max_mutants is None else max_mutants
+        for indices in _enumerate_combinations(next_start, n, order, chunk_size):
+            if remaining <= 0:
+                return
+            indices = indices[:int(min(len(indices), remaining))]
+            remaining -= len(indices)
+            table = MutantTable(
+                position[indices].ravel(), wt[indices].ravel(), mt[indices].ravel(),
+                np.repeat(np.arange(len(indices), dtype=np.int32), order), len(indices)
+            )
+            yield table, single_scores[indices].mean(axis=1)
+
+
+def _enumerate_combinations(next_start: np.ndarray, n: int, order: int, chunk_size: int) -> Iterator[np.ndarray]:
+    """Index tuples i1 < i2 < ... with strictly increasing positions, as (chunk, order) arrays."""
+
+    def extend(prefix: np.ndarray, depth: int) -> Iterator[np.ndarray]:
+        if depth == order:
+            yield prefix
+            return
+        first = next_start[prefix[:, -1]]
+        counts = n - first
+        # split the prefixes so that no extended block exceeds chunk_size rows
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(prefix):
+            base = ends[start - 1] if start else 0
+            stop = max(int(np.searchsorted(ends, base + chunk_size, side="right")), start + 1)
+            block_counts = counts[start:stop]
+            total = int(block_counts.sum())
+            if total:
+                rows = np.repeat(np.arange(start, stop), block_counts)
+                steps = np.arange(total) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+                extended = np.column_stack([prefix[rows], first[rows] + steps])
+                yield from extend(extended, depth + 1)
+            start = stop
+
+    if order < 1:
+        raise ValueError("order must be at least 1")
+    for start in range(0, n, chunk_size):
+        yield from extend(np.arange(start, min(start + chunk_size, n))[:, None], 1)
+
+
+def vocab_alphabet(vocab: Iterable[str]) -> str:
+    """One-letter residue tokens of a tokenizer vocabulary, used as the columns of its site scores."""
+    return "".join(token for token in vocab if len(token) == 1 and token.isalpha())
+
+
+def score_mutants(mutants: Union[Sequence[str], MutantTable], site_scores, offset: int = 0,
+                  alphabet: str = AMINO_ACIDS) -> List[float]:
+    """
+    Score mutant strings or a MutantTable against a per-site score table, see MutantTable.score.
+    The scorers use it in place of parsing every mutant string in a Python loop.
+    """
+    table = mutants if isinstance(mutants, MutantTable) else MutantTable.from_strings(mutants)
+    return table.score(site_scores, offset, alphabet).tolist()
+
+
+def write_csv(path: str, table: MutantTable, columns: Dict[str, np.ndarray], sort_by: Optional[str] = None,
+              ascending: bool = False, mode: str = "w", sep: str = ":", chunk_size: int = 1 << 16):
+    """
+    Write a mutant column and score columns to CSV without building a DataFrame of strings.
+
+    Args:
+        path: Output file
+        table: Mutants of the rows
+        columns: Column name to one value per mutant
+        sort_by: Column to sort the rows by, None keeps the table order
+        ascending: Sort order
+        mode: "w" writes the header, "a" appends rows of a further chunk
+        sep: Separator of multi-mutants
+        chunk_size: Rows formatted at once
+    """
+    order = np.arange(len(table))
+    if sort_by is not None:
+        values = columns[sort_by]
+        order = np.argsort(values if ascending else -values, kind="stable")
+    with open(path, mode, newline="") as f:
+        writer = csv.writer(f)
+        if mode == "w":
+            writer.writerow(["mutant", *columns])
+        for start in range(0, len(order), chunk_size):
+            rows = order[start:start + chunk_size]
+            values = [np.asarray(column)[rows].tolist() for column in columns.values()]
+            writer.writerows(zip(table.take(rows)._strings(sep), *values))
@@ -0,0 +1,207 @@
+import io
+import os
+import gzip
+import hashlib
+import threading
+import dataclasses
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Union
+import numpy as np
+import biotite.structure as bs
+from biotite.structure.io import pdb, pdbx
+from biotite.sequence import ProteinSequence
+
+# Number of parsed structures kept in memory by parse_structure
+CACHE_SIZE = 8
+COORDINATE_RECORDS = ("ATOM", "HETATM", "ANISOU")
+WATER_NAMES = ("HOH", "WAT")
+
+
+@dataclasses.dataclass
+class ParsedStructure:
+    """
+    A structure file parsed once and shared by all structure based scorers.
+
+    Holds the first model of the file as a biotite AtomArray with B-factors and occupancies, plus the
+    non-coordinate records of the file (header, remarks). Per-residue views (backbone coordinates,
+    sequence, B-factors, chains, residue ids) are derived from it with numpy. The scorers accept it
+    wherever they accept a PDB path, use parse_structure to build it.
+
+    Args:
+        path: Path of the parsed file
+        digest: sha256 of the file content
+        atoms: Atoms of the first model
+        header: All lines of the file that are not atom records
+    """
+    path: str
+    digest: str
+    atoms: bs.AtomArray = dataclasses.field(repr=False)
+    header: str = dataclasses.field(default="", repr=False)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def chain_ids(self) -> List[str]:
+        """Chain ids in the order of the file."""
+        return list(dict.fromkeys(self.atoms.chain_id.tolist()))
+
+    def select(self, chain: Union[str, Sequence[str], None] = None, standard_only: bool = False) -> bs.AtomArray:
+        """
+        Args:
+            chain: Chain id or list of chain ids, None keeps all chains
+            standard_only: Drop HETATM records, e.g. ligands and waters
+        """
+        atoms = self.atoms
+        mask = np.ones(len(atoms), dtype=bool)
+        if chain is not None:
+            mask &= np.isin(atoms.chain_id, [chain] if isinstance(chain, str) else list(chain))
+        if standard_only:
+            mask &= ~atoms.hetero
+        return atoms[mask]
+
+    def residue_ids(self, chain=None, standard_only: bool = False) -> List[tuple]:
+        """(chain id, residue number, insertion code) of every residue."""
+        atoms = self.select(chain, standard_only)
+        starts = bs.get_residue_starts(atoms)
+        return list(zip(atoms.chain_id[starts].tolist(), atoms.res_id[starts].tolist(), atoms.ins_code[starts].tolist()))
+
+    def residue_names(self, chain=None, standard_only: bool = False) -> np.ndarray:
+        atoms = self.select(chain, standard_only)
+        return atoms.res_name[bs.get_residue_starts(atoms)]
+
+    def chain_map(self, standard_only: bool = False) -> Dict[str, np.ndarray]:
+        """Indices of the residues of every chain, in the residue order of residue_ids(standard_only=...)."""
+        atoms = self.select(None, standard_only)
+        chains = atoms.chain_id[bs.get_residue_starts(atoms)]
+        return {chain: np.where(chains == chain)[0] for chain in dict.fromkeys(chains.tolist())}
+
+    def sequence(self, chain="A") -> str:
+        """Sequence of the residues with a peptide backbone, the same as extract_seq_from_pdb."""
+        atoms = self.select(chain)
+        atoms = atoms[bs.filter_peptide_backbone(atoms)]
+        return "".join(ProteinSequence.convert_letter_3to1(name) for name in bs.get_residues(atoms)[1])
+
+    def backbone_coords(self, atom_names: Sequence[str] = ("N", "CA", "C"), chain=None,
+                        standard_only: bool = False) -> np.ndarray:
+        """
+        Coordinates of the given atoms of every residue.
+
+        Returns:
+            Array of shape (num_residues, len(atom_names), 3), NaN where a residue lacks the atom
+        """
+        atoms = self.select(chain, standard_only)
+        starts = bs.get_residue_starts(atoms, add_exclusive_stop=True)
+        residue_index = np.repeat(np.arange(len(starts) - 1), np.diff(starts))
+        coords = np.full((len(starts) - 1, len(atom_names), 3), np.nan, dtype=np.float32)
+        for j, atom_name in enumerate(atom_names):
+            atom_index = np.where(atoms.atom_name == atom_name)[0]
+            # the first atom of that name wins if a residue has several
+            residues, first = np.unique(residue_index[atom_index], return_index=True)
+            coords[residues, j] = atoms.coord[atom_index[first]]
+        return coords
+
+    def residue_bfactors(self, chain=None, standard_only: bool = False) -> np.ndarray:
+        """Mean B-factor of the atoms of every residue, the pLDDT for predicted structures."""
+        atoms = self.select(chain, standard_only)
+        starts = bs.get_residue_starts(atoms, add_exclusive_stop=True)
+        sums = np.add.reduceat(atoms.b_factor.astype(np.float64), starts[:-1]) if len(atoms) else np.zeros(0)
+        return sums / np.diff(starts)
+
+    def to_biopython(self):
+        """
+        Build a new Biopython structure from the parsed atoms, without reading the file again.
+        A fresh object is returned on every call, callers are free to modify it.
+        """
+        from Bio.PDB.StructureBuilder import StructureBuilder
+
+        atoms = self.atoms
+        builder = StructureBuilder()
+        builder.init_structure(os.path.splitext(self.name)[0])
+        builder.init_model(0)
+        starts = bs.get_residue_starts(atoms, add_exclusive_stop=True)
+        current_chain = None
+        for start, stop in zip(starts[:-1], starts[1:]):
+            chain_id = atoms.chain_id[start]
+            if chain_id != current_chain:
+                builder.init_chain(chain_id)
+                builder.init_seg("    ")
+                current_chain = chain_id
+            res_name = atoms.res_name[start]
+            if res_name in WATER_NAMES:
+                field = "W"
+            elif atoms.hetero[start]:
+                field = "H"
+            else:
+                field = " "
+            builder.init_residue(res_name, field, int(atoms.res_id[start]), atoms.ins_code[start] or " ")
+            for i in range(start, stop):
+                atom_name = atoms.atom_name[i]
+                fullname = atom_name if len(atom_name) == 4 else f" {atom_name:<3}"
+                builder.init_atom(
+                    atom_name, atoms.coord[i], float(atoms.b_factor[i]), float(atoms.occupancy[i]),
+                    " ", fullname, element=atoms.element[i] or None
+                )
+        return builder.get_structure()
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _read_atoms(text: str, path: str) -> bs.AtomArray:
+    if path.endswith((".cif", ".mmcif")):
+        cif = pdbx.CIFFile.read(io.StringIO(text))
+        return pdbx.get_structure(cif, model=1, extra_fields=["b_factor", "occupancy"])
+    pdb_file = pdb.PDBFile.read(io.StringIO(text))
+    return pdb.get_structure(pdb_file, model=1, extra_fields=["b_factor", "occupancy"])
+
+
+def parse_structure(source: Union[str, os.PathLike, ParsedStructure]) -> ParsedStructure:
+    """
+    Parse a PDB or mmCIF file (optionally gzipped) once.
+
+    Results are memoised by the sha256 of the file content, so the same structure uploaded under
+    another name is not parsed again. A ParsedStructure is returned as is.
+    """
+    if isinstance(source, ParsedStructure):
+        return source
+    path = os.fspath(source)
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    with _cache_lock:
+        cached = _cache.get(digest)
+        if cached is not None:
+            _cache.move_to_end(digest)
+    if cached is not None:
+        # foldseek and the output file names still need the path the caller passed
+        return cached if cached.path == path else dataclasses.replace(cached, path=path)
+
+    format_path = path[:-3] if path.endswith(".gz") else path
+    if path.endswith(".gz"):
+        data = gzip.decompress(data)
+    text = data.decode("utf-8", "ignore")
+    header = "\n".join(line for line in text.splitlines() if not line.startswith(COORDINATE_RECORDS))
+    structure = ParsedStructure(path=path, digest=digest, atoms=_read_atoms(text, format_path), header=header)
+
+    with _cache_lock:
+        _cache[digest] = structure
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return structure
+
+
+def structure_path(source: Union[str, os.PathLike, ParsedStructure]) -> str:
+    """File path of a path or parsed structure."""
+    return source.path if isinstance(source, ParsedStructure) else os.fspath(source)
+
+
+def clear_structure_cache(digest: Optional[str] = None):
+    with _cache_lock:
+        if digest is None:
+            _cache.clear()
+        else:
+            _cache.pop(digest, None)
@@ -0,0 +1,33 @@
+import torch
+from torch_geometric.transforms import BaseTransform
+
+
+# @functional_transform('normalize_protein')
+class NormalizeProtein(BaseTransform):
+    r"""Centers and normalizes node positions to the interval :math:`(-1, 1)`
+    (functional name: :obj:`normalize_scale`).
+    """
+
+    def __init__(self, filename, skip_x=20, skip_edge_attr=64, safe_domi=1e-10):
+
+        dic = torch.load(filename)
+        self.skip_x = skip_x
+        self.skip_edge_attr = skip_edge_attr
+        self.safe_domi = safe_domi
+        self.x_mean = dic['x_mean']
+        self.x_std = dic['x_std']
+        self.pos_mean = dic['pos_mean']
+        self.pos_std = torch.mean(dic['pos_std'])
+        self.edge_attr_mean = dic['edge_attr_mean']
+        self.edge_attr_std = dic['edge_attr_std']
+
+    def __call__(self, data):
+        data.x[:, self.skip_x:] = (data.x[:, self.skip_x:] - self.x_mean[self.skip_x:]
+                                   ).div_(self.x_std[self.skip_x:] + self.safe_domi)
+        data.pos = data.pos - data.pos.mean(dim=-2, keepdim=False)
+        data.pos = data.pos.div_(self.pos_std + self.safe_domi)
+        data.edge_attr[:, self.skip_edge_attr:] = (data.edge_attr[:, self.skip_edge_attr:]
+                                                   - self.edge_attr_mean[self.skip_edge_attr:]).div_(self.edge_attr_std[self.skip_edge_attr:] + self.safe_domi)
+
+        return data
+# NormalizeProtein(filename = '/home/wang1/xinyexiong/protein/dataset_alpha_Fold/40_10/mean_attr.pt')
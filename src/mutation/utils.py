@@ -6,30 +6,32 @@ import os
 import random
 import csv
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 from datetime import datetime
 from numpy import array, cross, pi, arccos, sqrt
 from tqdm import tqdm
 from time import time
-from torch_geometric.transforms import BaseTransform
-from scipy.stats import spearmanr
 from numpy import nan
+from src.utils.fasta import read_fasta_sequence
+from src.mutation.mutant_table import MutantTable
+
+# The plotting, scipy and torch_geometric dependencies are imported where they are used, so the
+# zero-shot scripts that only need generate_mutations_from_sequence do not pay for them.
+
+
+def __getattr__(name):
+    # NormalizeProtein subclasses a torch_geometric transform, it moved to src.mutation.transforms
+    if name == "NormalizeProtein":
+        from src.mutation.transforms import NormalizeProtein
+        return NormalizeProtein
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def generate_mutations_from_sequence(sequence):
-    amino_acids = 'ACDEFGHIKLMNPQRSTVWY'
-    mutations = []
-    for i, original in enumerate(sequence):
-        for mutant in amino_acids:
-            if mutant != original: 
-                mutation = f"{original}{i+1}{mutant}" 
-                mutations.append(mutation) 
-    return mutations
+    # MutantTable.saturation(sequence) gives the same mutants without building the strings
+    return MutantTable.saturation(sequence).to_strings()
 
 def generate_point_mutations(fasta_file, output_csv):
-    with open(fasta_file, 'r') as f:
-        lines = f.readlines()
-        sequence = ''.join(line.strip() for line in lines[1:])
+    sequence = read_fasta_sequence(fasta_file)
 
     amino_acids = 'ACDEFGHIKLMNPQRSTVWY'
     mutations = []
@@ -186,39 +188,6 @@ def get_stat(graph_root, limited_num=None, num_subgroup=1000, max_limits=100000)
 
     return saved_filename_pt
 
-# @functional_transform('normalize_protein')
-
-
-class NormalizeProtein(BaseTransform):
-    r"""Centers and normalizes node positions to the interval :math:`(-1, 1)`
-    (functional name: :obj:`normalize_scale`).
-    """
-
-    def __init__(self, filename, skip_x=20, skip_edge_attr=64, safe_domi=1e-10):
-
-        dic = torch.load(filename)
-        self.skip_x = skip_x
-        self.skip_edge_attr = skip_edge_attr
-        self.safe_domi = safe_domi
-        self.x_mean = dic['x_mean']
-        self.x_std = dic['x_std']
-        self.pos_mean = dic['pos_mean']
-        self.pos_std = torch.mean(dic['pos_std'])
-        self.edge_attr_mean = dic['edge_attr_mean']
-        self.edge_attr_std = dic['edge_attr_std']
-
-    def __call__(self, data):
-        data.x[:, self.skip_x:] = (data.x[:, self.skip_x:] - self.x_mean[self.skip_x:]
-                                   ).div_(self.x_std[self.skip_x:] + self.safe_domi)
-        data.pos = data.pos - data.pos.mean(dim=-2, keepdim=False)
-        data.pos = data.pos.div_(self.pos_std + self.safe_domi)
-        data.edge_attr[:, self.skip_edge_attr:] = (data.edge_attr[:, self.skip_edge_attr:]
-                                                   - self.edge_attr_mean[self.skip_edge_attr:]).div_(self.edge_attr_std[self.skip_edge_attr:] + self.safe_domi)
-
-        return data
-# NormalizeProtein(filename = '/home/wang1/xinyexiong/protein/dataset_alpha_Fold/40_10/mean_attr.pt')
-
-
 class DihedralGeometryError(Exception):
     pass
 
@@ -421,6 +390,9 @@ def dihedral(vec1, vec2, vec3, vec4):
 
 
 def seq_dist_distrib(loader):
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
     before = time()
     q = np.array([0.25, 0.5, 0.75, 0.9, 0.95, 0.98, 0.99])
     seq_dist = torch.Tensor(0)
@@ -440,6 +412,8 @@ def seq_dist_distrib(loader):
 
 
 def mutat_test4(loader, device, model, dataset):
+    from scipy.stats import spearmanr
+
     # printed cor arranged along the protein names in dataset
     model.eval()
     m = torch.nn.Softmax()
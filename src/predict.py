@@ -18,6 +18,7 @@ from transformers import logging
 from peft import PeftModel
 # Import project modules
 from models.adapter_model import AdapterModel
+from utils.checkpoint import load_checkpoint
 from models.lora_model import LoraModel
 from models.pooling import MeanPooling, Attention1dPoolingHead, LightAttentionPoolingHead
 
@@ -177,8 +178,10 @@ def load_model_and_tokenizer(args):
             model_path = args.model_path
         else:
             model_path = f"{args.output_root}/{args.output_dir}/{args.output_model_name}"
-        model.load_state_dict(torch.load(model_path))
-        model.to(device).eval()
+        # move the model first, the weights are then loaded straight onto the device
+        model.to(device)
+        model.load_state_dict(load_checkpoint(model_path, device))
+        model.eval()
         # ! lora/ qlora
         if args.eval_method == 'plm-lora':
             lora_path = model_path.replace(".pt", "_lora")
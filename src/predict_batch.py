@@ -5,6 +5,7 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 import argparse
+import importlib.util
 import torch
 import re
 import json
@@ -21,6 +22,7 @@ from peft import PeftModel
 
 # Import project modules
 from models.adapter_model import AdapterModel
+from utils.checkpoint import load_checkpoint
 from models.lora_model import LoraModel
 from models.pooling import MeanPooling, Attention1dPoolingHead, LightAttentionPoolingHead
 
@@ -52,6 +54,10 @@ def parse_args():
     parser.add_argument('--use_foldseek', action='store_true', help="Use foldseek sequence")
     parser.add_argument('--use_ss8', action='store_true', help="Use secondary structure sequence")
     parser.add_argument('--structure_seq', type=str, default=None, help="Structure sequence types to use (comma-separated)")
+    parser.add_argument('--residue_output_format', type=str, default="wide", choices=["wide", "long", "parquet"],
+                        help="Per-residue output of residue tasks: 'wide' adds one column per position and class to the output file, "
+                             "'long' and 'parquet' stream one row per residue to <output_file>_residues.csv / .parquet")
+    parser.add_argument('--row_group_size', type=int, default=100000, help="Residues buffered per write of the per-residue table")
     
     # Other parameters
     parser.add_argument('--max_seq_len', type=int, default=1024, help="Maximum sequence length")
@@ -179,13 +185,15 @@ def load_model_and_tokenizer(args):
             model_path = args.model_path
         else:
             model_path = f"{args.output_root}/{args.output_dir}/{args.output_model_name}"
+        # move the model first, the weights are then loaded straight onto the device
+        model.to(device)
         if args.eval_method == "full":
-            model_weights = torch.load(model_path)
+            model_weights = load_checkpoint(model_path, device)
             model.load_state_dict(model_weights['model_state_dict'])
             plm_model.load_state_dict(model_weights['plm_state_dict'])
         else:
-            model.load_state_dict(torch.load(model_path))
-        model.to(device).eval()
+            model.load_state_dict(load_checkpoint(model_path, device))
+        model.eval()
         # ! lora/ qlora
         if args.eval_method == 'plm-lora':
             lora_path = model_path.replace(".pt", "_lora")
@@ -389,6 +397,85 @@ def predict_batch(model, plm_model, data_dict, device, args):
                 "predictions": predictions.tolist()
             }
 
+class ResidueWriter:
+    """
+    Streams per-residue predictions as a tidy table with one row per residue:
+    id, position (1-based), residue, predicted_class and class_{i}_prob, or prediction for residue regression.
+    Rows are buffered and appended to a csv file or written as parquet row groups.
+    """
+    def __init__(self, path, output_format, problem_type, num_labels, row_group_size=100000):
+        self.path = path
+        self.output_format = output_format
+        self.problem_type = problem_type
+        if problem_type == "residue_regression":
+            self.columns = ["id", "position", "residue", "prediction"]
+        else:
+            self.columns = ["id", "position", "residue", "predicted_class"] + [f"class_{i}_prob" for i in range(num_labels)]
+        self.row_group_size = row_group_size
+        self.buffer = {column: [] for column in self.columns}
+        self.num_buffered = 0
+        self.num_rows = 0
+        self.parquet_writer = None
+        if output_format == "parquet":
+            # fail before the prediction starts, pyarrow itself is imported when the first row group is written
+            if importlib.util.find_spec("pyarrow") is None:
+                raise ImportError("--residue_output_format parquet requires pyarrow, install it with `pip install pyarrow`")
+        else:
+            pd.DataFrame(columns=self.columns).to_csv(path, index=False)
+
+    def write(self, seq_id, aa_seq, prediction_results):
+        """
+        Add the residues of one sequence. Position i of the sequence is token i + 1 of the model output,
+        the same offset the collator uses for residue labels.
+
+        Returns:
+            predicted class (or value) of every residue
+        """
+        length = len(aa_seq)
+        if self.problem_type == "residue_regression":
+            values = np.asarray(prediction_results["predictions"]).reshape(-1)[1:length + 1]
+            self.buffer["prediction"].extend(values.tolist())
+            per_residue = values.tolist()
+        else:
+            classes = np.asarray(prediction_results["predicted_classes"]).reshape(-1)[1:length + 1]
+            probs = np.asarray(prediction_results["probabilities"])
+            probs = probs.reshape(-1, probs.shape[-1])[1:length + 1]
+            self.buffer["predicted_class"].extend(classes.tolist())
+            for i in range(len(self.columns) - 4):
+                self.buffer[f"class_{i}_prob"].extend(probs[:, i].tolist())
+            per_residue = classes.tolist()
+        length = len(per_residue)
+        self.buffer["id"].extend([seq_id] * length)
+        self.buffer["position"].extend(range(1, length + 1))
+        self.buffer["residue"].extend(aa_seq[:length])
+        self.num_buffered += length
+        if self.num_buffered >= self.row_group_size:
+            self.flush()
+        return per_residue
+
+    def flush(self):
+        if not self.num_buffered:
+            return
+        chunk = pd.DataFrame(self.buffer, columns=self.columns)
+        if self.output_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table.cast(self.parquet_writer.schema))
+        else:
+            chunk.to_csv(self.path, mode="a", header=False, index=False)
+        self.num_rows += self.num_buffered
+        self.buffer = {column: [] for column in self.columns}
+        self.num_buffered = 0
+
+    def close(self):
+        self.flush()
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+
 def main():
     # Parse command line arguments
     args = parse_args()
@@ -420,6 +507,17 @@ def main():
         
         # Initialize results dataframe
         results = []
+        if not os.path.exists(args.output_dir):
+            os.makedirs(args.output_dir)
+        output_file = os.path.join(args.output_dir, args.output_file)
+
+        # Per-residue predictions are streamed to their own table instead of one column per position
+        residue_writer = None
+        if "residue" in args.problem_type and args.residue_output_format != "wide":
+            suffix = ".parquet" if args.residue_output_format == "parquet" else ".csv"
+            residue_file = os.path.splitext(output_file)[0] + "_residues" + suffix
+            residue_writer = ResidueWriter(residue_file, args.residue_output_format, args.problem_type,
+                                           args.num_labels, args.row_group_size)
         
         # Process each sequence
         print("---------- Processing sequences ----------")
@@ -467,6 +565,12 @@ def main():
                     for i, prob in enumerate(prediction_results["probabilities"][0]):
                         result_row[f"label_{i}_prob"] = prob
                 
+                elif residue_writer is not None:
+                    # Keep only the per-residue predictions in the sequence table, probabilities go to the residue table
+                    seq_id = row["id"] if "id" in df.columns else idx
+                    residue_predictions = residue_writer.write(seq_id, aa_seq.strip(), prediction_results)
+                    result_row["residue_predictions"] = json.dumps(residue_predictions)
+                
                 elif args.problem_type == "residue_single_label_classification":
                     # For residue classification, each position has a prediction
                     # Store as a list of predictions per position
@@ -503,12 +607,12 @@ def main():
         results_df = pd.DataFrame(results)
         
         # Save results to output file
-        if not os.path.exists(args.output_dir):
-            os.makedirs(args.output_dir)
-        output_file = os.path.join(args.output_dir, args.output_file)
         print(f"---------- Saving results to {output_file} ----------")
         results_df.to_csv(output_file, index=False)
         print(f"Saved {len(results_df)} prediction results")
+        if residue_writer is not None:
+            residue_writer.close()
+            print(f"Saved {residue_writer.num_rows} residue predictions to {residue_writer.path}")
         
         print("---------- Batch prediction completed successfully ----------")
         
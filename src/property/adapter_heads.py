@@ -0,0 +1,186 @@
+import os
+import csv
+import copy
+import json
+import torch
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.models.adapter_model import AdapterModel
+from src.utils.checkpoint import load_checkpoint
+
+CONFIG_NAME = "lr5e-4_bt12k_ga8.json"
+WEIGHT_NAME = "lr5e-4_bt12k_ga8.pt"
+
+
+def get_device():
+    return torch.device("cuda" if torch.cuda.is_available(
+    ) else "mps" if torch.backends.mps.is_available() else "cpu")
+
+
+def adapter_name(adapter_path: str) -> str:
+    """Adapters are stored as ckpt/<dataset>/<model>, the dataset directory names the head."""
+    path = Path(adapter_path)
+    return path.parent.name or path.name
+
+
+def load_adapter_heads(args, device, adapter_paths: List[str], adapter_names: Optional[List[str]] = None,
+                       clear_structure_seq: bool = True) -> List[Tuple[str, object, AdapterModel]]:
+    """
+    Loads one trained AdapterModel per adapter path. All heads must be trained on the same PLM,
+    they are evaluated on a single forward pass of it.
+
+    Args:
+        args: Command line arguments, copied for every head and overridden by the head config
+        device: Device to load the heads on
+        adapter_paths: Directories holding the adapter config and weights
+        adapter_names: Names used in the output, defaults to the dataset directory of each adapter
+        clear_structure_seq: Drop the structure inputs from the config, only sequences are available
+
+    Returns:
+        list of (name, head args, model)
+    """
+    if adapter_names is not None and len(adapter_names) != len(adapter_paths):
+        raise ValueError("--adapter_names must have one name per --adapter_path")
+
+    heads = []
+    for i, model_path in enumerate(adapter_paths):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Adapter model file not found: {model_path}")
+
+        head_args = copy.deepcopy(args)
+        config_path = os.path.join(model_path, CONFIG_NAME)
+        # Load model configuration from config.json, but command-line arguments have higher priority.
+        try:
+            with open(config_path, "r") as f:
+                config = json.load(f)
+                print(f"Loaded configuration from {config_path}")
+                for key, value in config.items():
+                    setattr(head_args, key, value)
+        except FileNotFoundError:
+            print(f"Model config not found at {config_path}. Using command line arguments only.")
+        if clear_structure_seq:
+            head_args.structure_seq = ""
+
+        if heads and getattr(head_args, "plm_model", None) != getattr(heads[0][1], "plm_model", None):
+            raise ValueError(
+                f"{model_path} was trained on {getattr(head_args, 'plm_model', None)}, "
+                f"but {adapter_paths[0]} on {getattr(heads[0][1], 'plm_model', None)}"
+            )
+
+        model = AdapterModel(head_args)
+        model.to(device)
+        model.load_state_dict(load_checkpoint(os.path.join(model_path, WEIGHT_NAME), device))
+        model.eval()
+        name = adapter_names[i] if adapter_names else adapter_name(model_path)
+        heads.append((name, head_args, model))
+    return heads
+
+
+def format_batch_outputs(problem_type: str, outputs: torch.Tensor, lengths: List[int]) -> List[Dict]:
+    """
+    Converts the logits of a batch into the output fields of its problem type, one dict per sample.
+    Probabilities are computed on the device and copied to the host once for the whole batch.
+
+    Args:
+        problem_type: Problem type of the head
+        outputs: Logits of the batch, (batch, num_labels) or (batch, tokens, num_labels) for residue heads
+        lengths: Number of unpadded tokens of each sample, used to cut residue outputs
+    """
+    batch_size = outputs.shape[0]
+    if problem_type == "regression":
+        predictions = outputs.reshape(batch_size, -1)[:, 0].float().cpu().tolist()
+        return [{"prediction": prediction} for prediction in predictions]
+
+    elif problem_type == "single_label_classification":
+        probabilities = torch.nn.functional.softmax(outputs.float(), dim=1)
+        predicted_class = torch.argmax(probabilities, dim=1).cpu().tolist()
+        class_probs = probabilities.cpu().tolist()
+        return [
+            {"predicted_class": predicted, "probabilities": probs}
+            for predicted, probs in zip(predicted_class, class_probs)
+        ]
+
+    elif problem_type == "multi_label_classification":
+        sigmoid_outputs = torch.sigmoid(outputs.float()).reshape(batch_size, -1)
+        predictions = (sigmoid_outputs > 0.5).int().cpu().tolist()
+        probabilities = sigmoid_outputs.cpu().tolist()
+        return [
+            {"predicted_class": predicted, "probabilities": probs}
+            for predicted, probs in zip(predictions, probabilities)
+        ]
+
+    elif problem_type == "residue_single_label_classification":
+        probabilities = torch.nn.functional.softmax(outputs.float(), dim=-1)
+        predictions = torch.argmax(probabilities, dim=-1).cpu().tolist()
+        probabilities = probabilities.cpu().tolist()
+        # Residue outputs keep the leading batch dimension of the single sequence output format.
+        return [
+            {"predicted_class": [predicted[:length]], "probabilities": [probs[:length]]}
+            for predicted, probs, length in zip(predictions, probabilities, lengths)
+        ]
+
+    else:
+        # Default case for unknown problem types
+        raw_outputs = outputs.float().cpu()
+        return [{"raw_output": raw_outputs[i].squeeze().tolist()} for i in range(batch_size)]
+
+
+def result_fields(problem_type: str) -> List[str]:
+    if problem_type == "regression":
+        return ["prediction"]
+    if "classification" in problem_type:
+        return ["predicted_class", "probabilities"]
+    return ["raw_output"]
+
+
+def predict_heads(heads, plm_model, data_dict, device) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Computes the PLM embeddings of a batch once and evaluates every head on them.
+
+    Returns:
+        (head name, result fields of every sample in the batch) for each head
+    """
+    for k, v in data_dict.items():
+        data_dict[k] = v.to(device)
+    lengths = data_dict["aa_seq_attention_mask"].sum(dim=1).cpu().tolist()
+
+    with torch.no_grad():
+        seq_embeds = heads[0][2].plm_embedding(
+            plm_model, data_dict["aa_seq_input_ids"], data_dict["aa_seq_attention_mask"]
+        )
+        for name, head_args, model in heads:
+            outputs = model(plm_model, data_dict, seq_embeds=seq_embeds)
+            yield name, format_batch_outputs(head_args.problem_type, outputs, lengths)
+
+
+class PredictionWriter:
+    """
+    Writes prediction rows to a csv file as they are produced.
+
+    With a single head the table keeps one row per sequence. With several heads it is in long format,
+    one row per sequence and head, the head name in the "Dataset" column.
+    """
+    def __init__(self, output_csv: str, heads):
+        self.multi_head = len(heads) > 1
+        self.fieldnames = ["header", "sequence"] + (["Dataset"] if self.multi_head else [])
+        for _, head_args, _ in heads:
+            for field in result_fields(head_args.problem_type):
+                if field not in self.fieldnames:
+                    self.fieldnames.append(field)
+        self.file = open(output_csv, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames)
+        self.writer.writeheader()
+        self.num_rows = 0
+
+    def write(self, header: str, sequence: str, name: str, result_data: Dict):
+        row = {"header": header, "sequence": sequence}
+        if self.multi_head:
+            row["Dataset"] = name
+        for key, value in result_data.items():
+            # Convert list-like probabilities to a JSON string for storage.
+            row[key] = json.dumps(value) if isinstance(value, list) else value
+        self.writer.writerow(row)
+        self.num_rows += 1
+
+    def close(self):
+        self.file.close()
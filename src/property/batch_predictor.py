@@ -0,0 +1,124 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+from tqdm import tqdm
+from typing import Callable, List, Optional
+from src.models.pooling import cu_seqlens_from_mask
+from src.property.adapter_heads import get_device, load_adapter_heads, predict_heads, PredictionWriter
+from src.utils.fasta import FastaFile
+
+
+def build_parser(description: str = "Protein Prediction Pipeline") -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--fasta_file", type=str, required=True,
+                        help="Input FASTA file (can contain multiple sequences)")
+    parser.add_argument("--adapter_path", type=str, nargs="+", required=True,
+                        help="Path to one or more trained AdapterModel directories, all heads share one PLM forward pass")
+    parser.add_argument("--adapter_names", type=str, nargs="+", default=None,
+                        help="Name of each adapter in the output, defaults to the dataset directory of the adapter")
+    parser.add_argument("--output_csv", type=str, default="prediction_results.csv",
+                        help="Path to save the output CSV file, in long format with a Dataset column for several adapters")
+    parser.add_argument("--max_batch_token", type=int, default=12000,
+                        help="Token budget of a batch, padding included")
+    parser.add_argument("--batch_size", type=int, default=64,
+                        help="Maximum number of sequences in a batch")
+    parser.add_argument("--sort_window", type=int, default=4096,
+                        help="Number of sequences sorted by length together, rows are written in FASTA order per window")
+    return parser
+
+
+def make_batches(indices: List[int], lengths, max_batch_token: int, batch_size: int, special_tokens: int = 2) -> List[List[int]]:
+    """
+    Sort sequences by length and pack them into batches whose padded size stays within the token budget.
+    A sequence longer than the budget gets a batch of its own.
+
+    Args:
+        indices: Record indices to batch
+        lengths: Sequence length of every record
+        max_batch_token: Token budget of a batch, counted as longest sequence times batch size
+        batch_size: Maximum number of sequences in a batch
+        special_tokens: Tokens added by the tokenizer to every sequence
+    """
+    order = sorted(indices, key=lambda idx: lengths[idx], reverse=True)
+    batches, batch = [], []
+    for idx in order:
+        # sequences come longest first, so the first one of a batch sets its padded length
+        longest = lengths[batch[0]] + special_tokens if batch else lengths[idx] + special_tokens
+        if batch and (len(batch) >= batch_size or longest * (len(batch) + 1) > max_batch_token):
+            batches.append(batch)
+            batch = []
+        batch.append(idx)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def run_prediction(args, heads, plm_model, tokenizer, device, format_sequence: Optional[Callable[[str], str]] = None) -> int:
+    """
+    Predicts every sequence of the FASTA file with all heads and streams the rows to the output csv.
+
+    Returns:
+        number of written rows
+    """
+    fasta = FastaFile(args.fasta_file)
+    if not len(fasta):
+        print("No sequences found in the FASTA file.")
+        return 0
+
+    print(f"\nFound {len(fasta)} sequences and {len(heads)} adapters. Starting prediction...")
+    writer = PredictionWriter(args.output_csv, heads)
+    with tqdm(total=len(fasta), desc="Predicting sequences") as bar:
+        for window_start in range(0, len(fasta), args.sort_window):
+            window = range(window_start, min(window_start + args.sort_window, len(fasta)))
+            results = {}
+            for batch in make_batches(list(window), fasta.lengths, args.max_batch_token, args.batch_size):
+                sequences = [fasta.sequence(idx) for idx in batch]
+                inputs = [format_sequence(seq) for seq in sequences] if format_sequence else sequences
+                aa_inputs = tokenizer(inputs, return_tensors="pt", padding=True, truncation=True)
+                data_dict = {
+                    "aa_seq_input_ids": aa_inputs["input_ids"],
+                    "aa_seq_attention_mask": aa_inputs["attention_mask"],
+                    # the heads run on packed tokens, padding is only needed by the PLM
+                    "aa_seq_cu_seqlens": cu_seqlens_from_mask(aa_inputs["attention_mask"])
+                }
+                for name, batch_results in predict_heads(heads, plm_model, data_dict, device):
+                    for idx, result_data in zip(batch, batch_results):
+                        results.setdefault(idx, []).append((name, result_data))
+                bar.update(len(batch))
+
+            # write the window back in FASTA order
+            for idx in window:
+                header, sequence = fasta[idx]
+                for name, result_data in results.pop(idx):
+                    writer.write(header, sequence, name, result_data)
+    writer.close()
+    fasta.close()
+    return writer.num_rows
+
+
+def main(load_plm: Callable, format_sequence: Optional[Callable[[str], str]] = None, clear_structure_seq: bool = True):
+    """
+    Command line entry shared by the property predictors.
+
+    Args:
+        load_plm: Function of the device returning the tokenizer and the PLM
+        format_sequence: Optional function applied to every sequence before tokenization
+        clear_structure_seq: Drop the structure inputs from the adapter configs
+    """
+    args = build_parser().parse_args()
+
+    # Load the PLM, tokenizer and heads (only once).
+    print("---------- Loading Model and Tokenizer ----------")
+    device = get_device()
+    # Every head reads its own configuration from its adapter directory.
+    heads = load_adapter_heads(args, device, args.adapter_path, args.adapter_names, clear_structure_seq=clear_structure_seq)
+    tokenizer, plm_model = load_plm(device)
+    plm_model.eval()
+
+    num_rows = run_prediction(args, heads, plm_model, tokenizer, device, format_sequence)
+
+    print("\n---------- Prediction Complete ----------")
+    print(f"{num_rows} predictions saved to {args.output_csv}")
@@ -0,0 +1,89 @@
+"""
+Compare the streaming MultilabelF1Max with the exact count_f1_max on random multilabel data.
+
+Every method runs in its own process, the reported memory is the peak resident memory of that
+process (or the peak CUDA memory with --device cuda).
+
+    python src/training/benchmark_f1_max.py --samples 20000 --labels 5000 --num_bins 1000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_batches(args, device):
+    import torch
+    generator = torch.Generator().manual_seed(args.seed)
+    for start in range(0, args.samples, args.batch_size):
+        size = min(args.batch_size, args.samples - start)
+        target = (torch.rand(size, args.labels, generator=generator) < args.positive_rate).long()
+        # positives score higher on average, so the F1-max is well above the trivial value
+        logits = torch.randn(size, args.labels, generator=generator) + 2.0 * target - 3.0
+        yield torch.sigmoid(logits).to(device), target.to(device)
+
+
+def run_method(method, args, result_queue):
+    import torch
+    from training.metrics import MultilabelF1Max, count_f1_max
+
+    device = torch.device(args.device)
+    begin = time.perf_counter()
+    if method == "exact":
+        preds, target = [], []
+        for batch_preds, batch_target in make_batches(args, device):
+            preds.append(batch_preds)
+            target.append(batch_target)
+        value = count_f1_max(torch.cat(preds), torch.cat(target)).item()
+    else:
+        metric = MultilabelF1Max(num_labels=args.labels, num_bins=args.num_bins).to(device)
+        for batch_preds, batch_target in make_batches(args, device):
+            metric.update(batch_preds, batch_target)
+        value = metric.compute().item()
+    elapsed = time.perf_counter() - begin
+
+    if device.type == "cuda":
+        peak = torch.cuda.max_memory_allocated(device)
+    else:
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    result_queue.put((value, elapsed, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming F1-max metric")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--labels", type=int, default=5000)
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--positive_rate", type=float, default=0.005)
+    parser.add_argument("--num_bins", type=int, default=1000)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--seed", type=int, default=3407)
+    parser.add_argument("--skip_exact", action="store_true", help="Only run the streaming metric")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for method in ["streaming"] if args.skip_exact else ["streaming", "exact"]:
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=run_method, args=(method, args, result_queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{method}: failed with exit code {process.exitcode} (out of memory?)")
+            continue
+        results[method] = result_queue.get()
+        value, elapsed, peak = results[method]
+        print(f"{method:>9}: f1_max={value:.6f} time={elapsed:.2f}s peak_memory={peak / (1 << 20):.1f}MB")
+
+    if "exact" in results:
+        error = results["exact"][0] - results["streaming"][0]
+        print(f"exact - streaming = {error:.2e} with {args.num_bins} bins")
+
+
+if __name__ == "__main__":
+    main()
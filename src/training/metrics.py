@@ -3,7 +3,6 @@ from torchmetrics.classification import Accuracy, Recall, Precision, MatthewsCor
 from torchmetrics.classification import BinaryAccuracy, BinaryRecall, BinaryAUROC, BinaryF1Score, BinaryPrecision, BinaryMatthewsCorrCoef, BinaryF1Score
 from torchmetrics.classification import BinaryAveragePrecision, MulticlassAveragePrecision
 from torchmetrics.regression import SpearmanCorrCoef, MeanSquaredError
-from torchmetrics.classification import MultilabelAveragePrecision
 from torchmetrics import Metric
 import torch.nn.functional as F
 
@@ -53,10 +52,69 @@ def count_f1_max(pred, target):
     return all_f1.max()
 
 
-class MultilabelF1Max(MultilabelAveragePrecision):
+class MultilabelF1Max(Metric):
+    """
+    Streaming version of count_f1_max.
+
+    Instead of keeping all predictions of the epoch, every batch is reduced to per-threshold sums over
+    `num_bins` evenly spaced thresholds in [0, 1]: the summed precision and recall of the samples and the
+    number of samples with at least one prediction above the threshold. The state has a fixed size of
+    3 * num_bins values, no matter how many samples or labels are evaluated.
+
+    Every threshold of the histogram is one of the thresholds count_f1_max enumerates, so the result
+    never exceeds the exact F1-max (up to ties). It is lower only by the predictions that fall into the
+    bin right above the optimal threshold, i.e. it converges to the exact value as num_bins grows.
+
+    Args:
+        num_labels: Number of labels
+        num_bins: Number of thresholds, the resolution of the threshold is 1 / num_bins
+        chunk_elements: Upper bound of the per-sample histogram elements built at once, bounds the
+            temporary memory of an update
+    """
+    full_state_update = False
+
+    def __init__(self, num_labels: int, num_bins: int = 1000, chunk_elements: int = 1 << 22, **kwargs):
+        super().__init__(**kwargs)
+        self.num_labels = num_labels
+        self.num_bins = num_bins
+        self.chunk_size = max(1, chunk_elements // num_bins)
+        self.add_state("precision_sum", default=torch.zeros(num_bins, dtype=torch.float64), dist_reduce_fx="sum")
+        self.add_state("recall_sum", default=torch.zeros(num_bins, dtype=torch.float64), dist_reduce_fx="sum")
+        self.add_state("num_covered", default=torch.zeros(num_bins, dtype=torch.long), dist_reduce_fx="sum")
+        self.add_state("num_samples", default=torch.tensor(0, dtype=torch.long), dist_reduce_fx="sum")
+
+    def update(self, preds: torch.Tensor, target: torch.Tensor):
+        preds = preds.detach().float()
+        target = target.detach().float()
+        # logits are turned into probabilities, the same as MultilabelAveragePrecision does
+        if preds.numel() and (preds.min() < 0 or preds.max() > 1):
+            preds = preds.sigmoid()
+        # bin i holds the scores in [i / num_bins, (i + 1) / num_bins), 1.0 goes into the last bin
+        index = (preds * self.num_bins).long().clamp_(0, self.num_bins - 1)
+
+        for start in range(0, preds.shape[0], self.chunk_size):
+            chunk_index = index[start:start + self.chunk_size]
+            chunk_target = target[start:start + self.chunk_size]
+            pred_count = torch.zeros(chunk_index.shape[0], self.num_bins, device=preds.device)
+            pred_count.scatter_add_(1, chunk_index, torch.ones_like(chunk_target))
+            tp_count = torch.zeros_like(pred_count).scatter_add_(1, chunk_index, chunk_target)
+            # counts at or above every threshold, from the highest threshold down
+            pred_count = pred_count.flip(1).cumsum(1)
+            tp_count = tp_count.flip(1).cumsum(1)
+            precision = tp_count / pred_count.clamp(min=1)
+            recall = tp_count / (chunk_target.sum(1, keepdim=True) + 1e-10)
+            self.precision_sum += precision.sum(0).double()
+            self.recall_sum += recall.sum(0).double()
+            self.num_covered += (pred_count > 0).sum(0)
+        self.num_samples += preds.shape[0]
 
     def compute(self):
-        return count_f1_max(torch.cat(self.preds), torch.cat(self.target))
+        # like count_f1_max: precision is averaged over the samples with a prediction above the
+        # threshold, recall over all samples
+        precision = self.precision_sum / self.num_covered.clamp(min=1)
+        recall = self.recall_sum / self.num_samples.clamp(min=1)
+        f1 = 2 * precision * recall / (precision + recall + 1e-10)
+        return f1.max().float()
 
 class BaseResidueMetric(Metric):
     """
@@ -0,0 +1,53 @@
+import json
+import os
+import time
+
+
+class ProgressWriter:
+    """
+    Append structured progress events to a JSON lines file for the Web UI training monitor.
+
+    Every line is one event, e.g. {"event": "val_epoch", "epoch": 0, "loss": 0.41, "metrics": {...}, "time": ...}.
+    Step events are throttled to one per `min_interval` seconds, all other events are written immediately.
+    Without a path every call is a no-op, so the trainer can report unconditionally.
+    """
+    def __init__(self, path=None, min_interval=1.0):
+        self.path = path
+        self.min_interval = min_interval
+        self._last_step_time = {}
+        self._file = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def emit(self, event, **fields):
+        if self._file is None:
+            return
+        record = {"event": event, **fields, "time": time.time()}
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def step(self, stage, bar, **fields):
+        """
+        Report the position of a tqdm progress bar, throttled per stage.
+        The last step of a stage is always written so the UI ends at 100%.
+        """
+        if self._file is None:
+            return
+        now = time.time()
+        current, total = bar.n, bar.total
+        if current != total and now - self._last_step_time.get(stage, 0.0) < self.min_interval:
+            return
+        self._last_step_time[stage] = now
+        info = bar.format_dict
+        rate = info.get("rate") or 0.0
+        elapsed = info.get("elapsed") or 0.0
+        remaining = (total - current) / rate if rate and total else None
+        self.emit("step", stage=stage, current=current, total=total, elapsed=elapsed,
+                  remaining=remaining, rate=rate, **fields)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -7,6 +7,7 @@ from accelerate import Accelerator
 from .scheduler import create_scheduler
 from .metrics import setup_metrics
 from .loss_function import MultiClassFocalLossWithAlpha
+from .progress import ProgressWriter
 import wandb
 from models.model_factory import create_plm_and_tokenizer
 from peft import PeftModel
@@ -83,6 +84,9 @@ class Trainer:
         self.global_steps = 0
         self.early_stop_counter = 0
         
+        # Structured progress events for the Web UI monitor, a no-op without --progress_file
+        self.progress = ProgressWriter(getattr(args, 'progress_file', None))
+        
         # Save args
         with open(os.path.join(self.args.output_dir, f'{self.args.output_model_name.split(".")[0]}.json'), 'w') as f:
             json.dump(self.args.__dict__, f)
@@ -115,10 +119,12 @@ class Trainer:
         """Train the model."""
         for epoch in range(self.args.num_epochs):
             self.logger.info(f"---------- Epoch {epoch} ----------")
+            self.progress.emit("epoch", epoch=epoch, num_epochs=self.args.num_epochs)
             
             # Training phase
             train_loss = self._train_epoch(train_loader)
             self.logger.info(f'Epoch {epoch} Train Loss: {train_loss:.4f}')
+            self.progress.emit("train_epoch", epoch=epoch, loss=train_loss)
             
             # Validation phase
             val_loss, val_metrics = self._validate(val_loader)
@@ -177,6 +183,11 @@ class Trainer:
                     train_loss=loss.item(),
                     grad_step=self.global_steps // self.args.gradient_accumulation_steps
                 )
+                self.progress.step(
+                    "train", epoch_iterator,
+                    loss=loss.item(),
+                    grad_step=self.global_steps // self.args.gradient_accumulation_steps
+                )
         
         return total_loss / total_samples
     
@@ -215,7 +226,8 @@ class Trainer:
             metric.reset()
         
         with torch.no_grad():
-            for batch in tqdm(val_loader, desc="Validating"):
+            epoch_iterator = tqdm(val_loader, desc="Validating")
+            for batch in epoch_iterator:
                 batch = {k: v.to(self.device) for k, v in batch.items()}
                 
                 # Store current batch for metrics update
@@ -232,6 +244,7 @@ class Trainer:
                 
                 # Update metrics
                 self._update_metrics(logits, batch[self.args.label_column_name])
+                self.progress.step("valid", epoch_iterator)
         
         # Compute average loss
         avg_loss = total_loss / total_samples
@@ -248,6 +261,7 @@ class Trainer:
         
         # Add a clear signal that testing is starting
         self.logger.info("---------- Starting Test Phase ----------")
+        self.progress.emit("test_start")
         
         # Run evaluation with a custom testing function instead of reusing _validate
         test_loss, test_metrics = self._test_evaluate(test_loader)
@@ -257,6 +271,8 @@ class Trainer:
         self.logger.info(f"Test Loss: {test_loss:.4f}")
         for name, value in test_metrics.items():
             self.logger.info(f"Test {name}: {value:.4f}")
+        self.progress.emit("test", loss=test_loss, metrics=test_metrics)
+        self.progress.close()
             
         if self.args.wandb:
             wandb.log({f"test/{k}": v for k, v in test_metrics.items()})
@@ -280,7 +296,8 @@ class Trainer:
         
         with torch.no_grad():
             # Note the desc is "Testing" instead of "Validating"
-            for batch in tqdm(test_loader, desc="Testing"):
+            epoch_iterator = tqdm(test_loader, desc="Testing")
+            for batch in epoch_iterator:
                 batch = {k: v.to(self.device) for k, v in batch.items()}
                 
                 # Store current batch for metrics update
@@ -297,6 +314,7 @@ class Trainer:
                 
                 # Update metrics
                 self._update_metrics(logits, batch[self.args.label_column_name])
+                self.progress.step("test", epoch_iterator)
         
         # Compute average loss
         avg_loss = total_loss / total_samples
@@ -489,6 +507,7 @@ class Trainer:
         self.logger.info(f'Epoch {epoch} Val Loss: {val_loss:.4f}')
         for metric_name, metric_value in val_metrics.items():
             self.logger.info(f'Epoch {epoch} Val {metric_name}: {metric_value:.4f}')
+        self.progress.emit("val_epoch", epoch=epoch, loss=val_loss, metrics=val_metrics)
         
         if self.args.wandb:
             wandb.log({
@@ -523,6 +542,7 @@ class Trainer:
         # Save model if improved
         if should_save:
             self.logger.info(f"Saving model with best val {self.args.monitor}: {monitor_value:.4f}")
+            self.progress.emit("best", epoch=epoch, metric=self.args.monitor, value=monitor_value)
             save_path = os.path.join(self.args.output_dir, self.args.output_model_name)
             self._save_model(save_path)
 
@@ -49,11 +49,15 @@ def add_model_args(parser: argparse.ArgumentParser):
     model_group.add_argument('--pooling_method', type=str, default='mean',
                             choices=['mean', 'attention1d', 'light_attention'])
     model_group.add_argument('--pooling_dropout', type=float, default=0.1)
+    model_group.add_argument('--packed', action='store_true',
+                            help='Run the pooling heads on packed tokens without padding, the PLM still runs on the padded batch')
 
 def add_dataset_args(parser: argparse.ArgumentParser):
     """Add dataset-related arguments."""
     data_group = parser.add_argument_group('Dataset Configuration')
     data_group.add_argument('--dataset', type=str)
+    data_group.add_argument('--dataset_format', type=str, default='hf', choices=['hf', 'lmdb'],
+                            help='lmdb reads <dataset>/{train,validation,test} written by src/data/lmdb_dataset.py')
     data_group.add_argument('--dataset_config', type=str)
     data_group.add_argument('--normalize', type=str)
     data_group.add_argument('--num_labels', type=int)
@@ -104,6 +108,8 @@ def add_output_args(parser: argparse.ArgumentParser):
     output_group.add_argument('--output_model_name', type=str)
     output_group.add_argument('--output_root', default="ckpt")
     output_group.add_argument('--output_dir', default=None)
+    output_group.add_argument('--progress_file', type=str, default=None,
+                              help="write structured progress events as json lines, read by the Web UI monitor")
 
 def add_wandb_args(parser: argparse.ArgumentParser):
     """Add wandb-related arguments."""
@@ -0,0 +1,233 @@
+"""
+Checkpoint loading shared by the training, inference and zero-shot entry points.
+
+Checkpoints are loaded straight onto the target device without a full copy in CPU memory:
+- *.safetensors files (or a converted *.safetensors next to a *.pt) are read with safetensors
+- other files are loaded with torch.load(mmap=True), the tensors are mapped from the file
+
+Existing .pt checkpoints are converted offline with
+
+    python src/utils/checkpoint.py convert ckpt/
+    python src/utils/checkpoint.py benchmark ckpt/DeepSol/esm2_t33_650M_UR50D/lr5e-4_bt12k_ga8.pt --device cuda
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.parse
+from pathlib import Path
+from typing import Dict, Union
+import torch
+
+SAFETENSORS_SUFFIX = ".safetensors"
+# Separator of the flattened keys of nested checkpoints, e.g. "model_state_dict/classifier.weight"
+NESTED_SEPARATOR = "/"
+PathLike = Union[str, os.PathLike]
+
+
+def safetensors_path(path: PathLike) -> Path:
+    """Path of the converted safetensors file of a checkpoint."""
+    return Path(path).with_suffix(SAFETENSORS_SUFFIX)
+
+
+def _device_name(device) -> str:
+    device = torch.device(device)
+    if device.type == "cuda" and device.index is None:
+        return f"cuda:{torch.cuda.current_device()}"
+    return str(device)
+
+
+def _load_safetensors(path: Path, device: str) -> Dict:
+    from safetensors import safe_open
+
+    with safe_open(str(path), framework="pt", device=device) as f:
+        metadata = f.metadata() or {}
+        tensors = {key: f.get_tensor(key) for key in f.keys()}
+    if metadata.get("nested") != "true":
+        return tensors
+    checkpoint = {}
+    for key, tensor in tensors.items():
+        outer, inner = key.split(NESTED_SEPARATOR, 1)
+        checkpoint.setdefault(outer, {})[inner] = tensor
+    return checkpoint
+
+
+def load_checkpoint(path: PathLike, device="cpu", weights_only: bool = True):
+    """
+    Load a checkpoint onto the given device.
+
+    A *.pt checkpoint is replaced by its converted *.safetensors file if that exists and is not older,
+    so converting ckpt/ speeds up every entry point without changing any paths.
+
+    Args:
+        path: Checkpoint file, .pt/.pth/.bin or .safetensors
+        device: Device the tensors are loaded onto
+        weights_only: Passed to torch.load, only pickles with Python objects besides
+            tensors (e.g. the argparse Namespace of the ESM and MIF checkpoints) need False
+
+    Returns:
+        The loaded object, a state dict for all checkpoints this repo writes
+    """
+    path = Path(path)
+    device = _device_name(device)
+    converted = path if path.suffix == SAFETENSORS_SUFFIX else safetensors_path(path)
+    if converted.exists() and (
+        converted == path or not path.exists() or converted.stat().st_mtime >= path.stat().st_mtime
+    ):
+        return _load_safetensors(converted, device)
+
+    try:
+        return torch.load(path, map_location=device, mmap=True, weights_only=weights_only)
+    except RuntimeError as e:
+        # checkpoints in the legacy (pre zipfile) format cannot be memory-mapped
+        if "mmap" not in str(e):
+            raise
+        return torch.load(path, map_location=device, weights_only=weights_only)
+
+
+def load_url_checkpoint(url: str, device="cpu", weights_only: bool = True):
+    """
+    Load a checkpoint from the torch hub cache, downloading it first if it is not cached.
+    Same file name as torch.hub.load_state_dict_from_url, so existing caches are reused.
+    """
+    filename = os.path.basename(urllib.parse.urlparse(url).path)
+    cached = os.path.join(torch.hub.get_dir(), "checkpoints", filename)
+    if not os.path.exists(cached):
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        torch.hub.download_url_to_file(url, cached, progress=False)
+    return load_checkpoint(cached, device, weights_only)
+
+
+def convert_checkpoint(path: PathLike, output: PathLike = None) -> Path:
+    """
+    Convert a .pt state dict to safetensors. Checkpoints with one level of nesting, e.g. the
+    {"model_state_dict": ..., "plm_state_dict": ...} of full finetuning, are flattened.
+
+    Args:
+        path: .pt checkpoint
+        output: Output file, defaults to the checkpoint path with a .safetensors suffix
+
+    Returns:
+        Path of the written file
+    """
+    from safetensors.torch import save_file
+
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    if not isinstance(checkpoint, dict):
+        raise ValueError(f"{path} does not contain a state dict")
+    nested = any(isinstance(value, dict) for value in checkpoint.values())
+    tensors = {}
+    for key, value in checkpoint.items():
+        if nested and not isinstance(value, dict):
+            raise ValueError(f"{path} mixes tensors and dicts at the top level")
+        items = value.items() if nested else [(None, value)]
+        for inner, tensor in items:
+            name = key if inner is None else f"{key}{NESTED_SEPARATOR}{inner}"
+            if not isinstance(tensor, torch.Tensor):
+                raise ValueError(f"{path} has a non-tensor entry {name}")
+            # safetensors does not store shared or strided storages
+            tensors[name] = tensor.detach().contiguous().clone()
+
+    output = Path(output) if output is not None else safetensors_path(path)
+    save_file(tensors, str(output), metadata={"nested": "true" if nested else "false"})
+    return output
+
+
+def convert_directory(root: PathLike, force: bool = False):
+    """Convert every .pt checkpoint below root that has no up-to-date safetensors file."""
+    for path in sorted(Path(root).rglob("*.pt")):
+        output = safetensors_path(path)
+        if not force and output.exists() and output.stat().st_mtime >= path.stat().st_mtime:
+            print(f"Up to date: {output}")
+            continue
+        start = time.perf_counter()
+        try:
+            convert_checkpoint(path, output)
+        except (ValueError, RuntimeError, OSError) as e:
+            print(f"Skipped {path}: {e}")
+            continue
+        print(f"Converted {path} -> {output} ({output.stat().st_size / (1 << 20):.1f}MB, "
+              f"{time.perf_counter() - start:.2f}s)")
+
+
+# Loading strategies compared by the benchmark, each runs in a fresh interpreter
+BENCHMARK_METHODS = ["torch.load", "mmap", "safetensors"]
+
+
+def _to_device(state, device):
+    if isinstance(state, dict):
+        return {key: _to_device(value, device) for key, value in state.items()}
+    return state.to(device) if isinstance(state, torch.Tensor) else state
+
+
+def _benchmark_method(method: str, path: str, device: str) -> Dict:
+    import resource
+
+    start = time.perf_counter()
+    if method == "torch.load":
+        # what the entry points did before: the whole pickle in CPU memory, then copied to the device
+        state = torch.load(path, map_location="cpu", weights_only=True)
+        state = _to_device(state, device)
+    elif method == "mmap":
+        state = torch.load(path, map_location=device, mmap=True, weights_only=True)
+    else:
+        state = _load_safetensors(safetensors_path(path), _device_name(device))
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    return {"seconds": elapsed, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def benchmark(path: PathLike, device: str = "cpu", repeat: int = 3):
+    """
+    Time every loading strategy in a fresh process, the way a new worker loads its model.
+    The reported time includes moving the tensors to the device, not the import of torch.
+    """
+    path = str(path)
+    for method in BENCHMARK_METHODS:
+        if method == "safetensors" and not safetensors_path(path).exists():
+            print(f"{method:>11}: no {safetensors_path(path).name}, run the convert command first")
+            continue
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_run", method, path, "--device", device],
+                check=True, capture_output=True, text=True,
+            )
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        best = min(runs, key=lambda run: run["seconds"])
+        print(f"{method:>11}: {best['seconds']:.3f}s, peak RSS {best['peak_rss_mb']:.0f}MB (best of {repeat})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert and benchmark model checkpoints")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Write a .safetensors file next to every .pt file")
+    convert_parser.add_argument("root", type=str, help="Checkpoint file or directory, e.g. ckpt/")
+    convert_parser.add_argument("--force", action="store_true", help="Convert even if the safetensors file is up to date")
+    benchmark_parser = subparsers.add_parser("benchmark", help="Cold-start load time of a checkpoint")
+    benchmark_parser.add_argument("path", type=str, help=".pt checkpoint")
+    benchmark_parser.add_argument("--device", type=str, default="cpu")
+    benchmark_parser.add_argument("--repeat", type=int, default=3)
+    run_parser = subparsers.add_parser("_run")
+    run_parser.add_argument("method", choices=BENCHMARK_METHODS)
+    run_parser.add_argument("path", type=str)
+    run_parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if os.path.isdir(args.root):
+            convert_directory(args.root, args.force)
+        else:
+            print(f"Converted {args.root} -> {convert_checkpoint(args.root)}")
+    elif args.command == "benchmark":
+        benchmark(args.path, args.device, args.repeat)
+    else:
+        print(json.dumps(_benchmark_method(args.method, args.path, args.device)))
+
+
+if __name__ == "__main__":
+    main()
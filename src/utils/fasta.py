@@ -0,0 +1,239 @@
+import os
+import gzip
+import bisect
+import hashlib
+import tempfile
+from array import array
+from typing import Iterator, List, Optional, Tuple, Union
+
+# index directory for FASTA files in read-only directories
+INDEX_CACHE_DIR = os.environ.get("VENUS_FASTA_INDEX_DIR", os.path.expanduser("~/.cache/venusfactory/fasta_index"))
+
+
+def iter_fasta(file_path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Stream (header, sequence) pairs from a FASTA file, one record in memory at a time.
+    Headers are returned without the leading '>'. Gzipped files are supported.
+    """
+    opener = gzip.open if file_path.endswith(".gz") else open
+    header, sequence_parts = None, []
+    with opener(file_path, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(sequence_parts)
+                header, sequence_parts = line[1:], []
+            else:
+                sequence_parts.append(line)
+    if header is not None:
+        yield header, "".join(sequence_parts)
+
+
+def read_fasta_sequence(file_path: str) -> str:
+    """Return the sequence of the first record of a FASTA file."""
+    for _, sequence in iter_fasta(file_path):
+        return sequence
+    raise ValueError(f"No sequence found in {file_path}")
+
+
+def default_index_path(file_path: str) -> Optional[str]:
+    """
+    Where the index of a FASTA file is kept: next to it, or in INDEX_CACHE_DIR when its directory
+    is not writable. None for transient inputs in the temp directory (e.g. Web UI uploads), whose
+    index is only kept in memory.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    temp_dir = os.path.realpath(tempfile.gettempdir())
+    if os.path.commonpath([os.path.realpath(directory), temp_dir]) == temp_dir:
+        return None
+    if os.access(directory, os.W_OK):
+        return file_path + ".idx"
+    digest = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:16]
+    return os.path.join(INDEX_CACHE_DIR, f"{digest}-{os.path.basename(file_path)}.idx")
+
+
+def scan_fasta_index(file_path: str) -> Iterator[list]:
+    """
+    Scan a FASTA file once and yield one index record per sequence.
+
+    A record holds NAME, LENGTH, OFFSET, LINEBASES and LINEWIDTH as in samtools faidx, followed by
+    the byte offset of the header line so full headers can be read back without keeping them in memory.
+    """
+    with open(file_path, "rb") as f:
+        record = None
+        offset = 0
+        for line in f:
+            if line.startswith(b">"):
+                if record is not None:
+                    yield record
+                name = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ""
+                # name, length, sequence offset, line bases, line width, header offset
+                record = [name, 0, offset + len(line), 0, 0, offset]
+            elif record is not None:
+                bases = len(line.rstrip())
+                if bases:
+                    if record[3] == 0:
+                        record[3], record[4] = bases, len(line)
+                    record[1] += bases
+            offset += len(line)
+        if record is not None:
+            yield record
+
+
+def build_fasta_index(file_path: str, index_path: Optional[str] = None) -> str:
+    """Write the .fai-style index of scan_fasta_index, at default_index_path if no path is given."""
+    index_path = index_path or default_index_path(file_path) or file_path + ".idx"
+    if os.path.dirname(index_path):
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    # several shard workers may build the same index at once, each writes its own file and renames it
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as out:
+        for record in scan_fasta_index(file_path):
+            out.write("\t".join(map(str, record)) + "\n")
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+class FastaFile:
+    """
+    Random access to a large multi-FASTA file through a byte offset index.
+
+    Only the offsets and lengths are kept in memory, sequences are read from disk on demand.
+    The index is built on first use and rebuilt when the FASTA file is newer than it, see
+    default_index_path for where it is stored.
+
+    Example:
+        fasta = FastaFile("uniref50.fasta")
+        header, sequence = fasta[10]
+        sequence = fasta.get("UniRef50_P12345")
+        for header, sequence in fasta.iter_records(*fasta.shard(num_shards=8, shard_id=0)):
+            ...
+    """
+    def __init__(self, file_path: str, index_path: Optional[str] = None):
+        if file_path.endswith(".gz"):
+            raise ValueError("Random access needs an uncompressed FASTA file, use iter_fasta for gzipped files")
+        self.file_path = file_path
+        self.index_path = index_path or default_index_path(file_path)
+        self._file = None
+        self._name_to_idx = None
+        self.lengths = array("q")
+        self.offsets = array("q")
+        self.header_offsets = array("q")
+        if self.index_path is None:
+            # transient input, the index is not written to disk
+            names = []
+            for name, length, offset, _, _, header_offset in scan_fasta_index(file_path):
+                names.append(name)
+                self._append(length, offset, header_offset)
+            self._name_to_idx = {name: i for i, name in enumerate(names)}
+        else:
+            if not os.path.exists(self.index_path) or os.path.getmtime(self.index_path) < os.path.getmtime(file_path):
+                build_fasta_index(file_path, self.index_path)
+            self._load_index()
+        self.file_size = os.path.getsize(self.file_path)
+
+    def _append(self, length: int, offset: int, header_offset: int):
+        self.lengths.append(length)
+        self.offsets.append(offset)
+        self.header_offsets.append(header_offset)
+
+    def _load_index(self):
+        with open(self.index_path, "r") as f:
+            for line in f:
+                _, length, offset, _, _, header_offset = line.rstrip("\n").split("\t")
+                self._append(int(length), int(offset), int(header_offset))
+
+    def _handle(self):
+        # opened lazily so the object can be handed to DataLoader workers before first use
+        if self._file is None:
+            self._file = open(self.file_path, "rb")
+        return self._file
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_file"] = None
+        return state
+
+    def _record_end(self, idx: int) -> int:
+        return self.header_offsets[idx + 1] if idx + 1 < len(self) else self.file_size
+
+    def header(self, idx: int) -> str:
+        f = self._handle()
+        f.seek(self.header_offsets[idx])
+        return f.read(self.offsets[idx] - self.header_offsets[idx]).decode().strip()[1:]
+
+    def sequence(self, idx: int) -> str:
+        f = self._handle()
+        f.seek(self.offsets[idx])
+        return b"".join(f.read(self._record_end(idx) - self.offsets[idx]).split()).decode()
+
+    def __getitem__(self, idx: int) -> Tuple[str, str]:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        f = self._handle()
+        f.seek(self.header_offsets[idx])
+        header, _, body = f.read(self._record_end(idx) - self.header_offsets[idx]).partition(b"\n")
+        return header.decode().strip()[1:], b"".join(body.split()).decode()
+
+    def index_of(self, name: str) -> int:
+        """Record index of a sequence name (first word of the header)."""
+        if self._name_to_idx is None:
+            with open(self.index_path, "r") as f:
+                self._name_to_idx = {line.split("\t", 1)[0]: i for i, line in enumerate(f)}
+        return self._name_to_idx[name]
+
+    def get(self, name: str) -> str:
+        return self.sequence(self.index_of(name))
+
+    def shard(self, num_shards: int, shard_id: int) -> Tuple[int, int]:
+        """
+        Split the file into contiguous byte ranges of equal size.
+
+        return:
+            (start, stop) record indices of the shard, records are assigned by the offset of their header
+        """
+        byte_start = self.file_size * shard_id // num_shards
+        byte_stop = self.file_size * (shard_id + 1) // num_shards
+        start = bisect.bisect_left(self.header_offsets, byte_start)
+        stop = bisect.bisect_left(self.header_offsets, byte_stop) if shard_id < num_shards - 1 else len(self)
+        return start, stop
+
+    def iter_records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        stop = len(self) if stop is None else stop
+        for idx in range(start, stop):
+            yield self[idx]
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return self.iter_records()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class FastaSequences:
+    """Lazy list-like view over the sequences of a FastaFile."""
+    def __init__(self, fasta: FastaFile):
+        self.fasta = fasta
+        self.lengths = fasta.lengths
+
+    def __len__(self) -> int:
+        return len(self.fasta)
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(idx, slice):
+            return [self.fasta.sequence(i) for i in range(*idx.indices(len(self)))]
+        return self.fasta.sequence(idx)
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(len(self)):
+            yield self.fasta.sequence(idx)
@@ -0,0 +1,181 @@
+"""
+Import-time profile and cold-start benchmark of the entry points.
+
+"profile" runs a target under `python -X importtime` and summarises the log: the top-level imports
+by cumulative time and the packages by their own (self) import time. Scripts are executed with
+runpy under a name other than "__main__", so their imports run but their main() does not.
+
+    python src/utils/import_profile.py profile src/webui.py
+    python src/utils/import_profile.py profile src/mutation/models/esm2.py --top 15
+    python src/utils/import_profile.py profile -m web.chat_agent --path src
+
+"benchmark" measures the cold start of the Web UI (import and create_ui) and of a single zero-shot
+script in fresh interpreters, and appends the result to a JSON lines history so regressions show up:
+
+    python src/utils/import_profile.py benchmark --history benchmarks/startup.jsonl
+
+Run both from the repository root.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+# Cold-start targets of the benchmark, the Web UI needs src/ on sys.path like `python src/webui.py`
+BENCHMARK_TARGETS = {
+    "webui_import": ["-c", "import sys, runpy; sys.path.insert(0, 'src'); runpy.run_path('src/webui.py', run_name='__profile__')"],
+    "webui_create_ui": ["-c", "import sys; sys.path.insert(0, 'src'); import webui; webui.create_ui()"],
+    "zero_shot_esm2": ["-c", "import runpy; runpy.run_path('src/mutation/models/esm2.py', run_name='__profile__')"],
+}
+
+
+def parse_importtime(log: str) -> List[Dict]:
+    """
+    Parse the stderr of `python -X importtime`.
+
+    Returns:
+        One dict per imported module with name, depth, self_us and cumulative_us, in log order
+    """
+    records = []
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # one space after the separator, then two per nesting level
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        records.append({
+            "name": name.strip(),
+            "depth": depth,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return records
+
+
+def summarize(records: List[Dict], top: int = 20) -> Dict:
+    """Top-level imports by cumulative time and packages by self time, in seconds."""
+    packages = defaultdict(int)
+    for record in records:
+        packages[record["name"].split(".")[0]] += record["self_us"]
+    top_level = sorted((r for r in records if r["depth"] == 0), key=lambda r: r["cumulative_us"], reverse=True)
+    return {
+        "total_s": sum(packages.values()) / 1e6,
+        "top_level": [(r["name"], r["cumulative_us"] / 1e6) for r in top_level[:top]],
+        "packages": [(name, us / 1e6) for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]],
+    }
+
+
+def run_importtime(target: List[str]) -> List[Dict]:
+    """Run `python -X importtime <target>` and parse its log, the output of the target is discarded."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *target],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    records = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        print(f"Target exited with {result.returncode}:\n" + "\n".join(errors[-20:]), file=sys.stderr)
+    return records
+
+
+def profile_target(args) -> List[str]:
+    if args.module:
+        code = f"import sys; sys.path[:0] = {args.path!r}; import {args.module}"
+    else:
+        code = f"import sys, runpy; sys.path[:0] = {args.path!r}; runpy.run_path({args.script!r}, run_name='__profile__')"
+    return ["-c", code]
+
+
+def print_summary(summary: Dict):
+    print(f"Total import time: {summary['total_s']:.3f}s")
+    print("\nTop-level imports (cumulative):")
+    for name, seconds in summary["top_level"]:
+        print(f"  {seconds:8.3f}s  {name}")
+    print("\nPackages (self time):")
+    for name, seconds in summary["packages"]:
+        print(f"  {seconds:8.3f}s  {name}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark(repeat: int, history: str = None) -> Dict:
+    """Best wall time of every target over `repeat` fresh interpreters, plus its import time."""
+    results = {}
+    for name, target in BENCHMARK_TARGETS.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            status = subprocess.run([sys.executable, *target], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+            best = min(best, time.perf_counter() - start)
+            if status != 0:
+                break
+        if status != 0:
+            print(f"{name:>16}: failed with exit code {status}")
+            continue
+        summary = summarize(run_importtime(target), top=3)
+        results[name] = {"wall_s": round(best, 3), "import_s": round(summary["total_s"], 3),
+                         "slowest": [package for package, _ in summary["packages"]]}
+        print(f"{name:>16}: {best:.3f}s wall, {summary['total_s']:.3f}s importing, "
+              f"slowest {', '.join(results[name]['slowest'])}")
+
+    if history:
+        previous = None
+        if os.path.exists(history):
+            with open(history) as f:
+                lines = [line for line in f if line.strip()]
+            previous = json.loads(lines[-1]) if lines else None
+        if previous:
+            print(f"\nChange since {previous['commit']} ({previous['date']}):")
+            for name, result in results.items():
+                if name in previous["results"]:
+                    delta = result["wall_s"] - previous["results"][name]["wall_s"]
+                    print(f"{name:>16}: {delta:+.3f}s")
+        os.makedirs(os.path.dirname(os.path.abspath(history)), exist_ok=True)
+        entry = {"date": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                 "python": sys.version.split()[0], "results": results}
+        with open(history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile and cold-start benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    profile_parser = subparsers.add_parser("profile", help="Summarise `python -X importtime` of a script or module")
+    profile_parser.add_argument("script", type=str, nargs="?", help="Script to import, e.g. src/webui.py")
+    profile_parser.add_argument("-m", "--module", type=str, default=None, help="Module to import instead of a script")
+    profile_parser.add_argument("--path", type=str, action="append", default=[], help="Extra sys.path entries, e.g. src")
+    profile_parser.add_argument("--top", type=int, default=20, help="Number of entries per table")
+    profile_parser.add_argument("--json", type=str, default=None, help="Also write the parsed log to this file")
+    benchmark_parser = subparsers.add_parser("benchmark", help="Cold start of the Web UI and a zero-shot script")
+    benchmark_parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per target, the best is reported")
+    benchmark_parser.add_argument("--history", type=str, default=None, help="JSON lines file the results are appended to")
+    args = parser.parse_args()
+
+    if args.command == "profile":
+        if not args.module and not args.script:
+            parser.error("profile needs a script or --module")
+        if args.script and args.script.endswith(".py"):
+            # scripts import siblings relative to their own directory, like `python <script>` does
+            args.path = [os.path.dirname(os.path.abspath(args.script)), *args.path]
+        records = run_importtime(profile_target(args))
+        print_summary(summarize(records, args.top))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(records, f, indent=2)
+    else:
+        benchmark(args.repeat, args.history)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ class UsageEvent(BaseModel):
 
 @app.post("/api/stats/track")
 async def track_usage(event: UsageEvent):
+    # only appends to an in-memory buffer, the database write happens in a background flush
     if not event.timestamp:
         event.timestamp = datetime.now().isoformat()
     
@@ -30,13 +31,14 @@ async def track_usage(event: UsageEvent):
         "timestamp": event.timestamp
     }
 
+# plain functions run in the threadpool, the database read does not block the event loop
 @app.get("/api/stats")
-async def get_stats():
+def get_stats():
     stats = global_stats_manager.get_stats()
     return stats
 
 @app.get("/api/stats/reset")
-async def reset_stats():
+def reset_stats():
     success = global_stats_manager.reset_stats()
     if success:
         return {"status": "success", "message": "Stats reset successfully"}
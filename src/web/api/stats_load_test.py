@@ -0,0 +1,133 @@
+"""
+Load test of the usage stats store.
+
+Without --url the StatsManager is driven directly from several processes sharing one database,
+the way several uvicorn workers do. With --url the events are posted to a running stats API and
+the latency of GET /api/stats is measured while the events are sent.
+
+    python src/web/api/stats_load_test.py --processes 4 --events 20000
+    python src/web/api/stats_load_test.py --url http://127.0.0.1:8000 --events 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODULES = ("mutation_prediction", "function_analysis", "total_visits")
+
+
+def _worker(db_file, events, start_event, result_queue):
+    from utils.stats_manager import StatsManager
+    manager = StatsManager(db_file=db_file)
+    start_event.wait()
+    begin = time.perf_counter()
+    worst = 0.0
+    for i in range(events):
+        t = time.perf_counter()
+        manager.track_usage(MODULES[i % len(MODULES)])
+        worst = max(worst, time.perf_counter() - t)
+    tracked = time.perf_counter() - begin
+    manager.flush()
+    result_queue.put((tracked, time.perf_counter() - begin, worst))
+
+
+def run_local(args):
+    from utils.stats_manager import StatsManager
+    db_file = args.db_file or os.path.join(tempfile.mkdtemp(prefix="venus_stats_"), "usage_stats.db")
+    StatsManager(db_file=db_file).reset_stats()
+
+    ctx = mp.get_context("spawn")
+    start_event = ctx.Event()
+    result_queue = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(db_file, args.events, start_event, result_queue))
+               for _ in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    begin = time.perf_counter()
+    start_event.set()
+    results = [result_queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - begin
+
+    total = args.events * args.processes
+    stats = StatsManager(db_file=db_file).get_stats()
+    counted = sum(stats[module] for module in MODULES)
+    print(f"database: {db_file}")
+    print(f"{total} events from {args.processes} processes in {elapsed:.2f}s, {total / elapsed:,.0f} events/s")
+    print(f"slowest track_usage call: {max(r[2] for r in results) * 1e3:.3f} ms")
+    print(f"counted {counted} of {total} events: {'OK' if counted == total else 'MISMATCH'}")
+    return 0 if counted == total else 1
+
+
+async def run_http(args):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        before = (await client.get("/api/stats")).json()
+        sent = 0
+        lock = asyncio.Lock()
+        read_latency = []
+
+        async def post():
+            nonlocal sent
+            while True:
+                async with lock:
+                    if sent >= args.events:
+                        return
+                    i = sent
+                    sent += 1
+                response = await client.post("/api/stats/track", json={"module": MODULES[i % len(MODULES)]})
+                response.raise_for_status()
+
+        async def read(done):
+            # reads during the load show whether the event loop of the server stays responsive
+            while not done.is_set():
+                t = time.perf_counter()
+                (await client.get("/api/stats")).raise_for_status()
+                read_latency.append(time.perf_counter() - t)
+                await asyncio.sleep(0.05)
+
+        done = asyncio.Event()
+        reader = asyncio.create_task(read(done))
+        begin = time.perf_counter()
+        await asyncio.gather(*(post() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - begin
+        done.set()
+        await reader
+
+        after = (await client.get("/api/stats")).json()
+
+    counted = sum(after[module] - before[module] for module in MODULES)
+    print(f"{args.events} requests with concurrency {args.concurrency} in {elapsed:.2f}s, "
+          f"{args.events / elapsed:,.0f} events/s")
+    if read_latency:
+        read_latency.sort()
+        print(f"GET /api/stats during load: median {read_latency[len(read_latency) // 2] * 1e3:.1f} ms, "
+              f"max {read_latency[-1] * 1e3:.1f} ms")
+    # other clients may track events at the same time, so only a shortfall is an error
+    print(f"counted {counted} of {args.events} events: {'OK' if counted >= args.events else 'MISMATCH'}")
+    return 0 if counted >= args.events else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the usage stats store")
+    parser.add_argument("--url", type=str, default=None, help="Base url of a running stats API")
+    parser.add_argument("--events", type=int, default=20000, help="Events per process, or requests in total with --url")
+    parser.add_argument("--processes", type=int, default=4, help="Writer processes sharing the database")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent requests with --url")
+    parser.add_argument("--db_file", type=str, default=None, help="Database file, a temporary one by default")
+    args = parser.parse_args()
+
+    if args.url:
+        return asyncio.run(run_http(args))
+    return run_local(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
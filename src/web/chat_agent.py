@@ -0,0 +1,144 @@
+"""
+LangChain side of the VenusAgent chat tab: the DeepSeek chat model, the tools and the planner, worker
+and finalizer chains. Importing langchain and the tools takes seconds, so chat_tab imports this
+module with the first message of a conversation instead of at Web UI startup.
+"""
+import os
+import requests
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from langchain.agents import AgentExecutor, create_openai_tools_agent
+from langchain.tools import BaseTool
+from langchain.memory import ConversationBufferWindowMemory
+from langchain.schema import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.callbacks import CallbackManagerForLLMRun
+
+from web.chat_tools import *
+from web.prompts import PLANNER_PROMPT, WORKER_PROMPT, FINALIZER_PROMPT
+
+load_dotenv()
+
+
+class DeepSeekLLM(BaseChatModel):
+    api_key: str = None
+    base_url: str = "https://api.deepseek.com/v1"
+    model_name: str = "deepseek-chat"
+    temperature: float = 0.7
+    max_tokens: int = 4096
+    
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.api_key = self.api_key or os.getenv("DEEPSEEK_API_KEY")
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any,) -> ChatResult:
+        if not self.api_key:
+            raise ValueError("DeepSeek API key is not configured.")
+
+        message_dicts = []
+        for msg in messages:
+            if isinstance(msg, HumanMessage):
+                role = "user"
+            elif isinstance(msg, AIMessage):
+                role = "assistant"
+            elif isinstance(msg, SystemMessage):
+                role = "system"
+            else: 
+                role = "user" 
+            message_dicts.append({"role": role, "content": msg.content})
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.model_name,
+            "messages": message_dicts,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            **kwargs,
+        }
+        
+        response = requests.post(
+            f"{self.base_url}/chat/completions",
+            headers=headers,
+            json=payload,
+            timeout=120
+        )
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"API request failed: {response.status_code} - {response.text}")
+
+        result = response.json()
+        choice = result['choices'][0]
+        message_data = choice['message']
+
+        ai_message = AIMessage(
+            content=message_data.get('content', ''),
+            additional_kwargs=message_data,
+        )
+        
+        generation = ChatGeneration(message=ai_message)
+        return ChatResult(generations=[generation])
+
+    @property
+    def _llm_type(self) -> str:
+        return "deepseek-chat"
+
+
+def get_tools():
+    """Returns a list of all available tool instances."""
+    return [
+        zero_shot_sequence_prediction_tool,
+        zero_shot_structure_prediction_tool,
+        protein_function_prediction_tool,
+        functional_residue_prediction_tool,
+        interpro_query_tool,
+        uniprot_query_tool,
+        pdb_query_tool,
+        protein_properties_generation_tool,
+        generate_training_config_tool,
+        ai_code_execution_tool,
+        ncbi_sequence_download_tool,
+        alphafold_structure_download_tool
+    ]
+
+def create_planner_chain(llm: BaseChatModel, tools: List[BaseTool]):
+    """Creates the Planner chain that generates a step-by-step plan."""
+    tools_description = "\n".join([f"- {tool.name}: {tool.description}" for tool in tools])
+    planner_prompt_with_tools = PLANNER_PROMPT.partial(tools_description=tools_description)
+    return planner_prompt_with_tools | llm | JsonOutputParser()
+
+def create_worker_executor(llm: BaseChatModel, tools: List[BaseTool]):
+    """Creates a Worker AgentExecutor for a given set of tools."""
+    agent = create_openai_tools_agent(llm, tools, WORKER_PROMPT)
+    executor = AgentExecutor(
+        agent=agent,
+        tools=tools,
+        verbose=True,
+        handle_parsing_errors=True,
+        max_iterations=3, 
+        max_execution_time=300,
+    )
+    return executor
+
+def create_finalizer_chain(llm: BaseChatModel):
+    """Creates the Finalizer chain to aggregate all analyses into a final report."""
+    return FINALIZER_PROMPT | llm | StrOutputParser()
+
+
+def build_agents() -> Dict[str, Any]:
+    """Planner, one worker per tool, finalizer and memory of a new conversation."""
+    llm = DeepSeekLLM(temperature=0.1) # Use lower temp for predictable planning
+    all_tools = get_tools()
+    return {
+        'planner': create_planner_chain(llm, all_tools),
+        # For simplicity, we create one worker per tool. In a real scenario, you might group them.
+        'workers': {tool.name: create_worker_executor(llm, [tool]) for tool in all_tools},
+        'finalizer': create_finalizer_chain(llm),
+        'memory': ConversationBufferWindowMemory(memory_key="chat_history", return_messages=True, k=10),
+    }
@@ -2,7 +2,6 @@ import gradio as gr
 import json
 import os
 import re
-import requests
 import base64
 import numpy as np
 from typing import Dict, Any, List, Optional, Tuple, Mapping
@@ -12,100 +11,13 @@ import time
 from pathlib import Path
 from dotenv import load_dotenv
 from gradio_client import Client, handle_file
-from web.chat_tools import *
 import pandas as pd
 import uuid
 from datetime import datetime
 
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain.tools import BaseTool, tool
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.schema import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from langchain.schema.runnable import RunnablePassthrough
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain.schema import LLMResult
-from langchain_core.prompt_values import ChatPromptValue
-from pydantic import BaseModel, Field
-from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.outputs import ChatGeneration, ChatResult
-from langchain_core.callbacks import CallbackManagerForLLMRun
-
-# Import prompts from the new file
-from web.prompts import PLANNER_PROMPT, WORKER_PROMPT, ANALYZER_PROMPT, FINALIZER_PROMPT
-
 load_dotenv()
 
 
-class DeepSeekLLM(BaseChatModel):
-    api_key: str = None
-    base_url: str = "https://api.deepseek.com/v1"
-    model_name: str = "deepseek-chat"
-    temperature: float = 0.7
-    max_tokens: int = 4096
-    
-    def __init__(self, **kwargs: Any):
-        super().__init__(**kwargs)
-        self.api_key = self.api_key or os.getenv("DEEPSEEK_API_KEY")
-
-    def _generate(
-        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any,) -> ChatResult:
-        if not self.api_key:
-            raise ValueError("DeepSeek API key is not configured.")
-
-        message_dicts = []
-        for msg in messages:
-            if isinstance(msg, HumanMessage):
-                role = "user"
-            elif isinstance(msg, AIMessage):
-                role = "assistant"
-            elif isinstance(msg, SystemMessage):
-                role = "system"
-            else: 
-                role = "user" 
-            message_dicts.append({"role": role, "content": msg.content})
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": self.model_name,
-            "messages": message_dicts,
-            "max_tokens": self.max_tokens,
-            "temperature": self.temperature,
-            **kwargs,
-        }
-        
-        response = requests.post(
-            f"{self.base_url}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=120
-        )
-        
-        if response.status_code != 200:
-            raise RuntimeError(f"API request failed: {response.status_code} - {response.text}")
-
-        result = response.json()
-        choice = result['choices'][0]
-        message_data = choice['message']
-
-        ai_message = AIMessage(
-            content=message_data.get('content', ''),
-            additional_kwargs=message_data,
-        )
-        
-        generation = ChatGeneration(message=ai_message)
-        return ChatResult(generations=[generation])
-
-    @property
-    def _llm_type(self) -> str:
-        return "deepseek-chat"
-
-
 class ProteinContextManager:
     def __init__(self):
         self.sequences = {}  # {sequence_id: {'sequence': str, 'timestamp': datetime}}
@@ -196,46 +108,6 @@ class ProteinContextManager:
         return type_mapping.get(file_ext, 'unknown')
 
 
-def get_tools():
-    """Returns a list of all available tool instances."""
-    return [
-        zero_shot_sequence_prediction_tool,
-        zero_shot_structure_prediction_tool,
-        protein_function_prediction_tool,
-        functional_residue_prediction_tool,
-        interpro_query_tool,
-        uniprot_query_tool,
-        pdb_query_tool,
-        protein_properties_generation_tool,
-        generate_training_config_tool,
-        ai_code_execution_tool,
-        ncbi_sequence_download_tool,
-        alphafold_structure_download_tool
-    ]
-
-def create_planner_chain(llm: BaseChatModel, tools: List[BaseTool]):
-    """Creates the Planner chain that generates a step-by-step plan."""
-    tools_description = "\n".join([f"- {tool.name}: {tool.description}" for tool in tools])
-    planner_prompt_with_tools = PLANNER_PROMPT.partial(tools_description=tools_description)
-    return planner_prompt_with_tools | llm | JsonOutputParser()
-
-def create_worker_executor(llm: BaseChatModel, tools: List[BaseTool]):
-    """Creates a Worker AgentExecutor for a given set of tools."""
-    agent = create_openai_tools_agent(llm, tools, WORKER_PROMPT)
-    executor = AgentExecutor(
-        agent=agent,
-        tools=tools,
-        verbose=True,
-        handle_parsing_errors=True,
-        max_iterations=3, 
-        max_execution_time=300,
-    )
-    return executor
-
-def create_finalizer_chain(llm: BaseChatModel):
-    """Creates the Finalizer chain to aggregate all analyses into a final report."""
-    return FINALIZER_PROMPT | llm | StrOutputParser()
-
 class ConversationManager:
     def __init__(self):
         self.conversations = {}
@@ -246,24 +118,10 @@ class ConversationManager:
         if not title:
             title = f"Chat {datetime.now().strftime('%H:%M')}"
 
-        llm = DeepSeekLLM(temperature=0.1) # Use lower temp for predictable planning
-        all_tools = get_tools()
-
-        # Create the specialized agents for this conversation
-        planner_chain = create_planner_chain(llm, all_tools)
-        finalizer_chain = create_finalizer_chain(llm)
-
-        # Create a dictionary of workers, each with their specific tool(s)
-        # For simplicity, we create one worker per tool. In a real scenario, you might group them.
-        workers = {tool.name: create_worker_executor(llm, [tool]) for tool in all_tools}
-        
+        # planner, workers, finalizer and memory are built by ensure_agents with the first message
         self.conversations[conv_id] = {
             'id': conv_id,
             'title': title,
-            'planner': planner_chain,
-            'workers': workers,
-            'finalizer': finalizer_chain,
-            'memory': ConversationBufferWindowMemory(memory_key="chat_history", return_messages=True, k=10),
             'history': [],
             'created_at': datetime.now(),
             'protein_context': ProteinContextManager(),
@@ -273,6 +131,13 @@ class ConversationManager:
     def get_conversation(self, conv_id: str) -> dict:
         return self.conversations.get(conv_id)
 
+    def ensure_agents(self, conv: dict) -> dict:
+        """Build the LangChain agents of a conversation, importing langchain on first use."""
+        if 'planner' not in conv:
+            from web.chat_agent import build_agents
+            conv.update(build_agents())
+        return conv
+
     def delete_conversation(self, conv_id: str):
         if conv_id in self.conversations:
             conv = self.conversations[conv_id]
@@ -332,7 +197,9 @@ def create_chat_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
             return [], gr.MultimodalTextbox(value=None)
         conv_manager.active_conversation = selected_conv_id
         conv = conv_manager.get_conversation(selected_conv_id)
-        if conv:
+        if conv and 'memory' in conv:
+            from web.chat_agent import HumanMessage, AIMessage
+
             # Convert memory to chat history format
             history = []
             messages = conv['memory'].chat_memory.messages
@@ -463,6 +330,7 @@ def create_chat_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
         planner_input = f"{text}\n\n[CONTEXT: {'; '.join(context_parts)}]"
         
         try:
+            conv_manager.ensure_agents(conv)
             plan = conv['planner'].invoke({"input": planner_input})
         except Exception as e:
             history.append({"role": "assistant", "content": f"❌ **Planning Failed:** Sorry, I failed to create a plan. Error: {e}"})
@@ -473,6 +341,8 @@ def create_chat_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
         if not plan:
             history[-1] = {"role": "assistant", "content": "I can help with that! I'm generating answers, please be patient"}
             yield history, gr.MultimodalTextbox(value=None, interactive=False)
+            from web.chat_agent import DeepSeekLLM, HumanMessage
+
             llm = DeepSeekLLM()
             response = llm.invoke(conv['memory'].chat_memory.messages + [HumanMessage(content=text)])
             final_response = response.content
@@ -118,7 +118,6 @@ def zero_shot_structure_prediction_tool(structure_file: str, model_name: str = "
         
         # Check if structure_file is a JSON string containing file path
         try:
-            import json
             if structure_file.startswith('{') and structure_file.endswith('}'):
                 file_info = json.loads(structure_file)
                 if isinstance(file_info, dict) and 'file_path' in file_info:
@@ -256,37 +255,41 @@ def call_zero_shot_sequence_prediction(
     Call VenusFactory zero-shot sequence-based mutation prediction API.
     If fasta_file is provided, use it directly; otherwise, use sequence (writes to temp fasta).
     """
+    temp_fasta_path = None
     try:
         if fasta_file:
             fasta_path = fasta_file
-            temp_fasta_created = False
         elif sequence:
             temp_fasta = tempfile.NamedTemporaryFile(mode='w', suffix='.fasta', delete=False)
             temp_fasta.write(f">temp_sequence\n{sequence}\n")
             temp_fasta.close()
-            fasta_path = temp_fasta.name
-            temp_fasta_created = True
+            fasta_path = temp_fasta_path = temp_fasta.name
         else:
             return "Zero-shot sequence prediction error: No sequence or fasta_file provided."
 
-        client = Client("http://localhost:7860/")
-        result = client.predict(
-            function_selection="Activity",
-            file_obj=handle_file(fasta_path),
-            enable_ai=False,
-            ai_model="DeepSeek",
-            user_api_key=api_key,
-            model_name=model_name,
-            api_name="/handle_mutation_prediction_base"
-        )
+        # Scores computed before by any front-end are served from the result cache without touching a model
+        from web.venus_factory_quick_tool_tab import load_cached_zero_shot_prediction, format_mutation_display_df
+        cache_model = model_name if model_name in ["ESM2-650M", "ESM-1v", "ESM-1b"] else "ESM2-650M"
+        cached_df = load_cached_zero_shot_prediction(cache_model, fasta_path)
 
-        if 'temp_fasta_created' in locals() and temp_fasta_created:
-            os.unlink(fasta_path)
+        if cached_df is not None:
+            display_df = format_mutation_display_df(cached_df)
+            raw_result = json.dumps({"headers": list(display_df.columns), "data": display_df.values.tolist()})
+        else:
+            client = Client("http://localhost:7860/")
+            result = client.predict(
+                function_selection="Activity",
+                file_obj=handle_file(fasta_path),
+                enable_ai=False,
+                ai_model="DeepSeek",
+                user_api_key=api_key,
+                model_name=model_name,
+                api_name="/handle_mutation_prediction_base"
+            )
+            raw_result = result[2]
 
         # Limit mutation results to first 200 entries to avoid long context
-        raw_result = result[2]
         try:
-            import json
             # Check if raw_result is already a dict or needs to be parsed
             if isinstance(raw_result, dict):
                 result_data = raw_result
@@ -318,6 +321,9 @@ def call_zero_shot_sequence_prediction(
             return raw_result
     except Exception as e:
         return f"Zero-shot sequence prediction error: {str(e)}"
+    finally:
+        if temp_fasta_path and os.path.exists(temp_fasta_path):
+            os.unlink(temp_fasta_path)
 
 def call_zero_shot_structure_prediction_from_file(structure_file: str, model_name: str = "ESM-IF1", api_key: str = None) -> str:
     """Call VenusFactory zero-shot structure-based mutation prediction API"""
@@ -335,7 +341,6 @@ def call_zero_shot_structure_prediction_from_file(structure_file: str, model_nam
         # Limit mutation results to first 200 entries to avoid long context
         raw_result = result[2]
         try:
-            import json
             result_data = json.loads(raw_result)
             
             # Handle the data format with 'data' field containing mutations
@@ -458,7 +463,6 @@ def call_functional_residue_prediction(
         # Filter results to only include residues with predicted label = 1
         raw_result = result[1]
         try:
-            import json
             # Check if raw_result is already a dict or needs to be parsed
             if isinstance(raw_result, dict):
                 result_data = raw_result
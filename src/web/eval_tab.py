@@ -3,24 +3,20 @@ import json
 import os
 import subprocess
 import sys
-import threading
 import queue
 import time
 import pandas as pd
 import re
-from datasets import load_dataset
 from web.utils.command import preview_eval_command
 from web.utils.html_ui import load_html_template, format_metrics_table
 from web.utils.css_loader import get_css_style_tag
+from web.utils.job_queue import get_job_queue, QUEUED
 
 def create_eval_tab(constant):
     plm_models = constant["plm_models"]
     dataset_configs = constant["dataset_configs"]
-    is_evaluating = False
-    current_process = None
-    output_queue = queue.Queue()
-    stop_thread = False
-    process_aborted = False 
+    # Evaluation job of every browser session, jobs run through the shared job queue
+    session_jobs = {}
     plm_models = constant["plm_models"]
     
 
@@ -46,35 +42,13 @@ def create_eval_tab(constant):
         except Exception as e:
             return f"Error formatting metrics: {str(e)}"
 
-    def process_output(process, queue):
-        nonlocal stop_thread
-        while True:
-            if stop_thread:
-                break
-            output = process.stdout.readline()
-            if output == '' and process.poll() is not None:
-                break
-            if output:
-                queue.put(output.strip())
-        process.stdout.close()
-
-    def evaluate_model(plm_model, model_path, eval_method, is_custom_dataset, dataset_defined, dateset_custom, problem_type, num_labels, metrics, batch_mode, batch_size, batch_token, eval_structure_seq, pooling_method, sequence_column_name, label_column_name):
-        nonlocal is_evaluating, current_process, stop_thread, process_aborted
-        
-        if is_evaluating:
-            return "Evaluation is already in progress. Please wait...", gr.update(visible=False)
-        
-        # First reset all state variables to ensure clean start
-        is_evaluating = True
-        stop_thread = False
-        process_aborted = False  # Reset abort flag
-        
-        # Clear the output queue
-        while not output_queue.empty():
-            try:
-                output_queue.get_nowait()
-            except queue.Empty:
-                break
+    def evaluate_model(plm_model, model_path, eval_method, is_custom_dataset, dataset_defined, dateset_custom, problem_type, num_labels, metrics, batch_mode, batch_size, batch_token, eval_structure_seq, pooling_method, sequence_column_name, label_column_name, request: gr.Request = None):
+        session = request.session_hash if request is not None else None
+        current_process = session_jobs.get(session)
+        if current_process is not None and not current_process.is_done():
+            yield "Evaluation is already in progress. Please wait...", gr.update(visible=False)
+            return
+        current_process = None
         
         # Initialize progress info and start time
         start_time = time.time()
@@ -96,7 +70,6 @@ def create_eval_tab(constant):
         try:
             # Validate inputs
             if not model_path or not os.path.exists(os.path.dirname(model_path)):
-                is_evaluating = False
                 yield f"""
                 {get_css_style_tag('eval_predict_ui.css')}
                 {load_html_template('evaluation_error.html', error_message="Error: Invalid model path")}
@@ -109,7 +82,6 @@ def create_eval_tab(constant):
             else:
                 dataset = dataset_defined
                 if dataset not in dataset_configs:
-                    is_evaluating = False
                     yield f"""
                     {get_css_style_tag('eval_predict_ui.css')}
                     {load_html_template('evaluation_error.html', error_message="Error: Invalid dataset selection")}
@@ -163,20 +135,10 @@ def create_eval_tab(constant):
                     cmd.append(f"--{k}")
                     cmd.append(str(v))
             
-            # Start evaluation process
-            current_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                preexec_fn=os.setsid
-            )
-            
-            output_thread = threading.Thread(target=process_output, args=(current_process, output_queue))
-            output_thread.daemon = True
-            output_thread.start()
+            # Queue the evaluation, it starts as soon as a worker slot is free
+            current_process = get_job_queue().submit("eval", cmd, owner=session)
+            session_jobs[session] = current_process
+            output_queue = current_process.output
             
             sample_pattern = r"Total samples: (\d+)"
             progress_pattern = r"(\d+)/(\d+)"
@@ -185,9 +147,15 @@ def create_eval_tab(constant):
             
             while True:
                 # Check if the process still exists and hasn't been aborted
-                if process_aborted or current_process is None or current_process.poll() is not None:
+                if current_process.poll() is not None:
                     break
                 
+                if current_process.status == QUEUED:
+                    position = get_job_queue().position(current_process.id) or 0
+                    progress_info["stage"] = f"Queued ({position} job(s) ahead)"
+                elif progress_info["stage"].startswith("Queued"):
+                    progress_info["stage"] = "Preparing"
+                
                 try:
                     new_lines = []
                     lines_processed = 0
@@ -293,10 +261,8 @@ def create_eval_tab(constant):
                               error_details=f"<pre class='error-details'>{str(e)}</pre>")}
             """, gr.update(visible=False)
         finally:
-            if current_process:
-                stop_thread = True
-                is_evaluating = False
-                current_process = None
+            if current_process is not None and session_jobs.get(session) is current_process:
+                del session_jobs[session]
 
     def generate_progress_bar(progress_info):
         """Generate HTML for evaluation progress bar"""
@@ -326,22 +292,19 @@ def create_eval_tab(constant):
         """
         return html
 
-    def handle_eval_tab_abort():
-        """Handle abortion of the evaluation process"""
-        nonlocal is_evaluating, current_process, stop_thread, process_aborted
+    def handle_eval_tab_abort(request: gr.Request = None):
+        """Handle abortion of the evaluation job of this session"""
+        session = request.session_hash if request is not None else None
+        current_process = session_jobs.get(session)
         
-        if current_process is None:
-                    return f"""
+        if current_process is None or current_process.is_done():
+            return f"""
         {get_css_style_tag('eval_predict_ui.css')}
         {load_html_template('status_empty.html', message="No evaluation in progress to terminate.")}
         """, gr.update(visible=False)
         
         try:
-            # Set the abort flag before terminating the process
-            process_aborted = True
-            stop_thread = True
-            
-            # Using terminate instead of killpg for safety
+            # Cancelling also removes the job from the queue if it has not started yet
             current_process.terminate()
             
             # Wait for process to terminate (with timeout)
@@ -350,16 +313,7 @@ def create_eval_tab(constant):
             except subprocess.TimeoutExpired:
                 current_process.kill()
             
-            # Reset state completely
-            current_process = None
-            is_evaluating = False
-            
-            # Reset output queue to clear any pending messages
-            while not output_queue.empty():
-                try:
-                    output_queue.get_nowait()
-                except queue.Empty:
-                    break
+            session_jobs.pop(session, None)
             
             return f"""
             {get_css_style_tag('eval_predict_ui.css')}
@@ -367,16 +321,7 @@ def create_eval_tab(constant):
             """, gr.update(visible=False)
         except Exception as e:
             # Still need to reset states even if there's an error
-            current_process = None
-            is_evaluating = False
-            process_aborted = False
-            
-            # Reset output queue
-            while not output_queue.empty():
-                try:
-                    output_queue.get_nowait()
-                except queue.Empty:
-                    break
+            session_jobs.pop(session, None)
             
             return f"""
             {get_css_style_tag('eval_predict_ui.css')}
@@ -503,6 +448,9 @@ def create_eval_tab(constant):
             custom_dataset: custom dataset path
         Returns:
         """
+        # datasets is slow to import, load it with the first preview instead of at startup
+        from datasets import load_dataset
+
         # Determine which dataset to use based on selection
         if dataset_type == "Custom Dataset" and custom_dataset:
             try:
@@ -14,6 +14,7 @@ import re
 from web.utils.command import preview_predict_command
 from web.utils.html_ui import load_html_template, generate_prediction_status_html, generate_prediction_results_html, generate_batch_prediction_results_html, generate_table_rows
 from web.utils.css_loader import get_css_style_tag
+from web.utils.job_queue import get_job_queue
 from datetime import datetime
 
 def create_single_prediction_csv(prediction_data, problem_type, aa_seq):
@@ -103,13 +104,40 @@ def create_single_prediction_csv(prediction_data, problem_type, aa_seq):
         print(f"Error creating CSV file: {e}")
         return None
 
+class PredictionSession:
+    """Prediction state of one browser session, the tab is shared by every user of the server"""
+    def __init__(self):
+        self.is_predicting = False
+        self.current_process = None
+        self.output_queue = queue.Queue()
+        self.stop_thread = False
+        self.process_aborted = False  # Flag indicating if the process was manually terminated
+
+
 def create_predict_tab(constant):
     plm_models = constant["plm_models"]
-    is_predicting = False
-    current_process = None
-    output_queue = queue.Queue()
-    stop_thread = False
-    process_aborted = False  # Flag indicating if the process was manually terminated
+    # Prediction of every browser session, jobs run through the shared job queue
+    session_states = {}
+
+    def start_session(request):
+        """Fresh state for a new prediction of this session, None if one is already running"""
+        session = request.session_hash if request is not None else None
+        state = session_states.get(session)
+        if state is not None and state.is_predicting:
+            return session, None
+        state = session_states[session] = PredictionSession()
+        return session, state
+
+    def end_session(session, state):
+        if session_states.get(session) is state:
+            del session_states[session]
+
+    def running_session(request):
+        session = request.session_hash if request is not None else None
+        state = session_states.get(session)
+        if state is None or not state.is_predicting or state.current_process is None:
+            return None
+        return state
     
     def track_usage(module):
         try:
@@ -119,18 +147,18 @@ def create_predict_tab(constant):
         except Exception as e:
             print(f"Failed to track usage: {e}")
 
-    def process_output(process, queue):
-        """Process output from subprocess and put it in queue"""
-        nonlocal stop_thread
+    def process_output(job, output, state):
+        """Forward the output of a queued job to the output queue of its session"""
         while True:
-            if stop_thread:
-                break
-            output = process.stdout.readline()
-            if output == '' and process.poll() is not None:
+            if state.stop_thread:
                 break
-            if output:
-                queue.put(output.strip())
-        process.stdout.close()
+            try:
+                line = job.output.get(timeout=0.5)
+            except queue.Empty:
+                if job.poll() is not None:
+                    break
+                continue
+            output.put(line.strip())
 
     def generate_status_html(status_info):
         """Generate HTML for single sequence prediction status"""
@@ -139,12 +167,13 @@ def create_predict_tab(constant):
         
         return generate_prediction_status_html(stage, status)
 
-    def predict_sequence(plm_model, model_path, aa_seq, eval_method, eval_structure_seq, pooling_method, problem_type, num_labels):
+    def predict_sequence(plm_model, model_path, aa_seq, eval_method, eval_structure_seq, pooling_method, problem_type, num_labels, request: gr.Request = None):
         """Predict for a single protein sequence"""
-        nonlocal is_predicting, current_process, stop_thread, process_aborted
+        session, state = start_session(request)
+        current_process = None
         
-        # Check if we're already predicting
-        if is_predicting:
+        # Check if this session is already predicting
+        if state is None:
             return gr.HTML(f"""
             {get_css_style_tag('prediction_ui.css')}
             {load_html_template('prediction_warning.html', warning_message="A prediction is already running. Please wait or abort it.")}
@@ -152,13 +181,8 @@ def create_predict_tab(constant):
         
         track_usage("mutation_prediction")
         
-        # If the process was aborted but not reset properly, ensure we're in a clean state
-        if process_aborted:
-            process_aborted = False
-            
         # Set the prediction flag
-        is_predicting = True
-        stop_thread = False  # Ensure this is reset
+        state.is_predicting = True
         
         # Create a status info object, similar to batch prediction
         status_info = {
@@ -172,21 +196,21 @@ def create_predict_tab(constant):
         try:
             # Validate inputs
             if not model_path:
-                is_predicting = False
+                state.is_predicting = False
                 return gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_error.html', error_message="Please provide a model path")}
                 """), gr.update(visible=False)
                 
             if not os.path.exists(os.path.dirname(model_path)):
-                is_predicting = False
+                state.is_predicting = False
                 return gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_error.html', error_message="Invalid model path - directory does not exist")}
                 """), gr.update(visible=False)
                 
             if not aa_seq:
-                is_predicting = False
+                state.is_predicting = False
                 return gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_error.html', error_message="Amino acid sequence is required")}
@@ -237,23 +261,16 @@ def create_predict_tab(constant):
             
             # Start prediction process
             try:
-                current_process = subprocess.Popen(
-                    final_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True,
-                    preexec_fn=os.setsid if hasattr(os, "setsid") else None
-                )
+                current_process = get_job_queue().submit("predict", final_cmd, owner=session)
+                state.current_process = current_process
             except Exception as e:
-                is_predicting = False
+                state.is_predicting = False
                 return gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_error.html', error_message=f"Error starting prediction process: {str(e)}")}
                 """), gr.update(visible=False)
             
-            output_thread = threading.Thread(target=process_output, args=(current_process, output_queue))
+            output_thread = threading.Thread(target=process_output, args=(current_process, state.output_queue, state))
             output_thread.daemon = True
             output_thread.start()
             
@@ -270,12 +287,12 @@ def create_predict_tab(constant):
             
             while current_process.poll() is None:
                 # Check if the process was aborted
-                if process_aborted or stop_thread:
+                if state.process_aborted or state.stop_thread:
                     break
                 
                 try:
-                    while not output_queue.empty():
-                        line = output_queue.get_nowait()
+                    while not state.output_queue.empty():
+                        line = state.output_queue.get_nowait()
                         result_output += line + "\n"
                         
                         # Update status with more meaningful messages
@@ -324,13 +341,13 @@ def create_predict_tab(constant):
                     """), gr.update(visible=False)
             
             # Check if the process was aborted
-            if process_aborted:
+            if state.process_aborted:
                 # Show aborted message
                 yield gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_warning.html', warning_message="Prediction was aborted by user")}
                 """), gr.update(visible=False)
-                is_predicting = False
+                state.is_predicting = False
                 return
             
             # Process has completed
@@ -408,41 +425,36 @@ def create_predict_tab(constant):
             """), gr.update(visible=False)
         finally:
             # Reset state
-            is_predicting = False
+            state.is_predicting = False
             
             # Properly clean up the process
             if current_process and current_process.poll() is None:
                 try:
-                    # Use process group ID to kill all related processes if possible
-                    if hasattr(os, "killpg") and hasattr(os, "getpgid"):
-                        os.killpg(os.getpgid(current_process.pid), signal.SIGTERM)
-                    else:
-                        # On Windows or if killpg is not available
-                        current_process.terminate()
+                    # The job queue signals the whole process group, or drops the job if it has not started
+                    current_process.terminate()
                         
                     # Wait briefly for termination
                     try:
                         current_process.wait(timeout=1)
                     except subprocess.TimeoutExpired:
                         # Force kill if necessary
-                        if hasattr(os, "killpg") and hasattr(os, "getpgid"):
-                            os.killpg(os.getpgid(current_process.pid), signal.SIGKILL)
-                        else:
-                            current_process.kill()
+                        current_process.kill()
                 except Exception as e:
                     # Ignore errors during process cleanup
                     print(f"Error cleaning up process: {e}")
                 
             # Reset process reference
-            current_process = None
-            stop_thread = False
+            state.current_process = None
+            state.stop_thread = True
+            end_session(session, state)
 
-    def predict_batch(plm_model, model_path, eval_method, input_file, eval_structure_seq, pooling_method, problem_type, num_labels, batch_size):
+    def predict_batch(plm_model, model_path, eval_method, input_file, eval_structure_seq, pooling_method, problem_type, num_labels, batch_size, request: gr.Request = None):
         """Batch predict multiple protein sequences"""
-        nonlocal is_predicting, current_process, stop_thread, process_aborted
+        session, state = start_session(request)
+        current_process = None
         
-        # Check if we're already predicting (this check is performed first)
-        if is_predicting:
+        # Check if this session is already predicting (this check is performed first)
+        if state is None:
             return gr.HTML(f"""
             {get_css_style_tag('prediction_ui.css')}
             {load_html_template('prediction_warning.html', warning_message="A prediction is already running. Please wait or abort it.")}
@@ -450,20 +462,8 @@ def create_predict_tab(constant):
 
         track_usage("mutation_prediction")
         
-        # If the process was aborted but not reset properly, ensure we're in a clean state
-        if process_aborted:
-            process_aborted = False
-        
-        # Reset all state completely
-        is_predicting = True
-        stop_thread = False
-        
-        # Clear the output queue
-        while not output_queue.empty():
-            try:
-                output_queue.get_nowait()
-            except queue.Empty:
-                break
+        # The session state is fresh, only mark it as running
+        state.is_predicting = True
         
         # Initialize progress tracking with completely fresh state
         progress_info = {
@@ -485,8 +485,8 @@ def create_predict_tab(constant):
         
         try:
             # Check abort state before continuing
-            if process_aborted:
-                is_predicting = False
+            if state.process_aborted:
+                state.is_predicting = False
                 return gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('status_success.html', message="Process was aborted.")}
@@ -494,7 +494,7 @@ def create_predict_tab(constant):
             
             # Validate inputs
             if not model_path:
-                is_predicting = False
+                state.is_predicting = False
                 yield gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_error.html', error_message="Error: Model path is required")}
@@ -502,7 +502,7 @@ def create_predict_tab(constant):
                 return
                 
             if not os.path.exists(os.path.dirname(model_path)):
-                is_predicting = False
+                state.is_predicting = False
                 yield gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_error.html', error_message="Error: Invalid model path - directory does not exist")}
@@ -510,7 +510,7 @@ def create_predict_tab(constant):
                 return
             
             if not input_file:
-                is_predicting = False
+                state.is_predicting = False
                 yield gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_error.html', error_message="Error: Input file is required")}
@@ -542,7 +542,7 @@ def create_predict_tab(constant):
                 
                 # Verify file was saved correctly
                 if not os.path.exists(input_path):
-                    is_predicting = False
+                    state.is_predicting = False
                     yield gr.HTML(f"""
                     {get_css_style_tag('prediction_ui.css')}
                     {load_html_template('prediction_error.html', error_message="Error: Failed to save input file")}
@@ -558,7 +558,7 @@ def create_predict_tab(constant):
                     progress_info["current_step"] = f"Found {len(df)} sequences to process"
                     yield generate_progress_html(progress_info), gr.update(visible=False)
                 except Exception as e:
-                    is_predicting = False
+                    state.is_predicting = False
                     yield gr.HTML(f"""
                     {get_css_style_tag('prediction_ui.css')}
                     {load_html_template('prediction_error_with_details.html', 
@@ -570,7 +570,7 @@ def create_predict_tab(constant):
                     return
                 
             except Exception as e:
-                is_predicting = False
+                state.is_predicting = False
                 yield gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                                     {load_html_template('prediction_error_with_details.html', 
@@ -624,24 +624,17 @@ def create_predict_tab(constant):
             
             # Start prediction process
             try:
-                current_process = subprocess.Popen(
-                    final_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True,
-                    preexec_fn=os.setsid if hasattr(os, "setsid") else None
-                )
+                current_process = get_job_queue().submit("predict", final_cmd, owner=session)
+                state.current_process = current_process
             except Exception as e:
-                is_predicting = False
+                state.is_predicting = False
                 yield gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_error.html', error_message=f"Error starting prediction process: {str(e)}")}
                 """), gr.update(visible=False)
                 return
             
-            output_thread = threading.Thread(target=process_output, args=(current_process, output_queue))
+            output_thread = threading.Thread(target=process_output, args=(current_process, state.output_queue, state))
             output_thread.daemon = True
             output_thread.start()
             
@@ -652,7 +645,7 @@ def create_predict_tab(constant):
             # Modified processing loop with abort check
             while True:
                 # Check if process was aborted or completed
-                if process_aborted or current_process is None or current_process.poll() is not None:
+                if state.process_aborted or current_process is None or current_process.poll() is not None:
                     break
                 
                 # Check for new output
@@ -661,7 +654,7 @@ def create_predict_tab(constant):
                     new_lines = []
                     for _ in range(10):  # Process up to 10 lines at once
                         try:
-                            line = output_queue.get_nowait()
+                            line = state.output_queue.get_nowait()
                             new_lines.append(line)
                             result_output += line + "\n"
                             progress_info["lines"].append(line)
@@ -688,7 +681,7 @@ def create_predict_tab(constant):
                             break
                     
                     # Check if the process has been aborted before updating UI
-                    if process_aborted:
+                    if state.process_aborted:
                         break
                         
                     # Check if we need to update the UI
@@ -703,7 +696,7 @@ def create_predict_tab(constant):
                     
                 except Exception as e:
                     # Check if the process has been aborted before showing error
-                    if process_aborted:
+                    if state.process_aborted:
                         break
                         
                     yield gr.HTML(f"""
@@ -712,8 +705,8 @@ def create_predict_tab(constant):
                     """), gr.update(visible=False)
             
             # Check if aborted instead of completed
-            if process_aborted:
-                is_predicting = False
+            if state.process_aborted:
+                state.is_predicting = False
                 yield gr.HTML(f"""
                 {get_css_style_tag('prediction_ui.css')}
                 {load_html_template('prediction_warning.html', warning_message="Prediction was manually terminated. All prediction state has been reset.")}
@@ -783,10 +776,9 @@ def create_predict_tab(constant):
             yield gr.HTML(error_html), gr.update(visible=False)
         finally:
             # Always reset prediction state
-            is_predicting = False
-            if current_process:
-                current_process = None
-            process_aborted = False  # Reset abort flag
+            state.is_predicting = False
+            state.current_process = None
+            end_session(session, state)
 
     def generate_progress_html(progress_info):
         """Generate HTML progress bar similar to eval_tab"""
@@ -818,11 +810,10 @@ def create_predict_tab(constant):
         """Generate HTML table rows with special handling for sequence data, maintaining consistent style with eval_tab"""
         return generate_table_rows(df, max_rows)
 
-    def handle_predict_tab_abort():
-        """Handle abortion of the prediction process for both single and batch prediction"""
-        nonlocal is_predicting, current_process, stop_thread, process_aborted
-        
-        if not is_predicting or current_process is None:
+    def handle_predict_tab_abort(request: gr.Request = None):
+        """Handle abortion of the prediction process of this session for both single and batch prediction"""
+        state = running_session(request)
+        if state is None:
             return f"""
             {get_css_style_tag('prediction_ui.css')}
             {load_html_template('status_empty.html', message="No prediction process is currently running.")}
@@ -830,32 +821,27 @@ def create_predict_tab(constant):
         
         try:
             # Set the abort flag before terminating the process
-            process_aborted = True
-            stop_thread = True
+            state.process_aborted = True
+            state.stop_thread = True
             
             # Kill the process group
-            if hasattr(os, "killpg"):
-                os.killpg(os.getpgid(current_process.pid), signal.SIGTERM)
-            else:
-                current_process.terminate()
+            # The job queue signals the whole process group, or drops the job if it has not started
+            state.current_process.terminate()
             
             # Wait for process to terminate (with timeout)
             try:
-                current_process.wait(timeout=5)
+                state.current_process.wait(timeout=5)
             except subprocess.TimeoutExpired:
-                if hasattr(os, "killpg"):
-                    os.killpg(os.getpgid(current_process.pid), signal.SIGKILL)
-                else:
-                    current_process.kill()
+                state.current_process.kill()
             
             # Reset state
-            is_predicting = False
-            current_process = None
+            state.is_predicting = False
+            state.current_process = None
             
             # Clear output queue
-            while not output_queue.empty():
+            while not state.output_queue.empty():
                 try:
-                    output_queue.get_nowait()
+                    state.output_queue.get_nowait()
                 except queue.Empty:
                     break
             
@@ -866,14 +852,14 @@ def create_predict_tab(constant):
                 
         except Exception as e:
             # Reset states even on error
-            is_predicting = False
-            current_process = None
-            process_aborted = False
+            state.is_predicting = False
+            state.current_process = None
+            state.process_aborted = False
             
             # Clear queue
-            while not output_queue.empty():
+            while not state.output_queue.empty():
                 try:
-                    output_queue.get_nowait()
+                    state.output_queue.get_nowait()
                 except queue.Empty:
                     break
                     
@@ -883,44 +869,37 @@ def create_predict_tab(constant):
             """
 
     # Create handler functions for each tab
-    def handle_abort_single():
+    def handle_abort_single(request: gr.Request = None):
         """Handle abort for single sequence prediction tab"""
-        # Flag the process for abortion first
-        nonlocal stop_thread, process_aborted, is_predicting, current_process
-        
-        # Only proceed if there's an active prediction
-        if not is_predicting or current_process is None:
+        # Only proceed if this session has an active prediction
+        state = running_session(request)
+        if state is None:
             return gr.HTML(f"""
             {get_css_style_tag('prediction_ui.css')}
             {load_html_template('status_empty.html', message="No prediction process is currently running.")}
             """), gr.update(visible=False)
             
         # Set the abort flags
-        process_aborted = True
-        stop_thread = True
+        state.process_aborted = True
+        state.stop_thread = True
         
         # Terminate the process
         try:
-            if hasattr(os, "killpg"):
-                os.killpg(os.getpgid(current_process.pid), signal.SIGTERM)
-            else:
-                current_process.terminate()
+            # The job queue signals the whole process group, or drops the job if it has not started
+            state.current_process.terminate()
                 
             # Wait briefly for termination
             try:
-                current_process.wait(timeout=1)
+                state.current_process.wait(timeout=1)
             except subprocess.TimeoutExpired:
                 # Force kill if necessary
-                if hasattr(os, "killpg"):
-                    os.killpg(os.getpgid(current_process.pid), signal.SIGKILL)
-                else:
-                    current_process.kill()
+                state.current_process.kill()
         except Exception as e:
             pass  # Catch any termination errors
             
         # Reset state
-        is_predicting = False
-        current_process = None
+        state.is_predicting = False
+        state.current_process = None
         
         # Return the success message and hide download button
         return gr.HTML(f"""
@@ -928,49 +907,42 @@ def create_predict_tab(constant):
         {load_html_template('status_success.html', message="Prediction successfully terminated! All prediction state has been reset.")}
         """), gr.update(visible=False)
         
-    def handle_abort_batch():
+    def handle_abort_batch(request: gr.Request = None):
         """Handle abort for batch prediction tab"""
-        # Flag the process for abortion first
-        nonlocal stop_thread, process_aborted, is_predicting, current_process
-        
-        # Only proceed if there's an active prediction
-        if not is_predicting or current_process is None:
+        # Only proceed if this session has an active prediction
+        state = running_session(request)
+        if state is None:
             return gr.HTML(f"""
             {get_css_style_tag('prediction_ui.css')}
             {load_html_template('status_empty.html', message="No prediction process is currently running.")}
             """), gr.update(visible=False)
             
         # Set the abort flags
-        process_aborted = True
-        stop_thread = True
+        state.process_aborted = True
+        state.stop_thread = True
         
         # Terminate the process
         try:
-            if hasattr(os, "killpg"):
-                os.killpg(os.getpgid(current_process.pid), signal.SIGTERM)
-            else:
-                current_process.terminate()
+            # The job queue signals the whole process group, or drops the job if it has not started
+            state.current_process.terminate()
                 
             # Wait briefly for termination
             try:
-                current_process.wait(timeout=1)
+                state.current_process.wait(timeout=1)
             except subprocess.TimeoutExpired:
                 # Force kill if necessary
-                if hasattr(os, "killpg"):
-                    os.killpg(os.getpgid(current_process.pid), signal.SIGKILL)
-                else:
-                    current_process.kill()
+                state.current_process.kill()
         except Exception as e:
             pass  # Catch any termination errors
             
         # Reset state
-        is_predicting = False
-        current_process = None
+        state.is_predicting = False
+        state.current_process = None
         
         # Clear output queue
-        while not output_queue.empty():
+        while not state.output_queue.empty():
             try:
-                output_queue.get_nowait()
+                state.output_queue.get_nowait()
             except queue.Empty:
                 break
                 
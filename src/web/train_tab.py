@@ -2,11 +2,11 @@ import os
 import json
 import gradio as gr
 import time
-from datasets import load_dataset
 from typing import Any, Dict, Generator, List
 from dataclasses import dataclass
 from .utils.command import preview_command, save_arguments, build_command_list
-from .utils.monitor import TrainingMonitor
+from .utils.monitor import TrainingMonitor, cancel_job
+from .utils.job_queue import get_job_queue
 from .utils.html_ui import load_html_template
 import traceback
 import tempfile
@@ -150,14 +150,8 @@ class TrainingArgs:
         return args_dict
 
 def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
-    # Create training monitor
-    monitor = TrainingMonitor()
-    
-    # Add missing variable declarations
-    is_training = False
-    current_process = None
-    stop_thread = False
-    process_aborted = False
+    # Monitor of the latest run of every session, each run gets a new one so users never share state
+    session_monitors = {}
     
     plm_models = constant["plm_models"]
     dataset_configs = constant["dataset_configs"]
@@ -516,9 +510,30 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
         with gr.Column(scale=1):
             gr.Markdown("## Training Control")
             preview_button = gr.Button("Preview Command", elem_classes=["preview-command-btn"])
+            train_priority = gr.Number(
+                label="Queue Priority",
+                value=0,
+                precision=0,
+                info="Queued jobs with a higher priority start first"
+            )
             train_button = gr.Button("Start Training", variant="primary", elem_classes=["train-btn"])
             abort_button = gr.Button("Abort Training", variant="stop", elem_classes=["abort-btn"])
             
+    with gr.Accordion("Job Queue", open=False):
+        jobs_table = gr.Dataframe(
+            headers=["Job ID", "Kind", "Status", "Priority", "Position", "Device"],
+            value=[],
+            interactive=False
+        )
+        with gr.Row():
+            queue_job_id = gr.Textbox(label="Job ID", placeholder="ID from the table above", scale=2)
+            queue_job_priority = gr.Number(label="New Priority", value=0, precision=0, scale=1)
+        with gr.Row():
+            refresh_jobs_button = gr.Button("Refresh")
+            set_priority_button = gr.Button("Set Priority")
+            cancel_job_button = gr.Button("Cancel Job", variant="stop")
+        queue_status = gr.Markdown()
+    
     
     with gr.Row():
         command_preview = gr.Code(
@@ -651,7 +666,7 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
                 elem_id="metrics_plot"
             )
 
-    def update_progress(progress_info):
+    def update_progress(progress_info, monitor, plot_state):
         # If progress_info is empty or None, use completely fresh empty state
         if not progress_info or not any(progress_info.values()):
             fresh_status_html = load_html_template("status_empty.html")
@@ -788,235 +803,29 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
         else:
             best_info = "No best model found yet"
         
-        # get and update charts
-        loss_fig = monitor.get_loss_plot()
-        metrics_fig = monitor.get_metrics_plot()
+        # get and update charts, only when new points arrived so Gradio does not re-encode unchanged figures
+        plot_version = monitor.get_plot_version()
+        if plot_version == plot_state["version"]:
+            loss_fig, metrics_fig = gr.update(), gr.update()
+        else:
+            plot_state["version"] = plot_version
+            loss_fig = monitor.get_loss_plot()
+            metrics_fig = monitor.get_metrics_plot()
         
         # return updated components
         return status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update
 
-    def handle_train(*args) -> Generator:
-        nonlocal is_training, current_process, stop_thread, process_aborted, monitor
-        
-        # If already training, return
-        if is_training:
-            yield None, None, None, None, None, None, None
-            return
-        
-        # Force explicit state reset first thing
-        monitor._reset_tracking()
-        monitor._reset_stats()
-        
-        # Explicitly ensure stats are reset
-        if hasattr(monitor, "stats"):
-            monitor.stats = {}
-        
-        # Force override any cached state in monitor
-        monitor.current_progress = {
-            "current": 0,
-            "total": 0,
-            "epoch": 0,
-            "stage": "Waiting",
-            "progress_detail": "",
-            "best_epoch": -1,
-            "best_metric_name": "",
-            "best_metric_value": 0.0,
-            "elapsed_time": "",
-            "remaining_time": "",
-            "it_per_sec": 0.0,
-            "grad_step": 0,
-            "loss": 0.0,
-            "test_results_html": "",
-            "test_metrics": {},
-            "is_completed": False,
-            "lines": []
-        }
-        
-        # Reset all monitoring data structures
-        monitor.train_losses = []
-        monitor.val_losses = []
-        monitor.metrics = {}
-        monitor.epochs = []
-        if hasattr(monitor, "stats"):
-            monitor.stats = {}
-        
-        # Reset flags for new training session
-        process_aborted = False
-        stop_thread = False
-        
-        # Initialize table state
-        initial_stats = [
-            ["Training Model", "-", "-", "-"],
-            ["Pre-trained Model", "-", "-", "-"],
-            ["Combined Model", "-", "-", "-"]
-        ]
-        
-        # Initial UI state with "Initializing" message
-        initial_status_html = load_html_template("status_initializing.html")
-        
-        # First yield to update UI with "initializing" state
-        yield initial_stats, initial_status_html, "Best Model: None", gr.update(value="", visible=False), None, None, gr.update(visible=False)
-        
-        try:
-            # Parse training arguments
-            training_args = TrainingArgs(args, plm_models, dataset_configs)
-            
-            if training_args.training_method != "ses-adapter":
-                training_args.structure_seq = None
-            
-            args_dict = training_args.to_dict()
-            
-            # Save total epochs to monitor for use in progress_info
-            total_epochs = args_dict.get('num_epochs', 100)
-            monitor.current_progress['total_epochs'] = total_epochs
-            
-            # Update status to "Preparing dataset"
-            preparing_status_html = load_html_template("status_preparing.html")
-            yield initial_stats, preparing_status_html, "Best Model: None", gr.update(value="", visible=False), None, None, gr.update(visible=False)
-            
-            # Save arguments to file
-            save_arguments(args_dict, args_dict.get('output_dir', 'ckpt'))
-            
-            # Start training
-            is_training = True
-            process_aborted = False  # Reset abort flag
-            monitor.start_training(args_dict)
-            current_process = monitor.process  # Store the process reference
-            
-            starting_status_html = load_html_template("status_starting.html")
-            yield initial_stats, starting_status_html, "Best Model: None", gr.update(value="", visible=False), None, None, gr.update(visible=False)
-
-            # Add delay to ensure enough time for parsing initial statistics
-            for i in range(3):
-                time.sleep(1)
-                # Check if statistics are already available
-                stats = monitor.get_stats()
-                if stats and len(stats) > 0:
-                    break
-            
-            update_count = 0
-            while True:
-                # Check if the process still exists and hasn't been aborted
-                if process_aborted or (current_process and current_process.poll() is not None):
-                    break
-                    
-                try:
-                    update_count += 1
-                    time.sleep(0.5)
-                    
-                    # Check process status
-                    monitor.check_process_status()
-                    
-                    # Get latest progress info
-                    progress_info = monitor.get_progress()
-                    
-                    # If process has ended, check if it's normal end or error
-                    if not monitor.is_training:
-                        # Check both monitor.process and current_process since they might be different objects
-                        if (monitor.process and monitor.process.returncode != 0) or (current_process and current_process.poll() is not None and current_process.returncode != 0):
-                            # Get the return code from whichever process object is available
-                            return_code = monitor.process.returncode if monitor.process else current_process.returncode
-                            # Get complete output log
-                            error_output = "\n".join(progress_info.get("lines", []))
-                            if not error_output:
-                                error_output = "No output captured from the training process"
-                            
-                            # Ensure we set the is_completed flag to False for errors
-                            progress_info['is_completed'] = False
-                            monitor.current_progress['is_completed'] = False
-                            
-                            # Also set the stage to Error
-                            progress_info['stage'] = 'Error'
-                            monitor.current_progress['stage'] = 'Error'
-                            
-                            error_status_html = load_html_template("status_failed_code.html", return_code=return_code, error_output=error_output)
-                            yield (
-                                initial_stats,
-                                error_status_html,
-                                "Training failed",
-                                gr.update(value="", visible=False),
-                                None,
-                                None,
-                                gr.update(visible=False)
-                            )
-                            return
-                        else:
-                            # Only set is_completed to True if there was a successful exit code
-                            progress_info['is_completed'] = True
-                            monitor.current_progress['is_completed'] = True
-                    
-                    # Update UI
-                    stats = monitor.get_stats()
-                    if stats:
-                        model_stats = update_model_stats(stats)
-                    else:
-                        model_stats = initial_stats
-                    
-                    status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update = update_progress(progress_info)
-                    
-                    yield model_stats, status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update
-                    
-                except Exception as e:
-                    # Get complete output log
-                    error_output = "\n".join(progress_info.get("lines", []))
-                    if not error_output:
-                        error_output = "No output captured from the training process"
-                    
-                    error_status_html = load_html_template("status_error.html", error_title="Error during training", error_message=str(e))
-                    print(f"Error updating UI: {str(e)}")
-                    traceback.print_exc()
-                    yield initial_stats, error_status_html, "Training error", gr.update(value="", visible=False), None, None, gr.update(visible=False)
-                    return
-            
-            # Check if aborted
-            if process_aborted:
-                is_training = False
-                current_process = None
-                aborted_status_html = load_html_template("status_aborted.html")
-                yield initial_stats, aborted_status_html, "Training aborted", gr.update(value="", visible=False), None, None, gr.update(visible=False)
-                return
-            
-            # Final update after training ends (only for normal completion)
-            if monitor.process and monitor.process.returncode == 0:
-                try:
-                    progress_info = monitor.get_progress()
-                    progress_info['is_completed'] = True
-                    monitor.current_progress['is_completed'] = True
-                    
-                    stats = monitor.get_stats()
-                    if stats:
-                        model_stats = update_model_stats(stats)
-                    else:
-                        model_stats = initial_stats
-                    
-                    status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update = update_progress(progress_info)
-                    
-                    yield model_stats, status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update
-                except Exception as e:
-                    error_output = "\n".join(progress_info.get("lines", []))
-                    if not error_output:
-                        error_output = "No output captured from the training process"
-                    
-                    error_status_html = load_html_template("status_error.html", error_title="Error in final update", error_message=str(e))
-                    yield initial_stats, error_status_html, "Error in final update", gr.update(value="", visible=False), None, None, gr.update(visible=False)
-            
-        except Exception as e:
-            # Initialization error, may not have output log
-            error_status_html = load_html_template("status_error.html", error_title="Training initialization failed", error_message=str(e))
-            yield initial_stats, error_status_html, "Training failed", gr.update(value="", visible=False), None, None, gr.update(visible=False)
-        finally:
-            is_training = False
-            current_process = None
-    
-    def handle_train_tab_abort():
-        """Handle abortion of the training process"""
-        nonlocal is_training, current_process, stop_thread, process_aborted
+    def handle_train_tab_abort(request: gr.Request = None):
+        """Handle abortion of the training process of the current session"""
+        session = request.session_hash if request is not None else None
+        monitor = session_monitors.get(session)
+        empty_model_stats = [["Training Model", "-", "-", "-"], 
+                            ["Pre-trained Model", "-", "-", "-"], 
+                            ["Combined Model", "-", "-", "-"]]
         
-        if not is_training or current_process is None:
+        if monitor is None or not monitor.is_training or monitor.process is None:
             return (gr.HTML(load_html_template("status_empty.html")),
-            [["Training Model", "-", "-", "-"], 
-                ["Pre-trained Model", "-", "-", "-"], 
-                ["Combined Model", "-", "-", "-"]],
+            empty_model_stats,
             "Best Model: None",
             gr.update(value="", visible=False),
             None,
@@ -1024,70 +833,16 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
             gr.update(visible=False))
         
         try:
-            # Set the abort flag before terminating the process
-            process_aborted = True
-            stop_thread = True
-            
-            # Use process.terminate() instead of os.killpg for safer termination
-            # This avoids accidentally killing the parent WebUI process
-            current_process.terminate()
+            # abort_training clears monitor.process, keep the job to wait for it
+            process = monitor.process
+            monitor.abort_training()
             
             # Wait for process to terminate (with timeout)
             try:
-                current_process.wait(timeout=5)
+                process.wait(timeout=5)
             except subprocess.TimeoutExpired:
-                # Only if terminate didn't work, use a stronger method
-                # But do NOT use killpg which might kill the parent WebUI
-                current_process.kill()
-            
-            # Create a completely fresh state - not just resetting
-            monitor.is_training = False
-            
-            # Explicitly create a new dictionary instead of modifying the existing one
-            monitor.current_progress = {
-                "current": 0,
-                "total": 0,
-                "epoch": 0,
-                "stage": "Waiting",
-                "progress_detail": "",
-                "best_epoch": -1,
-                "best_metric_name": "",
-                "best_metric_value": 0.0,
-                "elapsed_time": "",
-                "remaining_time": "",
-                "it_per_sec": 0.0,
-                "grad_step": 0,
-                "loss": 0.0,
-                "test_results_html": "",
-                "test_metrics": {},
-                "is_completed": False,
-                "lines": []
-            }
-            
-            # Explicitly clear stats by creating a new dictionary
-            monitor.stats = {}
-            
-            if hasattr(monitor, "process") and monitor.process:
-                monitor.process = None
-                
-            # Reset state variables
-            is_training = False
-            current_process = None
-            
-            # Explicitly reset tracking to clear all state
-            monitor._reset_tracking()
-            monitor._reset_stats()
-            
-            # Reset all plots and statistics with new empty lists
-            monitor.train_losses = []
-            monitor.val_losses = []
-            monitor.metrics = {}
-            monitor.epochs = []
-            
-            # Create entirely fresh UI components
-            empty_model_stats = [["Training Model", "-", "-", "-"], 
-                                ["Pre-trained Model", "-", "-", "-"], 
-                                ["Combined Model", "-", "-", "-"]]
+                # Only signals the process group of the job, never the WebUI
+                process.kill()
             
             success_html = load_html_template("status_success.html")
             
@@ -1100,24 +855,6 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
                     None,
                     gr.update(visible=False))
         except Exception as e:
-            # Still need to reset states even if there's an error
-            is_training = False
-            current_process = None
-            process_aborted = False
-            
-            # Reset monitor state regardless of error
-            monitor.is_training = False
-            monitor.stats = {}
-            if hasattr(monitor, "process") and monitor.process:
-                monitor.process = None
-            monitor._reset_tracking()
-            monitor._reset_stats()
-            
-            # Fresh empty components
-            empty_model_stats = [["Training Model", "-", "-", "-"], 
-                                ["Pre-trained Model", "-", "-", "-"], 
-                                ["Combined Model", "-", "-", "-"]]
-            
             error_html = load_html_template("status_error.html", error_title="Failed to terminate training", error_message=str(e))
             
             # Return updates for all relevant components including empty model stats
@@ -1129,6 +866,35 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
                     None,
                     gr.update(visible=False))
 
+    def list_queue_jobs():
+        """Rows of the job queue table, newest job first"""
+        jobs = sorted(get_job_queue().list_jobs(), key=lambda job: job["submitted_at"], reverse=True)
+        return [
+            [job["id"], job["kind"], job["status"], job["priority"],
+             "-" if job["position"] is None else job["position"], job["device"] or "-"]
+            for job in jobs
+        ]
+
+    def handle_set_job_priority(job_id, priority, request: gr.Request = None):
+        """Change the priority of a queued job of this session"""
+        session = request.session_hash if request is not None else None
+        job_id = (job_id or "").strip()
+        if get_job_queue().set_priority(job_id, int(priority or 0), owner=session):
+            message = f"Priority of job `{job_id}` set to {int(priority or 0)}."
+        else:
+            message = f"Job `{job_id}` is not one of your queued jobs, only your waiting jobs can be reprioritized."
+        return message, list_queue_jobs()
+
+    def handle_cancel_job(job_id, request: gr.Request = None):
+        """Cancel a queued or running job of this session by id"""
+        session = request.session_hash if request is not None else None
+        job_id = (job_id or "").strip()
+        if cancel_job(job_id, owner=session):
+            message = f"Job `{job_id}` cancelled."
+        else:
+            message = f"Job `{job_id}` not found, already finished or submitted by another user."
+        return message, list_queue_jobs()
+
     def update_wandb_visibility_UI(checkbox):
         """Update wandb project and entity visibility for Gradio UI
         Args:
@@ -1246,41 +1012,6 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
             best_model: best model
             command_preview: command preview
         """
-        # Reset monitor state
-        monitor._reset_tracking()
-        monitor._reset_stats()
-        
-        # Explicitly ensure stats are reset
-        if hasattr(monitor, "stats"):
-            monitor.stats = {}
-        
-        # Create a completely fresh progress state
-        monitor.current_progress = {
-            "current": 0,
-            "total": 0,
-            "epoch": 0,
-            "stage": "Waiting",
-            "progress_detail": "",
-            "best_epoch": -1,
-            "best_metric_name": "",
-            "best_metric_value": 0.0,
-            "elapsed_time": "",
-            "remaining_time": "",
-            "it_per_sec": 0.0,
-            "grad_step": 0,
-            "loss": 0.0,
-            "test_results_html": "",
-            "test_metrics": {},
-            "is_completed": False,
-            "lines": []
-        }
-        
-        # Reset all statistical data
-        monitor.train_losses = []
-        monitor.val_losses = []
-        monitor.metrics = {}
-        monitor.epochs = []
-        
         # Force UI to reset by creating completely fresh components
         empty_model_stats = [["Training Model", "-", "-", "-"], 
                             ["Pre-trained Model", "-", "-", "-"], 
@@ -1306,7 +1037,8 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
         output_model_name, output_dir, wandb_logging, wandb_project, wandb_entity,
         patience, num_workers, max_grad_norm, structure_seq, 
         lora_r, lora_alpha, lora_dropout, lora_target_modules, 
-        monitored_metrics, monitored_strategy, sequence_column_name, label_column_name
+        monitored_metrics, monitored_strategy, sequence_column_name, label_column_name,
+        priority=0, request: gr.Request = None
     ) -> Generator:
         """Handle the train command button click event
         Args:
@@ -1345,58 +1077,26 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
             monitored_strategy: monitored strategy (max, min)
             sequence_column_name: name of the sequence column in dataset
             label_column_name: name of the label column in dataset
+            priority: queue priority of the job, higher starts first
+            request: Gradio request, its session hash owns the job
         Returns:
             model_stats: model stats
             status_html: status html
             best_info: best info
         """
-        nonlocal is_training, current_process, stop_thread, process_aborted, monitor
+        session = request.session_hash if request is not None else None
         
-        # If already training, return
-        if is_training:
+        # If this session is already training, return
+        previous = session_monitors.get(session)
+        if previous is not None and previous.is_training:
             yield None, None, None, None, None, None, None
             return
         
-        # Force explicit state reset first thing
-        monitor._reset_tracking()
-        monitor._reset_stats()
-        
-        # Explicitly ensure stats are reset
-        if hasattr(monitor, "stats"):
-            monitor.stats = {}
-        
-        # Force override any cached state in monitor
-        monitor.current_progress = {
-            "current": 0,
-            "total": 0,
-            "epoch": 0,
-            "stage": "Waiting",
-            "progress_detail": "",
-            "best_epoch": -1,
-            "best_metric_name": "",
-            "best_metric_value": 0.0,
-            "elapsed_time": "",
-            "remaining_time": "",
-            "it_per_sec": 0.0,
-            "grad_step": 0,
-            "loss": 0.0,
-            "test_results_html": "",
-            "test_metrics": {},
-            "is_completed": False,
-            "lines": []
-        }
-        
-        # Reset all monitoring data structures
-        monitor.train_losses = []
-        monitor.val_losses = []
-        monitor.metrics = {}
-        monitor.epochs = []
-        if hasattr(monitor, "stats"):
-            monitor.stats = {}
-        
-        # Reset flags for new training session
-        process_aborted = False
-        stop_thread = False
+        # Fresh monitor for every run, jobs of other sessions keep their own
+        monitor = TrainingMonitor()
+        session_monitors[session] = monitor
+        # Version of the data last sent to the plots
+        plot_state = {"version": None}
         
         # Initialize table state
         initial_stats = [
@@ -1471,9 +1171,7 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
             save_arguments(args_dict, args_dict.get('output_dir', 'ckpt'))
             
             # Start training
-            is_training = True
-            process_aborted = False  # Reset abort flag
-            monitor.start_training(args_dict)
+            monitor.start_training(args_dict, priority=int(priority or 0), owner=session)
             current_process = monitor.process  # Store the process reference
             
             starting_status_html = load_html_template("status_starting.html")
@@ -1490,7 +1188,7 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
             update_count = 0
             while True:
                 # Check if the process still exists and hasn't been aborted
-                if process_aborted or (current_process and current_process.poll() is not None):
+                if monitor.aborted or (current_process and current_process.poll() is not None):
                     break
                     
                 try:
@@ -1545,7 +1243,7 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
                     else:
                         model_stats = initial_stats
                     
-                    status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update = update_progress(progress_info)
+                    status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update = update_progress(progress_info, monitor, plot_state)
                     
                     yield model_stats, status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update
                     
@@ -1562,9 +1260,7 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
                     return
             
             # Check if aborted
-            if process_aborted:
-                is_training = False
-                current_process = None
+            if monitor.aborted:
                 aborted_status_html = load_html_template("status_aborted.html")
                 yield initial_stats, aborted_status_html, "Training aborted", gr.update(value="", visible=False), None, None, gr.update(visible=False)
                 return
@@ -1582,7 +1278,7 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
                     else:
                         model_stats = initial_stats
                     
-                    status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update = update_progress(progress_info)
+                    status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update = update_progress(progress_info, monitor, plot_state)
                     
                     yield model_stats, status_html, best_info, test_html_update, loss_fig, metrics_fig, download_btn_update
                 except Exception as e:
@@ -1597,9 +1293,6 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
             # Initialization error, may not have output log
             error_status_html = load_html_template("status_error.html", error_title="Training initialization failed", error_message=str(e))
             yield initial_stats, error_status_html, "Training failed", gr.update(value="", visible=False), None, None, gr.update(visible=False)
-        finally:
-            is_training = False
-            current_process = None
 
     def handle_config_import(config_path: str) -> List[gr.update]:
         """
@@ -1782,7 +1475,7 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
         outputs=[model_stats, progress_status, best_model_info, test_results_html, loss_plot, metrics_plot, download_csv_btn]
     ).then(
         fn=handle_train, 
-        inputs=input_components,
+        inputs=input_components + [train_priority],
         outputs=[model_stats, progress_status, best_model_info, test_results_html, loss_plot, metrics_plot, download_csv_btn]
     )
 
@@ -1792,6 +1485,19 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
         outputs=[progress_status, model_stats, best_model_info, test_results_html, loss_plot, metrics_plot, download_csv_btn]
     )
     
+    # bind job queue controls
+    refresh_jobs_button.click(fn=list_queue_jobs, outputs=[jobs_table])
+    set_priority_button.click(
+        fn=handle_set_job_priority,
+        inputs=[queue_job_id, queue_job_priority],
+        outputs=[queue_status, jobs_table]
+    )
+    cancel_job_button.click(
+        fn=handle_cancel_job,
+        inputs=[queue_job_id],
+        outputs=[queue_status, jobs_table]
+    )
+    
     wandb_logging.change(
         fn=update_wandb_visibility_UI,
         inputs=[wandb_logging],
@@ -1806,6 +1512,9 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
             custom_dataset: custom dataset path
         Returns:
         """
+        # datasets is slow to import, load it with the first preview instead of at startup
+        from datasets import load_dataset
+
         # Determine which dataset to use based on selection
         if dataset_type == "Custom Dataset" and custom_dataset:
             try:
@@ -1984,7 +1693,7 @@ def create_train_tab(constant: Dict[str, Any]) -> Dict[str, Any]:
         "loss_plot": loss_plot,
         "metrics_plot": metrics_plot,
         "train_button": train_button,
-        "monitor": monitor,
+        "session_monitors": session_monitors,
         "test_results_html": test_results_html,  # add test results HTML component
         "components": {
             "plm_model": plm_model,
@@ -1,7 +1,6 @@
 import os
 import json
 import gradio as gr
-from datasets import load_dataset
 
 def load_html_template(name: str, **kwargs) -> str:
     """Load and format an HTML fragment from assets/html_fragments/
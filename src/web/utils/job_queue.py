@@ -0,0 +1,307 @@
+import os
+import heapq
+import queue
+import signal
+import itertools
+import threading
+import subprocess
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Default worker slots when VENUS_JOB_DEVICES is not set: one device, no GPU pinning
+DEFAULT_SLOTS = {None: 2}
+# Finished jobs kept for listing
+MAX_FINISHED_JOBS = 200
+
+
+def parse_device_slots(spec: Optional[str]) -> Dict[Optional[str], int]:
+    """
+    Parse the worker slots of every device.
+
+    params:
+        spec: comma separated devices with an optional slot count, e.g. "0:2,1" runs
+            two jobs on GPU 0 and one on GPU 1. An empty spec uses DEFAULT_SLOTS.
+    return:
+        {device: number of slots}, jobs on a device get it as CUDA_VISIBLE_DEVICES
+    """
+    if not spec:
+        return dict(DEFAULT_SLOTS)
+    slots = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        device, _, count = item.partition(":")
+        slots[device.strip()] = int(count) if count else 1
+    return slots
+
+
+class Job:
+    """
+    A command submitted to the JobQueue.
+
+    Mirrors the parts of subprocess.Popen the tabs rely on (poll, wait, terminate, kill, returncode),
+    so a job can be used where a process was. Output lines go to `output` for the submitting client
+    and to the bounded `log` buffer for listings.
+    """
+    def __init__(self, job_queue: "JobQueue", job_id: str, kind: str, cmd: List[str], priority: int = 0,
+                 owner: Optional[str] = None, env: Optional[Dict[str, str]] = None, log_size: int = 2000):
+        self.id = job_id
+        self.kind = kind
+        self.cmd = cmd
+        self.priority = priority
+        self.owner = owner
+        self.env = env
+        self.status = QUEUED
+        self.device = None
+        self.returncode = None
+        self.process = None
+        self.output = queue.Queue()
+        self.log = deque(maxlen=log_size)
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._queue = job_queue
+        self._entry = None
+        self._done = threading.Event()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def owned_by(self, owner: Optional[str]) -> bool:
+        """Whether the client may change this job, an owner of None is not checked."""
+        return owner is None or self.owner == owner
+
+    def poll(self) -> Optional[int]:
+        return self.returncode if self._done.is_set() else None
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        if not self._done.wait(timeout):
+            raise subprocess.TimeoutExpired(self.cmd, timeout)
+        return self.returncode
+
+    def terminate(self):
+        self._queue.cancel(self.id)
+
+    def kill(self):
+        self._queue.cancel(self.id, sig=signal.SIGKILL)
+
+    def _append(self, line: str):
+        self.log.append(line)
+        self.output.put(line)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "owner": self.owner,
+            "device": self.device,
+            "returncode": self.returncode,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "position": self._queue.position(self.id),
+        }
+
+
+class JobQueue:
+    """
+    Local job queue for the train, eval and predict tabs.
+
+    Jobs wait in a priority queue (higher priority first, then submission order) and run as soon as a
+    worker slot is free. Every device has its own number of slots, configured by VENUS_JOB_DEVICES.
+
+    Example:
+        jobs = get_job_queue()
+        job = jobs.submit("eval", [sys.executable, "src/eval.py", ...], owner=request.session_hash)
+        while job.poll() is None:
+            line = job.output.get()
+    """
+    def __init__(self, slots: Optional[Dict[Optional[str], int]] = None):
+        self.slots = slots if slots is not None else parse_device_slots(os.environ.get("VENUS_JOB_DEVICES"))
+        self._running = {device: 0 for device in self.slots}
+        self._heap = []
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, kind: str, cmd: List[str], priority: int = 0, owner: Optional[str] = None,
+               env: Optional[Dict[str, str]] = None) -> Job:
+        """
+        Queue a command.
+
+        params:
+            kind: job type shown in listings, e.g. "train", "eval" or "predict"
+            cmd: command line of the job
+            priority: jobs with a higher priority start first
+            owner: id of the submitting client, e.g. the Gradio session hash
+            env: extra environment variables of the job
+        return:
+            the queued Job
+        """
+        with self._cond:
+            job = Job(self, f"{kind}-{next(self._ids)}", kind, cmd, priority, owner, env)
+            self._jobs[job.id] = job
+            self._push(job)
+            self._cond.notify_all()
+        return job
+
+    def _push(self, job: Job):
+        job._entry = (-job.priority, next(self._seq), job.id)
+        heapq.heappush(self._heap, job._entry)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [job.summary() for job in self._jobs.values() if owner is None or job.owner == owner]
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Number of queued jobs that start before this one, None if the job is not queued."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return None
+            return sum(1 for entry in self._heap if entry < job._entry and self._is_current(entry))
+
+    def set_priority(self, job_id: str, priority: int, owner: Optional[str] = None) -> bool:
+        """
+        Change the priority of a queued job, returns False if it already started.
+
+        params:
+            owner: only change the job if it was submitted by this client, None skips the check
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED or not job.owned_by(owner):
+                return False
+            job.priority = priority
+            # the old heap entry becomes stale and is skipped by the dispatcher
+            self._push(job)
+            self._cond.notify_all()
+            return True
+
+    def cancel(self, job_id: str, sig: int = signal.SIGTERM, owner: Optional[str] = None) -> bool:
+        """
+        Remove a queued job or signal the process group of a running one.
+
+        params:
+            owner: only cancel the job if it was submitted by this client, None skips the check
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.is_done() or not job.owned_by(owner):
+                return False
+            if job.status == QUEUED:
+                job._entry = None
+                self._finish(job, CANCELLED, -sig)
+                return True
+            job.status = CANCELLED
+            process = job.process
+        try:
+            os.killpg(os.getpgid(process.pid), sig)
+        except (ProcessLookupError, PermissionError, OSError):
+            process.send_signal(sig)
+        return True
+
+    def _is_current(self, entry) -> bool:
+        job = self._jobs.get(entry[2])
+        return job is not None and job._entry is entry and job.status == QUEUED
+
+    def _free_device(self):
+        free = [device for device, count in self.slots.items() if self._running[device] < count]
+        if not free:
+            return None, False
+        # fill the least loaded device first
+        return min(free, key=lambda device: self._running[device] / self.slots[device]), True
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                while self._heap and not self._is_current(self._heap[0]):
+                    heapq.heappop(self._heap)
+                device, has_slot = self._free_device()
+                if not self._heap or not has_slot:
+                    self._cond.wait()
+                    continue
+                job = self._jobs[heapq.heappop(self._heap)[2]]
+                self._start(job, device)
+
+    def _start(self, job: Job, device: Optional[str]):
+        env = os.environ.copy()
+        env.update(job.env or {})
+        if device is not None:
+            env["CUDA_VISIBLE_DEVICES"] = device
+        try:
+            job.process = subprocess.Popen(
+                job.cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                env=env,
+                start_new_session=True
+            )
+        except Exception as e:
+            job._append(f"ERROR: failed to start job: {e}")
+            self._finish(job, FAILED, -1)
+            return
+        job.status = RUNNING
+        job.device = device
+        job.started_at = time.time()
+        self._running[device] += 1
+        watcher = threading.Thread(target=self._watch, args=(job,), daemon=True)
+        watcher.start()
+
+    def _watch(self, job: Job):
+        for line in job.process.stdout:
+            job._append(line.rstrip("\n"))
+        job.process.stdout.close()
+        returncode = job.process.wait()
+        with self._cond:
+            self._running[job.device] -= 1
+            if job.status == CANCELLED:
+                status = CANCELLED
+            else:
+                status = COMPLETED if returncode == 0 else FAILED
+            self._finish(job, status, returncode)
+            self._cond.notify_all()
+
+    def _finish(self, job: Job, status: str, returncode: int):
+        job.status = status
+        job.returncode = returncode
+        job.finished_at = time.time()
+        job._done.set()
+        finished = [job_id for job_id, item in self._jobs.items() if item.is_done()]
+        for job_id in finished[:-MAX_FINISHED_JOBS]:
+            del self._jobs[job_id]
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """The job queue shared by all tabs of the server."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
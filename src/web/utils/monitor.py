@@ -1,31 +1,92 @@
 import threading
 import queue
-import subprocess
-import matplotlib.pyplot as plt
 import numpy as np
 import os
-import signal
 import re
 import time
+import tempfile
+from collections import OrderedDict
 from typing import Dict, Any, Optional
 from .command import build_command_list
+from .job_queue import get_job_queue, QUEUED
 import logging
 import json
 import io
 import base64
 
+LOG_CONTENT_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} - [a-zA-Z]+ - INFO - (.*)')
+TEST_INTERIM_PATTERN = re.compile(r'Batch (\d+)/(\d+): ([a-zA-Z_\-]+) = ([\d.]+)')
+# Stage names of the trainer progress events
+STAGE_NAMES = {'train': 'Training', 'valid': 'Validation', 'test': 'Testing'}
+# Long runs are downsampled to this many points per curve
+MAX_PLOT_POINTS = 500
+# Monitors of finished training jobs kept for lookups by job id
+MAX_FINISHED_MONITORS = 50
+
+# Monitor of every training job, keyed by the queue job id
+_job_monitors = OrderedDict()
+_job_monitors_lock = threading.Lock()
+
+
+def _register_monitor(job_id: str, monitor: "TrainingMonitor"):
+    with _job_monitors_lock:
+        _job_monitors[job_id] = monitor
+        finished = [key for key, item in _job_monitors.items() if not item.is_training]
+        for key in finished[:-MAX_FINISHED_MONITORS]:
+            del _job_monitors[key]
+
+
+def get_job_monitor(job_id: str) -> Optional["TrainingMonitor"]:
+    """Monitor of a training job, None for unknown ids and jobs of other kinds."""
+    with _job_monitors_lock:
+        return _job_monitors.get(job_id)
+
+
+def cancel_job(job_id: str, owner: Optional[str] = None) -> bool:
+    """
+    Cancel any queued or running job by id, training jobs are aborted through their monitor.
+
+    Jobs of other clients are refused if `owner` is given.
+    """
+    job = get_job_queue().get(job_id)
+    if job is not None and not job.owned_by(owner):
+        return False
+    monitor = get_job_monitor(job_id)
+    if monitor is not None and monitor.is_training and monitor.process is not None:
+        monitor.abort_training()
+        return True
+    return get_job_queue().cancel(job_id, owner=owner)
+
+
 class TrainingMonitor:
+    """
+    Progress, metrics and output of one training job.
+
+    Every run gets its own monitor, so concurrent jobs of different users never share state. Started
+    monitors are registered under their queue job id, see get_job_monitor.
+    """
     def __init__(self):
         """Initialize training monitor."""
         # Queues for thread-safe data exchange
         self.stats_queue = queue.Queue()
         self.message_queue = queue.Queue()
         self.is_training = False
+        self.aborted = False
         self.stop_thread = False
         self.process = None
+        self.job_id = None
         self.training_thread = None
         self.debug_progress = False  # Enable for debug info
         
+        # Structured progress events written by the trainer
+        self.progress_file = None
+        self._progress_offset = 0
+        self._progress_lock = threading.Lock()
+        
+        # Plots are only rebuilt when the tracked data changes
+        self._data_version = 0
+        self._plot_cache = {}
+        
         # Metrics tracking
         self._reset_tracking()
         
@@ -95,6 +156,11 @@ class TrainingMonitor:
             'valid_or_test': r'(?:Validating|Valid|Testing|Test):\s*(\d+)%\|[^|]*\|\s*(\d+)/(\d+)\s*\[([\d:]+)<([\d:]+),\s*([\d.]+)it/s(?:[^\]]*)\]',
         }
         
+        # Compile once, every output line of the training process goes through these
+        self.skip_output_patterns = [re.compile(pattern) for pattern in self.skip_output_patterns]
+        self.patterns = {name: re.compile(pattern) for name, pattern in self.patterns.items()}
+        self.progress_patterns = {name: re.compile(pattern) for name, pattern in self.progress_patterns.items()}
+        
         # Test results storage
         self.test_results = {}
         self.parsing_test_results = False
@@ -104,27 +170,36 @@ class TrainingMonitor:
     def _should_skip_line(self, line: str) -> bool:
         """Check if the line should be skipped from output."""
         for pattern in self.skip_output_patterns:
-            if re.search(pattern, line):
+            if pattern.search(line):
                 return True
         return False
     
-    def _process_output(self, process):
-        """Process output from training process in real-time."""
+    def _process_output(self, job):
+        """Process output from the training job in real-time."""
         while True:
             if self.stop_thread:
                 break
-            output = process.stdout.readline()
-            if output == '' and process.poll() is not None:
-                break
-            if output:
-                line = output.strip()
+            try:
+                output = job.output.get(timeout=0.5)
+            except queue.Empty:
+                if job.poll() is not None:
+                    break
+                continue
+            line = output.strip()
+            if line:
                 if not self._should_skip_line(line):
                     self.message_queue.put(line)
                 self._process_output_line(line)
-        process.stdout.close()
         
-    def start_training(self, args: Dict[str, Any]):
-        """Start training process."""
+    def start_training(self, args: Dict[str, Any], priority: int = 0, owner: Optional[str] = None):
+        """
+        Queue the training job of this monitor.
+
+        Args:
+            args: Training arguments
+            priority: Queued jobs with a higher priority start first
+            owner: Id of the submitting client, e.g. the Gradio session hash
+        """
         if self.is_training:
             self.message_queue.put("Training already in progress")
             return
@@ -138,6 +213,12 @@ class TrainingMonitor:
         # Store total epochs for progress calculation
         self.current_progress['total_epochs'] = args.get('num_epochs', 100)
         
+        # Let the trainer report progress as json lines, stdout is then only parsed for model statistics
+        self._remove_progress_file()
+        fd, self.progress_file = tempfile.mkstemp(prefix="venus_progress_", suffix=".jsonl")
+        os.close(fd)
+        args = {**args, 'progress_file': self.progress_file}
+        
         try:
             # Build command
             cmd = build_command_list(args)
@@ -145,15 +226,13 @@ class TrainingMonitor:
             # Log command
             self.message_queue.put(f"Starting training with command: {' '.join(cmd)}")
             
-            # Start process
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
+            # Queue the job, it starts as soon as a worker slot is free
+            self.process = get_job_queue().submit("train", cmd, priority=priority, owner=owner)
+            self.job_id = self.process.id
+            _register_monitor(self.job_id, self)
+            position = get_job_queue().position(self.process.id)
+            if position:
+                self.message_queue.put(f"Training job {self.process.id} queued, {position} job(s) ahead")
             
             # Start thread to process output
             self.training_thread = threading.Thread(
@@ -168,20 +247,165 @@ class TrainingMonitor:
             self.is_training = False
             self.message_queue.put(f"ERROR: {self.error_message}")
             
+    def _remove_progress_file(self):
+        if self.progress_file and os.path.exists(self.progress_file):
+            try:
+                os.remove(self.progress_file)
+            except OSError:
+                pass
+        self.progress_file = None
+        self._progress_offset = 0
+    
+    def _read_progress_events(self):
+        """Apply the progress events the trainer appended since the last call."""
+        if not self.progress_file:
+            return
+        with self._progress_lock:
+            try:
+                with open(self.progress_file, 'rb') as f:
+                    f.seek(self._progress_offset)
+                    chunk = f.read()
+            except OSError:
+                return
+            # The trainer may be in the middle of writing a line, keep it for the next call
+            end = chunk.rfind(b'\n') + 1
+            if end == 0:
+                return
+            self._progress_offset += end
+            for raw_line in chunk[:end].splitlines():
+                try:
+                    event = json.loads(raw_line)
+                except ValueError:
+                    continue
+                try:
+                    self._apply_event(event)
+                except Exception as e:
+                    if self.debug_progress:
+                        print(f"Error applying progress event {event}: {e}")
+    
+    def _apply_event(self, event: Dict[str, Any]):
+        """Update the tracked progress and metrics from one trainer event."""
+        kind = event.get('event')
+        if kind == 'epoch':
+            self.current_epoch = event['epoch']
+            self.current_progress['epoch'] = event['epoch']
+            if event.get('num_epochs'):
+                self.current_progress['total_epochs'] = event['num_epochs']
+        elif kind == 'step':
+            stage = STAGE_NAMES.get(event.get('stage'), 'Training')
+            current, total = event.get('current', 0), event.get('total') or 0
+            elapsed = self._format_interval(event.get('elapsed'))
+            remaining = self._format_interval(event.get('remaining'))
+            it_per_sec = float(event.get('rate') or 0.0)
+            self.current_progress['stage'] = stage
+            self.current_progress['current'] = current
+            self.current_progress['total'] = total
+            self.current_progress['elapsed_time'] = elapsed
+            self.current_progress['remaining_time'] = remaining
+            self.current_progress['it_per_sec'] = it_per_sec
+            detail = f"{current}/{total}[{elapsed}<{remaining},{it_per_sec:.2f}it/s"
+            if stage == 'Training':
+                self.current_progress['grad_step'] = event.get('grad_step', 0)
+                self.current_progress['loss'] = float(event.get('loss', 0.0))
+                detail += f",grad_step={event.get('grad_step', 0)},train_loss={event.get('loss', 0.0):.4f}"
+            self.current_progress['progress_detail'] = detail + "]"
+        elif kind == 'train_epoch':
+            self._record_train_loss(event['epoch'], event['loss'])
+        elif kind == 'val_epoch':
+            self._record_val_loss(event['epoch'], event['loss'])
+            for metric_name, metric_value in event.get('metrics', {}).items():
+                self._record_val_metric(event['epoch'], metric_name.lower(), metric_value)
+        elif kind == 'best':
+            self.current_epoch = event.get('epoch', self.current_epoch)
+            self._record_best(event['metric'].lower(), float(event['value']))
+        elif kind == 'test_start':
+            self.current_progress['stage'] = 'Testing'
+            self.current_progress['test_metrics'] = {}
+            self.current_progress['test_results_html'] = ''
+        elif kind == 'test':
+            self.current_progress['stage'] = 'Testing'
+            self.test_results = {'loss': float(event['loss'])}
+            for metric_name, metric_value in event.get('metrics', {}).items():
+                self.test_results[metric_name.lower()] = float(metric_value)
+            self._update_test_results_display()
+    
+    @staticmethod
+    def _format_interval(seconds) -> str:
+        """Format seconds like tqdm does, e.g. 01:23 or 1:02:03."""
+        if seconds is None:
+            return ''
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+        return f"{minutes:02d}:{seconds:02d}"
+    
+    def _ensure_epoch(self, epoch: int) -> int:
+        """Return the index of an epoch in the tracked lists, adding it if needed."""
+        if epoch not in self.epochs:
+            self.epochs.append(epoch)
+            if len(self.train_losses) < len(self.epochs):
+                self.train_losses.append(None)
+        return self.epochs.index(epoch)
+    
+    def _record_train_loss(self, epoch: int, loss: float):
+        self.current_progress['epoch'] = epoch
+        self.current_progress['loss'] = float(loss)
+        self.current_epoch = epoch
+        idx = self._ensure_epoch(epoch)
+        self.train_losses[idx] = float(loss)
+        self._data_version += 1
+    
+    def _record_val_loss(self, epoch: int, loss: float):
+        idx = self._ensure_epoch(epoch)
+        # Keep val_losses and val_metrics['loss'] aligned with the epochs list
+        while len(self.val_losses) < len(self.epochs):
+            self.val_losses.append(None)
+        self.val_losses[idx] = float(loss)
+        self.val_metrics.setdefault('loss', [])
+        while len(self.val_metrics['loss']) < len(self.epochs):
+            self.val_metrics['loss'].append(None)
+        self.val_metrics['loss'][idx] = float(loss)
+        self._data_version += 1
+    
+    def _record_val_metric(self, epoch: int, metric_name: str, metric_value: float):
+        if metric_name == 'accuracy' or metric_name == 'acc':
+            self.current_progress['val_accuracy'] = float(metric_value)
+        idx = self._ensure_epoch(epoch)
+        self.val_metrics.setdefault(metric_name, [])
+        while len(self.val_metrics[metric_name]) < len(self.epochs):
+            self.val_metrics[metric_name].append(None)
+        self.val_metrics[metric_name][idx] = float(metric_value)
+        self._data_version += 1
+    
+    def _record_best(self, metric_name: str, metric_value: float):
+        # 更新Best Performance信息
+        self.current_progress['best_metric_name'] = metric_name
+        self.current_progress['best_metric_value'] = metric_value
+        self.current_progress['best_epoch'] = self.current_epoch
+        
+        # 如果是accuracy指标，同时更新best_accuracy
+        if metric_name == 'accuracy':
+            self.current_progress['best_accuracy'] = metric_value
+        
+        print(f"Best model updated - Metric: {metric_name}, Value: {metric_value}, Epoch: {self.current_epoch}")
+        
+        # 将最佳模型信息添加到消息队列，确保UI能够显示
+        best_model_msg = f"Best model saved at epoch {self.current_epoch} with {metric_name}: {metric_value:.4f}"
+        self.message_queue.put(best_model_msg)
+    
     def abort_training(self):
         """Abort the training process."""
         if self.process:
             # Save completed state before termination
             was_completed = self.current_progress.get('is_completed', False)
             
-            # Terminate process
-            try:
-                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
-            except:
-                self.process.terminate()
+            # Cancel the job, this also removes it from the queue if it has not started yet
+            self.process.terminate()
             
             # Mark as not training
             self.is_training = False
+            self.aborted = True
             
             # Fully reset the tracking state
             self._reset_tracking()
@@ -215,6 +439,7 @@ class TrainingMonitor:
             
             # Clear process reference
             self.process = None
+            self._remove_progress_file()
             
         # Return reset state
         return {
@@ -240,13 +465,53 @@ class TrainingMonitor:
             
         return message_text
     
+    def get_plot_version(self) -> int:
+        """Version of the plotted data, it changes whenever a new point arrives."""
+        self._read_progress_events()
+        return self._data_version
+    
     def get_loss_plot(self):
         """
-        Generate a static plot showing training and validation loss.
+        Return the loss plot, rebuilt only when new points arrived since the last call.
+        
+        Returns:
+            matplotlib Figure object for display in gr.Plot
+        """
+        return self._get_cached_plot('loss', self._render_loss_plot)
+    
+    def get_metrics_plot(self):
+        """
+        Return the validation metrics plot, rebuilt only when new points arrived since the last call.
         
         Returns:
             matplotlib Figure object for display in gr.Plot
         """
+        return self._get_cached_plot('metrics', self._render_metrics_plot)
+    
+    def _get_cached_plot(self, name: str, render):
+        self._read_progress_events()
+        cached = self._plot_cache.get(name)
+        if cached is not None and cached[0] == self._data_version:
+            return cached[1]
+        # Close only the previous figure of this plot, the other one is still cached
+        if cached is not None and cached[1] is not None:
+            # matplotlib is imported by the renderers, not when the Web UI starts
+            import matplotlib.pyplot as plt
+            plt.close(cached[1])
+        fig = render()
+        self._plot_cache[name] = (self._data_version, fig)
+        return fig
+    
+    @staticmethod
+    def _downsample(x, y):
+        """Keep at most MAX_PLOT_POINTS evenly spaced points of a curve, the last point is always kept."""
+        if len(x) <= MAX_PLOT_POINTS:
+            return x, y
+        indices = np.unique(np.linspace(0, len(x) - 1, MAX_PLOT_POINTS).round().astype(int))
+        return [x[i] for i in indices], [y[i] for i in indices]
+    
+    def _render_loss_plot(self):
+        """Generate a static plot showing training and validation loss."""
         # Return None if insufficient data
         if not self.epochs or (not self.train_losses and not self.val_losses):
             return None
@@ -255,9 +520,6 @@ class TrainingMonitor:
             import matplotlib.pyplot as plt
             import matplotlib
             
-            # Close any existing figures to prevent memory leaks
-            plt.close('all')
-            
             # 设置科研风格的matplotlib样式
             plt.style.use('seaborn-v0_8-whitegrid')
             matplotlib.rcParams.update({
@@ -289,6 +551,7 @@ class TrainingMonitor:
                 if valid_indices:  # 确保有有效数据
                     valid_epochs = [self.epochs[i] for i in valid_indices]
                     valid_losses = [self.train_losses[i] for i in valid_indices]
+                    valid_epochs, valid_losses = self._downsample(valid_epochs, valid_losses)
                     ax.plot(valid_epochs, valid_losses, 'o-', label='Train Loss', 
                             color='#1f77b4', linewidth=2, markersize=6, markeredgecolor='white', 
                             markeredgewidth=1.5)
@@ -299,6 +562,7 @@ class TrainingMonitor:
                 if valid_indices:  # 确保有有效数据
                     valid_epochs = [self.epochs[i] for i in valid_indices]
                     valid_losses = [self.val_losses[i] for i in valid_indices]
+                    valid_epochs, valid_losses = self._downsample(valid_epochs, valid_losses)
                     ax.plot(valid_epochs, valid_losses, 'o-', label='Validation Loss', 
                             color='#ff7f0e', linewidth=2, markersize=6, markeredgecolor='white', 
                             markeredgewidth=1.5)
@@ -333,13 +597,8 @@ class TrainingMonitor:
             plt.close('all')  # Close any open figures in case of error
             return None
     
-    def get_metrics_plot(self):
-        """
-        Generate a static plot showing validation metrics.
-        
-        Returns:
-            matplotlib Figure object for display in gr.Plot
-        """
+    def _render_metrics_plot(self):
+        """Generate a static plot showing validation metrics."""
         # Return None if insufficient data
         if not self.epochs or not self.val_metrics:
             return None
@@ -348,9 +607,6 @@ class TrainingMonitor:
             import matplotlib.pyplot as plt
             import matplotlib
             
-            # Close any existing figures to prevent memory leaks
-            plt.close('all')
-            
             # 设置科研风格的matplotlib样式
             plt.style.use('seaborn-v0_8-whitegrid')
             matplotlib.rcParams.update({
@@ -390,6 +646,7 @@ class TrainingMonitor:
                         has_valid_data = True
                         valid_epochs = [self.epochs[i] for i in valid_indices]
                         valid_values = [values[i] for i in valid_indices]
+                        valid_epochs, valid_values = self._downsample(valid_epochs, valid_values)
                         
                         # 确保所有值都不超过1.0
                         valid_values = [min(val, 1.0) for val in valid_values]
@@ -471,9 +728,16 @@ class TrainingMonitor:
     
     def get_progress(self) -> Dict[str, Any]:
         """Return current progress information."""
+        self._read_progress_events()
+        
         # Ensure we're returning a deep copy to prevent reference issues
         progress_copy = self.current_progress.copy()
         
+        # Show the queue position until the job gets a worker slot
+        if self.process is not None and getattr(self.process, 'status', None) == QUEUED:
+            position = get_job_queue().position(self.process.id) or 0
+            progress_copy['stage'] = f"Queued ({position} job(s) ahead)"
+        
         # Ensure all expected keys have default values if missing
         default_progress = {
             'stage': 'Waiting',
@@ -519,13 +783,18 @@ class TrainingMonitor:
             if len(self.current_progress['lines']) > max_lines:
                 self.current_progress['lines'] = self.current_progress['lines'][-max_lines:]
             
+            # Progress and metrics arrive as structured events, stdout only carries the model statistics
+            if self.progress_file:
+                self._process_stats_line(line)
+                return
+            
             # Always check for test progress if in Testing stage
             if self.current_progress.get('stage') == 'Testing':
                 if self._process_test_progress(line):
                     return
             
             # Check for test phase start
-            if re.search(self.patterns['test_phase_start'], line):
+            if self.patterns['test_phase_start'].search(line):
                 self.current_progress['stage'] = 'Testing'
                 # Reset test metrics at the start of test phase
                 self.current_progress['test_metrics'] = {}
@@ -533,7 +802,7 @@ class TrainingMonitor:
                 return
             
             # Check for epoch header pattern (e.g., "---------- Epoch 1 ----------")
-            epoch_header_match = re.search(self.patterns['epoch_header'], line)
+            epoch_header_match = self.patterns['epoch_header'].search(line)
             if epoch_header_match:
                 new_epoch = int(epoch_header_match.group(1))
                 # Update current epoch
@@ -544,7 +813,7 @@ class TrainingMonitor:
                 return
             
             # Detect test results header
-            if re.search(self.patterns['test_header'], line):
+            if self.patterns['test_header'].search(line):
                 self.parsing_test_results = True
                 self.test_results = {}
                 # Set stage to 'Testing' when we see the test results header
@@ -553,7 +822,7 @@ class TrainingMonitor:
             
             # Extract the actual content part of the log line if it contains timestamp and INFO
             log_content = line
-            log_match = re.search(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} - [a-zA-Z]+ - INFO - (.*)', line)
+            log_match = LOG_CONTENT_PATTERN.search(line)
             if log_match:
                 log_content = log_match.group(1)
                 
@@ -561,7 +830,7 @@ class TrainingMonitor:
                 collected_new_metric = False
                 
                 # 尝试匹配测试损失值
-                test_loss_match = re.search(self.patterns['test_loss'], log_content)
+                test_loss_match = self.patterns['test_loss'].search(log_content)
                 if test_loss_match:
                     loss_value = float(test_loss_match.group(1))
                     self.test_results['loss'] = loss_value
@@ -570,7 +839,7 @@ class TrainingMonitor:
                         print(f"Matched test loss: {loss_value}")
                 
                 # 特别处理f1指标
-                test_f1_match = re.search(self.patterns['test_f1'], log_content)
+                test_f1_match = self.patterns['test_f1'].search(log_content)
                 if test_f1_match and not test_loss_match:
                     f1_value = float(test_f1_match.group(1))
                     self.test_results['f1'] = f1_value
@@ -580,7 +849,7 @@ class TrainingMonitor:
                 
                 # 尝试匹配常见指标
                 if not test_loss_match and not test_f1_match:
-                    common_metric_match = re.search(self.patterns['test_common_metrics'], log_content)
+                    common_metric_match = self.patterns['test_common_metrics'].search(log_content)
                     if common_metric_match:
                         metric_name, metric_value = common_metric_match.groups()
                         metric_name = metric_name.strip().lower()
@@ -596,7 +865,7 @@ class TrainingMonitor:
                 
                 # 尝试匹配其他测试指标
                 if not test_loss_match and not test_f1_match and not (locals().get('common_metric_match')):
-                    test_metric_match = re.search(self.patterns['test_metric'], log_content)
+                    test_metric_match = self.patterns['test_metric'].search(log_content)
                     if test_metric_match:
                         metric_name, metric_value = test_metric_match.groups()
                         metric_name = metric_name.strip().lower()
@@ -630,70 +899,11 @@ class TrainingMonitor:
                 return
             
             # Parse model parameter statistics
-            if "Model Parameters Statistics:" in line:
-                self.current_stats = {}
-                self.parsing_stats = True
-                self.skipped_first_separator = False
-                return
-            
-            if self.parsing_stats:
-                # Handle separator line
-                if "------------------------" in line:
-                    # If this is the first separator line, skip it
-                    if not self.skipped_first_separator:
-                        self.skipped_first_separator = True
-                        return
-                    
-                    # If it's the last separator line, check if we have enough information
-                    required_keys = ["adapter_total", "adapter_trainable", 
-                                    "pretrain_total", "pretrain_trainable", 
-                                    "combined_total", "combined_trainable", 
-                                    "trainable_percentage"]
-                    
-                    missing_keys = [key for key in required_keys if key not in self.current_stats]
-                    
-                    if not missing_keys:
-                        # Put statistics in queue
-                        self.stats_queue.put(self.current_stats.copy())
-                        # Update cache
-                        self.last_stats.update(self.current_stats)
-                    
-                    self.parsing_stats = False
-                    self.current_model = None
-                    self.skipped_first_separator = False
-                    return
-                
-                # If first separator not yet skipped, don't process other lines
-                if not self.skipped_first_separator:
-                    return
-                
-                # Match model name sections
-                if "Adapter Model:" in line:
-                    self.current_model = "adapter"
-                    return
-                elif "Pre-trained Model:" in line:
-                    self.current_model = "pretrain"
-                    return
-                elif "Combined:" in line:
-                    self.current_model = "combined"
-                    return
-                
-                # Parse parameter information
-                param_match = re.search(self.patterns['model_param'], line)
-                if param_match and self.current_model:
-                    stat_name, stat_value = param_match.groups()
-                    stat_name = stat_name.strip().lower()
-                    
-                    if "total parameters" in stat_name:
-                        self.current_stats[f"{self.current_model}_total"] = stat_value
-                    elif "trainable parameters" in stat_name:
-                        self.current_stats[f"{self.current_model}_trainable"] = stat_value
-                    elif "trainable percentage" in stat_name and self.current_model == "combined":
-                        self.current_stats["trainable_percentage"] = stat_value
+            if self._process_stats_line(line):
                 return
             
             # Process training progress
-            train_progress_match = re.search(self.progress_patterns['train'], line)
+            train_progress_match = self.progress_patterns['train'].search(line)
             if train_progress_match:
                 percentage, current, total, elapsed, remaining, it_per_sec = train_progress_match.groups()[:6]
                 grad_step = train_progress_match.group(7) if len(train_progress_match.groups()) >= 7 and train_progress_match.group(7) else "0"
@@ -717,7 +927,7 @@ class TrainingMonitor:
                 return
             
             # Validation or Testing progress - consolidated since they use same tqdm format
-            valid_or_test_match = re.search(self.progress_patterns['valid_or_test'], line)
+            valid_or_test_match = self.progress_patterns['valid_or_test'].search(line)
             if valid_or_test_match:
                 percentage, current, total, elapsed, remaining, it_per_sec = valid_or_test_match.groups()
                 
@@ -737,141 +947,31 @@ class TrainingMonitor:
                 return
             
             # Parse training loss
-            train_match = re.search(self.patterns['train'], line)
+            train_match = self.patterns['train'].search(line)
             if train_match:
                 epoch, loss = train_match.groups()
-                current_epoch = int(epoch)
-                
-                self.current_progress['epoch'] = current_epoch
-                self.current_progress['loss'] = float(loss)
-                self.current_epoch = current_epoch
-                
-                # Add new epoch to epochs list
-                if current_epoch not in self.epochs:
-                    self.epochs.append(current_epoch)
-                    self.train_losses.append(float(loss))
-                else:
-                    # Update existing epoch
-                    idx = self.epochs.index(current_epoch)
-                    self.train_losses[idx] = float(loss)
+                self._record_train_loss(int(epoch), float(loss))
                 return
             
             # Parse validation loss
-            val_match = re.search(self.patterns['val'], line)
+            val_match = self.patterns['val'].search(line)
             if val_match:
                 epoch, loss = val_match.groups()
-                current_epoch = int(epoch)
-                
-                # Ensure current epoch exists
-                if current_epoch not in self.epochs:
-                    self.epochs.append(current_epoch)
-                    if len(self.train_losses) < len(self.epochs):
-                        self.train_losses.append(None)
-                
-                idx = self.epochs.index(current_epoch)
-                
-                # Ensure val_losses list matches epochs list length
-                while len(self.val_losses) < len(self.epochs):
-                    self.val_losses.append(None)
-                
-                # Update val_losses at correct position
-                self.val_losses[idx] = float(loss)
-                
-                # Also update val_metrics dictionary
-                if 'loss' not in self.val_metrics:
-                    self.val_metrics['loss'] = []
-                
-                # Ensure val_metrics['loss'] matches epochs length
-                while len(self.val_metrics['loss']) < len(self.epochs):
-                    self.val_metrics['loss'].append(None)
-                
-                # Update val_metrics['loss'] at correct position
-                self.val_metrics['loss'][idx] = float(loss)
+                self._record_val_loss(int(epoch), float(loss))
                 return
             
             # Parse validation metrics
-            val_metric_match = re.search(self.patterns['val_metric'], line)
+            val_metric_match = self.patterns['val_metric'].search(line)
             if val_metric_match:
                 epoch, metric_name, metric_value = val_metric_match.groups()
-                current_epoch = int(epoch)
-                metric_name = metric_name.strip().lower()
-                
-                # Handle different possible metrics
-                if metric_name == 'accuracy' or metric_name == 'acc':
-                    self.current_progress['val_accuracy'] = float(metric_value)
-                
-                # Ensure current epoch exists
-                if current_epoch not in self.epochs:
-                    self.epochs.append(current_epoch)
-                    if len(self.train_losses) < len(self.epochs):
-                        self.train_losses.append(None)
-                
-                # Add to corresponding metric list
-                if metric_name not in self.val_metrics:
-                    self.val_metrics[metric_name] = []
-                
-                # Ensure list length matches epochs
-                while len(self.val_metrics[metric_name]) < len(self.epochs):
-                    self.val_metrics[metric_name].append(None)
-                
-                idx = self.epochs.index(current_epoch)
-                self.val_metrics[metric_name][idx] = float(metric_value)
+                self._record_val_metric(int(epoch), metric_name.strip().lower(), float(metric_value))
                 return
             
-            # 首先检查原始行是否包含"Saving model with best val"
-            if "Saving model with best val" in line:
-                # 直接从原始行提取信息，避免依赖正则表达式
-                try:
-                    # 尝试直接解析行内容
-                    parts = line.split("Saving model with best val ")[1].split(": ")
-                    if len(parts) == 2:
-                        metric_name = parts[0].strip().lower()
-                        metric_value = float(parts[1].strip())
-                        
-                        # 更新Best Performance信息
-                        self.current_progress['best_metric_name'] = metric_name
-                        self.current_progress['best_metric_value'] = metric_value
-                        self.current_progress['best_epoch'] = self.current_epoch
-                        
-                        # 如果是accuracy指标，同时更新best_accuracy
-                        if metric_name == 'accuracy':
-                            self.current_progress['best_accuracy'] = metric_value
-                        
-                        # 记录调试信息
-                        print(f"Best model updated - Metric: {metric_name}, Value: {metric_value}, Epoch: {self.current_epoch}")
-                        
-                        # 将最佳模型信息添加到消息队列，确保UI能够显示
-                        best_model_msg = f"Best model saved at epoch {self.current_epoch} with {metric_name}: {metric_value:.4f}"
-                        self.message_queue.put(best_model_msg)
-                        
-                        return
-                except Exception as e:
-                    print(f"Error parsing best model info: {e}, line: {line}")
-            
-            # 如果直接解析失败，尝试使用正则表达式
             # Match best model save info: e.g., "Saving model with best val accuracy: 0.9088"
-            best_save_match = re.search(self.patterns['best_save'], log_content)
+            best_save_match = self.patterns['best_save'].search(log_content)
             if best_save_match:
                 metric_name, metric_value = best_save_match.groups()
-                metric_name = metric_name.strip().lower()
-                metric_value = float(metric_value)
-                
-                # 更新Best Performance信息
-                self.current_progress['best_metric_name'] = metric_name
-                self.current_progress['best_metric_value'] = metric_value
-                self.current_progress['best_epoch'] = self.current_epoch
-                
-                # 如果是accuracy指标，同时更新best_accuracy
-                if metric_name == 'accuracy':
-                    self.current_progress['best_accuracy'] = metric_value
-                
-                # 记录调试信息
-                print(f"Best model updated (regex) - Metric: {metric_name}, Value: {metric_value}, Epoch: {self.current_epoch}")
-                
-                # 将最佳模型信息添加到消息队列，确保UI能够显示
-                best_model_msg = f"Best model saved at epoch {self.current_epoch} with {metric_name}: {metric_value:.4f}"
-                self.message_queue.put(best_model_msg)
-                
+                self._record_best(metric_name.strip().lower(), float(metric_value))
                 return
                 
             # 检查进程是否已经结束
@@ -891,8 +991,77 @@ class TrainingMonitor:
                 print(error_msg)
                 print(f"Line content: {line}")
     
+    def _process_stats_line(self, line: str) -> bool:
+        """Parse the model parameter statistics block, returns True if the line belongs to it."""
+        if "Model Parameters Statistics:" in line:
+            self.current_stats = {}
+            self.parsing_stats = True
+            self.skipped_first_separator = False
+            return True
+        
+        if not self.parsing_stats:
+            return False
+        
+        # Handle separator line
+        if "------------------------" in line:
+            # If this is the first separator line, skip it
+            if not self.skipped_first_separator:
+                self.skipped_first_separator = True
+                return True
+            
+            # If it's the last separator line, check if we have enough information
+            required_keys = ["adapter_total", "adapter_trainable", 
+                            "pretrain_total", "pretrain_trainable", 
+                            "combined_total", "combined_trainable", 
+                            "trainable_percentage"]
+            
+            missing_keys = [key for key in required_keys if key not in self.current_stats]
+            
+            if not missing_keys:
+                # Put statistics in queue
+                self.stats_queue.put(self.current_stats.copy())
+                # Update cache
+                self.last_stats.update(self.current_stats)
+            
+            self.parsing_stats = False
+            self.current_model = None
+            self.skipped_first_separator = False
+            return True
+        
+        # If first separator not yet skipped, don't process other lines
+        if not self.skipped_first_separator:
+            return True
+        
+        # Match model name sections
+        if "Adapter Model:" in line:
+            self.current_model = "adapter"
+            return True
+        elif "Pre-trained Model:" in line:
+            self.current_model = "pretrain"
+            return True
+        elif "Combined:" in line:
+            self.current_model = "combined"
+            return True
+        
+        # Parse parameter information
+        param_match = self.patterns['model_param'].search(line)
+        if param_match and self.current_model:
+            stat_name, stat_value = param_match.groups()
+            stat_name = stat_name.strip().lower()
+            
+            if "total parameters" in stat_name:
+                self.current_stats[f"{self.current_model}_total"] = stat_value
+            elif "trainable parameters" in stat_name:
+                self.current_stats[f"{self.current_model}_trainable"] = stat_value
+            elif "trainable percentage" in stat_name and self.current_model == "combined":
+                self.current_stats["trainable_percentage"] = stat_value
+        return True
+
     def _reset_tracking(self):
         """重置所有跟踪状态"""
+        # Invalidate cached plots, the version keeps increasing across runs
+        self._data_version += 1
+        
         # 重置指标跟踪
         self.train_losses = []
         self.val_losses = []
@@ -1118,7 +1287,7 @@ class TrainingMonitor:
     def _process_test_progress(self, line: str):
         """Process test progress from output lines during testing phase."""
         # Parse intermediate test results if available
-        test_metric_interim_match = re.search(r'Batch (\d+)/(\d+): ([a-zA-Z_\-]+) = ([\d.]+)', line)
+        test_metric_interim_match = TEST_INTERIM_PATTERN.search(line)
         if test_metric_interim_match:
             batch, total_batches, metric_name, metric_value = test_metric_interim_match.groups()
             progress = int(batch) / int(total_batches) * 100
@@ -1136,6 +1305,8 @@ class TrainingMonitor:
     def check_process_status(self):
         """Check if the training process has completed."""
         if self.process and self.process.poll() is not None:
+            # Apply the last events before reporting the final state
+            self._read_progress_events()
             self.is_training = False
             
             # Check for normal vs error termination based on return code
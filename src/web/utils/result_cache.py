@@ -0,0 +1,202 @@
+import os
+import ast
+import hashlib
+import importlib.util
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional
+import pandas as pd
+
+# Bump to invalidate every entry, e.g. when the stored table layout changes
+CACHE_VERSION = 2
+# Files up to this size are versioned by their content, larger ones (checkpoints) by size and mtime
+CONTENT_VERSION_LIMIT = 1 << 20
+# Root of the `src.` imports of the prediction scripts
+REPO_ROOT = Path(__file__).resolve().parents[3]
+
+
+def input_digest(file_path: str, include_headers: bool = False) -> str:
+    """
+    Hash the content of an input file.
+
+    FASTA files are hashed by their ordered sequences, so the same protein typed into the chat or
+    uploaded with different line wrapping maps to the same entry. The headers are only hashed with
+    `include_headers`, for results that are labelled by them. Other files are hashed as bytes.
+    """
+    digest = hashlib.sha256()
+    if str(file_path).lower().endswith((".fasta", ".fa")):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith(">"):
+                    digest.update(line.encode() + b"\n" if include_headers else b">")
+                elif line:
+                    digest.update(line.upper().encode())
+    else:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def path_version(path) -> str:
+    """Version of a script or checkpoint, a directory is versioned by the files directly inside it."""
+    path = Path(path)
+    if not path.exists():
+        return f"{path}:missing"
+    if path.is_dir():
+        return ";".join(path_version(child) for child in sorted(path.iterdir()) if child.is_file())
+    stat = path.stat()
+    if stat.st_size <= CONTENT_VERSION_LIMIT:
+        return f"{path.name}:{hashlib.sha256(path.read_bytes()).hexdigest()}"
+    return f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _module_file(module: str) -> Optional[Path]:
+    path = REPO_ROOT.joinpath(*module.split("."))
+    if path.with_suffix(".py").is_file():
+        return path.with_suffix(".py")
+    if (path / "__init__.py").is_file():
+        return path / "__init__.py"
+    return None
+
+
+@lru_cache(maxsize=256)
+def _direct_dependencies(path: Path, mtime_ns: int) -> tuple:
+    """Files of the `src.` modules a script imports, the mtime only invalidates this memo."""
+    try:
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        return ()
+    modules = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            modules.append(node.module)
+            # `from src.mutation import utils` imports a module as well
+            modules += [f"{node.module}.{alias.name}" for alias in node.names]
+    files = (_module_file(module) for module in modules if module == "src" or module.startswith("src."))
+    return tuple(sorted({file for file in files if file is not None}))
+
+
+def script_dependencies(script_path) -> List[Path]:
+    """A script and every repository module it imports, directly or through other modules."""
+    script_path = Path(script_path).resolve()
+    seen, stack = set(), [script_path]
+    while stack:
+        path = stack.pop()
+        if path in seen or not path.is_file():
+            continue
+        seen.add(path)
+        stack.extend(_direct_dependencies(path, path.stat().st_mtime_ns))
+    return sorted(seen)
+
+
+class ResultCache:
+    """
+    Content addressed cache of prediction tables shared by the Quick Tools, Advanced Tools and the chat agent.
+
+    Entries are keyed by the input file content, the model and the version of the prediction script
+    and of every repository module it imports (plus the adapter checkpoints for function predictions).
+    They are stored as parquet files, or as pickles if pyarrow is not installed. When the cache grows
+    beyond `max_bytes` the least recently used entries are removed.
+
+    Args:
+        cache_dir: Directory of the cache, VENUS_RESULT_CACHE_DIR or temp_outputs/result_cache by default
+        max_bytes: Size limit, VENUS_RESULT_CACHE_MB (default 512) megabytes by default, 0 disables the cache
+    """
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or os.environ.get("VENUS_RESULT_CACHE_DIR", "temp_outputs/result_cache"))
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("VENUS_RESULT_CACHE_MB", 512)) * (1 << 20))
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.enabled = max_bytes > 0
+        self.suffix = ".parquet" if importlib.util.find_spec("pyarrow") is not None else ".pkl"
+
+    def make_key(self, input_file: str, model_name: str, version_paths: Iterable = (), extra: Iterable[str] = (),
+                 include_headers: bool = False) -> str:
+        """
+        Args:
+            input_file: FASTA or PDB file the prediction runs on
+            model_name: Name of the model
+            version_paths: Scripts and checkpoints whose change invalidates the entry, the repository
+                modules imported by the scripts are versioned as well
+            extra: Other settings of the prediction, e.g. the adapter datasets
+            include_headers: Key FASTA inputs by their headers too, for tables with a header column
+        """
+        paths = []
+        for path in version_paths:
+            paths += script_dependencies(path) if str(path).endswith(".py") else [path]
+        parts = [str(CACHE_VERSION), input_digest(input_file, include_headers), model_name]
+        parts += [path_version(path) for path in dict.fromkeys(paths)]
+        parts += [str(item) for item in extra]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path) if self.suffix == ".parquet" else pd.read_pickle(path)
+        except (FileNotFoundError, OSError, ValueError, EOFError):
+            return None
+        # mark as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return df
+
+    def put(self, key: str, df: pd.DataFrame):
+        if not self.enabled or df is None or df.empty:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            if self.suffix == ".parquet":
+                df.to_parquet(tmp_path, index=False, compression="zstd")
+            else:
+                df.reset_index(drop=True).to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Failed to cache prediction results: {e}")
+            if tmp_path.exists():
+                tmp_path.unlink()
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for path in self.cache_dir.glob(f"*/*{self.suffix}"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                except OSError:
+                    pass
+
+
+_result_cache = None
+
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
@@ -1,77 +1,190 @@
 import json
 import os
+import time
+import atexit
+import sqlite3
+import threading
 from datetime import datetime
 
+TRACKED_MODULES = ("mutation_prediction", "function_analysis", "total_visits")
+
+
 class StatsManager:
-    def __init__(self):
-        self.stats_file = "data/usage_stats.json"
-        self.backup_file = "data/usage_stats_backup.json"
+    """
+    Usage statistics stored as an append-only event table in SQLite (WAL mode).
+
+    track_usage only appends to an in-memory buffer, a background thread writes the buffer in one
+    transaction every `flush_interval` seconds or `flush_size` events. Counts are aggregated on read,
+    so several uvicorn workers can share the database without rewriting each other's state.
+    """
+    def __init__(self, db_file="data/usage_stats.db", flush_interval=0.5, flush_size=1000, compact_every=1200):
+        self.db_file = db_file
+        self.legacy_stats_file = "data/usage_stats.json"
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.compact_every = compact_every
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._local = threading.local()
         self.ensure_data_dir()
-        self.load_stats()
-    
+        self._init_db()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
     def ensure_data_dir(self):
         """Ensure data directory exists"""
-        os.makedirs("data", exist_ok=True)
-    
-    def load_stats(self):
-        """Load statistics data"""
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+
+    def _connect(self):
+        # one connection per thread, sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            if os.path.exists(self.stats_file):
-                with open(self.stats_file, 'r', encoding='utf-8') as f:
-                    self.stats = json.load(f)
-            elif os.path.exists(self.backup_file):
-                with open(self.backup_file, 'r', encoding='utf-8') as f:
-                    self.stats = json.load(f)
-                self.save_stats()
-            else:
-                self.stats = self.get_default_stats()
-                self.save_stats()
-        except Exception as e:
-            print(f"Error loading stats: {e}")
-            self.stats = self.get_default_stats()
-    
-    def save_stats(self):
-        """Save statistics data"""
+            conn.execute("CREATE TABLE IF NOT EXISTS events (module TEXT NOT NULL, ts REAL NOT NULL)")
+            # counts carried over from the former JSON file or folded in by compact()
+            conn.execute("CREATE TABLE IF NOT EXISTS baseline (module TEXT PRIMARY KEY, count INTEGER NOT NULL, ts REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            migrated = conn.execute("SELECT value FROM meta WHERE key = 'legacy_json_imported'").fetchone()
+            if migrated is None:
+                self._import_legacy_stats(conn)
+                conn.execute("INSERT INTO meta VALUES ('legacy_json_imported', ?)", (datetime.now().isoformat(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _import_legacy_stats(self, conn):
+        """Carry over the counts of the JSON stats file used before."""
+        if not os.path.exists(self.legacy_stats_file):
+            return
         try:
-            temp_file = self.stats_file + ".tmp"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(self.stats, f, indent=2, ensure_ascii=False)
-            
-            if os.path.exists(self.stats_file):
-                import shutil
-                shutil.copy2(self.stats_file, self.backup_file)
-            
-            os.replace(temp_file, self.stats_file)
+            with open(self.legacy_stats_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
         except Exception as e:
-            print(f"Error saving stats: {e}")
-    
+            print(f"Error loading legacy stats: {e}")
+            return
+        now = time.time()
+        for module in TRACKED_MODULES:
+            if isinstance(legacy.get(module), int):
+                conn.execute("INSERT OR REPLACE INTO baseline VALUES (?, ?, ?)", (module, legacy[module], now))
+
     def track_usage(self, module):
-        """Track feature usage count"""
-        if module in self.stats:
-            self.stats[module] += 1
-            self.stats["last_updated"] = datetime.now().isoformat()
-            self.save_stats()
-            return True
-        return False
-    
+        """Track feature usage count, the event is written by the background flush."""
+        if module not in TRACKED_MODULES:
+            return False
+        with self._buffer_lock:
+            self._buffer.append((module, time.time()))
+            full = len(self._buffer) >= self.flush_size
+        if full:
+            self._wakeup.set()
+        return True
+
+    def _flush_loop(self):
+        rounds = 0
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            rounds += 1
+            try:
+                self.flush()
+                # about every 10 minutes by default, keeps the aggregation on read cheap
+                if rounds % self.compact_every == 0:
+                    self.compact()
+            except Exception as e:
+                print(f"Error saving stats: {e}")
+
+    def flush(self):
+        """Write the buffered events in a single transaction."""
+        with self._flush_lock:
+            with self._buffer_lock:
+                events, self._buffer = self._buffer, []
+            if not events:
+                return
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("INSERT INTO events VALUES (?, ?)", events)
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # keep the events for the next flush
+                with self._buffer_lock:
+                    self._buffer = events + self._buffer
+                raise
+
     def get_stats(self):
         """Get statistics data"""
-        return self.stats.copy()
-    
+        self.flush()
+        stats = {module: 0 for module in TRACKED_MODULES}
+        last_updated = None
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT module, SUM(count), MAX(ts) FROM ("
+            "  SELECT module, count, ts FROM baseline"
+            "  UNION ALL SELECT module, COUNT(*), MAX(ts) FROM events GROUP BY module"
+            ") GROUP BY module"
+        ).fetchall()
+        for module, count, ts in rows:
+            if module in stats:
+                stats[module] = count
+            if ts is not None and (last_updated is None or ts > last_updated):
+                last_updated = ts
+        stats["last_updated"] = datetime.fromtimestamp(last_updated or time.time()).isoformat()
+        return stats
+
+    def compact(self):
+        """Fold the event rows into the baseline counts to keep the table small."""
+        self.flush()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO baseline (module, count, ts) "
+                "SELECT module, COUNT(*), MAX(ts) FROM events WHERE true GROUP BY module "
+                "ON CONFLICT(module) DO UPDATE SET count = count + excluded.count, ts = excluded.ts"
+            )
+            conn.execute("DELETE FROM events")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
     def get_default_stats(self):
         """Get default statistics data"""
-        return {
-            "mutation_prediction": 0,
-            "function_analysis": 0,
-            "total_visits": 0,
-            "last_updated": datetime.now().isoformat()
-        }
-    
+        stats = {module: 0 for module in TRACKED_MODULES}
+        stats["last_updated"] = datetime.now().isoformat()
+        return stats
+
     def reset_stats(self):
         """Reset statistics data"""
-        self.stats = self.get_default_stats()
-        self.save_stats()
+        with self._buffer_lock:
+            self._buffer = []
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM events")
+            conn.execute("DELETE FROM baseline")
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Error resetting stats: {e}")
+            return False
         return True
 
 # Global instance
-global_stats_manager = StatsManager() 
+global_stats_manager = StatsManager()
@@ -8,14 +8,13 @@ import time
 import zipfile
 from pathlib import Path
 from typing import Dict, Any, List, Generator, Optional, Tuple
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
 import requests
 from dataclasses import dataclass
 import re
 import json
 from .utils.paste_content_handler import process_pasted_content
+from .utils.result_cache import get_result_cache
 from web.venus_factory_quick_tool_tab import *
 # --- Constants and Mappings ---
 
@@ -180,6 +179,13 @@ def run_zero_shot_prediction(model_type: str, model_name: str, file_path: str) -
         if not os.path.exists(script_path):
             return f"Script not found: {script_path}", pd.DataFrame()
         
+        # Shared with the Quick Tools and the chat agent
+        cache = get_result_cache()
+        cache_key = cache.make_key(file_path, model_name, [script_path])
+        cached_df = cache.get(cache_key)
+        if cached_df is not None:
+            return "Prediction loaded from cache.", cached_df
+        
         file_argument = "--pdb_file" if file_path.lower().endswith(".pdb") else "--fasta_file"
         
         cmd = [
@@ -200,6 +206,7 @@ def run_zero_shot_prediction(model_type: str, model_name: str, file_path: str) -
         if os.path.exists(output_csv):
             df = pd.read_csv(output_csv)
             os.remove(output_csv)
+            cache.put(cache_key, df)
             return "Prediction completed successfully!", df
         
         return "Prediction finished but no output file was created.", pd.DataFrame()
@@ -219,6 +226,7 @@ def handle_mutation_prediction_advance(
     model_name:str,
     progress=gr.Progress()
 ) -> Generator:
+    import plotly.graph_objects as go
     try:
         import requests
         requests.post("/api/stats/track", json={"module": "mutation_prediction"})
@@ -415,14 +423,9 @@ def handle_protein_function_prediction_chat(
             if not script_path.exists() or not adapter_path.exists():
                 raise FileNotFoundError(f"Required files not found for dataset {dataset}")
 
-            cmd = [sys.executable, str(script_path), "--fasta_file", str(Path(fasta_file.name)), "--adapter_path", str(adapter_path), "--output_csv", str(output_file)]
-            subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-
-            if output_file.exists():
-                df = pd.read_csv(output_file)
-                df["Dataset"] = dataset
+            df = run_function_prediction(script_path, fasta_file.name, [adapter_path], [dataset], output_file)
+            if not df.empty:
                 all_results_list.append(df)
-                os.remove(output_file)
         except Exception as e:
             error_detail = e.stderr if isinstance(e, subprocess.CalledProcessError) else str(e)
             all_results_list.append(pd.DataFrame([{"Dataset": dataset, "header": "ERROR", "sequence": error_detail}]))
@@ -520,14 +523,9 @@ def handle_protein_function_prediction_advance(
             if not script_path.exists() or not adapter_path.exists():
                 raise FileNotFoundError(f"Required files not found: Script={script_path}, Adapter={adapter_path}")
             
-            cmd = [sys.executable, str(script_path), "--fasta_file", str(Path(fasta_file.name)), "--adapter_path", str(adapter_path), "--output_csv", str(output_file)]
-            subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-            
-            if output_file.exists():
-                df = pd.read_csv(output_file) 
-                df["Dataset"] = dataset
+            df = run_function_prediction(script_path, fasta_file.name, [adapter_path], [dataset], output_file)
+            if not df.empty:
                 all_results_list.append(df)
-                os.remove(output_file)
         except Exception as e:
             error_detail = e.stderr if isinstance(e, subprocess.CalledProcessError) else str(e)
             print(f"Failed to process '{dataset}': {error_detail}")
@@ -777,15 +775,10 @@ def handle_protein_residue_function_prediction_chat(
         else:
             file_path = fasta_file.name
         
-        cmd = [sys.executable, str(script_path), "--fasta_file", str(Path(file_path)), "--adapter_path", str(adapter_path), "--output_csv", str(output_file)]
-        subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-        
-        if output_file.exists():
-            df = pd.read_csv(output_file) 
+        df = run_function_prediction(script_path, file_path, [adapter_path], [dataset], output_file)
+        if not df.empty:
             df["Task"] = task
-            df["Dataset"] = dataset
             all_results_list.append(df)
-            os.remove(output_file)
 
     
     if all_results_list:
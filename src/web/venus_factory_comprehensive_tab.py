@@ -9,8 +9,6 @@ import time
 import zipfile
 from pathlib import Path
 from typing import Dict, Any, List, Generator, Optional, Tuple, Union
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
 import requests
 from dataclasses import dataclass
@@ -7,18 +7,21 @@ import time
 import zipfile
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List, Generator, Optional, Tuple, Union
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from typing import TYPE_CHECKING, Dict, Any, List, Generator, Optional, Tuple, Union
 import numpy as np
 import requests
 from dataclasses import dataclass
 import re
 import json
 from .utils.paste_content_handler import process_pasted_content
+from .utils.result_cache import get_result_cache
 from dotenv import load_dotenv
 load_dotenv()
 
+# plotly is imported by the functions that draw, so it is not loaded before the first result
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
 MODEL_MAPPING_ZERO_SHOT = {
     "ESM2-650M": "esm2", 
     "ESM-1b": "esm1b",
@@ -795,6 +798,13 @@ def run_zero_shot_prediction(model_type: str, model_name: str, file_path: str) -
         if not os.path.exists(script_path):
             return f"Script not found: {script_path}", pd.DataFrame()
         
+        # Same input, model and script version: reuse the stored scores without loading the model
+        cache = get_result_cache()
+        cache_key = cache.make_key(file_path, model_name, [script_path])
+        cached_df = cache.get(cache_key)
+        if cached_df is not None:
+            return "Prediction loaded from cache.", cached_df
+        
         file_argument = "--pdb_file" if model_type == "structure" else "--fasta_file"
         cmd = [
             sys.executable, script_path, 
@@ -814,6 +824,7 @@ def run_zero_shot_prediction(model_type: str, model_name: str, file_path: str) -
         if os.path.exists(output_csv):
             df = pd.read_csv(output_csv)
             os.remove(output_csv)
+            cache.put(cache_key, df)
             return "Prediction completed successfully!", df
         
         return "Prediction finished but no output file was created.", pd.DataFrame()
@@ -824,6 +835,86 @@ def run_zero_shot_prediction(model_type: str, model_name: str, file_path: str) -
     except Exception as e:
         return f"An unexpected error occurred: {e}", pd.DataFrame()
 
+def format_mutation_display_df(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """Ranked mutants with their scores scaled to [-1, 1], as shown in the results table."""
+    score_col = next((c for c in raw_df.columns if 'score' in c.lower()), raw_df.columns[1])
+    
+    display_df = pd.DataFrame()
+    display_df['Mutant'] = raw_df['mutant']
+    display_df['Prediction Rank'] = range(1, len(raw_df) + 1)
+    
+    min_s, max_s = raw_df[score_col].min(), raw_df[score_col].max()
+    if max_s == min_s:
+        scaled_scores = pd.Series([0.0] * len(raw_df))
+    else:
+        scaled_scores = -1 + 2 * (raw_df[score_col] - min_s) / (max_s - min_s)
+    display_df['Prediction Score'] = scaled_scores.round(2)
+    return display_df
+
+def load_cached_zero_shot_prediction(model_name: str, file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Look up the zero-shot scores of a file without running anything, None if they are not cached.
+    Multi-sequence FASTA files are reduced to their first sequence as in the prediction handler.
+    """
+    script_name = MODEL_MAPPING_ZERO_SHOT.get(model_name)
+    if not script_name:
+        return None
+    script_path = f"src/mutation/models/{script_name}.py"
+    if file_path.lower().endswith((".fasta", ".fa")):
+        file_path = process_fasta_file(file_path)
+    cache = get_result_cache()
+    return cache.get(cache.make_key(file_path, model_name, [script_path]))
+
+def run_function_prediction(script_path: Path, file_path: str, adapter_paths: List[Path], adapter_names: List[str], output_file: Path) -> pd.DataFrame:
+    """
+    Run a property predictor on a FASTA file with one or more adapter heads.
+    Results are cached by the FASTA content, the script and the adapter checkpoints.
+    Raises subprocess.CalledProcessError if the script fails.
+    """
+    cache = get_result_cache()
+    cache_key = cache.make_key(file_path, script_path.stem, [script_path, *adapter_paths], extra=adapter_names,
+                               include_headers=True)
+    cached_df = cache.get(cache_key)
+    if cached_df is not None:
+        return cached_df
+
+    cmd = [sys.executable, str(script_path), "--fasta_file", str(Path(file_path)),
+           "--adapter_path", *[str(adapter_path) for adapter_path in adapter_paths],
+           "--adapter_names", *adapter_names,
+           "--output_csv", str(output_file)]
+    subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
+
+    if not output_file.exists():
+        return pd.DataFrame()
+    df = pd.read_csv(output_file)
+    os.remove(output_file)
+    if "Dataset" not in df.columns:
+        df["Dataset"] = adapter_names[0]
+    cache.put(cache_key, df)
+    return df
+
+def run_function_predictions(script_path: Path, file_path: str, adapter_paths: List[Path], adapter_names: List[str], output_file: Path) -> List[pd.DataFrame]:
+    """
+    Run all adapter heads in one process, falling back to one process per dataset if it fails,
+    so a single broken dataset only marks its own rows as ERROR.
+    """
+    try:
+        return [run_function_prediction(script_path, file_path, adapter_paths, adapter_names, output_file)]
+    except subprocess.CalledProcessError as e:
+        if len(adapter_names) == 1:
+            return [pd.DataFrame([{"Dataset": adapter_names[0], "header": "ERROR", "sequence": e.stderr}])]
+        print(f"Combined prediction of '{', '.join(adapter_names)}' failed, retrying each dataset: {e.stderr}")
+
+    results = []
+    for adapter_path, dataset in zip(adapter_paths, adapter_names):
+        dataset_output = output_file.with_name(f"{output_file.stem}_{dataset}{output_file.suffix}")
+        try:
+            results.append(run_function_prediction(script_path, file_path, [adapter_path], [dataset], dataset_output))
+        except subprocess.CalledProcessError as e:
+            print(f"Failed to process '{dataset}': {e.stderr}")
+            results.append(pd.DataFrame([{"Dataset": dataset, "header": "ERROR", "sequence": e.stderr}]))
+    return results
+
 def prepare_top_residue_heatmap_data(df: pd.DataFrame) -> Tuple:
     """Prepare data for heatmap visualization."""
     score_col = next((col for col in df.columns if 'score' in col.lower()), None)
@@ -874,8 +965,9 @@ def prepare_top_residue_heatmap_data(df: pd.DataFrame) -> Tuple:
             
     return x_labels, y_labels, z_data, score_matrix, rank_matrix
 
-def generate_plotly_heatmap(x_labels: List, y_labels: List, z_data: np.ndarray, score_data: np.ndarray) -> go.Figure:
+def generate_plotly_heatmap(x_labels: List, y_labels: List, z_data: np.ndarray, score_data: np.ndarray) -> "go.Figure":
     """Generate Plotly heatmap visualization."""
+    import plotly.graph_objects as go
     if z_data is None or z_data.size == 0:
         return go.Figure().update_layout(title="Not enough data for heatmap")
 
@@ -957,6 +1049,7 @@ def handle_mutation_prediction_base(
     model_name: Optional[str] = None,
     progress=gr.Progress()
 ) -> Generator:
+    import plotly.graph_objects as go
     try:
         import requests
         requests.post("/api/stats/track", json={"module": "function_analysis"})
@@ -1025,18 +1118,7 @@ def handle_mutation_prediction_base(
         )
         return
     
-    score_col = next((c for c in raw_df.columns if 'score' in c.lower()), raw_df.columns[1])
-    
-    display_df = pd.DataFrame()
-    display_df['Mutant'] = raw_df['mutant']
-    display_df['Prediction Rank'] = range(1, len(raw_df) + 1)
-    
-    min_s, max_s = raw_df[score_col].min(), raw_df[score_col].max()
-    if max_s == min_s:
-        scaled_scores = pd.Series([0.0] * len(raw_df))
-    else:
-        scaled_scores = -1 + 2 * (raw_df[score_col] - min_s) / (max_s - min_s)
-    display_df['Prediction Score'] = scaled_scores.round(2)
+    display_df = format_mutation_display_df(raw_df)
 
     df_for_heatmap = raw_df.copy()
     df_for_heatmap['Prediction Rank'] = range(1, len(df_for_heatmap) + 1)
@@ -1115,8 +1197,10 @@ def handle_mutation_prediction_base(
         gr.update(visible=total_residues > 20), display_df, expert_analysis
     )
 
-def generate_plots_for_all_results(results_df: pd.DataFrame) -> go.Figure:
+def generate_plots_for_all_results(results_df: pd.DataFrame) -> "go.Figure":
     """Generate plots for function prediction results with consistent Dardana font and academic styling."""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
     # Filter data
     plot_df = results_df[
         (results_df['header'] != "ERROR") & 
@@ -1299,45 +1383,51 @@ def handle_protein_function_prediction(
     timestamp = str(int(time.time()))
     function_dir = get_save_path("Protein_function_result")
 
-    # Run predictions for each dataset
+    # Run all datasets in one process: the PLM is loaded once and every adapter head shares its embeddings
     progress(0.1, desc="Running prediction...")
-    for i, dataset in enumerate(datasets):
-        yield (
-            f"⏳ Running prediction...", 
-            pd.DataFrame(), 
-            gr.update(visible=False), 
-            "AI analysis will appear here...",
-            "AI Analysis disabled."
-        )
-        
-        try:
-            model_key = MODEL_MAPPING_FUNCTION.get(model)
-            if not model_key:
-                raise ValueError(f"Model key not found for {model}")
-            
-            adapter_key = MODEL_ADAPTER_MAPPING_FUNCTION[model_key]
-            script_path = Path("src") / "property" / f"{model_key}.py"
+    yield (
+        f"⏳ Running prediction...", 
+        pd.DataFrame(), 
+        gr.update(visible=False), 
+        "AI analysis will appear here...",
+        "AI Analysis disabled."
+    )
+
+    try:
+        model_key = MODEL_MAPPING_FUNCTION.get(model)
+        if not model_key:
+            raise ValueError(f"Model key not found for {model}")
+
+        adapter_key = MODEL_ADAPTER_MAPPING_FUNCTION[model_key]
+        script_path = Path("src") / "property" / f"{model_key}.py"
+        if not script_path.exists():
+            raise FileNotFoundError(f"Required files not found: Script={script_path}")
+
+        run_datasets = []
+        for dataset in datasets:
             adapter_path = Path("ckpt") / dataset / adapter_key
-            output_file = function_dir / f"{dataset}_{model}_{timestamp}.csv"
-            
-            if not script_path.exists() or not adapter_path.exists():
-                raise FileNotFoundError(f"Required files not found: Script={script_path}, Adapter={adapter_path}")
+            if adapter_path.exists():
+                run_datasets.append(dataset)
+            else:
+                all_results_list.append(pd.DataFrame([{"Dataset": dataset, "header": "ERROR", "sequence": f"Required files not found: Adapter={adapter_path}"}]))
+
+        if run_datasets:
             if isinstance(fasta_file, str):
                 file_path = fasta_file
             else:
                 file_path = fasta_file.name
-            cmd = [sys.executable, str(script_path), "--fasta_file", str(Path(file_path)), "--adapter_path", str(adapter_path), "--output_csv", str(output_file)]
-            subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-            
-            if output_file.exists():
-                df = pd.read_csv(output_file) 
-                df["Dataset"] = dataset
-                all_results_list.append(df)
-                os.remove(output_file)
-        except Exception as e:
-            error_detail = e.stderr if isinstance(e, subprocess.CalledProcessError) else str(e)
-            print(f"Failed to process '{dataset}': {error_detail}")
-            all_results_list.append(pd.DataFrame([{"Dataset": dataset, "header": "ERROR", "sequence": error_detail}]))
+            output_file = function_dir / f"{task}_{model}_{timestamp}.csv"
+            adapter_paths = [Path("ckpt") / dataset / adapter_key for dataset in run_datasets]
+            for df in run_function_predictions(script_path, file_path, adapter_paths, run_datasets, output_file):
+                if not df.empty:
+                    all_results_list.append(df)
+    except Exception as e:
+        error_detail = e.stderr if isinstance(e, subprocess.CalledProcessError) else str(e)
+        # only the datasets without a status yet failed here
+        done = {dataset for df in all_results_list for dataset in df["Dataset"].unique()}
+        failed = [dataset for dataset in datasets if dataset not in done]
+        print(f"Failed to process '{', '.join(failed)}': {error_detail}")
+        all_results_list.append(pd.DataFrame([{"Dataset": dataset, "header": "ERROR", "sequence": error_detail} for dataset in failed]))
     progress(0.7, desc="Processing results...")
     if not all_results_list:
         yield (
@@ -1514,8 +1604,9 @@ def handle_protein_function_prediction(
     print("Final yield completed successfully!")
 
 
-def generate_plots_for_residue_results(results_df: pd.DataFrame, task: str = "Functional Prediction") -> go.Figure:
+def generate_plots_for_residue_results(results_df: pd.DataFrame, task: str = "Functional Prediction") -> "go.Figure":
     """Generate plots for residue prediction results with consistent styling."""
+    import plotly.graph_objects as go
     if results_df.empty:
         fig = go.Figure()
         fig.add_annotation(
@@ -1616,6 +1707,23 @@ def generate_plots_for_residue_results(results_df: pd.DataFrame, task: str = "Fu
     return fig
 
 def expand_residue_predictions(df):
+    # Tidy per-residue tables (one row per residue, e.g. predict_batch.py --residue_output_format long/parquet)
+    # are already expanded, only map their columns instead of building a row dict per residue
+    if {'position', 'residue'}.issubset(df.columns):
+        prob_columns = [c for c in df.columns if c.startswith('class_') and c.endswith('_prob')]
+        expanded = pd.DataFrame({
+            'index': df['position'].to_numpy() - 1,
+            'residue': df['residue'].to_numpy(),
+        })
+        if prob_columns:
+            probs = df[prob_columns].to_numpy()
+            expanded['predicted_label'] = probs.argmax(axis=1)
+            expanded['probability'] = probs.max(axis=1)
+        else:
+            expanded['predicted_label'] = df['predicted_class'].to_numpy() if 'predicted_class' in df.columns else df['prediction'].to_numpy()
+            expanded['probability'] = np.nan
+        return expanded
+
     expanded_rows = []
     
     for _, row in df.iterrows():
@@ -1707,30 +1815,23 @@ def handle_protein_residue_function_prediction(
         if not datasets:
             raise ValueError(f"No datasets found for task: {task}")
         
-        for dataset in datasets:
-            script_path = Path("src") / "property" / f"{model_key}.py"
-            adapter_path = Path("ckpt") / dataset / adapter_key
-            output_file = residue_save_dir/ f"{dataset}_{model}_{timestamp}.csv"
+        script_path = Path("src") / "property" / f"{model_key}.py"
+        adapter_paths = [Path("ckpt") / dataset / adapter_key for dataset in datasets]
+        output_file = residue_save_dir/ f"{task}_{model}_{timestamp}.csv"
 
+        for adapter_path in adapter_paths:
             if not script_path.exists() or not adapter_path.exists():
                 raise FileNotFoundError(f"Required files not found: Script={script_path}, Adapter={adapter_path}")
-            if isinstance(fasta_file, str):
-                file_path = fasta_file
-            else:
-                file_path = fasta_file.name
-            
-            cmd = [sys.executable, str(script_path),
-                 "--fasta_file", str(Path(file_path)), 
-                 "--adapter_path", str(adapter_path), 
-                 "--output_csv", str(output_file)]
-            subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-            
-            if output_file.exists():
-                df = pd.read_csv(output_file) 
-                df["Task"] = task
-                df["Dataset"] = dataset
-                all_results_list.append(df)
-                os.remove(output_file)
+        if isinstance(fasta_file, str):
+            file_path = fasta_file
+        else:
+            file_path = fasta_file.name
+
+        # one process for all datasets of the task, the heads share a single PLM forward pass
+        df = run_function_prediction(script_path, file_path, adapter_paths, datasets, output_file)
+        if not df.empty:
+            df["Task"] = task
+            all_results_list.append(df)
 
     except Exception as e:
         error_detail = e.stderr if isinstance(e, subprocess.CalledProcessError) else str(e)